@@ -5,13 +5,17 @@ from fastapi import APIRouter
 
 from app.api.api_v1.endpoints import (
     ai,
+    analytics,
     auth,
     calls,
     crm,
+    dashboard,
     forecasts,
     instagram,
     leads,
     messages,
+    realtime,
+    telephony,
     users,
 )
 
@@ -26,4 +30,8 @@ api_router.include_router(crm.router, prefix="/crm", tags=["crm"])
 api_router.include_router(forecasts.router, prefix="/forecasts", tags=["forecasts"])
 api_router.include_router(calls.router, prefix="/calls", tags=["calls"])
 api_router.include_router(ai.router, prefix="/ai", tags=["ai"])
+api_router.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"])
+api_router.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 api_router.include_router(instagram.router, prefix="/instagram", tags=["instagram"])
+api_router.include_router(realtime.router, prefix="/realtime", tags=["realtime"])
+api_router.include_router(telephony.router, prefix="/telephony", tags=["telephony"])
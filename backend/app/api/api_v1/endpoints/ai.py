@@ -1,22 +1,66 @@
 """
 API endpoints для AI функций
 """
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_active_user
+from app.models.call import Call, CallTranscript
 from app.models.lead import Lead
 from app.models.lead_interaction import LeadInteraction, InteractionAuthor
 from app.models.user import User
 from app.services.ai_chat import AIChatServiceError, generate_sales_assistant_reply
+from app.services.analytics import (
+    AI_CHAT_REQUESTS,
+    AI_CHAT_TOKENS,
+    AI_MESSAGE_TOKENS,
+    AI_MESSAGES,
+    metric_totals,
+    record_rollup,
+)
+from app.services.call_analysis import (
+    ANALYSIS_FIELDS,
+    analyze_transcript,
+    batch_analysis_running,
+    count_pending_transcripts,
+    run_batch_analysis_job,
+)
+from app.services.call_index import index_transcript
+from app.services.forecasting import ForecastError, create_pending_forecast, run_forecast_job
 
 router = APIRouter()
 
+AVAILABLE_MODELS = [
+    {
+        "id": "gpt-4",
+        "name": "GPT-4",
+        "type": "text",
+        "max_tokens": 8192,
+        "cost_per_1k_tokens": 0.03
+    },
+    {
+        "id": "gpt-4-turbo",
+        "name": "GPT-4 Turbo",
+        "type": "text",
+        "max_tokens": 128000,
+        "cost_per_1k_tokens": 0.01
+    },
+    {
+        "id": "gpt-3.5-turbo",
+        "name": "GPT-3.5 Turbo",
+        "type": "text",
+        "max_tokens": 4096,
+        "cost_per_1k_tokens": 0.002
+    }
+]
+
 
 class EmailGenerationRequest(BaseModel):
     lead_id: int
@@ -109,20 +153,49 @@ async def score_lead(
 
 @router.post("/analyze-call")
 async def analyze_call(
-    call_id: int,
+    background_tasks: BackgroundTasks,
+    call_id: Optional[int] = None,
+    limit: int = Query(500, ge=1, le=5000),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """AI-анализ звонка"""
-    # TODO: Реализовать AI анализ звонка
-    # Здесь будет анализ транскрипта звонка
-    
-    return {"message": "Call analysis initiated", "call_id": call_id}
+    """AI-анализ звонка; без call_id - пакетный анализ непроанализированных транскриптов"""
+    agent_id = None if current_user.role in ["analyst", "admin"] else current_user.id
+
+    if call_id is None:
+        if batch_analysis_running():
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Batch call analysis is already running")
+        pending = count_pending_transcripts(db, limit, agent_id)
+        if pending:
+            background_tasks.add_task(run_batch_analysis_job, limit, agent_id)
+        return {"message": "Batch call analysis initiated", "pending": pending}
+
+    call = db.query(Call).filter(Call.id == call_id).first()
+    if not call:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Call not found")
+    if agent_id is not None and call.agent_id != agent_id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    transcript = db.query(CallTranscript).filter(CallTranscript.call_id == call_id).first()
+    if not transcript or not transcript.text:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transcript not found")
+
+    analysis = await run_in_threadpool(analyze_transcript, transcript.text, transcript.language or "de")
+    for field in ANALYSIS_FIELDS:
+        setattr(transcript, field, analysis.get(field))
+    index_transcript(db, transcript)
+    db.commit()
+    return {
+        "call_id": call_id,
+        **{field: analysis.get(field) for field in ANALYSIS_FIELDS},
+        "tokens_used": analysis.get("tokens_used"),
+    }
 
 
 @router.post("/generate-forecast")
 async def generate_forecast(
     period_type: str,
+    background_tasks: BackgroundTasks,
+    period_start: Optional[datetime] = Query(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -134,59 +207,63 @@ async def generate_forecast(
             detail="Not enough permissions"
         )
     
-    # TODO: Реализовать AI генерацию прогноза
-    # Здесь будет анализ исторических данных и создание прогноза
+    try:
+        forecast = create_pending_forecast(db, period_type, period_start, current_user.id)
+    except ForecastError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        ) from exc
     
-    return {"message": "Forecast generation initiated", "period_type": period_type}
+    background_tasks.add_task(run_forecast_job, forecast.id)
+    
+    return {"message": "Forecast generation initiated", "forecast_id": forecast.id, "period_type": period_type}
 
 
 @router.get("/models")
 async def get_available_models():
     """Получение списка доступных AI моделей"""
-    return {
-        "models": [
-            {
-                "id": "gpt-4",
-                "name": "GPT-4",
-                "type": "text",
-                "max_tokens": 8192,
-                "cost_per_1k_tokens": 0.03
-            },
-            {
-                "id": "gpt-4-turbo",
-                "name": "GPT-4 Turbo",
-                "type": "text",
-                "max_tokens": 128000,
-                "cost_per_1k_tokens": 0.01
-            },
-            {
-                "id": "gpt-3.5-turbo",
-                "name": "GPT-3.5 Turbo",
-                "type": "text",
-                "max_tokens": 4096,
-                "cost_per_1k_tokens": 0.002
-            }
-        ]
-    }
+    return {"models": AVAILABLE_MODELS}
 
 
 @router.get("/usage")
 async def get_ai_usage(
+    db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Получение статистики использования AI"""
-    # TODO: Реализовать подсчет использования AI
-    # Здесь будет статистика по токенам, запросам и т.д.
-    
+    """Получение статистики использования AI (из дневных агрегатов)"""
+    today = datetime.utcnow().date()
+    tomorrow = today + timedelta(days=1)
+    metrics = (AI_MESSAGES, AI_CHAT_REQUESTS, AI_MESSAGE_TOKENS, AI_CHAT_TOKENS)
+    day_totals = metric_totals(db, metrics, today, tomorrow, user_id=current_user.id)
+    month_totals = metric_totals(db, metrics, today.replace(day=1), tomorrow, user_id=current_user.id)
+
+    cost_per_1k = next(
+        (model["cost_per_1k_tokens"] for model in AVAILABLE_MODELS if model["id"] == settings.OPENAI_MODEL),
+        0.0,
+    )
+
+    def _usage(totals: Dict[str, float]) -> Dict[str, Any]:
+        tokens = int(totals[AI_MESSAGE_TOKENS] + totals[AI_CHAT_TOKENS])
+        return {
+            "tokens": tokens,
+            "requests": int(totals[AI_MESSAGES] + totals[AI_CHAT_REQUESTS]),
+            "cost": round(tokens / 1000 * cost_per_1k, 4),
+        }
+
+    usage_today = _usage(day_totals)
+    usage_month = _usage(month_totals)
     return {
         "user_id": current_user.id,
-        "tokens_used_today": 1500,
-        "tokens_used_month": 45000,
-        "requests_today": 25,
-        "requests_month": 750,
-        "cost_today": 0.45,
-        "cost_month": 13.50
+        "tokens_used_today": usage_today["tokens"],
+        "tokens_used_month": usage_month["tokens"],
+        "requests_today": usage_today["requests"],
+        "requests_month": usage_month["requests"],
+        "cost_today": usage_today["cost"],
+        "cost_month": usage_month["cost"]
     }
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_sales_agent(
     chat_request: ChatRequest,
@@ -234,7 +311,7 @@ async def chat_with_sales_agent(
         recent_interactions = (
             db.query(LeadInteraction)
             .filter(LeadInteraction.lead_id == lead.id)
-            .order_by(LeadInteraction.created_at.desc())
+            .order_by(LeadInteraction.created_at.desc(), LeadInteraction.id.desc())
             .limit(5)
             .all()
         )
@@ -286,7 +363,11 @@ async def chat_with_sales_agent(
             )
         )
         lead.last_contacted = datetime.utcnow()
-        db.commit()
+
+    usage = ai_result.get("usage") or {}
+    record_rollup(db, current_user.id, AI_CHAT_REQUESTS)
+    record_rollup(db, current_user.id, AI_CHAT_TOKENS, usage.get("total_tokens") or 0)
+    db.commit()
 
     return ChatResponse(
         reply=reply_text,
@@ -0,0 +1,156 @@
+"""
+API endpoints для аналитики: дневные агрегаты и показатели звонков
+"""
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from app.core.cache import query_cache, track_tables
+from app.core.database import SessionLocal, get_db
+from app.core.security import get_current_active_user, require_role
+from app.models.call import Call, CallDirection, CallTranscript
+from app.models.user import User
+from app.schemas.analytics import CallAnalyticsResponse, RollupQueryResponse
+from app.services.analytics import (
+    BACKFILL_METRICS,
+    HOOK_METRICS,
+    INTERVALS,
+    LEAD_STATUS_PREFIX,
+    backfill_rollups,
+    call_stats,
+    full_history_range,
+    is_known_metric,
+    query_rollups,
+)
+
+router = APIRouter()
+
+CALL_TABLES = (Call.__tablename__, CallTranscript.__tablename__)
+track_tables(*CALL_TABLES)
+
+# Максимальная длина запрашиваемого диапазона
+MAX_RANGE_DAYS = 3 * 366
+
+
+def _run_backfill(start: Optional[date], end: Optional[date]) -> None:
+    db = SessionLocal()
+    try:
+        if start is None or end is None:
+            full_start, full_end = full_history_range(db)
+            start, end = start or full_start, end or full_end
+        backfill_rollups(db, start, end)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _resolve_range(start: Optional[date], end: Optional[date], interval: str) -> Tuple[date, date]:
+    """Проверка интервала и диапазона; по умолчанию последние 30 дней"""
+    if interval not in INTERVALS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"interval must be one of: {', '.join(INTERVALS)}"
+        )
+
+    end = end or datetime.utcnow().date() + timedelta(days=1)
+    start = start or end - timedelta(days=30)
+    if start >= end or (end - start).days > MAX_RANGE_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid date range (max {MAX_RANGE_DAYS} days)"
+        )
+    return start, end
+
+
+@router.get("/metrics")
+async def get_metrics(
+    current_user: User = Depends(get_current_active_user)
+):
+    """Список доступных метрик"""
+    return {
+        "metrics": list(BACKFILL_METRICS) + list(HOOK_METRICS),
+        "lead_status_prefix": LEAD_STATUS_PREFIX,
+        "intervals": list(INTERVALS),
+    }
+
+
+@router.get("/daily", response_model=RollupQueryResponse)
+async def get_daily_metrics(
+    metric: List[str] = Query(...),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    interval: str = Query("day"),
+    user_id: Optional[int] = Query(None),
+    by_user: bool = Query(False),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Ряды метрик по дням/неделям/месяцам за [start, end)"""
+    unknown = [name for name in metric if not is_known_metric(name)]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown metrics: {', '.join(unknown)}"
+        )
+    start, end = _resolve_range(start, end, interval)
+
+    # Не-админы видят только свои показатели
+    if current_user.role not in ("admin", "analyst"):
+        user_id = current_user.id
+    user_ids = [user_id] if user_id is not None else None
+
+    series = query_rollups(db, metric, start, end, user_ids=user_ids, interval=interval, by_user=by_user)
+    return RollupQueryResponse(start=start, end=end, interval=interval, series=series)
+
+
+@router.get("/calls", response_model=CallAnalyticsResponse)
+async def get_call_analytics(
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    interval: str = Query("day"),
+    agent_id: Optional[int] = Query(None),
+    lead_id: Optional[int] = Query(None),
+    direction: Optional[CallDirection] = Query(None),
+    by_agent: bool = Query(True),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Звонки, доля отвеченных, средняя длительность и тональность за [start, end) по периодам и агентам"""
+    start, end = _resolve_range(start, end, interval)
+
+    # Не-админы видят только свои звонки
+    if current_user.role not in ("admin", "analyst"):
+        agent_id = current_user.id
+
+    # Кэш сбрасывается любым коммитом, изменившим звонки или транскрипты
+    return query_cache.get_or_set(
+        "analytics:calls",
+        CALL_TABLES,
+        (start, end, interval, agent_id, lead_id, direction, by_agent),
+        lambda: CallAnalyticsResponse(
+            start=start,
+            end=end,
+            interval=interval,
+            **call_stats(db, start, end, interval, agent_id, lead_id, direction, by_agent),
+        ).model_dump(mode="json"),
+    )
+
+
+@router.post("/rollups/backfill")
+async def backfill_daily_rollups(
+    background_tasks: BackgroundTasks,
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    current_user: User = Depends(require_role("admin"))
+):
+    """Пересчет агрегатов из исходных таблиц (только для админов)"""
+    if start is not None and end is not None and start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end"
+        )
+    background_tasks.add_task(_run_backfill, start, end)
+
+    return {"message": "Rollup backfill initiated", "start": start, "end": end}
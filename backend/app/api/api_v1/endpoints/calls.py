@@ -1,15 +1,44 @@
 """
 API endpoints для звонков
 """
+import uuid
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from loguru import logger
+from sqlalchemy import and_, or_, select
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db
-from app.core.security import get_current_active_user
+from app.core.config import settings
+from app.core.database import SessionLocal, get_db
+from app.core.security import get_current_active_user, require_role
 from app.models.user import User
-from app.models.call import Call, CallTranscript, CallTask
+from app.models.call import Call, CallDirection, CallTranscript, CallTranscriptTerm, CallTask
+from app.models.lead import Lead
 from app.schemas.call import Call as CallSchema, CallCreate, CallUpdate, CallList, CallTranscript as CallTranscriptSchema, CallTask as CallTaskSchema
+from app.schemas.call import CallerIdResult, CallSearchHit, CallSearchResult, CallTaskCreate, CallTaskList, CallTaskUpdate
+from app.services.call_index import normalize_term, rebuild_term_index
+from app.services.phone_index import lead_for_phone
+from app.services.storage import (
+    LocalRecordingStorage,
+    S3RecordingStorage,
+    StorageError,
+    StorageObjectTooLarge,
+    get_recording_storage,
+)
+from app.services.task_scheduler import PRIORITY_RANK, TASK_STATUSES, next_tasks, task_reminder_scheduler
+from app.services.transcription import (
+    AudioFormatError,
+    RecordingTooLargeError,
+    SpeechToTextError,
+    TranscriptionJob,
+    set_transcription_status,
+)
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.phone import normalize_phone
+from app.utils.range_response import RangeFileResponse
 
 router = APIRouter()
 
@@ -58,15 +87,129 @@ async def get_calls(
     )
 
 
+SEARCH_COLUMNS = (
+    Call.id,
+    Call.lead_id,
+    Call.agent_id,
+    Call.direction,
+    Call.status,
+    Call.duration_seconds,
+    Call.created_at,
+    CallTranscript.id.label("transcript_id"),
+    CallTranscript.sentiment_score,
+    CallTranscript.sentiment_label,
+    CallTranscript.summary,
+    CallTranscript.intents,
+    CallTranscript.keywords,
+)
+
+
+def _run_term_reindex() -> None:
+    db = SessionLocal()
+    try:
+        rebuild_term_index(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+@router.get("/search", response_model=CallSearchResult)
+async def search_calls(
+    keyword: List[str] = Query([]),
+    intent: List[str] = Query([]),
+    entity: List[str] = Query([]),
+    sentiment_min: Optional[float] = Query(None, ge=-1, le=1),
+    sentiment_max: Optional[float] = Query(None, ge=-1, le=1),
+    sentiment_label: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Поиск звонков по индексу транскриптов (keyset пагинация по id, новые первыми).
+
+    Значения одного параметра объединяются через ИЛИ, разные параметры - через И.
+    """
+    query = db.query(*SEARCH_COLUMNS).join(CallTranscript, CallTranscript.call_id == Call.id)
+
+    # Фильтрация по агенту (если не админ)
+    if current_user.role != "admin":
+        query = query.filter(Call.agent_id == current_user.id)
+
+    for kind, values in (("keyword", keyword), ("intent", intent), ("entity", entity)):
+        terms = {normalize_term(value) for value in values} - {""}
+        if terms:
+            query = query.filter(
+                Call.id.in_(
+                    select(CallTranscriptTerm.call_id).where(
+                        CallTranscriptTerm.kind == kind,
+                        CallTranscriptTerm.term.in_(terms),
+                    )
+                )
+            )
+
+    if sentiment_min is not None:
+        query = query.filter(CallTranscript.sentiment_score >= sentiment_min)
+    if sentiment_max is not None:
+        query = query.filter(CallTranscript.sentiment_score <= sentiment_max)
+    if sentiment_label:
+        query = query.filter(CallTranscript.sentiment_label == sentiment_label.lower())
+    if date_from:
+        query = query.filter(Call.created_at >= date_from)
+    if date_to:
+        query = query.filter(Call.created_at < date_to)
+
+    if cursor:
+        try:
+            (cursor_id,) = decode_cursor(cursor, 1)
+            cursor_id = int(cursor_id)
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            ) from exc
+        query = query.filter(Call.id < cursor_id)
+
+    rows = query.order_by(Call.id.desc()).limit(limit + 1).all()
+    items = [CallSearchHit.model_validate(row._mapping) for row in rows[:limit]]
+    next_cursor = encode_cursor([items[-1].id]) if len(rows) > limit else None
+    return CallSearchResult(items=items, next_cursor=next_cursor)
+
+
+@router.post("/search/reindex")
+async def reindex_call_search(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(require_role("admin"))
+):
+    """Пересборка индекса термов по всем транскриптам (только для админов)"""
+    background_tasks.add_task(_run_term_reindex)
+
+    return {"message": "Call search reindex initiated"}
+
+
+def _visible_lead_criteria(current_user: User) -> List:
+    """Агент видит только своих и еще не назначенных лидов"""
+    if current_user.role == "admin":
+        return []
+    return [or_(Lead.assigned_to == current_user.id, Lead.assigned_to.is_(None))]
+
+
 @router.post("/", response_model=CallSchema)
 async def create_call(
     call_create: CallCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Создание нового звонка"""
+    """Создание нового звонка; без lead_id лид определяется по номеру собеседника"""
     call_data = call_create.dict()
     call_data["agent_id"] = current_user.id
+    if call_data.get("lead_id") is None:
+        counterpart = call_data["from_number"] if call_create.direction == CallDirection.INBOUND else call_data["to_number"]
+        lead = lead_for_phone(db, counterpart, *_visible_lead_criteria(current_user))
+        if lead is not None:
+            call_data["lead_id"] = lead.id
     
     call = Call(**call_data)
     db.add(call)
@@ -76,6 +219,162 @@ async def create_call(
     return call
 
 
+@router.get("/caller-id", response_model=CallerIdResult)
+async def caller_id(
+    number: str = Query(..., min_length=1, max_length=32),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Лид по номеру звонящего: одна выборка по индексу leads.phone_e164"""
+    lead = lead_for_phone(db, number, *_visible_lead_criteria(current_user))
+    return CallerIdResult(
+        number=number,
+        phone_e164=lead.phone_e164 if lead is not None else normalize_phone(number),
+        lead=lead,
+    )
+
+
+@router.get("/tasks", response_model=CallTaskList)
+async def get_call_tasks(
+    task_status: Optional[str] = Query(None, alias="status"),
+    assigned_to: Optional[int] = Query(None),
+    due_before: Optional[datetime] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Получение списка задач по звонкам (по сроку, keyset пагинация по due_at, id)"""
+    query = db.query(CallTask)
+    
+    # Фильтрация по назначенному пользователю
+    if current_user.role != "admin":
+        query = query.filter(CallTask.assigned_to == current_user.id)
+    elif assigned_to is not None:
+        query = query.filter(CallTask.assigned_to == assigned_to)
+
+    if task_status:
+        query = query.filter(CallTask.status == task_status)
+    if due_before:
+        query = query.filter(CallTask.due_at < due_before)
+
+    if cursor:
+        try:
+            cursor_due, cursor_id = decode_cursor(cursor, 2)
+            cursor_due, cursor_id = datetime.fromisoformat(cursor_due), int(cursor_id)
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            ) from exc
+        query = query.filter(
+            or_(
+                CallTask.due_at > cursor_due,
+                and_(CallTask.due_at == cursor_due, CallTask.id > cursor_id),
+            )
+        )
+
+    tasks = query.order_by(CallTask.due_at, CallTask.id).limit(limit + 1).all()
+    next_cursor = encode_cursor([tasks[limit - 1].due_at, tasks[limit - 1].id]) if len(tasks) > limit else None
+    return CallTaskList(items=tasks[:limit], next_cursor=next_cursor)
+
+
+@router.get("/tasks/next", response_model=List[CallTaskSchema])
+async def get_next_call_tasks(
+    limit: int = Query(10, ge=1, le=100),
+    assigned_to: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Очередь агента: следующие открытые задачи по приоритету, затем по сроку"""
+    user_id = current_user.id
+    # Админ может посмотреть очередь другого агента
+    if assigned_to is not None and assigned_to != current_user.id:
+        if current_user.role != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not enough permissions"
+            )
+        user_id = assigned_to
+
+    return next_tasks(db, user_id, limit)
+
+
+def _validate_task_fields(priority: Optional[str], task_status: Optional[str]) -> None:
+    if priority is not None and priority not in PRIORITY_RANK:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"priority must be one of: {', '.join(PRIORITY_RANK)}"
+        )
+    if task_status is not None and task_status not in TASK_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"status must be one of: {', '.join(TASK_STATUSES)}"
+        )
+
+
+@router.post("/tasks", response_model=CallTaskSchema)
+async def create_call_task(
+    task_create: CallTaskCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Создание задачи по звонку"""
+    _validate_task_fields(task_create.priority, None)
+    task_data = task_create.dict()
+    task_data["created_by"] = current_user.id
+    # Без исполнителя задача попадает в очередь создателя
+    if task_data["assigned_to"] is None:
+        task_data["assigned_to"] = current_user.id
+    
+    task = CallTask(**task_data)
+    db.add(task)
+    db.commit()
+    db.refresh(task)
+    task_reminder_scheduler.schedule(task)
+    
+    return task
+
+
+@router.put("/tasks/{task_id}", response_model=CallTaskSchema)
+async def update_call_task(
+    task_id: int,
+    task_update: CallTaskUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Обновление задачи по звонку"""
+    task = db.query(CallTask).filter(CallTask.id == task_id).first()
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Call task not found"
+        )
+    
+    # Проверяем права доступа
+    if current_user.role != "admin" and current_user.id not in (task.assigned_to, task.created_by):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    update_data = task_update.dict(exclude_unset=True)
+    _validate_task_fields(update_data.get("priority"), update_data.get("status"))
+    for field, value in update_data.items():
+        setattr(task, field, value)
+    # Новый срок - новое напоминание
+    if "due_at" in update_data:
+        task.reminder_sent_at = None
+    if update_data.get("status") == "completed" and task.completed_at is None:
+        task.completed_at = datetime.utcnow()
+
+    db.commit()
+    db.refresh(task)
+    task_reminder_scheduler.schedule(task)
+    
+    return task
+
+
 @router.get("/{call_id}", response_model=CallSchema)
 async def get_call(
     call_id: int,
@@ -123,6 +422,9 @@ async def update_call(
         )
     
     update_data = call_update.dict(exclude_unset=True)
+    if "metadata" in update_data:
+        # metadata зарезервировано в SQLAlchemy - колонка называется call_metadata
+        update_data["call_metadata"] = update_data.pop("metadata")
     
     for field, value in update_data.items():
         setattr(call, field, value)
@@ -164,14 +466,21 @@ async def get_call_transcript(
     return transcript
 
 
-@router.post("/{call_id}/transcript")
+@router.post("/{call_id}/transcript", status_code=status.HTTP_202_ACCEPTED)
 async def create_call_transcript(
     call_id: int,
-    transcript_data: dict,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    language: str = Query("de", min_length=2, max_length=10),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Создание транскрипта звонка"""
+    """Создание транскрипта звонка.
+
+    Тело запроса - запись звонка (audio/wav, audio/mpeg, ...), читается потоком и
+    распознается фрагментами по мере загрузки; либо JSON {"text": ...} с готовым
+    транскриптом. Анализ и сохранение выполняются в фоне.
+    """
     call = db.query(Call).filter(Call.id == call_id).first()
     if not call:
         raise HTTPException(
@@ -186,40 +495,217 @@ async def create_call_transcript(
             detail="Not enough permissions"
         )
     
-    # TODO: Реализовать создание транскрипта
-    # Здесь будет логика обработки аудио и создания транскрипта
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        payload = await request.json()
+        text = payload.get("text") if isinstance(payload, dict) else None
+        if not text or not isinstance(text, str):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="text is required"
+            )
+        job = TranscriptionJob.from_text(call_id, text, payload.get("language") or language)
+    else:
+        try:
+            job = TranscriptionJob(call_id, language, content_type)
+        except (AudioFormatError, SpeechToTextError) as exc:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=str(exc)
+            ) from exc
+        try:
+            async for data in request.stream():
+                await job.feed(data)
+            await job.finish_upload()
+        except RecordingTooLargeError as exc:
+            job.abort()
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=str(exc)
+            ) from exc
+        except AudioFormatError as exc:
+            job.abort()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(exc)
+            ) from exc
+        except SpeechToTextError as exc:
+            job.abort()
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=str(exc)
+            ) from exc
+
+    set_transcription_status(db, call, "processing", started_at=datetime.utcnow().isoformat(), error=None)
+    db.commit()
+    background_tasks.add_task(job.complete)
     
-    return {"message": "Call transcript creation initiated", "call_id": call_id}
+    return {
+        "message": "Call transcript creation initiated",
+        "call_id": call_id,
+        "chunks": job.chunks_submitted,
+        "uploaded_bytes": job.uploaded_bytes,
+    }
 
 
-@router.get("/tasks", response_model=List[CallTaskSchema])
-async def get_call_tasks(
+# Расширения файлов записей по Content-Type
+RECORDING_EXTENSIONS = {
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/wave": "wav",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/mp4": "m4a",
+    "audio/x-m4a": "m4a",
+    "audio/ogg": "ogg",
+    "audio/webm": "webm",
+    "audio/flac": "flac",
+}
+
+
+@router.put("/{call_id}/recording", response_model=CallSchema)
+async def upload_call_recording(
+    call_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Получение списка задач по звонкам"""
-    query = db.query(CallTask)
+    """Загрузка записи звонка.
+
+    Тело запроса - аудиофайл; пишется в хранилище потоком, без чтения в память
+    целиком. Предыдущая запись звонка удаляется.
+    """
+    call = db.query(Call).filter(Call.id == call_id).first()
+    if not call:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Call not found"
+        )
     
-    # Фильтрация по назначенному пользователю
-    if current_user.role != "admin":
-        query = query.filter(CallTask.assigned_to == current_user.id)
+    # Проверяем права доступа
+    if current_user.role != "admin" and call.agent_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
     
-    tasks = query.all()
-    return tasks
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    extension = RECORDING_EXTENSIONS.get(content_type)
+    if extension is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported recording type '{content_type}', expected one of {sorted(RECORDING_EXTENSIONS)}"
+        )
+    
+    key = f"calls/{call_id}/{uuid.uuid4().hex}.{extension}"
+    try:
+        # Неизвестный бэкенд или S3 без бакета - та же ошибка хранилища
+        storage = get_recording_storage()
+        stored = await storage.save_stream(
+            key,
+            request.stream(),
+            content_type,
+            max_bytes=settings.RECORDING_MAX_UPLOAD_MB * 1024 * 1024,
+        )
+    except StorageObjectTooLarge as exc:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Recording exceeds {settings.RECORDING_MAX_UPLOAD_MB} MB"
+        ) from exc
+    except StorageError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(exc)
+        ) from exc
+    
+    metadata = dict(call.call_metadata or {})
+    previous = metadata.get("recording") or {}
+    metadata["recording"] = {
+        "storage": storage.name,
+        "key": stored.key,
+        "size": stored.size,
+        "content_type": stored.content_type,
+        "uploaded_at": datetime.utcnow().isoformat(),
+    }
+    call.call_metadata = metadata
+    call.recording_url = f"{settings.API_V1_STR}/calls/{call_id}/recording"
+    db.commit()
+    db.refresh(call)
+    
+    if previous.get("key") and previous.get("key") != stored.key:
+        try:
+            await get_recording_storage(previous.get("storage")).delete(previous["key"])
+        except StorageError as exc:
+            logger.warning(f"Old recording of call {call_id} was not deleted: {exc}")
+    
+    return call
 
 
-@router.post("/tasks", response_model=CallTaskSchema)
-async def create_call_task(
-    task_data: dict,
+@router.get("/{call_id}/recording")
+async def get_call_recording(
+    call_id: int,
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Создание задачи по звонку"""
-    task_data["created_by"] = current_user.id
+    """Воспроизведение записи звонка.
+
+    Локальное хранилище отдает файл с поддержкой Range (перемотка в плеере);
+    при RECORDING_ACCEL_REDIRECT_PREFIX файл отдает nginx. Для S3 - редирект
+    на presigned URL.
+    """
+    call = db.query(Call).filter(Call.id == call_id).first()
+    if not call:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Call not found"
+        )
     
-    task = CallTask(**task_data)
-    db.add(task)
-    db.commit()
-    db.refresh(task)
+    # Проверяем права доступа
+    if current_user.role != "admin" and call.agent_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
     
-    return task
+    recording = (call.call_metadata or {}).get("recording") or {}
+    if not recording.get("key"):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Call recording not found"
+        )
+    
+    try:
+        storage = get_recording_storage(recording.get("storage"))
+    except StorageError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(exc)
+        ) from exc
+    media_type = recording.get("content_type") or "application/octet-stream"
+    if isinstance(storage, S3RecordingStorage):
+        url = await run_in_threadpool(
+            storage.presigned_url, recording["key"], settings.RECORDING_URL_EXPIRES_SECONDS
+        )
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+    
+    if isinstance(storage, LocalRecordingStorage):
+        if settings.RECORDING_ACCEL_REDIRECT_PREFIX:
+            # Range и sendfile выполняет nginx (internal location над RECORDING_STORAGE_PATH)
+            prefix = settings.RECORDING_ACCEL_REDIRECT_PREFIX.rstrip("/")
+            return Response(
+                media_type=media_type,
+                headers={"X-Accel-Redirect": f"{prefix}/{recording['key']}"},
+            )
+        path = storage.path(recording["key"])
+        if not path.is_file():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Call recording file is missing"
+            )
+        return RangeFileResponse(str(path), request.headers, media_type=media_type)
+    
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Call recording not found"
+    )
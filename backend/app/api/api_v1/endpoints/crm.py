@@ -2,18 +2,33 @@
 API endpoints для CRM интеграций
 """
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
 from app.core.security import require_role
 from app.models.user import User
 from app.models.crm_connection import CRMConnection
+from app.models.crm_record_hash import CRMRecordHash
+from app.models.crm_sync_cursor import CRMSyncCursor
 from app.schemas.crm_connection import CRMConnection as CRMConnectionSchema, CRMConnectionCreate, CRMConnectionUpdate, CRMConnectionList
+from app.services.crm import CRMAdapterError, crm_sync_scheduler, get_adapter, run_connection_sync
+from app.services.crm.mapping import FieldMappingError, compile_field_mapping, invalidate_compiled_mapping
 
 router = APIRouter()
 
 
+def _validate_field_mapping(field_mapping) -> None:
+    """Проверка маппинга полей до сохранения подключения"""
+    try:
+        compile_field_mapping(field_mapping)
+    except FieldMappingError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid field mapping: {exc}"
+        ) from exc
+
+
 @router.get("/connections", response_model=CRMConnectionList)
 async def get_crm_connections(
     db: Session = Depends(get_db),
@@ -32,6 +47,7 @@ async def create_crm_connection(
 ):
     """Создание нового CRM подключения (только для админов)"""
     connection_data = connection_create.dict()
+    _validate_field_mapping(connection_data.get("field_mapping"))
     connection = CRMConnection(**connection_data)
     db.add(connection)
     db.commit()
@@ -73,6 +89,8 @@ async def update_crm_connection(
         )
     
     update_data = connection_update.dict(exclude_unset=True)
+    if "field_mapping" in update_data:
+        _validate_field_mapping(update_data["field_mapping"])
     
     for field, value in update_data.items():
         setattr(connection, field, value)
@@ -80,6 +98,10 @@ async def update_crm_connection(
     db.commit()
     db.refresh(connection)
     
+    # Маппинг изменился - скомпилированная версия будет пересобрана при следующей синхронизации
+    if "field_mapping" in update_data:
+        invalidate_compiled_mapping(connection.id)
+    
     return connection
 
 
@@ -97,8 +119,10 @@ async def delete_crm_connection(
             detail="CRM connection not found"
         )
     
+    db.query(CRMRecordHash).filter(CRMRecordHash.connection_id == connection_id).delete(synchronize_session=False)
     db.delete(connection)
     db.commit()
+    invalidate_compiled_mapping(connection_id)
     
     return {"message": "CRM connection deleted successfully"}
 
@@ -106,6 +130,7 @@ async def delete_crm_connection(
 @router.post("/connections/{connection_id}/sync")
 async def sync_crm_data(
     connection_id: int,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_role("admin"))
 ):
@@ -123,12 +148,31 @@ async def sync_crm_data(
             detail="CRM connection is not active"
         )
     
-    # TODO: Реализовать синхронизацию с CRM
-    # Здесь будет логика синхронизации данных
+    # Проверяем, что для типа CRM есть адаптер и он корректно настроен
+    try:
+        get_adapter(connection).close()
+    except CRMAdapterError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        ) from exc
+    
+    background_tasks.add_task(run_connection_sync, connection_id)
     
     return {"message": "CRM sync initiated", "connection_id": connection_id}
 
 
+@router.post("/sync-all")
+async def sync_all_crm_connections(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(require_role("admin"))
+):
+    """Параллельная синхронизация всех активных подключений (только для админов)"""
+    background_tasks.add_task(crm_sync_scheduler.run_all)
+    
+    return {"message": "CRM sync initiated for all active connections"}
+
+
 @router.get("/connections/{connection_id}/status")
 async def get_crm_connection_status(
     connection_id: int,
@@ -143,8 +187,7 @@ async def get_crm_connection_status(
             detail="CRM connection not found"
         )
     
-    # TODO: Реализовать проверку статуса подключения
-    # Здесь будет логика проверки доступности CRM API
+    cursors = db.query(CRMSyncCursor).filter(CRMSyncCursor.connection_id == connection_id).all()
     
     return {
         "connection_id": connection_id,
@@ -152,5 +195,15 @@ async def get_crm_connection_status(
         "last_sync": connection.last_sync_at,
         "sync_count": connection.sync_count,
         "error_count": connection.error_count,
-        "last_error": connection.last_error
+        "last_error": connection.last_error,
+        "last_sync_stats": (connection.connection_metadata or {}).get("last_sync_stats"),
+        "cursors": [
+            {
+                "object_type": cursor.object_type,
+                "direction": cursor.direction,
+                "high_water_mark": cursor.high_water_mark,
+                "records_synced": cursor.records_synced,
+            }
+            for cursor in cursors
+        ]
     }
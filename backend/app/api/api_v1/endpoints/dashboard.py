@@ -0,0 +1,46 @@
+"""
+API endpoints для главной страницы
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.core.cache import query_cache, track_tables
+from app.core.config import settings
+from app.core.database import get_db
+from app.core.security import get_current_active_user
+from app.models.call import Call, CallTask
+from app.models.lead import Lead
+from app.models.message import Message
+from app.models.user import User
+from app.schemas.dashboard import DashboardSummary
+from app.services.dashboard import dashboard_summary
+
+router = APIRouter()
+
+DASHBOARD_TABLES = (Lead.__tablename__, Message.__tablename__, Call.__tablename__, CallTask.__tablename__)
+track_tables(*DASHBOARD_TABLES)
+
+
+@router.get("/summary", response_model=DashboardSummary)
+async def get_dashboard_summary(
+    user_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Лиды по статусам и скорингу, воронка сообщений, звонки за сегодня и просроченные задачи.
+
+    Не-админы видят только свои данные; админ без user_id - сводку по команде.
+    Ответ кэшируется на DASHBOARD_CACHE_SECONDS и сбрасывается изменением таблиц.
+    """
+    if current_user.role not in ("admin", "analyst"):
+        user_id = current_user.id
+
+    return query_cache.get_or_set(
+        "dashboard:summary",
+        DASHBOARD_TABLES,
+        user_id,
+        lambda: DashboardSummary(**dashboard_summary(db, user_id)).model_dump(mode="json"),
+        ttl_seconds=settings.DASHBOARD_CACHE_SECONDS,
+    )
@@ -1,27 +1,119 @@
 """
 API endpoints для прогнозов
 """
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
 
+from app.core.cache import query_cache, track_tables
 from app.core.database import get_db
 from app.core.security import get_current_active_user, require_role
 from app.models.user import User
 from app.models.forecast import Forecast
-from app.schemas.forecast import Forecast as ForecastSchema, ForecastCreate, ForecastUpdate, ForecastList
+from app.schemas.forecast import Forecast as ForecastSchema, ForecastCreate, ForecastUpdate, ForecastList, ForecastSummary
+from app.services.forecast_evaluation import run_evaluation_job
+from app.services.forecasting import PERIOD_MONTHS, ForecastError, create_pending_forecast, run_backtest, run_forecast_job
+from app.utils.pagination import decode_cursor, encode_cursor
 
 router = APIRouter()
 
+track_tables(Forecast.__tablename__)
+
+# Колонки списка: без JSON разбивок, статус извлекается из метаданных на стороне БД
+SUMMARY_COLUMNS = (
+    Forecast.id,
+    Forecast.period_type,
+    Forecast.period_start,
+    Forecast.period_end,
+    Forecast.predicted_revenue,
+    Forecast.predicted_deals,
+    Forecast.predicted_leads,
+    Forecast.accuracy_score,
+    Forecast.confidence_level,
+    Forecast.actual_revenue,
+    Forecast.actual_deals,
+    Forecast.actual_leads,
+    Forecast.model_name,
+    Forecast.forecast_metadata["status"].as_string().label("status"),
+    Forecast.created_at,
+)
+
+
+def _list_forecasts(
+    db: Session,
+    period_type: Optional[str],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+    limit: int,
+    cursor: Optional[List],
+    include_total: bool = False,
+) -> dict:
+    filters = []
+    if period_type:
+        filters.append(Forecast.period_type == period_type)
+    # Периоды, пересекающиеся с [date_from, date_to)
+    if date_from:
+        filters.append(Forecast.period_end > date_from)
+    if date_to:
+        filters.append(Forecast.period_start < date_to)
+
+    query = db.query(*SUMMARY_COLUMNS).filter(*filters)
+    if cursor is not None:
+        cursor_start, cursor_id = cursor
+        query = query.filter(
+            or_(
+                Forecast.period_start < cursor_start,
+                and_(Forecast.period_start == cursor_start, Forecast.id < cursor_id),
+            )
+        )
+    rows = query.order_by(Forecast.period_start.desc(), Forecast.id.desc()).limit(limit + 1).all()
+
+    items = [ForecastSummary.model_validate(row._mapping) for row in rows[:limit]]
+    next_cursor = encode_cursor([items[-1].period_start, items[-1].id]) if len(rows) > limit else None
+    # count(*) растет с историей прогнозов; keyset курсорам точное число не нужно
+    total = db.query(func.count(Forecast.id)).filter(*filters).scalar() if include_total else None
+    return ForecastList(items=items, total=total, next_cursor=next_cursor).model_dump(mode="json")
+
 
 @router.get("/", response_model=ForecastList)
 async def get_forecasts(
+    period_type: Optional[str] = Query(None),
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(False, description="Посчитать общее число прогнозов по фильтрам"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Получение списка прогнозов"""
-    forecasts = db.query(Forecast).all()
-    return ForecastList(items=forecasts, total=len(forecasts))
+    """Получение списка прогнозов (keyset пагинация по period_start, id)"""
+    if period_type is not None and period_type not in PERIOD_MONTHS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"period_type must be one of: {', '.join(PERIOD_MONTHS)}"
+        )
+
+    decoded_cursor = None
+    if cursor:
+        try:
+            cursor_start, cursor_id = decode_cursor(cursor, 2)
+            decoded_cursor = [datetime.fromisoformat(cursor_start), int(cursor_id)]
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            ) from exc
+
+    # Кэш сбрасывается любым коммитом, изменившим таблицу прогнозов
+    return query_cache.get_or_set(
+        "forecasts:list",
+        (Forecast.__tablename__,),
+        (period_type, date_from, date_to, limit, cursor, include_total),
+        lambda: _list_forecasts(db, period_type, date_from, date_to, limit, decoded_cursor, include_total),
+    )
 
 
 @router.post("/", response_model=ForecastSchema)
@@ -47,6 +139,48 @@ async def create_forecast(
     return forecast
 
 
+@router.get("/backtest")
+async def backtest_forecast_model(
+    period_type: str = Query("monthly"),
+    periods: int = Query(12, ge=1, le=60),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Бэктест модели прогноза на прошлых периодах"""
+    # Только аналитики и админы могут запускать бэктест
+    if current_user.role not in ["analyst", "admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    try:
+        # Скользящий бэктест на numpy - в пуле потоков, чтобы не блокировать event loop
+        return await run_in_threadpool(run_backtest, db, period_type, periods)
+    except ForecastError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        ) from exc
+
+
+@router.post("/evaluate")
+async def evaluate_forecasts(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Расчет фактических значений и точности прогнозов закрытых периодов (в фоне)"""
+    if current_user.role not in ["analyst", "admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions"
+        )
+
+    background_tasks.add_task(run_evaluation_job)
+
+    return {"message": "Forecast evaluation initiated"}
+
+
 @router.get("/{forecast_id}", response_model=ForecastSchema)
 async def get_forecast(
     forecast_id: int,
@@ -120,10 +254,12 @@ async def delete_forecast(
 @router.post("/generate")
 async def generate_forecast(
     period_type: str,
+    background_tasks: BackgroundTasks,
+    period_start: Optional[datetime] = Query(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Генерация нового прогноза с помощью AI"""
+    """Генерация нового прогноза (расчет в фоне)"""
     # Только аналитики и админы могут генерировать прогнозы
     if current_user.role not in ["analyst", "admin"]:
         raise HTTPException(
@@ -131,7 +267,20 @@ async def generate_forecast(
             detail="Not enough permissions"
         )
     
-    # TODO: Реализовать AI генерацию прогноза
-    # Здесь будет вызов AI сервиса для создания прогноза
+    try:
+        forecast = create_pending_forecast(db, period_type, period_start, current_user.id)
+    except ForecastError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        ) from exc
+    
+    background_tasks.add_task(run_forecast_job, forecast.id)
     
-    return {"message": "Forecast generation initiated", "period_type": period_type}
+    return {
+        "message": "Forecast generation initiated",
+        "forecast_id": forecast.id,
+        "period_type": period_type,
+        "period_start": forecast.period_start,
+        "period_end": forecast.period_end,
+    }
@@ -1,12 +1,17 @@
 """
 Instagram integration endpoints
 """
+import json
 from datetime import datetime
-from typing import List, Optional
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.core.database import get_db
 from app.core.security import get_current_active_user
 from app.models.instagram_account import InstagramAccount
@@ -14,17 +19,208 @@ from app.models.lead import Lead
 from app.schemas.instagram import (
     InstagramAccount as InstagramAccountSchema,
     InstagramAccountCreate,
+    InstagramAccountList,
     InstagramAccountUpdate,
     InstagramSyncResponse,
 )
-from app.schemas.lead import LeadSource, LeadStatus
 from app.models.user import User
+from app.services.call_status import verify_hmac_signature
+from app.services.instagram import (
+    InstagramSourceError,
+    InstagramSyncInProgress,
+    InstagramWebhookError,
+    InstagramWebhookQueueFull,
+    group_by_sender,
+    instagram_sync_scheduler,
+    instagram_webhook_debouncer,
+    parse_webhook,
+    run_direct_batch,
+    sync_account,
+)
 
 router = APIRouter()
 
 
-def _get_account(db: Session) -> Optional[InstagramAccount]:
-    return db.query(InstagramAccount).first()
+def _default_account(db: Session) -> Optional[InstagramAccount]:
+    """Первый подключенный аккаунт - для эндпоинтов /account времен одного аккаунта"""
+    return db.query(InstagramAccount).order_by(InstagramAccount.id).first()
+
+
+def _get_account(db: Session, account_id: int) -> InstagramAccount:
+    account = db.query(InstagramAccount).filter(InstagramAccount.id == account_id).first()
+    if not account:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Instagram account not found",
+        )
+    return account
+
+
+def _ensure_unique_business_id(db: Session, business_account_id: Optional[str], account_id: Optional[int] = None) -> None:
+    """Webhook находит аккаунт по business_account_id - он не должен повторяться"""
+    if not business_account_id:
+        return
+    query = db.query(InstagramAccount.id).filter(InstagramAccount.business_account_id == business_account_id)
+    if account_id is not None:
+        query = query.filter(InstagramAccount.id != account_id)
+    if query.first():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Instagram business account is already connected",
+        )
+
+
+def _commit_account(db: Session, account: InstagramAccount) -> None:
+    """Коммит с проверкой уникальности business_account_id на уровне БД (параллельные запросы)"""
+    try:
+        db.commit()
+    except IntegrityError as exc:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Instagram business account is already connected",
+        ) from exc
+    db.refresh(account)
+
+
+def _create_account(db: Session, payload: dict) -> InstagramAccount:
+    now = datetime.utcnow()
+    status_value = "connected" if payload.get("access_token") else "pending"
+    account = InstagramAccount(
+        **payload,
+        status=status_value,
+        connected_at=now if status_value == "connected" else None,
+        updated_at=now,
+    )
+    db.add(account)
+    return account
+
+
+def _apply_update(account: InstagramAccount, payload: dict) -> None:
+    now = datetime.utcnow()
+    for field, value in payload.items():
+        setattr(account, field, value)
+    if payload.get("status") == "connected" and not account.connected_at:
+        account.connected_at = now
+    account.updated_at = now
+
+
+async def _run_sync(db: Session, account: InstagramAccount) -> InstagramSyncResponse:
+    if account.status != "connected":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Instagram account is not connected",
+        )
+
+    try:
+        result = await run_in_threadpool(sync_account, db, account)
+    except InstagramSyncInProgress as exc:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(exc),
+        ) from exc
+    except InstagramSourceError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=str(exc),
+        ) from exc
+
+    created_leads = (
+        db.query(Lead).filter(Lead.id.in_(result.created_ids)).order_by(Lead.id).all()
+        if result.created_ids
+        else []
+    )
+    return InstagramSyncResponse(
+        synced=len(result.created_ids),
+        created_leads=created_leads,
+        duplicates=result.duplicates,
+        linked=result.linked,
+        pages=result.pages,
+        next_cursor=result.next_cursor,
+    )
+
+
+@router.get("/accounts", response_model=InstagramAccountList)
+async def list_accounts(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Список подключенных Instagram аккаунтов"""
+    accounts = db.query(InstagramAccount).order_by(InstagramAccount.id).all()
+    return InstagramAccountList(items=accounts, total=len(accounts))
+
+
+@router.post("/accounts", response_model=InstagramAccountSchema, status_code=status.HTTP_201_CREATED)
+async def create_account(
+    account_data: InstagramAccountCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Подключение еще одного Instagram аккаунта"""
+    payload = account_data.dict(exclude_unset=True)
+    _ensure_unique_business_id(db, payload.get("business_account_id"))
+    account = _create_account(db, payload)
+    _commit_account(db, account)
+    return account
+
+
+@router.post("/accounts/sync-all")
+async def sync_all_accounts(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_active_user),
+):
+    """Параллельная синхронизация всех подключенных аккаунтов в фоне"""
+    background_tasks.add_task(instagram_sync_scheduler.run_all)
+    return {"message": "Instagram sync initiated for all connected accounts"}
+
+
+@router.get("/accounts/{account_id}", response_model=InstagramAccountSchema)
+async def get_account_by_id(
+    account_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Instagram аккаунт по ID; состояние синхронизации - в integration_metadata.sync"""
+    return _get_account(db, account_id)
+
+
+@router.put("/accounts/{account_id}", response_model=InstagramAccountSchema)
+async def update_account_by_id(
+    account_id: int,
+    account_update: InstagramAccountUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Частичное обновление Instagram аккаунта"""
+    account = _get_account(db, account_id)
+    payload = account_update.dict(exclude_unset=True)
+    _ensure_unique_business_id(db, payload.get("business_account_id"), account.id)
+    _apply_update(account, payload)
+    _commit_account(db, account)
+    return account
+
+
+@router.delete("/accounts/{account_id}")
+async def delete_account(
+    account_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Отключение Instagram аккаунта; импортированные лиды остаются"""
+    account = _get_account(db, account_id)
+    db.delete(account)
+    db.commit()
+    return {"message": "Instagram account deleted successfully"}
+
+
+@router.post("/accounts/{account_id}/sync", response_model=InstagramSyncResponse)
+async def sync_account_by_id(
+    account_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """Импорт лидов из Direct одного аккаунта с его сохраненного курсора"""
+    return await _run_sync(db, _get_account(db, account_id))
 
 
 @router.get("/account", response_model=Optional[InstagramAccountSchema])
@@ -32,8 +228,8 @@ async def get_account(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    """Возвращает подключенный Instagram аккаунт (если есть)"""
-    return _get_account(db)
+    """Возвращает первый подключенный Instagram аккаунт (если есть)"""
+    return _default_account(db)
 
 
 @router.post("/account", response_model=InstagramAccountSchema, status_code=status.HTTP_200_OK)
@@ -42,31 +238,23 @@ async def upsert_account(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    """Создание или обновление подключения Instagram"""
-    account = _get_account(db)
-    now = datetime.utcnow()
+    """Создание или обновление первого подключения Instagram"""
+    account = _default_account(db)
     payload = account_data.dict(exclude_unset=True)
-
-    status_value = "connected" if payload.get("access_token") else "pending"
+    _ensure_unique_business_id(db, payload.get("business_account_id"), account.id if account else None)
 
     if account:
+        now = datetime.utcnow()
         for field, value in payload.items():
             setattr(account, field, value)
-        account.status = status_value or account.status
+        account.status = "connected" if payload.get("access_token") else "pending"
         if account.status == "connected":
             account.connected_at = now
         account.updated_at = now
     else:
-        account = InstagramAccount(
-            **payload,
-            status=status_value,
-            connected_at=now if status_value == "connected" else None,
-            updated_at=now,
-        )
-        db.add(account)
+        account = _create_account(db, payload)
 
-    db.commit()
-    db.refresh(account)
+    _commit_account(db, account)
     return account
 
 
@@ -76,8 +264,8 @@ async def update_account(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    """Частичное обновление данных Instagram аккаунта"""
-    account = _get_account(db)
+    """Частичное обновление первого Instagram аккаунта"""
+    account = _default_account(db)
     if not account:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -85,17 +273,9 @@ async def update_account(
         )
 
     payload = account_update.dict(exclude_unset=True)
-    now = datetime.utcnow()
-
-    for field, value in payload.items():
-        setattr(account, field, value)
-
-    if payload.get("status") == "connected" and not account.connected_at:
-        account.connected_at = now
-
-    account.updated_at = now
-    db.commit()
-    db.refresh(account)
+    _ensure_unique_business_id(db, payload.get("business_account_id"), account.id)
+    _apply_update(account, payload)
+    _commit_account(db, account)
     return account
 
 
@@ -104,87 +284,68 @@ async def sync_instagram_leads(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    """Имитация импорта лидов из Instagram DM"""
-    account = _get_account(db)
-    if not account or account.status != "connected":
+    """Импорт лидов из Instagram DM первого аккаунта постранично с сохраненного курсора"""
+    account = _default_account(db)
+    if not account:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Instagram account is not connected",
         )
+    return await _run_sync(db, account)
 
-    now = datetime.utcnow()
-    sample_leads = [
-        {
-            "name": "Ирина Сергеева",
-            "email": "irina.sergeeva@example.com",
-            "phone": "+7 (916) 123-45-67",
-            "notes": "Запрос в Instagram: нужен корпоративный сайт для IT-компании.",
-            "custom_fields": {"requested_service": "Корпоративный сайт", "budget": "≈ 6 000 €"},
-            "tags": ["instagram", "web", "it-services"],
-        },
-        {
-            "name": "DigitalFlow Studio",
-            "email": "ceo@digitalflow.studio",
-            "phone": "+49 151 23456789",
-            "company": "DigitalFlow Studio",
-            "notes": "Хочет обсудить SEO и техническую поддержку корпоративного портала.",
-            "custom_fields": {"requested_service": "SEO + поддержка", "preferred_language": "de"},
-            "tags": ["instagram", "seo"],
-        },
-        {
-            "name": "Артем Ковалев",
-            "email": "artem.kovalev@example.com",
-            "phone": "+7 (903) 555-12-90",
-            "notes": "Написал в Direct: требуются услуги интеграции CRM и разработка чат-бота.",
-            "custom_fields": {"requested_service": "CRM + чат-бот", "priority": "high"},
-            "tags": ["instagram", "automation"],
-        },
-    ]
-
-    created_leads: List[Lead] = []
-
-    for item in sample_leads:
-        # Проверяем дубликаты по email
-        email = item.get("email")
-        if email:
-            duplicate = db.query(Lead).filter(Lead.email == email).first()
-            if duplicate:
-                continue
-
-        lead = Lead(
-            name=item["name"],
-            email=email,
-            phone=item.get("phone"),
-            company=item.get("company"),
-            status=LeadStatus.NEW.value,
-            source=LeadSource.SOCIAL.value,
-            source_data={
-                "platform": "instagram",
-                "username": account.username,
-                "synced_at": now.isoformat(),
-            },
-            tags=item.get("tags"),
-            custom_fields=item.get("custom_fields"),
-            notes=item.get("notes"),
-        )
-        db.add(lead)
-        created_leads.append(lead)
 
-    if not created_leads:
-        return InstagramSyncResponse(synced=0, created_leads=[])
+@router.get("/webhook", response_class=PlainTextResponse)
+async def verify_instagram_webhook(
+    mode: str = Query(..., alias="hub.mode"),
+    verify_token: str = Query(..., alias="hub.verify_token"),
+    challenge: str = Query(..., alias="hub.challenge"),
+):
+    """Подтверждение подписки webhook: Meta ожидает hub.challenge в ответ"""
+    if not settings.INSTAGRAM_WEBHOOK_VERIFY_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Instagram webhook is not configured",
+        )
+    if mode != "subscribe" or verify_token != settings.INSTAGRAM_WEBHOOK_VERIFY_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid verify token",
+        )
+    return PlainTextResponse(challenge)
 
-    account.last_sync_at = now
-    integration_metadata = account.integration_metadata or {}
-    integration_metadata["sync_count"] = integration_metadata.get("sync_count", 0) + 1
-    account.integration_metadata = integration_metadata
-    account.updated_at = now
 
-    db.commit()
+@router.post("/webhook", status_code=status.HTTP_200_OK)
+async def instagram_webhook(request: Request):
+    """Входящие сообщения Direct: проверка подписи и постановка в корзину отправителя"""
+    if not settings.INSTAGRAM_APP_SECRET:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Instagram webhook is not configured",
+        )
+    body = await request.body()
+    if not verify_hmac_signature(settings.INSTAGRAM_APP_SECRET, body, request.headers.get("X-Hub-Signature-256")):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid webhook signature",
+        )
+    try:
+        messages = parse_webhook(json.loads(body))
+    except (ValueError, InstagramWebhookError) as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc),
+        ) from exc
 
-    for lead in created_leads:
-        db.refresh(lead)
+    if instagram_webhook_debouncer.running:
+        try:
+            instagram_webhook_debouncer.submit(messages)
+        except InstagramWebhookQueueFull as exc:
+            # Meta повторит доставку
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(exc),
+            ) from exc
+    elif messages:
+        await run_in_threadpool(run_direct_batch, group_by_sender(messages))
 
-    return InstagramSyncResponse(
-        synced=len(created_leads),
-        created_leads=created_leads,
-    )
+    return Response(status_code=status.HTTP_200_OK)
@@ -4,21 +4,30 @@ API endpoints для лидов
 from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import or_
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response, status
+from sqlalchemy import and_, or_, select
 from sqlalchemy.orm import Session
 
 from app.core.database import get_db
 from app.core.security import get_current_active_user, require_role
 from app.models.lead import Lead
+from app.models.lead_duplicate import LeadDuplicateCandidate
 from app.models.lead_interaction import LeadInteraction, InteractionAuthor as ModelInteractionAuthor
 from app.models.user import User
 from app.schemas.lead import Lead as LeadSchema, LeadCreate, LeadList, LeadUpdate
+from app.schemas.lead_duplicate import (
+    LeadDuplicateCandidate as LeadDuplicateCandidateSchema,
+    LeadDuplicateList,
+    LeadMergeRequest,
+    LeadMergeResult,
+)
 from app.schemas.lead_interaction import (
     InteractionAuthor,
     LeadInteraction as LeadInteractionSchema,
     LeadInteractionCreate,
 )
+from app.services.dedup import merge_leads, run_dedup_scan
+from app.utils.pagination import decode_cursor, encode_cursor
 
 router = APIRouter()
 
@@ -103,6 +112,87 @@ async def create_lead(
     return lead
 
 
+def _with_summaries(db: Session, candidates: List[LeadDuplicateCandidate]) -> List[LeadDuplicateCandidateSchema]:
+    """Пары с краткими данными обоих лидов - один запрос IN на страницу"""
+    lead_ids = {lead_id for candidate in candidates for lead_id in (candidate.lead_id, candidate.duplicate_id)}
+    leads = {lead.id: lead for lead in db.query(Lead).filter(Lead.id.in_(lead_ids)).all()} if lead_ids else {}
+    return [
+        LeadDuplicateCandidateSchema.model_validate(candidate).model_copy(
+            update={"lead": leads.get(candidate.lead_id), "duplicate": leads.get(candidate.duplicate_id)}
+        )
+        for candidate in candidates
+    ]
+
+
+@router.get("/duplicates", response_model=LeadDuplicateList)
+async def get_duplicate_candidates(
+    status_filter: str = Query("open", alias="status", pattern="^(open|dismissed)$"),
+    min_score: Optional[float] = Query(None, ge=0, le=1),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role("admin"))
+):
+    """Пары похожих лидов от самых похожих (только для админов)"""
+    query = db.query(LeadDuplicateCandidate).filter(LeadDuplicateCandidate.status == status_filter)
+    if min_score is not None:
+        query = query.filter(LeadDuplicateCandidate.score >= min_score)
+    if cursor:
+        try:
+            score, candidate_id = decode_cursor(cursor, 2)
+            score, candidate_id = float(score), int(candidate_id)
+        except (TypeError, ValueError) as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor",
+            ) from exc
+        query = query.filter(
+            or_(
+                LeadDuplicateCandidate.score < score,
+                and_(LeadDuplicateCandidate.score == score, LeadDuplicateCandidate.id < candidate_id),
+            )
+        )
+    rows = (
+        query.order_by(LeadDuplicateCandidate.score.desc(), LeadDuplicateCandidate.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    candidates = rows[:limit]
+    next_cursor = (
+        encode_cursor([candidates[-1].score, candidates[-1].id]) if len(rows) > limit else None
+    )
+    return LeadDuplicateList(items=_with_summaries(db, candidates), next_cursor=next_cursor)
+
+
+@router.post("/duplicates/scan")
+async def scan_duplicates(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(require_role("admin"))
+):
+    """Полный поиск дубликатов по всем лидам в фоне (только для админов)"""
+    background_tasks.add_task(run_dedup_scan)
+    return {"message": "Duplicate scan initiated"}
+
+
+@router.post("/duplicates/{candidate_id}/dismiss", response_model=LeadDuplicateCandidateSchema)
+async def dismiss_duplicate_candidate(
+    candidate_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role("admin"))
+):
+    """Пара - не дубликат: повторные проходы ее не вернут (только для админов)"""
+    candidate = db.query(LeadDuplicateCandidate).filter(LeadDuplicateCandidate.id == candidate_id).first()
+    if not candidate:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Duplicate candidate not found"
+        )
+    candidate.status = "dismissed"
+    db.commit()
+    db.refresh(candidate)
+    return _with_summaries(db, [candidate])[0]
+
+
 @router.get("/{lead_id}", response_model=LeadSchema)
 async def get_lead(
     lead_id: int,
@@ -184,13 +274,89 @@ async def delete_lead(
     return {"message": "Lead deleted successfully"}
 
 
+@router.post("/{lead_id}/merge", response_model=LeadMergeResult)
+async def merge_lead(
+    lead_id: int,
+    merge_request: LeadMergeRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_role("admin"))
+):
+    """Слияние дубликата в лид: сообщения, звонки и история переносятся, дубликат удаляется (только для админов)"""
+    if merge_request.duplicate_id == lead_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot merge a lead into itself"
+        )
+    leads = {lead.id: lead for lead in db.query(Lead).filter(Lead.id.in_([lead_id, merge_request.duplicate_id])).all()}
+    if len(leads) != 2:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Lead not found"
+        )
+
+    moved = merge_leads(db, leads[lead_id], leads[merge_request.duplicate_id])
+    db.commit()
+    lead = leads[lead_id]
+    db.refresh(lead)
+    return LeadMergeResult(lead=lead, moved=moved)
+
+
+def _interaction_anchor(db: Session, cursor: str, lead_id: int):
+    """(created_at, id) строки курсора подзапросом: сравнение идет значениями из БД.
+
+    Строка курсора должна существовать и принадлежать лиду: иначе подзапрос
+    вернул бы NULL, и страница молча оказалась бы пустой.
+    """
+    try:
+        (interaction_id,) = decode_cursor(cursor, 1)
+        interaction_id = int(interaction_id)
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        ) from exc
+    anchor = (
+        db.query(LeadInteraction.id)
+        .filter(LeadInteraction.id == interaction_id, LeadInteraction.lead_id == lead_id)
+        .first()
+    )
+    if anchor is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    created_at = (
+        select(LeadInteraction.created_at)
+        .where(LeadInteraction.id == interaction_id, LeadInteraction.lead_id == lead_id)
+        .scalar_subquery()
+    )
+    return created_at, interaction_id
+
+
 @router.get("/{lead_id}/interactions", response_model=List[LeadInteractionSchema])
 async def get_lead_interactions(
     lead_id: int,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = Query(None, description="Курсор: более старые записи"),
+    after: Optional[str] = Query(None, description="Курсор: записи новее (с последней просмотренной)"),
+    since_id: Optional[int] = Query(None, ge=0, description="Только новые строки с id больше указанного"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user),
 ):
-    """Получение истории взаимодействий с лидом"""
+    """Получение истории взаимодействий с лидом.
+
+    Страница - в хронологическом порядке; без курсора - последние limit записей.
+    Курсоры следующих страниц - в заголовках X-Older-Cursor (есть более старые
+    записи) и X-Newer-Cursor (последняя запись страницы). since_id - легкий
+    режим для живой ленты: только строки, добавленные после указанного id.
+    """
+    if sum(value is not None for value in (before, after, since_id)) > 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use only one of before, after, since_id",
+        )
+
     lead = db.query(Lead).filter(Lead.id == lead_id).first()
     if not lead:
         raise HTTPException(
@@ -204,12 +370,57 @@ async def get_lead_interactions(
             detail="Not enough permissions",
         )
 
-    interactions = (
-        db.query(LeadInteraction)
-        .filter(LeadInteraction.lead_id == lead_id)
-        .order_by(LeadInteraction.created_at.asc())
+    query = db.query(LeadInteraction).filter(LeadInteraction.lead_id == lead_id)
+    if since_id is not None:
+        # id растет с каждой вставкой - хвост читается по первичному ключу
+        interactions = (
+            query.filter(LeadInteraction.id > since_id)
+            .order_by(LeadInteraction.id.asc())
+            .limit(limit)
+            .all()
+        )
+        if interactions:
+            response.headers["X-Newer-Cursor"] = encode_cursor([interactions[-1].id])
+        return interactions
+
+    if after is not None:
+        created_at, interaction_id = _interaction_anchor(db, after, lead_id)
+        rows = (
+            query.filter(
+                or_(
+                    LeadInteraction.created_at > created_at,
+                    and_(LeadInteraction.created_at == created_at, LeadInteraction.id > interaction_id),
+                )
+            )
+            .order_by(LeadInteraction.created_at.asc(), LeadInteraction.id.asc())
+            .limit(limit + 1)
+            .all()
+        )
+        interactions = rows[:limit]
+        if interactions:
+            response.headers["X-Older-Cursor"] = encode_cursor([interactions[0].id])
+        response.headers["X-Newer-Cursor"] = encode_cursor([interactions[-1].id]) if interactions else after
+        response.headers["X-Has-Newer"] = "true" if len(rows) > limit else "false"
+        return interactions
+
+    if before is not None:
+        created_at, interaction_id = _interaction_anchor(db, before, lead_id)
+        query = query.filter(
+            or_(
+                LeadInteraction.created_at < created_at,
+                and_(LeadInteraction.created_at == created_at, LeadInteraction.id < interaction_id),
+            )
+        )
+    rows = (
+        query.order_by(LeadInteraction.created_at.desc(), LeadInteraction.id.desc())
+        .limit(limit + 1)
         .all()
     )
+    interactions = list(reversed(rows[:limit]))
+    if len(rows) > limit:
+        response.headers["X-Older-Cursor"] = encode_cursor([interactions[0].id])
+    if interactions:
+        response.headers["X-Newer-Cursor"] = encode_cursor([interactions[-1].id])
     return interactions
 
 
@@ -124,6 +124,9 @@ async def update_message(
     
     # Обновляем данные
     update_data = message_update.dict(exclude_unset=True)
+    if "metadata" in update_data:
+        # metadata зарезервировано в SQLAlchemy - колонка называется message_metadata
+        update_data["message_metadata"] = update_data.pop("metadata")
     
     for field, value in update_data.items():
         setattr(message, field, value)
@@ -0,0 +1,116 @@
+"""
+WebSocket лента изменений лидов
+"""
+import asyncio
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.security import verify_token
+from app.models.lead import Lead
+from app.models.user import User
+from app.services.realtime import RealtimeSubscription, realtime_hub
+
+router = APIRouter()
+
+
+def _load_user(token: str) -> Optional[User]:
+    user_id = verify_token(token)
+    if user_id is None:
+        return None
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        return user if user is not None and user.is_active else None
+    finally:
+        db.close()
+
+
+def _lead_access_error(user: User, lead_id: int) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        assigned_to = db.query(Lead.assigned_to).filter(Lead.id == lead_id).first()
+    finally:
+        db.close()
+    if assigned_to is None:
+        return "Lead not found"
+    if user.role != "admin" and assigned_to[0] != user.id:
+        return "Not enough permissions"
+    return None
+
+
+async def _handle_command(websocket: WebSocket, user: User, subscription: RealtimeSubscription, command: Any) -> None:
+    action = command.get("action") if isinstance(command, dict) else None
+    if action not in ("subscribe", "unsubscribe"):
+        await websocket.send_json({"type": "error", "detail": "action must be subscribe or unsubscribe"})
+        return
+
+    if command.get("scope") == "my_leads":
+        realtime_hub.set_my_leads(subscription, action == "subscribe")
+        await websocket.send_json({"type": f"{action}d", "scope": "my_leads"})
+        return
+
+    lead_id = command.get("lead_id")
+    if not isinstance(lead_id, int):
+        await websocket.send_json({"type": "error", "detail": "lead_id or scope=my_leads is required"})
+        return
+    if action == "unsubscribe":
+        realtime_hub.unsubscribe_lead(subscription, lead_id)
+    else:
+        error = await run_in_threadpool(_lead_access_error, user, lead_id)
+        if error:
+            await websocket.send_json({"type": "error", "lead_id": lead_id, "detail": error})
+            return
+        realtime_hub.subscribe_lead(subscription, lead_id)
+    await websocket.send_json({"type": f"{action}d", "lead_id": lead_id})
+
+
+async def _receive_commands(websocket: WebSocket, user: User, subscription: RealtimeSubscription) -> None:
+    while True:
+        try:
+            command: Dict[str, Any] = await websocket.receive_json()
+        except ValueError:
+            await websocket.send_json({"type": "error", "detail": "Invalid JSON"})
+            continue
+        await _handle_command(websocket, user, subscription, command)
+
+
+async def _send_events(websocket: WebSocket, subscription: RealtimeSubscription) -> None:
+    while True:
+        await websocket.send_json(await subscription.queue.get())
+
+
+@router.websocket("/ws")
+async def realtime_feed(websocket: WebSocket, token: str = Query(...)):
+    """Лента событий лидов.
+
+    Токен доступа передается параметром token (браузер не задает заголовки
+    WebSocket). Команды клиента: {"action": "subscribe"|"unsubscribe",
+    "lead_id": N} или {"action": ..., "scope": "my_leads"}. Сервер присылает
+    {"type": "event", "event": {...}} с событием outbox; {"type": "resync"} -
+    клиент отстал и должен перечитать данные.
+    """
+    user = await run_in_threadpool(_load_user, token)
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscription = RealtimeSubscription(user.id, asyncio.get_running_loop(), settings.REALTIME_QUEUE_SIZE)
+    tasks = [
+        asyncio.create_task(_receive_commands(websocket, user, subscription)),
+        asyncio.create_task(_send_events(websocket, subscription)),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            exc = task.exception()
+            if exc is not None and not isinstance(exc, WebSocketDisconnect):
+                raise exc
+    finally:
+        for task in tasks:
+            task.cancel()
+        realtime_hub.remove(subscription)
@@ -0,0 +1,98 @@
+"""
+API endpoints для callback телефонии
+"""
+import json
+from typing import List
+from urllib.parse import parse_qsl
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.call_status import (
+    CallStatusEvent,
+    CallStatusEventError,
+    CallStatusQueueFull,
+    call_status_ingestor,
+    coalesce,
+    parse_generic_event,
+    parse_twilio_event,
+    run_status_batch,
+    verify_hmac_signature,
+    verify_twilio_signature,
+)
+
+router = APIRouter()
+
+
+def _twilio_events(request: Request, body: bytes) -> List[CallStatusEvent]:
+    if not settings.TWILIO_AUTH_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Twilio webhook is not configured"
+        )
+    params = dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+    # За прокси Twilio подписывает публичный URL, а не внутренний
+    url = str(request.url)
+    if settings.TELEPHONY_WEBHOOK_BASE_URL:
+        url = settings.TELEPHONY_WEBHOOK_BASE_URL.rstrip("/") + request.url.path
+        if request.url.query:
+            url += f"?{request.url.query}"
+    if not verify_twilio_signature(settings.TWILIO_AUTH_TOKEN, url, params, request.headers.get("X-Twilio-Signature")):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid webhook signature"
+        )
+    return [parse_twilio_event(params)]
+
+
+def _generic_events(request: Request, body: bytes) -> List[CallStatusEvent]:
+    if not settings.TELEPHONY_WEBHOOK_SECRET:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Telephony webhook is not configured"
+        )
+    if not verify_hmac_signature(settings.TELEPHONY_WEBHOOK_SECRET, body, request.headers.get("X-Telephony-Signature")):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid webhook signature"
+        )
+    try:
+        data = json.loads(body)
+    except ValueError as exc:
+        raise CallStatusEventError("Body must be JSON") from exc
+    # Одно событие или пачка {"events": [...]}
+    items = data.get("events") if isinstance(data, dict) and "events" in data else [data]
+    if not isinstance(items, list):
+        raise CallStatusEventError("events must be a list")
+    return [parse_generic_event(item) for item in items]
+
+
+@router.post("/webhooks/{provider}/status", status_code=status.HTTP_204_NO_CONTENT)
+async def call_status_webhook(
+    provider: str,
+    request: Request
+):
+    """Callback статуса звонка: проверка подписи и постановка в очередь пакетного применения"""
+    body = await request.body()
+    try:
+        events = _twilio_events(request, body) if provider == "twilio" else _generic_events(request, body)
+    except CallStatusEventError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(exc)
+        ) from exc
+
+    if call_status_ingestor.running:
+        try:
+            call_status_ingestor.submit(events)
+        except CallStatusQueueFull as exc:
+            # Провайдер повторит callback
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(exc)
+            ) from exc
+    else:
+        await run_in_threadpool(run_status_batch, coalesce(events))
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,140 @@
+"""
+Кэш результатов запросов с инвалидацией по версии таблиц
+
+Каждая отслеживаемая таблица имеет счетчик версии (Redis, при отсутствии -
+память процесса). Коммит сессии, изменившей строки таблицы, увеличивает
+счетчик; ключ кэша включает версии таблиц, поэтому устаревшие записи
+просто перестают совпадать и вытесняются LRU.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+import redis
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.database import redis_client
+
+
+class TableVersions:
+    """Счетчики версий таблиц: Redis INCR, при недоступности Redis - локальные"""
+
+    def __init__(self, redis_conn: Optional["redis.Redis"] = None):
+        self.redis = redis_conn
+        self._local: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        tables = tuple(tables)
+        if self.redis is not None:
+            try:
+                return tuple(int(value or 0) for value in self.redis.mget([f"table_version:{t}" for t in tables]))
+            except redis.RedisError as exc:
+                logger.warning(f"Table versions fallback to local counters: {exc}")
+        with self._lock:
+            return tuple(self._local.get(table, 0) for table in tables)
+
+    def bump(self, tables: Iterable[str]) -> None:
+        tables = tuple(tables)
+        # Локальный счетчик увеличивается всегда - на случай перехода на fallback
+        with self._lock:
+            for table in tables:
+                self._local[table] = self._local.get(table, 0) + 1
+        if self.redis is not None:
+            try:
+                pipeline = self.redis.pipeline()
+                for table in tables:
+                    pipeline.incr(f"table_version:{table}")
+                pipeline.execute()
+            except redis.RedisError as exc:
+                logger.warning(f"Failed to bump table versions {tables}: {exc}")
+
+
+class QueryCache:
+    """LRU кэш в памяти процесса; ключ = (namespace, версии таблиц, параметры)"""
+
+    def __init__(self, versions: TableVersions, max_entries: int = 512, ttl_seconds: float = 300):
+        self.versions = versions
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_set(
+        self,
+        namespace: str,
+        tables: Iterable[str],
+        params: Hashable,
+        loader: Callable[[], Any],
+        ttl_seconds: Optional[float] = None,
+    ) -> Any:
+        """ttl_seconds - срок записи вместо общего (короткий для часто меняющихся сводок)"""
+        key = (namespace, self.versions.get(tables), params)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = loader()
+        with self._lock:
+            self._entries[key] = (now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+table_versions = TableVersions(redis_client)
+query_cache = QueryCache(table_versions)
+
+# Таблицы, версии которых отслеживаются по коммитам сессий
+_tracked_tables: Set[str] = set()
+
+
+def track_tables(*tables: str) -> None:
+    """Включение отслеживания версий для таблиц"""
+    _tracked_tables.update(tables)
+
+
+def _mark(session: Session, tables: Iterable[str]) -> None:
+    changed = {table for table in tables if table in _tracked_tables}
+    if changed:
+        session.info.setdefault("changed_tables", set()).update(changed)
+
+
+@event.listens_for(Session, "after_flush")
+def _capture_changed_tables(session: Session, flush_context) -> None:
+    _mark(
+        session,
+        (obj.__table__.name for obj in (*session.new, *session.dirty, *session.deleted) if hasattr(obj, "__table__")),
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _capture_bulk_changes(orm_execute_state) -> None:
+    # Массовые update()/delete() через ORM не проходят через flush
+    if (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert) and (
+        orm_execute_state.bind_mapper is not None
+    ):
+        _mark(orm_execute_state.session, (orm_execute_state.bind_mapper.local_table.name,))
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_changed_tables(session: Session) -> None:
+    changed = session.info.pop("changed_tables", None)
+    if changed:
+        table_versions.bump(sorted(changed))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_tables(session: Session) -> None:
+    session.info.pop("changed_tables", None)
@@ -1,7 +1,7 @@
 """
 Конфигурация приложения
 """
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 from pydantic import AnyHttpUrl, field_validator
 from pydantic_settings import BaseSettings
 import secrets
@@ -31,17 +31,103 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: Optional[str] = ""
     OPENAI_MODEL: str = "gpt-4"
     OPENAI_MAX_TOKENS: int = 2000
+    CALL_ANALYSIS_MAX_CHARS: int = 24000  # длинные транскрипты обрезаются до начала и конца
+    CALL_ANALYSIS_BATCH_TOKENS: int = 6000  # бюджет транскриптов на один запрос пакетного анализа
+    CALL_ANALYSIS_BATCH_MAX_ITEMS: int = 8
+    CALL_ANALYSIS_CONCURRENCY: int = 4
+
+    # Транскрибация звонков
+    STT_BACKEND: str = "openai"  # openai, fake
+    STT_MODEL: str = "whisper-1"
+    STT_MAX_ATTEMPTS: int = 3
+    TRANSCRIPTION_CHUNK_SECONDS: float = 60.0  # WAV режется по времени
+    TRANSCRIPTION_CHUNK_OVERLAP_SECONDS: float = 1.0
+    TRANSCRIPTION_CHUNK_BYTES: int = 1_000_000  # MP3 режется по байтам
+    TRANSCRIPTION_SINGLE_FILE_MAX_MB: int = 25  # ogg/webm/mp4/flac не режутся: лимит файла STT
+    TRANSCRIPTION_CONCURRENCY: int = 4  # фрагментов одной записи в работе одновременно
+    TRANSCRIPTION_WORKERS: int = 8  # общий пул потоков STT
+    TRANSCRIPTION_MAX_UPLOAD_MB: int = 500
+
+    # Задачи по звонкам
+    CALL_TASK_REMINDER_TICK_SECONDS: float = 1.0  # тик колеса напоминаний, 0 - напоминания отключены
+    CALL_TASK_REMINDER_REFRESH_SECONDS: int = 60  # загрузка окна ближайших сроков из БД
+    CALL_TASK_REMINDER_LEAD_SECONDS: int = 300  # за сколько до срока напоминать
     
     # CRM интеграции
     HUBSPOT_API_KEY: Optional[str] = None
     PIPEDRIVE_API_KEY: Optional[str] = None
     SALESFORCE_CLIENT_ID: Optional[str] = None
     SALESFORCE_CLIENT_SECRET: Optional[str] = None
+    CRM_SYNC_PAGE_SIZE: int = 100
+    CRM_SYNC_INTERVAL_SECONDS: int = 0  # 0 - периодическая синхронизация отключена
+    CRM_SYNC_DEFAULT_CONCURRENCY: int = 2  # параллельных синхронизаций на провайдера
+    CRM_SYNC_PROVIDER_CONCURRENCY: Dict[str, int] = {}  # {"hubspot": 4}
+    CRM_SYNC_MAX_RETRIES: int = 5
+    CRM_SYNC_RETRY_BASE_DELAY: float = 1.0
+    CRM_SYNC_RETRY_MAX_DELAY: float = 60.0
+    
+    # Outbox (лента изменений лидов, сообщений и звонков)
+    OUTBOX_RELAY_ENABLED: bool = True
+    OUTBOX_BATCH_SIZE: int = 200
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 5.0  # опрос для изменений из других процессов
+    OUTBOX_GAP_TIMEOUT_SECONDS: float = 2.0  # ожидание незакоммиченной транзакции с меньшим ID
+    OUTBOX_PRUNE_INTERVAL_SECONDS: float = 3600.0
+    OUTBOX_WEBHOOK_URLS: List[str] = []
+    OUTBOX_WEBHOOK_SECRET: Optional[str] = None
+    OUTBOX_CRM_PUSH_ENABLED: bool = True
+
+    # Лента реального времени (WebSocket); при REDIS_URL - рассылка через Redis pub/sub между воркерами
+    REALTIME_ENABLED: bool = True
+    REALTIME_REDIS_CHANNEL: str = "realtime:lead_events"
+    REALTIME_QUEUE_SIZE: int = 500  # очередь соединения; при переполнении клиент получает resync
+
+    # Сводка главной страницы: кэш на пользователя
+    DASHBOARD_CACHE_SECONDS: float = 10.0
+    
+    # Прогнозы
+    FORECAST_HISTORY_DAYS: int = 1095  # глубина истории для моделей
+    FORECAST_CONVERSION_WINDOW_DAYS: int = 180
+    FORECAST_DEFAULT_DEAL_VALUE: float = 5000.0  # если в CRM нет сумм сделок
+    FORECAST_BACKTEST_PERIODS: int = 12  # прошлых периодов в бэктесте при расчете прогноза, 0 - отключить
+    FORECAST_EVALUATION_INTERVAL_SECONDS: int = 3600  # проверка закрытых периодов, 0 - отключить
     
     # Телефония
     TWILIO_ACCOUNT_SID: Optional[str] = None
     TWILIO_AUTH_TOKEN: Optional[str] = None
     TWILIO_PHONE_NUMBER: Optional[str] = None
+    TELEPHONY_WEBHOOK_SECRET: Optional[str] = None  # HMAC-SHA256 подпись callback остальных провайдеров
+    TELEPHONY_WEBHOOK_BASE_URL: Optional[str] = None  # публичный URL API для проверки подписи Twilio за прокси
+    CALL_STATUS_FLUSH_SECONDS: float = 0.2  # сброс очереди статусов, 0 - применять в запросе
+    CALL_STATUS_BATCH_SIZE: int = 1000  # звонков в очереди для досрочного сброса
+    CALL_STATUS_MAX_PENDING: int = 50000
+    CALL_STATUS_MAX_ATTEMPTS: int = 5  # сбросов с ошибкой, после которых событие отбрасывается
+    PHONE_DEFAULT_COUNTRY_CODE: str = "49"  # код страны для номеров без международного префикса
+    PHONE_BACKFILL_ON_STARTUP: bool = True  # заполнить leads.phone_e164 у старых лидов при старте
+    PHONE_BACKFILL_BATCH_SIZE: int = 1000
+
+    # Поиск дубликатов лидов: сравнение только внутри блоков с общим ключом
+    DEDUP_ENABLED: bool = True  # инкрементальный поиск для новых и измененных лидов через outbox
+    DEDUP_MIN_SCORE: float = 0.8  # порог сходства пары (0-1)
+    DEDUP_MAX_BLOCK_SIZE: int = 200  # более крупные блоки (общий префикс, хостинг) пропускаются
+    DEDUP_COMPANY_PREFIX_LENGTH: int = 8
+    DEDUP_BATCH_SIZE: int = 1000  # лидов и блоков на пачку полного прохода
+
+    # Instagram
+    INSTAGRAM_SAMPLE_DATA: bool = True  # демо-контакты вместо Graph API
+    INSTAGRAM_GRAPH_API_URL: str = "https://graph.facebook.com/v19.0"
+    INSTAGRAM_SYNC_PAGE_SIZE: int = 50  # диалогов на страницу импорта
+    INSTAGRAM_SYNC_MAX_PAGES: int = 20  # страниц за один запуск синхронизации
+    INSTAGRAM_SYNC_INTERVAL_SECONDS: int = 0  # 0 - периодическая синхронизация отключена
+    INSTAGRAM_SYNC_CONCURRENCY: int = 4  # аккаунтов синхронизируется одновременно
+    INSTAGRAM_ACCOUNT_REQUESTS_PER_MINUTE: float = 60.0  # бюджет запросов Graph API на аккаунт
+    INSTAGRAM_HTTP_MAX_CONNECTIONS: int = 20  # общий пул соединений к Graph API
+    INSTAGRAM_APP_SECRET: Optional[str] = None  # подпись X-Hub-Signature-256 webhook
+    INSTAGRAM_WEBHOOK_VERIFY_TOKEN: Optional[str] = None  # hub.verify_token при подписке webhook
+    INSTAGRAM_WEBHOOK_TICK_SECONDS: float = 1.0  # проверка закрытых корзин, 0 - применять в запросе
+    INSTAGRAM_WEBHOOK_DEBOUNCE_SECONDS: float = 5.0  # тишина отправителя, закрывающая корзину
+    INSTAGRAM_WEBHOOK_MAX_WAIT_SECONDS: float = 30.0  # предел ожидания для непрерывной переписки
+    INSTAGRAM_WEBHOOK_MAX_PENDING: int = 20000
+    INSTAGRAM_WEBHOOK_MAX_ATTEMPTS: int = 5  # сбросов с ошибкой, после которых корзина отбрасывается
     
     # Email
     SMTP_HOST: Optional[str] = None
@@ -54,6 +140,12 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: Optional[str] = None
     AWS_BUCKET_NAME: Optional[str] = None
     AWS_REGION: str = "eu-central-1"
+    AWS_ENDPOINT_URL: Optional[str] = None  # S3-совместимое хранилище (MinIO и т.д.)
+    RECORDING_STORAGE_BACKEND: str = "local"  # local, s3
+    RECORDING_STORAGE_PATH: str = "./data/recordings"
+    RECORDING_MAX_UPLOAD_MB: int = 500
+    RECORDING_URL_EXPIRES_SECONDS: int = 3600  # срок presigned URL для S3
+    RECORDING_ACCEL_REDIRECT_PREFIX: Optional[str] = None  # internal location nginx: файл отдает nginx через sendfile
     
     # Мониторинг
     SENTRY_DSN: Optional[str] = None
@@ -63,6 +155,10 @@ class Settings(BaseSettings):
     MAX_LEADS_PER_USER: int = 10000
     MAX_MESSAGES_PER_DAY: int = 1000
     RATE_LIMIT_PER_MINUTE: int = 60
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_WRITE_COST: int = 2  # стоимость POST/PUT/DELETE в единицах бюджета
+    RATE_LIMIT_AI_COST: int = 5  # стоимость запросов к /ai
+    RATE_LIMIT_REDIS_TIMEOUT_SECONDS: float = 0.1  # дольше - запрос считается локальным token bucket
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,202 @@
+"""
+Ограничение частоты запросов (rate limiting)
+
+Бюджет считается отдельно для каждого пользователя (или IP для анонимных
+запросов) и каждого класса маршрутов. Запросы к AI стоят дороже чтения,
+поэтому один интеграционный клиент не может занять весь /ai/chat и БД.
+
+Проверка выполняется в middleware на каждом запросе, поэтому Redis
+вызывается асинхронным клиентом с коротким таймаутом: медленный или
+недоступный Redis не блокирует event loop, а запрос считается локально.
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import redis
+from fastapi import Request
+from redis import asyncio as aioredis
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import redis_client
+from app.core.security import verify_token
+
+WINDOW_SECONDS = 60
+# После ошибки Redis запросы считаются локально, пока не пройдет пауза (таймаут не платится на каждом запросе)
+REDIS_RETRY_SECONDS = 5.0
+
+# Пути, которые не лимитируются (служебные)
+# Callback телефонии и webhook Instagram защищены подписью и приходят пачками с IP провайдера
+EXEMPT_PATHS = (
+    "/health",
+    "/docs",
+    "/redoc",
+    f"{settings.API_V1_STR}/openapi.json",
+    f"{settings.API_V1_STR}/telephony/webhooks",
+    f"{settings.API_V1_STR}/instagram/webhook",
+)
+
+# Атомарное скользящее окно (sliding window counter) на Redis.
+# Оценка нагрузки = предыдущее окно * доля перекрытия + текущее окно.
+# KEYS[1] - счетчик текущего окна, KEYS[2] - счетчик предыдущего окна
+# ARGV: limit, cost, window, elapsed (секунды с начала текущего окна)
+SLIDING_WINDOW_LUA = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+local limit = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local elapsed = tonumber(ARGV[4])
+local weighted = previous * ((window - elapsed) / window) + current
+if weighted + cost > limit then
+    return {0, tostring(weighted)}
+end
+current = redis.call('INCRBY', KEYS[1], cost)
+if current == cost then
+    redis.call('EXPIRE', KEYS[1], window * 2)
+end
+return {1, tostring(weighted + cost)}
+"""
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: int  # секунды до восстановления бюджета
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset_after),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.reset_after)
+        return headers
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket в памяти процесса"""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Списывает cost токенов. Возвращает (успех, остаток токенов)"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 10000:
+                self._prune(now)
+            return allowed, tokens
+
+    def wait_time(self, tokens: float, cost: float = 1.0) -> float:
+        """Сколько секунд ждать, пока в корзине накопится cost токенов"""
+        if tokens >= cost or self.refill_per_second <= 0:
+            return 0.0
+        return (cost - tokens) / self.refill_per_second
+
+    def _prune(self, now: float) -> None:
+        # Полностью восстановившиеся корзины ничем не отличаются от новых
+        full_after = self.capacity / self.refill_per_second if self.refill_per_second else math.inf
+        stale = [key for key, (_, updated_at) in self._buckets.items() if now - updated_at >= full_after]
+        for key in stale:
+            del self._buckets[key]
+
+
+class RateLimiter:
+    """Лимитер: Redis sliding window, при отсутствии или ошибке Redis - локальный token bucket"""
+
+    def __init__(self, limit_per_minute: int, redis_conn: Optional["aioredis.Redis"] = None):
+        self.limit = limit_per_minute
+        self.redis = redis_conn
+        self.local = TokenBucket(capacity=limit_per_minute, refill_per_second=limit_per_minute / WINDOW_SECONDS)
+        self._script = redis_conn.register_script(SLIDING_WINDOW_LUA) if redis_conn is not None else None
+        self._redis_retry_at = 0.0
+
+    async def hit(self, key: str, cost: int = 1) -> RateLimitDecision:
+        if self._script is not None and time.monotonic() >= self._redis_retry_at:
+            try:
+                return await self._hit_redis(key, cost)
+            except (redis.RedisError, OSError) as exc:
+                self._redis_retry_at = time.monotonic() + REDIS_RETRY_SECONDS
+                logger.warning(f"Rate limiter fallback to local bucket for {REDIS_RETRY_SECONDS:g}s: {exc}")
+        return self._hit_local(key, cost)
+
+    async def _hit_redis(self, key: str, cost: int) -> RateLimitDecision:
+        now = time.time()
+        window_index = int(now // WINDOW_SECONDS)
+        elapsed = now - window_index * WINDOW_SECONDS
+        allowed, used = await self._script(
+            keys=[f"ratelimit:{key}:{window_index}", f"ratelimit:{key}:{window_index - 1}"],
+            args=[self.limit, cost, WINDOW_SECONDS, elapsed],
+        )
+        used = float(used)
+        return RateLimitDecision(
+            allowed=bool(int(allowed)),
+            limit=self.limit,
+            remaining=max(0, int(self.limit - used)),
+            reset_after=max(1, math.ceil(WINDOW_SECONDS - elapsed)),
+        )
+
+    def _hit_local(self, key: str, cost: int) -> RateLimitDecision:
+        allowed, tokens = self.local.consume(key, cost)
+        if allowed:
+            reset_after = (self.limit - tokens) / self.local.refill_per_second
+        else:
+            reset_after = self.local.wait_time(tokens, cost)
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=self.limit,
+            remaining=max(0, int(tokens)),
+            reset_after=max(1, math.ceil(reset_after)),
+        )
+
+
+def classify_route(request: Request) -> Tuple[str, int]:
+    """Класс маршрута и стоимость запроса в единицах бюджета"""
+    if request.url.path.startswith(f"{settings.API_V1_STR}/ai"):
+        return "ai", settings.RATE_LIMIT_AI_COST
+    if request.method in ("POST", "PUT", "PATCH", "DELETE"):
+        return "write", settings.RATE_LIMIT_WRITE_COST
+    return "read", 1
+
+
+def client_identity(request: Request) -> str:
+    """Идентификатор клиента: пользователь из JWT или IP-адрес"""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        user_id = verify_token(token)
+        if user_id is not None:
+            return f"user:{user_id}"
+    client_host = request.client.host if request.client else "unknown"
+    return f"ip:{client_host}"
+
+
+def is_exempt(request: Request) -> bool:
+    return request.method == "OPTIONS" or request.url.path.startswith(EXEMPT_PATHS)
+
+
+def _redis_connection() -> Optional["aioredis.Redis"]:
+    """Отдельный асинхронный клиент лимитера; None - Redis не настроен или не ответил при старте"""
+    if redis_client is None:
+        return None
+    timeout = settings.RATE_LIMIT_REDIS_TIMEOUT_SECONDS
+    return aioredis.from_url(settings.REDIS_URL, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+
+rate_limiter = RateLimiter(settings.RATE_LIMIT_PER_MINUTE, _redis_connection())
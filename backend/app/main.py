@@ -6,14 +6,24 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.responses import JSONResponse
 from loguru import logger
+import asyncio
 import os
 import time
 
 from app.core.config import settings
 from app.api.api_v1.api import api_router
 from app.core.database import engine
+from app.core.rate_limit import classify_route, client_identity, is_exempt, rate_limiter
 from app.models import Base
-from app.utils.bootstrap import seed_demo_users
+from app.services.call_status import call_status_ingestor
+from app.services.crm.scheduler import crm_sync_scheduler
+from app.services.forecast_evaluation import forecast_evaluation_scheduler
+from app.services.instagram import close_graph_http_client, instagram_sync_scheduler, instagram_webhook_debouncer
+from app.services.outbox import outbox_relay, register_default_consumers
+from app.services.phone_index import run_phone_backfill
+from app.services.realtime import realtime_broker
+from app.services.task_scheduler import task_reminder_scheduler
+from app.utils.bootstrap import seed_demo_users, upgrade_schema
 
 
 
@@ -32,7 +42,61 @@ async def on_startup():
     """Создание таблиц при старте приложения (опционально)"""
     if settings.AUTO_CREATE_TABLES:
         Base.metadata.create_all(bind=engine)
+        # create_all не меняет существующие таблицы: новые колонки и индексы добавляются отдельно
+        upgrade_schema(engine)
         seed_demo_users()
+    if settings.PHONE_BACKFILL_ON_STARTUP:
+        # Пачками в фоне: старт приложения не ждет обхода таблицы лидов
+        asyncio.get_running_loop().run_in_executor(None, run_phone_backfill)
+    if settings.REALTIME_ENABLED:
+        realtime_broker.start()
+    if settings.OUTBOX_RELAY_ENABLED:
+        register_default_consumers(outbox_relay)
+        outbox_relay.start()
+    if settings.CRM_SYNC_INTERVAL_SECONDS > 0:
+        crm_sync_scheduler.start(settings.CRM_SYNC_INTERVAL_SECONDS)
+    if settings.FORECAST_EVALUATION_INTERVAL_SECONDS > 0:
+        forecast_evaluation_scheduler.start(settings.FORECAST_EVALUATION_INTERVAL_SECONDS)
+    if settings.CALL_TASK_REMINDER_TICK_SECONDS > 0:
+        task_reminder_scheduler.start(settings.CALL_TASK_REMINDER_TICK_SECONDS)
+    if settings.CALL_STATUS_FLUSH_SECONDS > 0:
+        call_status_ingestor.start(settings.CALL_STATUS_FLUSH_SECONDS)
+    if settings.INSTAGRAM_SYNC_INTERVAL_SECONDS > 0:
+        instagram_sync_scheduler.start(settings.INSTAGRAM_SYNC_INTERVAL_SECONDS)
+    if settings.INSTAGRAM_WEBHOOK_TICK_SECONDS > 0:
+        instagram_webhook_debouncer.start(settings.INSTAGRAM_WEBHOOK_TICK_SECONDS)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Остановка фоновых задач"""
+    await crm_sync_scheduler.stop()
+    await forecast_evaluation_scheduler.stop()
+    await task_reminder_scheduler.stop()
+    await call_status_ingestor.stop()
+    await instagram_sync_scheduler.stop()
+    await instagram_webhook_debouncer.stop()
+    close_graph_http_client()
+    outbox_relay.stop()
+    realtime_broker.stop()
+
+# Rate limiting (регистрируется до CORS, чтобы ответы 429 тоже получали CORS заголовки)
+@app.middleware("http")
+async def enforce_rate_limit(request: Request, call_next):
+    if not settings.RATE_LIMIT_ENABLED or is_exempt(request):
+        return await call_next(request)
+
+    route_class, cost = classify_route(request)
+    decision = await rate_limiter.hit(f"{client_identity(request)}:{route_class}", cost)
+    if not decision.allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many requests"},
+            headers=decision.headers(),
+        )
+
+    response = await call_next(request)
+    response.headers.update(decision.headers())
+    return response
 
 # CORS middleware
 cors_origins = [origin.strip() for origin in settings.BACKEND_CORS_ORIGINS.split(",")]
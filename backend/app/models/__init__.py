@@ -5,24 +5,37 @@ from app.core.database import Base
 from app.models.user import User
 from app.models.lead import Lead
 from app.models.lead_interaction import LeadInteraction
+from app.models.lead_duplicate import LeadDedupKey, LeadDuplicateCandidate
 from app.models.message import Message
 from app.models.instagram_account import InstagramAccount
 from app.models.crm_connection import CRMConnection
+from app.models.crm_sync_cursor import CRMSyncCursor
+from app.models.crm_record_hash import CRMRecordHash
 from app.models.forecast import Forecast
-from app.models.call import Call, CallTranscript, CallTask
+from app.models.call import Call, CallTranscript, CallTranscriptTerm, CallTask
 from app.models.phone_number import PhoneNumber
+from app.models.outbox import OutboxEvent, OutboxConsumerOffset
+from app.models.daily_rollup import DailyRollup
 
 __all__ = [
     "Base",
     "User", 
     "Lead",
     "LeadInteraction",
+    "LeadDedupKey",
+    "LeadDuplicateCandidate",
     "Message",
     "InstagramAccount",
     "CRMConnection",
+    "CRMSyncCursor",
+    "CRMRecordHash",
     "Forecast",
     "Call",
     "CallTranscript", 
+    "CallTranscriptTerm",
     "CallTask",
-    "PhoneNumber"
+    "PhoneNumber",
+    "OutboxEvent",
+    "OutboxConsumerOffset",
+    "DailyRollup"
 ]
@@ -1,7 +1,7 @@
 """
 Модели для телефонии
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, Float, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, Float, Enum, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -26,11 +26,16 @@ class CallStatus(str, enum.Enum):
 
 class Call(Base):
     __tablename__ = "calls"
+    __table_args__ = (
+        # Аналитика звонков по агенту и периоду
+        Index("ix_calls_agent_created", "agent_id", "created_at"),
+        Index("ix_calls_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
     # Связи
-    lead_id = Column(Integer, ForeignKey("leads.id"), nullable=True)
+    lead_id = Column(Integer, ForeignKey("leads.id"), nullable=True, index=True)
     agent_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
     # Номера телефонов
@@ -40,6 +45,7 @@ class Call(Base):
     # Направление и статус
     direction = Column(Enum(CallDirection), nullable=False)
     status = Column(Enum(CallStatus), default=CallStatus.INITIATED)
+    status_event_at = Column(DateTime(timezone=True), nullable=True)  # время события провайдера для последнего статуса
     
     # Временные метки
     start_time = Column(DateTime(timezone=True), nullable=True)
@@ -52,7 +58,7 @@ class Call(Base):
     consent_given = Column(Boolean, default=False)
     
     # Внешние ID
-    external_call_id = Column(String(255), nullable=True)  # ID в телефонии провайдера
+    external_call_id = Column(String(255), nullable=True, index=True)  # ID в телефонии провайдера
     provider = Column(String(50), nullable=True)  # twilio, vonage, etc.
     
     # Метаданные
@@ -78,7 +84,7 @@ class CallTranscript(Base):
     id = Column(Integer, primary_key=True, index=True)
     
     # Связь с звонком
-    call_id = Column(Integer, ForeignKey("calls.id"), nullable=False)
+    call_id = Column(Integer, ForeignKey("calls.id"), nullable=False, index=True)
     
     # Транскрипт
     language = Column(String(10), default="de")
@@ -100,6 +106,7 @@ class CallTranscript(Base):
     
     # Метаданные
     processing_time = Column(Float, nullable=True)  # секунды
+    processing_stages = Column(JSON, nullable=True)  # {"upload": 1.2, "transcription_wait": 3.4, "analysis": 2.1, ...}
     model_used = Column(String(100), nullable=True)
     
     # Временные метки
@@ -113,8 +120,32 @@ class CallTranscript(Base):
         return f"<CallTranscript(id={self.id}, call_id={self.call_id}, sentiment='{self.sentiment_label}')>"
 
 
+class CallTranscriptTerm(Base):
+    """Инвертированный индекс по ключевым словам, намерениям и сущностям транскриптов"""
+
+    __tablename__ = "call_transcript_terms"
+    __table_args__ = (
+        UniqueConstraint("transcript_id", "kind", "term", name="uq_call_transcript_term"),
+        Index("ix_call_transcript_terms_kind_term_call", "kind", "term", "call_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    transcript_id = Column(Integer, ForeignKey("call_transcripts.id", ondelete="CASCADE"), nullable=False)
+    call_id = Column(Integer, ForeignKey("calls.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String(20), nullable=False)  # keyword, intent, entity
+    term = Column(String(255), nullable=False)  # нормализованное значение (нижний регистр)
+
+    def __repr__(self):
+        return f"<CallTranscriptTerm(call_id={self.call_id}, kind='{self.kind}', term='{self.term}')>"
+
+
 class CallTask(Base):
     __tablename__ = "call_tasks"
+    __table_args__ = (
+        # Очередь агента и окно напоминаний планировщика
+        Index("ix_call_tasks_assignee_status_due", "assigned_to", "status", "due_at"),
+        Index("ix_call_tasks_status_due", "status", "due_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -131,6 +162,7 @@ class CallTask(Base):
     # Время
     due_at = Column(DateTime(timezone=True), nullable=False)
     completed_at = Column(DateTime(timezone=True), nullable=True)
+    reminder_sent_at = Column(DateTime(timezone=True), nullable=True)
     
     # Статус
     status = Column(String(20), default="pending")  # pending, in_progress, completed, cancelled
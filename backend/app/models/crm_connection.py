@@ -3,6 +3,7 @@
 """
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, JSON
 from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
 
 from app.core.database import Base
 
@@ -52,5 +53,12 @@ class CRMConnection(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
+    # Связи
+    sync_cursors = relationship(
+        "CRMSyncCursor",
+        back_populates="connection",
+        cascade="all, delete-orphan"
+    )
+    
     def __repr__(self):
         return f"<CRMConnection(id={self.id}, type='{self.crm_type}', org='{self.org_name}')>"
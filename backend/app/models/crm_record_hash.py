@@ -0,0 +1,25 @@
+"""
+Модель хешей синхронизированных записей CRM
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class CRMRecordHash(Base):
+    __tablename__ = "crm_record_hashes"
+    __table_args__ = (
+        UniqueConstraint("connection_id", "lead_id", name="uq_crm_record_hash"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    connection_id = Column(Integer, ForeignKey("crm_connections.id", ondelete="CASCADE"), nullable=False)
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False)
+
+    # Хеш смапленного payload на момент последней синхронизации
+    payload_hash = Column(String(64), nullable=False)
+    synced_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<CRMRecordHash(connection_id={self.connection_id}, lead_id={self.lead_id})>"
@@ -0,0 +1,33 @@
+"""
+Модель курсоров синхронизации с CRM
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+
+from app.core.database import Base
+
+
+class CRMSyncCursor(Base):
+    __tablename__ = "crm_sync_cursors"
+    __table_args__ = (
+        UniqueConstraint("connection_id", "object_type", "direction", name="uq_crm_sync_cursor"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    connection_id = Column(Integer, ForeignKey("crm_connections.id", ondelete="CASCADE"), nullable=False)
+
+    object_type = Column(String(50), nullable=False)  # leads, contacts, deals
+    direction = Column(String(10), nullable=False)  # pull, push
+
+    # Отметка "до какого момента изменения уже перенесены"
+    high_water_mark = Column(DateTime(timezone=True), nullable=True)
+    records_synced = Column(Integer, default=0)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    connection = relationship("CRMConnection", back_populates="sync_cursors")
+
+    def __repr__(self):
+        return f"<CRMSyncCursor(connection_id={self.connection_id}, object='{self.object_type}', direction='{self.direction}')>"
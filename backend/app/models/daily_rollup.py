@@ -0,0 +1,26 @@
+"""
+Модель дневных агрегатов для аналитики
+"""
+from sqlalchemy import Column, Integer, String, Date, DateTime, Float, Index, UniqueConstraint
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class DailyRollup(Base):
+    __tablename__ = "daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "user_id", "metric", name="uq_daily_rollup"),
+        Index("ix_daily_rollups_metric_day", "metric", "day"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    # 0 - без ответственного (NULL не участвует в уникальном ключе upsert)
+    user_id = Column(Integer, nullable=False, default=0)
+    metric = Column(String(64), nullable=False)  # leads_created, lead_status:completed, messages_sent...
+    value = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<DailyRollup(day={self.day}, user_id={self.user_id}, metric='{self.metric}', value={self.value})>"
@@ -1,7 +1,7 @@
 """
 Модель прогнозов
 """
-from sqlalchemy import Column, Integer, String, DateTime, Float, JSON, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Float, JSON, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -10,6 +10,11 @@ from app.core.database import Base
 
 class Forecast(Base):
     __tablename__ = "forecasts"
+    __table_args__ = (
+        # Keyset пагинация списка: (period_start, id) по убыванию, с фильтром по типу и без
+        Index("ix_forecasts_period_start_id", "period_start", "id"),
+        Index("ix_forecasts_type_period_start_id", "period_type", "period_start", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
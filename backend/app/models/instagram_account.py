@@ -19,7 +19,7 @@ class InstagramAccount(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(150), nullable=False)
-    business_account_id = Column(String(255), nullable=True)
+    business_account_id = Column(String(255), nullable=True, unique=True, index=True)  # webhook находит аккаунт по нему
     profile_url = Column(String(500), nullable=True)
     followers_count = Column(Integer, nullable=True)
 
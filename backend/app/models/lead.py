@@ -1,7 +1,7 @@
 """
 Модель лида
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, Float, Index, event, inspect
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -10,6 +10,11 @@ from app.core.database import Base
 
 class Lead(Base):
     __tablename__ = "leads"
+    __table_args__ = (
+        Index("ix_leads_crm_type_crm_id", "crm_type", "crm_id"),
+        # Сводка по лидам пользователя читается только из индекса
+        Index("ix_leads_assigned_status_category", "assigned_to", "status", "score_category"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -17,6 +22,7 @@ class Lead(Base):
     name = Column(String(255), nullable=False)
     email = Column(String(255), index=True, nullable=True)
     phone = Column(String(20), nullable=True)
+    phone_e164 = Column(String(16), nullable=True, index=True)  # нормализованный phone: поиск дубликатов и caller ID
     company = Column(String(255), nullable=True)
     position = Column(String(255), nullable=True)
     website = Column(String(500), nullable=True)
@@ -41,6 +47,7 @@ class Lead(Base):
     # Источник
     source = Column(String(100), nullable=True)  # website, social, call, event, referral
     source_data = Column(JSON, nullable=True)  # Дополнительные данные об источнике
+    instagram_user_id = Column(String(64), nullable=True, unique=True, index=True)  # IGSID собеседника в Direct
     
     # Назначение
     assigned_to = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -53,6 +60,7 @@ class Lead(Base):
     # CRM интеграция
     crm_id = Column(String(100), nullable=True)  # ID в внешней CRM
     crm_type = Column(String(50), nullable=True)  # hubspot, pipedrive, salesforce
+    crm_object_type = Column(String(50), nullable=True)  # leads, contacts
     
     # Временные метки
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -72,3 +80,14 @@ class Lead(Base):
     
     def __repr__(self):
         return f"<Lead(id={self.id}, name='{self.name}', company='{self.company}', score={self.score})>"
+
+
+@event.listens_for(Lead, "before_insert")
+@event.listens_for(Lead, "before_update")
+def _fill_phone_e164(mapper, connection, target: Lead) -> None:
+    """phone_e164 следует за phone при записи через ORM (массовые операции заполняют его сами)"""
+    from app.utils.phone import normalize_phone  # app.utils импортирует модели
+
+    state = inspect(target)
+    if state.attrs.phone.history.has_changes() or (target.phone and target.phone_e164 is None):
+        target.phone_e164 = normalize_phone(target.phone)
@@ -0,0 +1,47 @@
+"""
+Модели поиска дубликатов лидов: ключи блокировки и пары-кандидаты
+"""
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, JSON, String, UniqueConstraint
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+
+
+class LeadDedupKey(Base):
+    """Ключ блокировки лида: с кем сравнивать, решают только общие ключи"""
+    __tablename__ = "lead_dedup_keys"
+    __table_args__ = (
+        # Блок ключа читается из индекса; второй индекс - замена ключей лида
+        Index("ix_lead_dedup_keys_key_lead", "key", "lead_id"),
+        Index("ix_lead_dedup_keys_lead", "lead_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False)
+    key = Column(String(300), nullable=False)  # co:<компания>, dom:<домен>, ph:<E.164>
+
+    def __repr__(self):
+        return f"<LeadDedupKey(lead_id={self.lead_id}, key='{self.key}')>"
+
+
+class LeadDuplicateCandidate(Base):
+    """Пара лидов, похожих выше порога; lead_id < duplicate_id"""
+    __tablename__ = "lead_duplicate_candidates"
+    __table_args__ = (
+        UniqueConstraint("lead_id", "duplicate_id", name="uq_lead_duplicate_pair"),
+        Index("ix_lead_duplicate_candidates_status_score", "status", "score", "id"),
+        Index("ix_lead_duplicate_candidates_duplicate", "duplicate_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False)
+    duplicate_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False)
+    score = Column(Float, nullable=False)  # 0-1
+    reasons = Column(JSON, nullable=True)  # {"company": 0.93, "phone": 1.0, "keys": ["co:digitalflow", "ph:+49..."]}
+    status = Column(String(20), nullable=False, default="open")  # open, dismissed
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<LeadDuplicateCandidate(lead_id={self.lead_id}, duplicate_id={self.duplicate_id}, score={self.score})>"
@@ -8,6 +8,7 @@ from sqlalchemy import (
     DateTime,
     Enum as SqlEnum,
     ForeignKey,
+    Index,
     Integer,
     JSON,
     String,
@@ -27,9 +28,13 @@ class InteractionAuthor(Enum):
 
 class LeadInteraction(Base):
     __tablename__ = "lead_interactions"
+    __table_args__ = (
+        # Лента лида по времени и keyset курсоры; заменяет одиночный индекс по lead_id
+        Index("ix_lead_interactions_lead_created_id", "lead_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False, index=True)
+    lead_id = Column(Integer, ForeignKey("leads.id", ondelete="CASCADE"), nullable=False)
     # Для SQLite используем native_enum=False, чтобы хранить как строки
     author_type = Column(
         SqlEnum(InteractionAuthor, native_enum=False, length=20),
@@ -38,6 +43,8 @@ class LeadInteraction(Base):
     author_name = Column(String(255), nullable=True)
     message = Column(Text, nullable=False)
     context = Column(JSON, nullable=True)
+    # ID сообщения во внешнем канале (mid Instagram): повторная доставка не пишется дважды
+    external_message_id = Column(String(255), nullable=True, unique=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     lead = relationship("Lead", back_populates="interactions")
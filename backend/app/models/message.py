@@ -1,7 +1,7 @@
 """
 Модель сообщений
 """
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, JSON, Enum, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import enum
@@ -28,6 +28,10 @@ class MessageStatus(str, enum.Enum):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Воронка сообщений пользователя в сводке
+        Index("ix_messages_created_by_status", "created_by", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
@@ -0,0 +1,178 @@
+"""
+Модели transactional outbox и захват изменений лидов, сообщений, взаимодействий и звонков
+"""
+import enum
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import Column, Integer, String, DateTime, JSON, event, inspect, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from app.core.database import Base
+from app.models.call import Call
+from app.models.lead import Lead
+from app.models.lead_interaction import LeadInteraction
+from app.models.message import Message
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    # Без AUTOINCREMENT SQLite переиспользует ID после очистки таблицы
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    # Монотонный ID задает порядок доставки
+    id = Column(Integer, primary_key=True, index=True)
+    aggregate_type = Column(String(50), nullable=False)  # lead, message, interaction, call, call_task
+    aggregate_id = Column(Integer, nullable=False)
+    event_type = Column(String(20), nullable=False)  # created, updated, deleted
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<OutboxEvent(id={self.id}, {self.aggregate_type}:{self.aggregate_id} {self.event_type})>"
+
+
+class OutboxConsumerOffset(Base):
+    __tablename__ = "outbox_consumer_offsets"
+
+    consumer = Column(String(100), primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<OutboxConsumerOffset(consumer='{self.consumer}', last_event_id={self.last_event_id})>"
+
+
+# Модель -> (тип агрегата, поля, значения которых попадают в payload).
+# Для остальных колонок в payload передается только имя измененного поля.
+TRACKED_AGGREGATES: Dict[type, Tuple[str, Tuple[str, ...]]] = {
+    Lead: ("lead", ("assigned_to", "status", "score", "score_category", "email", "phone", "crm_type", "crm_id")),
+    Message: ("message", ("lead_id", "created_by", "message_type", "status", "is_ai_generated", "ai_tokens_used")),
+    LeadInteraction: ("interaction", ("lead_id", "author_type", "author_name")),
+    Call: ("call", ("lead_id", "agent_id", "direction", "status", "duration_seconds")),
+}
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _build_event(obj: Any, event_type: str) -> Dict[str, Any]:
+    aggregate_type, fields = TRACKED_AGGREGATES[type(obj)]
+    state = inspect(obj)
+    # state.dict не загружает expired атрибуты - внутри flush это важно
+    values = state.dict
+    object_id = values.get("id") or (state.identity[0] if state.identity else None)
+    payload: Dict[str, Any] = {"id": object_id}
+    payload.update({name: _jsonable(values.get(name)) for name in fields})
+    if aggregate_type == "lead":
+        payload["lead_id"] = object_id
+
+    if event_type == "updated":
+        changed_fields: List[str] = []
+        changes: Dict[str, List[Any]] = {}
+        for attr in state.mapper.column_attrs:
+            history = state.attrs[attr.key].history
+            if not history.has_changes():
+                continue
+            changed_fields.append(attr.key)
+            if attr.key in fields:
+                old = history.deleted[0] if history.deleted else None
+                changes[attr.key] = [_jsonable(old), _jsonable(values.get(attr.key))]
+        if not changed_fields:
+            return {}
+        payload["changed_fields"] = changed_fields
+        payload["changes"] = changes
+
+    return {
+        "aggregate_type": aggregate_type,
+        "aggregate_id": object_id,
+        "event_type": event_type,
+        "payload": payload,
+    }
+
+
+def created_events(model: type, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """События created для строк массового INSERT (строки уже содержат id).
+
+    Не переданные в строке поля берутся из скалярных default колонок, как их
+    заполнит INSERT.
+    """
+    aggregate_type, fields = TRACKED_AGGREGATES[model]
+    columns = model.__table__.c
+    events: List[Dict[str, Any]] = []
+    for row in rows:
+        payload: Dict[str, Any] = {"id": row["id"]}
+        for name in fields:
+            default = columns[name].default
+            value = row.get(name, default.arg if default is not None and default.is_scalar else None)
+            payload[name] = _jsonable(value)
+        if aggregate_type == "lead":
+            payload["lead_id"] = row["id"]
+        events.append({
+            "aggregate_type": aggregate_type,
+            "aggregate_id": row["id"],
+            "event_type": "created",
+            "payload": payload,
+        })
+    return events
+
+
+def add_outbox_events(session: Session, events: List[Dict[str, Any]]) -> None:
+    """Запись событий в текущей транзакции сессии.
+
+    Используется и для массовых UPDATE/INSERT, которые не проходят через
+    unit of work и поэтому не захватываются автоматически.
+    """
+    if not events:
+        return
+    session.connection().execute(insert(OutboxEvent.__table__), events)
+    session.info["outbox_pending"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _capture_changes(session: Session, flush_context) -> None:
+    events: List[Dict[str, Any]] = []
+    for objects, event_type in (
+        (session.new, "created"),
+        (session.dirty, "updated"),
+        (session.deleted, "deleted"),
+    ):
+        for obj in objects:
+            if type(obj) not in TRACKED_AGGREGATES:
+                continue
+            if event_type == "updated" and not session.is_modified(obj, include_collections=False):
+                continue
+            built = _build_event(obj, event_type)
+            if built:
+                events.append(built)
+    add_outbox_events(session, events)
+
+
+# Подписчики на коммит транзакций с событиями (релей просыпается без опроса)
+_commit_listeners: List[Callable[[], None]] = []
+
+
+def on_outbox_commit(callback: Callable[[], None]) -> None:
+    if callback not in _commit_listeners:
+        _commit_listeners.append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_commit(session: Session) -> None:
+    if session.info.pop("outbox_pending", False):
+        for callback in _commit_listeners:
+            callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop("outbox_pending", None)
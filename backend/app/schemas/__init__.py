@@ -4,14 +4,33 @@ Pydantic схемы для валидации данных
 from app.schemas.user import User, UserCreate, UserUpdate, UserInDB
 from app.schemas.lead import Lead, LeadCreate, LeadUpdate, LeadInDB
 from app.schemas.lead_interaction import LeadInteraction, LeadInteractionCreate
+from app.schemas.lead_duplicate import LeadDuplicateCandidate, LeadDuplicateList, LeadMergeRequest, LeadMergeResult
 from app.schemas.message import Message, MessageCreate, MessageUpdate
 from app.schemas.auth import Token, TokenPayload, LoginRequest
 from app.schemas.crm_connection import CRMConnection, CRMConnectionCreate, CRMConnectionUpdate
-from app.schemas.forecast import Forecast, ForecastCreate, ForecastUpdate
-from app.schemas.call import Call, CallCreate, CallTranscript, CallTask
+from app.schemas.forecast import Forecast, ForecastCreate, ForecastList, ForecastSummary, ForecastUpdate
+from app.schemas.call import Call, CallCreate, CallerIdResult, CallSearchHit, CallSearchResult, CallTranscript, CallTask, CallTaskList
+from app.schemas.analytics import (
+    AgentCallStats,
+    CallAnalyticsResponse,
+    CallStats,
+    CallStatsPoint,
+    RollupPoint,
+    RollupQueryResponse,
+    RollupSeries,
+)
+from app.schemas.dashboard import (
+    DashboardCalls,
+    DashboardLeads,
+    DashboardMessages,
+    DashboardSummary,
+    DashboardTask,
+    DashboardTasks,
+)
 from app.schemas.instagram import (
     InstagramAccount,
     InstagramAccountCreate,
+    InstagramAccountList,
     InstagramAccountUpdate,
     InstagramSyncResponse,
 )
@@ -20,10 +39,14 @@ __all__ = [
     "User", "UserCreate", "UserUpdate", "UserInDB",
     "Lead", "LeadCreate", "LeadUpdate", "LeadInDB",
     "LeadInteraction", "LeadInteractionCreate",
+    "LeadDuplicateCandidate", "LeadDuplicateList", "LeadMergeRequest", "LeadMergeResult",
     "Message", "MessageCreate", "MessageUpdate",
     "Token", "TokenPayload", "LoginRequest",
     "CRMConnection", "CRMConnectionCreate", "CRMConnectionUpdate",
-    "InstagramAccount", "InstagramAccountCreate", "InstagramAccountUpdate", "InstagramSyncResponse",
-    "Forecast", "ForecastCreate", "ForecastUpdate",
-    "Call", "CallCreate", "CallTranscript", "CallTask"
+    "InstagramAccount", "InstagramAccountCreate", "InstagramAccountList", "InstagramAccountUpdate", "InstagramSyncResponse",
+    "Forecast", "ForecastCreate", "ForecastUpdate", "ForecastList", "ForecastSummary",
+    "Call", "CallCreate", "CallerIdResult", "CallTranscript", "CallTask", "CallTaskList", "CallSearchHit", "CallSearchResult",
+    "RollupPoint", "RollupSeries", "RollupQueryResponse",
+    "CallStats", "CallStatsPoint", "AgentCallStats", "CallAnalyticsResponse",
+    "DashboardSummary", "DashboardLeads", "DashboardMessages", "DashboardCalls", "DashboardTask", "DashboardTasks"
 ]
@@ -0,0 +1,55 @@
+"""
+Схемы для аналитики
+"""
+from typing import List, Optional
+from datetime import date
+from pydantic import BaseModel
+
+
+class RollupPoint(BaseModel):
+    period: date
+    value: float
+
+
+class RollupSeries(BaseModel):
+    metric: str
+    user_id: Optional[int] = None
+    total: float
+    points: List[RollupPoint]
+
+
+class RollupQueryResponse(BaseModel):
+    """Ряды метрик из дневных агрегатов"""
+    start: date
+    end: date
+    interval: str
+    series: List[RollupSeries]
+
+
+class CallStats(BaseModel):
+    calls: int
+    answered: int
+    answer_rate: Optional[float] = None
+    total_duration_seconds: int
+    avg_duration_seconds: Optional[float] = None
+    avg_sentiment: Optional[float] = None
+
+
+class CallStatsPoint(CallStats):
+    period: date
+
+
+class AgentCallStats(BaseModel):
+    agent_id: int
+    totals: CallStats
+    points: List[CallStatsPoint]
+
+
+class CallAnalyticsResponse(BaseModel):
+    """Показатели звонков по периодам и агентам"""
+    start: date
+    end: date
+    interval: str
+    totals: CallStats
+    points: List[CallStatsPoint]
+    agents: List[AgentCallStats]
@@ -44,7 +44,7 @@ class CallInDB(CallBase):
     consent_given: bool
     external_call_id: Optional[str] = None
     provider: Optional[str] = None
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = Field(None, validation_alias="call_metadata")
     error_message: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -95,6 +95,7 @@ class CallTranscriptInDB(CallTranscriptBase):
     confidence_score: Optional[float] = None
     quality_score: Optional[float] = None
     processing_time: Optional[float] = None
+    processing_stages: Optional[Dict[str, Any]] = None
     model_used: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -136,8 +137,9 @@ class CallTaskInDB(CallTaskBase):
     created_by: int
     status: str
     completed_at: Optional[datetime] = None
+    reminder_sent_at: Optional[datetime] = None
     notes: Optional[str] = None
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = Field(None, validation_alias="task_metadata")
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -149,6 +151,12 @@ class CallTask(CallTaskInDB):
     pass
 
 
+class CallTaskList(BaseModel):
+    """Страница списка задач по звонкам"""
+    items: List[CallTask]
+    next_cursor: Optional[str] = None
+
+
 class CallList(BaseModel):
     """Список звонков с пагинацией"""
     items: List[Call]
@@ -156,3 +164,49 @@ class CallList(BaseModel):
     page: int
     size: int
     pages: int
+
+
+class CallSearchHit(BaseModel):
+    """Звонок из поиска по индексу транскриптов"""
+    id: int
+    lead_id: Optional[int] = None
+    agent_id: int
+    direction: CallDirection
+    status: CallStatus
+    duration_seconds: Optional[int] = None
+    created_at: datetime
+    transcript_id: int
+    sentiment_score: Optional[float] = None
+    sentiment_label: Optional[str] = None
+    summary: Optional[str] = None
+    intents: Optional[List[str]] = None
+    keywords: Optional[List[str]] = None
+
+    class Config:
+        from_attributes = True
+
+
+class CallSearchResult(BaseModel):
+    """Страница результатов поиска звонков"""
+    items: List[CallSearchHit]
+    next_cursor: Optional[str] = None
+
+
+class CallerIdLead(BaseModel):
+    """Лид, найденный по номеру звонящего"""
+    id: int
+    name: str
+    company: Optional[str] = None
+    status: Optional[str] = None
+    score_category: Optional[str] = None
+    assigned_to: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+
+class CallerIdResult(BaseModel):
+    """Результат caller ID: номер в E.164 и лид (None - не найден или чужой)"""
+    number: str
+    phone_e164: Optional[str] = None
+    lead: Optional[CallerIdLead] = None
@@ -49,7 +49,7 @@ class CRMConnectionInDB(CRMConnectionBase):
     error_count: int
     last_error: Optional[str] = None
     field_mapping: Optional[Dict[str, Any]] = None
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = Field(None, validation_alias="connection_metadata")
     created_at: datetime
     updated_at: Optional[datetime] = None
 
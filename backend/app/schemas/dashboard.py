@@ -0,0 +1,54 @@
+"""
+Схемы сводки для главной страницы
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class DashboardLeads(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+    by_score_category: Dict[str, int]
+
+
+class DashboardMessages(BaseModel):
+    total: int
+    by_status: Dict[str, int]
+
+
+class DashboardCalls(BaseModel):
+    total: int
+    answered: int
+    completed: int
+    total_duration_seconds: int
+
+
+class DashboardTask(BaseModel):
+    id: int
+    lead_id: int
+    assigned_to: Optional[int] = None
+    task_type: str
+    priority: Optional[str] = None
+    status: Optional[str] = None
+    due_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class DashboardTasks(BaseModel):
+    overdue: int
+    due_today: int
+    oldest_overdue: List[DashboardTask]
+
+
+class DashboardSummary(BaseModel):
+    """Сводка пользователя или команды (user_id=None)"""
+    user_id: Optional[int] = None
+    generated_at: datetime
+    leads: DashboardLeads
+    messages: DashboardMessages
+    calls_today: DashboardCalls
+    tasks: DashboardTasks
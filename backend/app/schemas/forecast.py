@@ -51,7 +51,7 @@ class ForecastInDB(ForecastBase):
     manager_breakdown: Optional[Dict[str, Any]] = None
     product_breakdown: Optional[Dict[str, Any]] = None
     notes: Optional[str] = None
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = Field(None, validation_alias="forecast_metadata")
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -63,7 +63,30 @@ class Forecast(ForecastInDB):
     pass
 
 
+class ForecastSummary(BaseModel):
+    """Прогноз без разбивок и метаданных (для списков)"""
+    id: int
+    period_type: str
+    period_start: datetime
+    period_end: datetime
+    predicted_revenue: float
+    predicted_deals: int
+    predicted_leads: int
+    accuracy_score: Optional[float] = None
+    confidence_level: Optional[float] = None
+    actual_revenue: Optional[float] = None
+    actual_deals: Optional[int] = None
+    actual_leads: Optional[int] = None
+    model_name: Optional[str] = None
+    status: Optional[str] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 class ForecastList(BaseModel):
-    """Список прогнозов"""
-    items: list[Forecast]
-    total: int
+    """Страница списка прогнозов"""
+    items: list[ForecastSummary]
+    total: Optional[int] = None  # только при include_total
+    next_cursor: Optional[str] = None
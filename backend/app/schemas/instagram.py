@@ -43,6 +43,16 @@ class InstagramAccount(InstagramAccountBase):
         from_attributes = True
 
 
+class InstagramAccountList(BaseModel):
+    """Список Instagram аккаунтов"""
+    items: List[InstagramAccount]
+    total: int
+
+
 class InstagramSyncResponse(BaseModel):
     synced: int
     created_leads: List[Lead] = []
+    duplicates: int = 0
+    linked: int = 0  # существующие лиды, к которым привязан собеседник
+    pages: int = 0
+    next_cursor: Optional[str] = None
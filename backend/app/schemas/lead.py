@@ -79,8 +79,10 @@ class LeadInDB(LeadBase):
     score: float
     score_category: str
     assigned_to: Optional[int] = None
+    phone_e164: Optional[str] = None
     crm_id: Optional[str] = None
     crm_type: Optional[str] = None
+    crm_object_type: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
     last_contacted: Optional[datetime] = None
@@ -0,0 +1,57 @@
+"""
+Схемы поиска и слияния дубликатов лидов
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.lead import Lead
+
+
+class DuplicateLeadSummary(BaseModel):
+    """Краткие данные лида в паре-кандидате"""
+    id: int
+    name: str
+    company: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    website: Optional[str] = None
+    assigned_to: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class LeadDuplicateCandidate(BaseModel):
+    """Пара похожих лидов; lead - более ранний"""
+    id: int
+    lead_id: int
+    duplicate_id: int
+    score: float
+    reasons: Optional[Dict[str, Any]] = None
+    status: str
+    created_at: Optional[datetime] = None
+    lead: Optional[DuplicateLeadSummary] = None
+    duplicate: Optional[DuplicateLeadSummary] = None
+
+    class Config:
+        from_attributes = True
+
+
+class LeadDuplicateList(BaseModel):
+    """Страница пар-кандидатов, от самых похожих"""
+    items: List[LeadDuplicateCandidate]
+    next_cursor: Optional[str] = None
+
+
+class LeadMergeRequest(BaseModel):
+    """Слияние duplicate_id в лид из пути"""
+    duplicate_id: int = Field(..., ge=1)
+
+
+class LeadMergeResult(BaseModel):
+    """Итог слияния: обновленный лид и число перенесенных записей"""
+    lead: Lead
+    moved: Dict[str, int]
@@ -41,7 +41,7 @@ class MessageInDB(MessageBase):
     replied_at: Optional[datetime] = None
     external_id: Optional[str] = None
     thread_id: Optional[str] = None
-    metadata: Optional[Dict[str, Any]] = None
+    metadata: Optional[Dict[str, Any]] = Field(None, validation_alias="message_metadata")
     error_message: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
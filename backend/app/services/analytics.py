@@ -0,0 +1,403 @@
+"""
+Дневные агрегаты (rollups) для аналитики, прогнозов и статистики AI
+"""
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func, or_
+from sqlalchemy.orm import Session
+
+from app.models.call import Call, CallDirection, CallStatus, CallTranscript
+from app.models.daily_rollup import DailyRollup
+from app.models.lead import Lead
+from app.models.message import Message, MessageStatus
+from app.models.outbox import OutboxEvent
+from app.utils.sql import bulk_increment
+
+# Метрики, которые пересчитываются из исходных таблиц при backfill
+LEADS_CREATED = "leads_created"
+LEAD_STATUS_PREFIX = "lead_status:"  # переход лида в статус, например lead_status:completed
+MESSAGES_CREATED = "messages_created"
+MESSAGE_STATUS_METRICS = {
+    MessageStatus.SENT.value: "messages_sent",
+    MessageStatus.DELIVERED.value: "messages_delivered",
+    MessageStatus.OPENED.value: "messages_opened",
+    MessageStatus.REPLIED.value: "messages_replied",
+    MessageStatus.FAILED.value: "messages_failed",
+}
+AI_MESSAGES = "ai_messages"
+AI_MESSAGE_TOKENS = "ai_message_tokens"
+CALLS_CREATED = "calls_created"
+CALLS_COMPLETED = "calls_completed"
+CALL_SECONDS = "call_seconds"
+
+# Метрики только из write hooks (в исходных таблицах не хранятся, backfill их не трогает)
+AI_CHAT_REQUESTS = "ai_chat_requests"
+AI_CHAT_TOKENS = "ai_chat_tokens"
+
+BACKFILL_METRICS = (
+    LEADS_CREATED,
+    MESSAGES_CREATED,
+    *MESSAGE_STATUS_METRICS.values(),
+    AI_MESSAGES,
+    AI_MESSAGE_TOKENS,
+    CALLS_CREATED,
+    CALLS_COMPLETED,
+    CALL_SECONDS,
+)
+HOOK_METRICS = (AI_CHAT_REQUESTS, AI_CHAT_TOKENS)
+
+INTERVALS = ("day", "week", "month")
+
+RollupKey = Tuple[date, int, str]
+
+
+def is_known_metric(metric: str) -> bool:
+    return metric in BACKFILL_METRICS or metric in HOOK_METRICS or (
+        metric.startswith(LEAD_STATUS_PREFIX) and len(metric) > len(LEAD_STATUS_PREFIX)
+    )
+
+
+def apply_increments(db: Session, increments: Dict[RollupKey, float]) -> None:
+    """Прибавление к агрегатам одним executemany (без commit)"""
+    bulk_increment(
+        db,
+        DailyRollup,
+        [
+            {"day": day, "user_id": user_id, "metric": metric, "value": value}
+            for (day, user_id, metric), value in increments.items()
+            if value
+        ],
+        index_elements=("day", "user_id", "metric"),
+        column="value",
+    )
+
+
+def record_rollup(db: Session, user_id: Optional[int], metric: str, value: float = 1, day: Optional[date] = None) -> None:
+    """Write hook: прибавление к агрегату в текущей транзакции"""
+    apply_increments(db, {(day or datetime.utcnow().date(), user_id or 0, metric): value})
+
+
+def _change(payload: Dict[str, Any], field: str) -> Optional[List[Any]]:
+    return (payload.get("changes") or {}).get(field)
+
+
+def increments_from_events(events: Iterable[OutboxEvent]) -> Dict[RollupKey, float]:
+    """Приращения агрегатов по событиям outbox"""
+    increments: Counter = Counter()
+    for event in events:
+        payload = event.payload or {}
+        day = (event.created_at or datetime.utcnow()).date()
+
+        if event.aggregate_type == "lead":
+            user_id = payload.get("assigned_to") or 0
+            if event.event_type == "created":
+                increments[(day, user_id, LEADS_CREATED)] += 1
+                if payload.get("status") and payload["status"] != "new":
+                    increments[(day, user_id, LEAD_STATUS_PREFIX + payload["status"])] += 1
+            elif event.event_type == "updated":
+                status_change = _change(payload, "status")
+                if status_change and status_change[1]:
+                    increments[(day, user_id, LEAD_STATUS_PREFIX + status_change[1])] += 1
+
+        elif event.aggregate_type == "message":
+            user_id = payload.get("created_by") or 0
+            if event.event_type == "created":
+                increments[(day, user_id, MESSAGES_CREATED)] += 1
+                if payload.get("is_ai_generated"):
+                    increments[(day, user_id, AI_MESSAGES)] += 1
+                    increments[(day, user_id, AI_MESSAGE_TOKENS)] += payload.get("ai_tokens_used") or 0
+                new_status = payload.get("status")
+            elif event.event_type == "updated":
+                status_change = _change(payload, "status")
+                new_status = status_change[1] if status_change else None
+            else:
+                new_status = None
+            if new_status in MESSAGE_STATUS_METRICS:
+                increments[(day, user_id, MESSAGE_STATUS_METRICS[new_status])] += 1
+
+        elif event.aggregate_type == "call":
+            user_id = payload.get("agent_id") or 0
+            if event.event_type == "created":
+                increments[(day, user_id, CALLS_CREATED)] += 1
+                if payload.get("status") == CallStatus.COMPLETED.value:
+                    increments[(day, user_id, CALLS_COMPLETED)] += 1
+                increments[(day, user_id, CALL_SECONDS)] += payload.get("duration_seconds") or 0
+            elif event.event_type == "updated":
+                status_change = _change(payload, "status")
+                if status_change and status_change[1] == CallStatus.COMPLETED.value:
+                    increments[(day, user_id, CALLS_COMPLETED)] += 1
+                duration_change = _change(payload, "duration_seconds")
+                if duration_change:
+                    increments[(day, user_id, CALL_SECONDS)] += (duration_change[1] or 0) - (duration_change[0] or 0)
+
+    return dict(increments)
+
+
+# --- Backfill ---
+
+
+def _to_date(value: Any) -> date:
+    # SQLite возвращает date() строкой, PostgreSQL - объектом date
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def backfill_rollups(db: Session, start: date, end: date) -> int:
+    """Пересчет пересчитываемых метрик за [start, end) из исходных таблиц (без commit).
+
+    Один GROUP BY (владелец, день) на метрику; агрегаты write hooks не затрагиваются.
+    """
+    start_dt = datetime.combine(start, datetime.min.time())
+    end_dt = datetime.combine(end, datetime.min.time())
+
+    def grouped(owner, timestamp, value, *filters):
+        day = func.date(timestamp)
+        return (
+            db.query(owner, day, value)
+            .filter(timestamp >= start_dt, timestamp < end_dt, *filters)
+            .group_by(owner, day)
+            .all()
+        )
+
+    counts = func.count()
+    sources: List[Tuple[str, list]] = [
+        (LEADS_CREATED, grouped(Lead.assigned_to, Lead.created_at, counts)),
+        (MESSAGES_CREATED, grouped(Message.created_by, Message.created_at, counts)),
+        (AI_MESSAGES, grouped(Message.created_by, Message.created_at, counts, Message.is_ai_generated.is_(True))),
+        (
+            AI_MESSAGE_TOKENS,
+            grouped(
+                Message.created_by,
+                Message.created_at,
+                func.sum(Message.ai_tokens_used),
+                Message.is_ai_generated.is_(True),
+            ),
+        ),
+        (CALLS_CREATED, grouped(Call.agent_id, Call.created_at, counts)),
+        (
+            CALLS_COMPLETED,
+            grouped(
+                Call.agent_id, func.coalesce(Call.start_time, Call.created_at), counts, Call.status == CallStatus.COMPLETED
+            ),
+        ),
+        (
+            CALL_SECONDS,
+            grouped(Call.agent_id, func.coalesce(Call.start_time, Call.created_at), func.sum(Call.duration_seconds)),
+        ),
+    ]
+    # Статусы сообщений имеют собственные временные метки
+    for status_value, timestamp in (
+        (MessageStatus.SENT.value, Message.sent_at),
+        (MessageStatus.DELIVERED.value, Message.delivered_at),
+        (MessageStatus.OPENED.value, Message.opened_at),
+        (MessageStatus.REPLIED.value, Message.replied_at),
+    ):
+        sources.append((MESSAGE_STATUS_METRICS[status_value], grouped(Message.created_by, timestamp, counts)))
+    sources.append(
+        (
+            MESSAGE_STATUS_METRICS[MessageStatus.FAILED.value],
+            grouped(
+                Message.created_by,
+                func.coalesce(Message.updated_at, Message.created_at),
+                counts,
+                Message.status == MessageStatus.FAILED,
+            ),
+        )
+    )
+
+    rows: Dict[RollupKey, float] = {}
+    for metric, metric_rows in sources:
+        for owner, day, value in metric_rows:
+            if value:
+                rows[(_to_date(day), owner or 0, metric)] = float(value)
+
+    # История переходов лидов не хранится: берем текущий статус на дату последнего изменения
+    status_time = func.coalesce(Lead.updated_at, Lead.created_at)
+    status_day = func.date(status_time)
+    status_rows = (
+        db.query(Lead.assigned_to, Lead.status, status_day, func.count())
+        .filter(status_time >= start_dt, status_time < end_dt, Lead.status.isnot(None), Lead.status != "new")
+        .group_by(Lead.assigned_to, Lead.status, status_day)
+        .all()
+    )
+    for owner, lead_status, day, value in status_rows:
+        rows[(_to_date(day), owner or 0, LEAD_STATUS_PREFIX + lead_status)] = float(value)
+
+    db.query(DailyRollup).filter(
+        DailyRollup.day >= start,
+        DailyRollup.day < end,
+        or_(DailyRollup.metric.in_(BACKFILL_METRICS), DailyRollup.metric.like(f"{LEAD_STATUS_PREFIX}%")),
+    ).delete(synchronize_session=False)
+    apply_increments(db, rows)
+    return len(rows)
+
+
+def full_history_range(db: Session) -> Tuple[date, date]:
+    """Диапазон дат исходных данных для полного backfill"""
+    earliest = [
+        value
+        for value in (
+            db.query(func.min(Lead.created_at)).scalar(),
+            db.query(func.min(Message.created_at)).scalar(),
+            db.query(func.min(Call.created_at)).scalar(),
+        )
+        if value is not None
+    ]
+    today = datetime.utcnow().date()
+    start = min(value.date() for value in earliest) if earliest else today
+    return start, today + timedelta(days=1)
+
+
+# --- Чтение ---
+
+
+def _bucket(day: date, interval: str) -> date:
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    if interval == "month":
+        return day.replace(day=1)
+    return day
+
+
+def query_rollups(
+    db: Session,
+    metrics: Sequence[str],
+    start: date,
+    end: date,
+    user_ids: Optional[Sequence[int]] = None,
+    interval: str = "day",
+    by_user: bool = False,
+) -> List[Dict[str, Any]]:
+    """Ряды метрик за [start, end) только из агрегатов"""
+    owner = DailyRollup.user_id if by_user else None
+    columns = [DailyRollup.metric, DailyRollup.day, func.sum(DailyRollup.value)]
+    group_by = [DailyRollup.metric, DailyRollup.day]
+    if owner is not None:
+        columns.append(owner)
+        group_by.append(owner)
+
+    query = db.query(*columns).filter(
+        DailyRollup.metric.in_(list(metrics)),
+        DailyRollup.day >= start,
+        DailyRollup.day < end,
+    )
+    if user_ids is not None:
+        query = query.filter(DailyRollup.user_id.in_([user_id or 0 for user_id in user_ids]))
+
+    buckets: Dict[Tuple[str, Optional[int]], Counter] = {}
+    for row in query.group_by(*group_by).all():
+        metric, day, value = row[0], _to_date(row[1]), row[2]
+        user_id = row[3] if by_user else None
+        buckets.setdefault((metric, user_id), Counter())[_bucket(day, interval)] += value or 0
+
+    series = []
+    for (metric, user_id), points in sorted(buckets.items(), key=lambda item: (item[0][0], item[0][1] or 0)):
+        entry: Dict[str, Any] = {
+            "metric": metric,
+            "total": sum(points.values()),
+            "points": [{"period": period, "value": value} for period, value in sorted(points.items())],
+        }
+        if by_user:
+            entry["user_id"] = user_id or None
+        series.append(entry)
+    return series
+
+
+def metric_totals(db: Session, metrics: Sequence[str], start: date, end: date, user_id: Optional[int] = None) -> Dict[str, float]:
+    """Суммы метрик за период одним запросом"""
+    query = db.query(DailyRollup.metric, func.sum(DailyRollup.value)).filter(
+        DailyRollup.metric.in_(list(metrics)),
+        DailyRollup.day >= start,
+        DailyRollup.day < end,
+    )
+    if user_id is not None:
+        query = query.filter(DailyRollup.user_id == user_id)
+    totals = {metric: 0.0 for metric in metrics}
+    totals.update({metric: float(value or 0) for metric, value in query.group_by(DailyRollup.metric).all()})
+    return totals
+
+
+# --- Звонки ---
+
+ANSWERED_CALL_STATUSES = (CallStatus.ANSWERED, CallStatus.COMPLETED)
+
+
+def _call_stats(values: List[float]) -> Dict[str, Any]:
+    calls, answered, duration_sum, duration_count, sentiment_sum, sentiment_count = values
+    return {
+        "calls": int(calls),
+        "answered": int(answered),
+        "answer_rate": round(answered / calls, 4) if calls else None,
+        "total_duration_seconds": int(duration_sum),
+        "avg_duration_seconds": round(duration_sum / duration_count, 1) if duration_count else None,
+        "avg_sentiment": round(sentiment_sum / sentiment_count, 4) if sentiment_count else None,
+    }
+
+
+def call_stats(
+    db: Session,
+    start: date,
+    end: date,
+    interval: str = "day",
+    agent_id: Optional[int] = None,
+    lead_id: Optional[int] = None,
+    direction: Optional[CallDirection] = None,
+    by_agent: bool = True,
+) -> Dict[str, Any]:
+    """Показатели звонков за [start, end) одним GROUP BY (агент, день).
+
+    Суммы, а не средние, складываются по неделям/месяцам и агентам, поэтому
+    средние за любой период считаются точно.
+    """
+    day = func.date(Call.created_at)
+    query = (
+        db.query(
+            Call.agent_id,
+            day,
+            func.count(Call.id),
+            func.sum(case((Call.status.in_(ANSWERED_CALL_STATUSES), 1), else_=0)),
+            func.sum(Call.duration_seconds),
+            func.count(Call.duration_seconds),
+            func.sum(CallTranscript.sentiment_score),
+            func.count(CallTranscript.sentiment_score),
+        )
+        .outerjoin(CallTranscript, CallTranscript.call_id == Call.id)
+        .filter(
+            Call.created_at >= datetime.combine(start, datetime.min.time()),
+            Call.created_at < datetime.combine(end, datetime.min.time()),
+        )
+    )
+    if agent_id is not None:
+        query = query.filter(Call.agent_id == agent_id)
+    if lead_id is not None:
+        query = query.filter(Call.lead_id == lead_id)
+    if direction is not None:
+        query = query.filter(Call.direction == direction)
+
+    size = 6
+    totals = [0.0] * size
+    points: Dict[date, List[float]] = {}
+    agents: Dict[int, Dict[str, Any]] = {}
+    for row in query.group_by(Call.agent_id, day).all():
+        agent, period = row[0], _bucket(_to_date(row[1]), interval)
+        values = [float(value or 0) for value in row[2:]]
+        targets = [totals, points.setdefault(period, [0.0] * size)]
+        if by_agent:
+            entry = agents.setdefault(agent, {"totals": [0.0] * size, "points": {}})
+            targets += [entry["totals"], entry["points"].setdefault(period, [0.0] * size)]
+        for target in targets:
+            for index, value in enumerate(values):
+                target[index] += value
+
+    def _series(buckets: Dict[date, List[float]]) -> List[Dict[str, Any]]:
+        return [{"period": period, **_call_stats(values)} for period, values in sorted(buckets.items())]
+
+    return {
+        "totals": _call_stats(totals),
+        "points": _series(points),
+        "agents": [
+            {"agent_id": agent, "totals": _call_stats(entry["totals"]), "points": _series(entry["points"])}
+            for agent, entry in sorted(agents.items())
+        ],
+    }
@@ -0,0 +1,69 @@
+"""
+Разбор упавшей пачки фоновой очереди
+
+Пачка, упавшая из-за данных одного элемента, при простом возврате в очередь
+падала бы на каждом тике и блокировала остальные. После сбоя элементы
+применяются по одному: удачные проходят сразу, упавшие возвращаются со
+счетчиком попыток и отбрасываются после max_attempts. Если подряд падают
+первые ISOLATION_PROBE элементов, это похоже на недоступность БД: пачка
+целиком возвращается в очередь без траты попыток, а проверенные элементы
+уходят в ее конец, чтобы следующая проверка взяла другие.
+"""
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Generic, Hashable, List, TypeVar
+
+from loguru import logger
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+ISOLATION_PROBE = 3
+
+
+@dataclass
+class IsolationResult(Generic[K, V]):
+    totals: Dict[str, int]
+    retry: Dict[K, V] = field(default_factory=dict)  # вернуть в очередь (в этом порядке)
+    dropped: List[K] = field(default_factory=list)  # исчерпали попытки
+    outage: bool = False  # падают все элементы - пачка отложена целиком
+
+
+def isolate_failed_batch(
+    batch: Dict[K, V],
+    apply: Callable[[Dict[K, V]], Dict[str, int]],
+    attempts: Dict[K, int],
+    max_attempts: int,
+    totals: Dict[str, int],
+) -> IsolationResult[K, V]:
+    """Применение элементов упавшей пачки по одному; attempts - счетчики попыток очереди"""
+    result = IsolationResult(dict(totals))
+    failed: List[K] = []
+    items = list(batch.items())
+    if len(items) == 1:
+        # Пачка из одного элемента уже упала - повтор ничего не изолирует
+        failed = [items[0][0]]
+        items = []
+
+    for position, (key, value) in enumerate(items):
+        if len(failed) == position == ISOLATION_PROBE:
+            result.outage = True
+            result.retry = {**dict(items[position:]), **{probed: batch[probed] for probed in failed}}
+            return result
+        try:
+            applied = apply({key: value})
+        except Exception as exc:  # noqa: BLE001
+            logger.warning(f"Batch item {key!r} failed: {exc}")
+            failed.append(key)
+            continue
+        attempts.pop(key, None)
+        for name, count in applied.items():
+            result.totals[name] = result.totals.get(name, 0) + count
+
+    for key in failed:
+        attempts[key] = attempts.get(key, 0) + 1
+        if attempts[key] >= max_attempts:
+            attempts.pop(key)
+            result.dropped.append(key)
+        else:
+            result.retry[key] = batch[key]
+    return result
@@ -0,0 +1,330 @@
+"""
+AI анализ транскриптов звонков: тональность, резюме, намерения, ключевые слова
+"""
+import json
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.call import Call, CallTranscript
+from app.services.ai_chat import AIChatServiceError, generate_sales_assistant_reply
+from app.services.call_index import sync_transcript_terms
+
+SENTIMENT_LABELS = ("positive", "neutral", "negative")
+INTENTS = ("interested", "not_interested", "objection", "meeting_request", "callback_request", "pricing_question")
+
+ANALYSIS_PROMPT = (
+    "Ты анализируешь транскрипт звонка отдела продаж. Верни только JSON без пояснений с полями: "
+    '"sentiment_score" (число от -1 до 1), "sentiment_label" (positive, neutral или negative), '
+    '"summary" (2-3 предложения на языке звонка), '
+    f'"intents" (список из: {", ".join(INTENTS)}), '
+    '"keywords" (до 10 ключевых слов), "entities" (объект: person, company, product, date, amount - только найденные), '
+    '"quality_score" (число от 0 до 1 - качество разговора менеджера).'
+)
+
+# Эвристика на случай недоступности AI: короткие словари для de/en/ru
+_POSITIVE = {"gut", "super", "interessant", "gerne", "danke", "great", "good", "interested", "thanks", "отлично", "интересно", "спасибо", "хорошо"}
+_NEGATIVE = {"nein", "teuer", "schlecht", "leider", "kein", "expensive", "bad", "no", "not", "дорого", "плохо", "нет", "неинтересно"}
+_INTENT_PATTERNS = {
+    "meeting_request": r"\b(termin|meeting|treffen|встреч\w*|demo)\b",
+    "callback_request": r"\b(zurückrufen|rückruf|call back|callback|перезвон\w*)\b",
+    "pricing_question": r"\b(preis\w*|kosten|price|pricing|cost|цен\w*|стоимост\w*)\b",
+    "objection": r"\b(zu teuer|too expensive|дорого|konkurrenz|competitor|конкурент\w*)\b",
+    "interested": r"\b(interessant|interessiert|interested|интересн\w*)\b",
+    "not_interested": r"\b(kein interesse|not interested|неинтересно)\b",
+}
+_STOPWORDS = {
+    "und", "oder", "aber", "der", "die", "das", "ein", "eine", "ich", "sie", "wir", "ist", "sind", "nicht", "mit", "für",
+    "the", "and", "or", "but", "you", "we", "is", "are", "to", "of", "a", "in", "for", "it", "that", "this",
+    "и", "в", "не", "на", "что", "мы", "вы", "это", "с", "по", "да", "как", "а",
+}
+_WORD_RE = re.compile(r"[^\W\d_]{3,}", re.UNICODE)
+# Один пакетный анализ на процесс: повторный запуск по тем же строкам оплатил бы вызовы модели дважды
+_batch_lock = threading.Lock()
+
+
+def _clip_text(text: str, limit: int) -> str:
+    """Начало и конец длинного транскрипта: там обычно знакомство и договоренности"""
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    return f"{text[:half]}\n[...]\n{text[-half:]}"
+
+
+def heuristic_analysis(text: str) -> Dict[str, Any]:
+    """Локальный анализ без AI"""
+    words = [word.lower() for word in _WORD_RE.findall(text)]
+    positive = sum(word in _POSITIVE for word in words)
+    negative = sum(word in _NEGATIVE for word in words)
+    score = (positive - negative) / max(positive + negative, 1)
+    label = "positive" if score > 0.2 else "negative" if score < -0.2 else "neutral"
+    lowered = text.lower()
+    sentences = re.split(r"(?<=[.!?])\s+", text.strip())
+    return {
+        "sentiment_score": round(score, 3),
+        "sentiment_label": label,
+        "summary": " ".join(sentences[:2])[:500] or None,
+        "intents": [intent for intent, pattern in _INTENT_PATTERNS.items() if re.search(pattern, lowered)],
+        "keywords": [word for word, _ in Counter(w for w in words if w not in _STOPWORDS).most_common(10)],
+        "entities": {},
+        "quality_score": None,
+        "model_used": "heuristic",
+        "tokens_used": 0,
+    }
+
+
+def _extract_json(content: str) -> Optional[Any]:
+    match = re.search(r"[\[{].*[\]}]", content or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(0))
+    except ValueError:
+        return None
+
+
+def normalize_analysis(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Приведение полей ответа модели к формату CallTranscript"""
+
+    def _number(value: Any, low: float, high: float) -> Optional[float]:
+        try:
+            return max(low, min(high, float(value)))
+        except (TypeError, ValueError):
+            return None
+
+    label = str(data.get("sentiment_label") or "").lower()
+    return {
+        "sentiment_score": _number(data.get("sentiment_score"), -1.0, 1.0),
+        "sentiment_label": label if label in SENTIMENT_LABELS else None,
+        "summary": (str(data["summary"]).strip() or None) if data.get("summary") else None,
+        "intents": [str(intent) for intent in data.get("intents") or [] if str(intent) in INTENTS],
+        "keywords": [str(keyword) for keyword in (data.get("keywords") or [])][:10],
+        "entities": data.get("entities") if isinstance(data.get("entities"), dict) else {},
+        "quality_score": _number(data.get("quality_score"), 0.0, 1.0),
+    }
+
+
+def parse_analysis(content: str) -> Optional[Dict[str, Any]]:
+    """Разбор JSON ответа модели с нормализацией полей"""
+    data = _extract_json(content)
+    return normalize_analysis(data) if isinstance(data, dict) else None
+
+
+def analyze_transcript(text: str, language: str = "de") -> Dict[str, Any]:
+    """Анализ транскрипта моделью OpenAI; без ключа или при ошибке - эвристика"""
+    if not text.strip():
+        return heuristic_analysis(text)
+    messages: List[Dict[str, str]] = [
+        {"role": "system", "content": ANALYSIS_PROMPT},
+        {"role": "user", "content": f"Язык: {language}\nТранскрипт:\n{_clip_text(text, settings.CALL_ANALYSIS_MAX_CHARS)}"},
+    ]
+    try:
+        result = generate_sales_assistant_reply(messages, temperature=0.0)
+    except AIChatServiceError as exc:
+        logger.warning(f"Call analysis falls back to heuristics: {exc}")
+        return heuristic_analysis(text)
+
+    analysis = parse_analysis(result.get("content") or "")
+    if analysis is None:
+        logger.warning("Call analysis response is not valid JSON, using heuristics")
+        return heuristic_analysis(text)
+    analysis["model_used"] = result.get("model") or settings.OPENAI_MODEL
+    analysis["tokens_used"] = (result.get("usage") or {}).get("total_tokens") or 0
+    return analysis
+
+
+# --- Пакетный анализ ---
+
+BATCH_PROMPT = (
+    ANALYSIS_PROMPT.replace("Верни только JSON без пояснений", "Тебе передано несколько транскриптов. Для каждого верни")
+    + ' Ответ - только JSON вида {"results": [{"id": <id транскрипта>, ...поля...}]} в том же порядке.'
+)
+# Примерный объем ответа модели на один транскрипт
+OUTPUT_TOKENS_PER_ITEM = 250
+
+
+@dataclass
+class BatchItem:
+    transcript_id: int
+    call_id: int
+    text: str
+    language: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценка числа токенов без токенизатора (~4 символа на токен)"""
+    return len(text) // 4 + 1
+
+
+def pack_batches(items: List[BatchItem], token_budget: int, max_items: int) -> List[List[BatchItem]]:
+    """Упаковка транскриптов в запросы: first-fit decreasing по оценке токенов.
+
+    Транскрипт длиннее бюджета уходит отдельным запросом (и будет обрезан).
+    """
+    batches: List[List[BatchItem]] = []
+    remaining: List[int] = []
+    for item in sorted(items, key=lambda i: i.tokens, reverse=True):
+        tokens = min(item.tokens, token_budget)
+        for index, free in enumerate(remaining):
+            if tokens <= free and len(batches[index]) < max_items:
+                batches[index].append(item)
+                remaining[index] -= tokens
+                break
+        else:
+            batches.append([item])
+            remaining.append(token_budget - tokens)
+    return batches
+
+
+def analyze_batch(batch: List[BatchItem]) -> Tuple[Dict[int, Dict[str, Any]], int]:
+    """Один запрос к модели на пакет; (результаты по id транскрипта, токены).
+
+    Транскрипты, пропущенные моделью, анализируются по одному.
+    """
+    if len(batch) == 1:
+        item = batch[0]
+        analysis = analyze_transcript(item.text, item.language)
+        return {item.transcript_id: analysis}, analysis.get("tokens_used") or 0
+
+    char_budget = settings.CALL_ANALYSIS_BATCH_TOKENS * 4
+    body = "\n\n".join(
+        f"### id={item.transcript_id} (язык: {item.language})\n{_clip_text(item.text, char_budget)}" for item in batch
+    )
+    messages = [{"role": "system", "content": BATCH_PROMPT}, {"role": "user", "content": body}]
+    try:
+        result = generate_sales_assistant_reply(
+            messages, temperature=0.0, max_tokens=OUTPUT_TOKENS_PER_ITEM * len(batch)
+        )
+    except AIChatServiceError as exc:
+        logger.warning(f"Batch call analysis falls back to heuristics: {exc}")
+        return {item.transcript_id: heuristic_analysis(item.text) for item in batch}, 0
+
+    tokens = (result.get("usage") or {}).get("total_tokens") or 0
+    model = result.get("model") or settings.OPENAI_MODEL
+    data = _extract_json(result.get("content") or "")
+    entries = data.get("results") if isinstance(data, dict) else data
+    batch_ids = {item.transcript_id for item in batch}
+    analyses: Dict[int, Dict[str, Any]] = {}
+    for entry in entries if isinstance(entries, list) else []:
+        try:
+            transcript_id = int(entry.get("id"))
+        except (AttributeError, TypeError, ValueError):
+            continue
+        # Чужой или выдуманный моделью id не должен попасть в другой транскрипт
+        if transcript_id not in batch_ids:
+            continue
+        analyses[transcript_id] = {**normalize_analysis(entry), "model_used": model}
+
+    for item in batch:
+        if item.transcript_id not in analyses:
+            analyses[item.transcript_id] = analyze_transcript(item.text, item.language)
+            tokens += analyses[item.transcript_id].get("tokens_used") or 0
+    return analyses, tokens
+
+
+ANALYSIS_FIELDS = (
+    "sentiment_score", "sentiment_label", "summary", "intents", "keywords", "entities", "quality_score", "model_used",
+)
+
+
+def _pending_query(db: Session, agent_id: Optional[int], *columns):
+    query = db.query(*columns).filter(
+        CallTranscript.text.isnot(None),
+        CallTranscript.text != "",
+        or_(CallTranscript.sentiment_label.is_(None), CallTranscript.summary.is_(None)),
+    )
+    if agent_id is not None:
+        query = query.join(Call, Call.id == CallTranscript.call_id).filter(Call.agent_id == agent_id)
+    return query
+
+
+def pending_transcripts(db: Session, limit: int, agent_id: Optional[int] = None) -> List[BatchItem]:
+    """Транскрипты с текстом, но без тональности или резюме (без загрузки остальных колонок)"""
+    columns = (CallTranscript.id, CallTranscript.call_id, CallTranscript.text, CallTranscript.language)
+    rows = (
+        _pending_query(db, agent_id, *columns)
+        .order_by(CallTranscript.id)
+        .limit(limit)
+        .all()
+    )
+    return [BatchItem(transcript_id, call_id, text, language or "de") for transcript_id, call_id, text, language in rows]
+
+
+def count_pending_transcripts(db: Session, limit: int, agent_id: Optional[int] = None) -> int:
+    """Число транскриптов для пакетного анализа (не больше limit) без чтения текстов"""
+    subquery = _pending_query(db, agent_id, CallTranscript.id).limit(limit).subquery()
+    return db.query(func.count()).select_from(subquery).scalar()
+
+
+def batch_analysis_running() -> bool:
+    return _batch_lock.locked()
+
+
+def run_batch_analysis(db: Session, limit: int, agent_id: Optional[int] = None) -> Dict[str, Any]:
+    """Пакетный анализ транскриптов: упаковка, параллельные запросы, одна массовая запись (без commit)"""
+    started = time.perf_counter()
+    items = pending_transcripts(db, limit, agent_id)
+    max_items = max(1, min(settings.CALL_ANALYSIS_BATCH_MAX_ITEMS, settings.OPENAI_MAX_TOKENS // OUTPUT_TOKENS_PER_ITEM))
+    batches = pack_batches(items, settings.CALL_ANALYSIS_BATCH_TOKENS, max_items)
+
+    analyses: Dict[int, Dict[str, Any]] = {}
+    tokens = 0
+    if batches:
+        workers = min(settings.CALL_ANALYSIS_CONCURRENCY, len(batches))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="call-analysis") as executor:
+            for batch_analyses, batch_tokens in executor.map(analyze_batch, batches):
+                analyses.update(batch_analyses)
+                tokens += batch_tokens
+    analyzed = time.perf_counter()
+
+    rows = [
+        {"id": transcript_id, **{field: analysis.get(field) for field in ANALYSIS_FIELDS}}
+        for transcript_id, analysis in analyses.items()
+    ]
+    if rows:
+        db.execute(update(CallTranscript), rows)
+        call_ids = {item.transcript_id: item.call_id for item in items}
+        sync_transcript_terms(db, [{**row, "call_id": call_ids[row["id"]]} for row in rows])
+
+    summary = {
+        "transcripts": len(rows),
+        "requests": len(batches),
+        "tokens_used": tokens,
+        "seconds": {
+            "analysis": round(analyzed - started, 3),
+            "write": round(time.perf_counter() - analyzed, 3),
+        },
+    }
+    logger.info(f"Batch call analysis: {summary}")
+    return summary
+
+
+def run_batch_analysis_job(limit: int, agent_id: Optional[int] = None) -> None:
+    """Пакетный анализ в отдельной сессии (фоновая задача); параллельный запуск пропускается"""
+    if not _batch_lock.acquire(blocking=False):
+        logger.info("Batch call analysis is already running")
+        return
+    db = SessionLocal()
+    try:
+        run_batch_analysis(db, limit, agent_id)
+        db.commit()
+    except Exception as exc:  # noqa: BLE001
+        db.rollback()
+        logger.exception(f"Batch call analysis failed: {exc}")
+    finally:
+        db.close()
+        _batch_lock.release()
@@ -0,0 +1,113 @@
+"""
+Инвертированный индекс транскриптов звонков: ключевые слова, намерения, сущности
+
+JSON поля CallTranscript не индексируются, поэтому при каждой записи анализа
+термы раскладываются в call_transcript_terms (kind, term) -> call_id, и поиск
+звонков идет по индексу без чтения транскриптов.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from app.models.call import CallTranscript, CallTranscriptTerm
+
+TERM_KINDS = ("keyword", "intent", "entity")
+TERM_MAX_LENGTH = 255
+
+
+def normalize_term(value: Any) -> str:
+    """Нижний регистр, схлопнутые пробелы; так же нормализуются запросы поиска"""
+    return re.sub(r"\s+", " ", str(value)).strip().lower()[:TERM_MAX_LENGTH]
+
+
+def _entity_values(entities: Any) -> Iterable[Any]:
+    if not isinstance(entities, dict):
+        return []
+    values = []
+    for value in entities.values():
+        values.extend(value if isinstance(value, list) else [value])
+    return [value for value in values if value is not None and not isinstance(value, (dict, list))]
+
+
+def transcript_terms(
+    keywords: Optional[List[Any]],
+    intents: Optional[List[Any]],
+    entities: Optional[Dict[str, Any]],
+) -> Set[Tuple[str, str]]:
+    """Пары (kind, term) одного транскрипта"""
+    terms = set()
+    for kind, values in (("keyword", keywords or []), ("intent", intents or []), ("entity", _entity_values(entities))):
+        for value in values:
+            term = normalize_term(value)
+            if term:
+                terms.add((kind, term))
+    return terms
+
+
+def sync_transcript_terms(db: Session, transcripts: Iterable[Dict[str, Any]]) -> int:
+    """Перезапись термов транскриптов (без commit).
+
+    transcripts - словари с id, call_id, keywords, intents, entities. Старые
+    термы удаляются одним DELETE, новые вставляются одним executemany.
+    """
+    rows = []
+    transcript_ids = []
+    for transcript in transcripts:
+        transcript_ids.append(transcript["id"])
+        rows.extend(
+            {"transcript_id": transcript["id"], "call_id": transcript["call_id"], "kind": kind, "term": term}
+            for kind, term in transcript_terms(
+                transcript.get("keywords"), transcript.get("intents"), transcript.get("entities")
+            )
+        )
+    if not transcript_ids:
+        return 0
+    db.execute(delete(CallTranscriptTerm).where(CallTranscriptTerm.transcript_id.in_(transcript_ids)))
+    if rows:
+        db.execute(insert(CallTranscriptTerm), rows)
+    return len(rows)
+
+
+def index_transcript(db: Session, transcript: CallTranscript) -> int:
+    """Перезапись термов одного ORM транскрипта (без commit)"""
+    if transcript.id is None:
+        db.flush()
+    return sync_transcript_terms(
+        db,
+        [{
+            "id": transcript.id,
+            "call_id": transcript.call_id,
+            "keywords": transcript.keywords,
+            "intents": transcript.intents,
+            "entities": transcript.entities,
+        }],
+    )
+
+
+def rebuild_term_index(db: Session, batch_size: int = 1000) -> int:
+    """Полная пересборка индекса по всем транскриптам пачками (без commit)"""
+    total = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(
+                CallTranscript.id,
+                CallTranscript.call_id,
+                CallTranscript.keywords,
+                CallTranscript.intents,
+                CallTranscript.entities,
+            )
+            .filter(CallTranscript.id > last_id)
+            .order_by(CallTranscript.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        total += sync_transcript_terms(db, [row._asdict() for row in rows])
+        last_id = rows[-1].id
+    logger.info(f"Call transcript term index rebuilt: {total} terms")
+    return total
@@ -0,0 +1,372 @@
+"""
+Прием статусов звонков от телефонии: проверка подписи, очередь, пакетное применение
+
+Провайдер присылает callback на каждый переход статуса; в кампаниях обзвона
+это сотни запросов в секунду. Запрос только проверяет подпись и кладет
+событие в очередь, где события одного звонка схлопываются по external_call_id.
+Очередь сбрасывается пачкой: один SELECT по external_call_id, одно массовое
+UPDATE и события outbox. Устаревшие события (пришедшие не по порядку)
+отбрасываются по рангу статуса и времени события.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from loguru import logger
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.call import Call, CallStatus
+from app.models.outbox import add_outbox_events
+from app.services.batch_retry import isolate_failed_batch
+
+TERMINAL_STATUSES = (CallStatus.COMPLETED, CallStatus.FAILED, CallStatus.BUSY, CallStatus.NO_ANSWER)
+STATUS_RANK = {
+    CallStatus.INITIATED: 0,
+    CallStatus.RINGING: 1,
+    CallStatus.ANSWERED: 2,
+    **{terminal: 3 for terminal in TERMINAL_STATUSES},
+}
+
+# Статусы провайдеров -> CallStatus
+PROVIDER_STATUSES = {
+    "queued": CallStatus.INITIATED,
+    "initiated": CallStatus.INITIATED,
+    "ringing": CallStatus.RINGING,
+    "in-progress": CallStatus.ANSWERED,
+    "answered": CallStatus.ANSWERED,
+    "completed": CallStatus.COMPLETED,
+    "busy": CallStatus.BUSY,
+    "failed": CallStatus.FAILED,
+    "canceled": CallStatus.FAILED,
+    "no-answer": CallStatus.NO_ANSWER,
+    "no_answer": CallStatus.NO_ANSWER,
+}
+
+
+class CallStatusEventError(ValueError):
+    """Callback не содержит корректного события статуса"""
+
+
+class CallStatusQueueFull(RuntimeError):
+    """Очередь переполнена: провайдер должен повторить callback позже"""
+
+
+@dataclass
+class CallStatusEvent:
+    external_call_id: str
+    status: CallStatus
+    event_at: datetime  # UTC без таймзоны
+    duration_seconds: Optional[int] = None
+    answered_at: Optional[datetime] = None  # самый ранний answered среди схлопнутых событий
+
+    def __post_init__(self) -> None:
+        if self.status == CallStatus.ANSWERED and self.answered_at is None:
+            self.answered_at = self.event_at
+
+    def supersedes(self, status: Optional[CallStatus], event_at: Optional[datetime]) -> bool:
+        """Новее ли событие, чем состояние (status, event_at)"""
+        if status is None:
+            return True
+        rank, current_rank = STATUS_RANK[self.status], STATUS_RANK.get(status, 0)
+        if rank != current_rank:
+            return rank > current_rank
+        return event_at is None or self.event_at > _naive_utc(event_at)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+# --- Подписи ---
+
+
+def verify_hmac_signature(secret: str, body: bytes, header: Optional[str]) -> bool:
+    """Заголовок "sha256=<hex>" от HMAC-SHA256 тела запроса"""
+    if not header:
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(header.removeprefix("sha256="), expected)
+
+
+def verify_twilio_signature(auth_token: str, url: str, params: Mapping[str, str], header: Optional[str]) -> bool:
+    """X-Twilio-Signature: base64 HMAC-SHA1 от URL и отсортированных параметров формы"""
+    if not header:
+        return False
+    payload = url + "".join(f"{key}{params[key]}" for key in sorted(params))
+    digest = hmac.new(auth_token.encode("utf-8"), payload.encode("utf-8"), hashlib.sha1).digest()
+    return hmac.compare_digest(header, base64.b64encode(digest).decode())
+
+
+# --- Разбор callback ---
+
+
+def _parse_status(value: Any) -> CallStatus:
+    status = PROVIDER_STATUSES.get(str(value or "").strip().lower())
+    if status is None:
+        raise CallStatusEventError(f"Unknown call status '{value}'")
+    return status
+
+
+def _parse_duration(value: Any) -> Optional[int]:
+    if value in (None, ""):
+        return None
+    try:
+        return max(0, int(float(value)))
+    except (TypeError, ValueError) as exc:
+        raise CallStatusEventError(f"Invalid call duration '{value}'") from exc
+
+
+def parse_twilio_event(params: Mapping[str, str]) -> CallStatusEvent:
+    """Событие из формы Twilio status callback"""
+    if not params.get("CallSid"):
+        raise CallStatusEventError("CallSid is required")
+    try:
+        event_at = _naive_utc(parsedate_to_datetime(params["Timestamp"])) if params.get("Timestamp") else None
+    except (TypeError, ValueError) as exc:
+        raise CallStatusEventError("Invalid Timestamp") from exc
+    return CallStatusEvent(
+        external_call_id=params["CallSid"],
+        status=_parse_status(params.get("CallStatus")),
+        event_at=event_at or datetime.utcnow(),
+        duration_seconds=_parse_duration(params.get("CallDuration")),
+    )
+
+
+def parse_generic_event(data: Mapping[str, Any]) -> CallStatusEvent:
+    """Событие в общем формате: external_call_id, status, timestamp (ISO), duration_seconds"""
+    if not isinstance(data, Mapping) or not data.get("external_call_id"):
+        raise CallStatusEventError("external_call_id is required")
+    try:
+        event_at = _naive_utc(datetime.fromisoformat(str(data["timestamp"]))) if data.get("timestamp") else None
+    except ValueError as exc:
+        raise CallStatusEventError("Invalid timestamp") from exc
+    return CallStatusEvent(
+        external_call_id=str(data["external_call_id"]),
+        status=_parse_status(data.get("status")),
+        event_at=event_at or datetime.utcnow(),
+        duration_seconds=_parse_duration(data.get("duration_seconds")),
+    )
+
+
+# --- Применение ---
+
+
+def coalesce(
+    events: Iterable[CallStatusEvent],
+    into: Optional[Dict[str, CallStatusEvent]] = None,
+) -> Dict[str, CallStatusEvent]:
+    """Последнее по порядку статусов событие на каждый звонок.
+
+    Длительность и время ответа переносятся из схлопнутых событий: answered
+    и completed короткого звонка часто приходят в одну пачку.
+    """
+    latest = into if into is not None else {}
+    for event in events:
+        current = latest.get(event.external_call_id)
+        if current is None:
+            latest[event.external_call_id] = event
+            continue
+        answered = [value for value in (current.answered_at, event.answered_at) if value is not None]
+        if event.supersedes(current.status, current.event_at):
+            if event.duration_seconds is None:
+                event.duration_seconds = current.duration_seconds
+            latest[event.external_call_id] = current = event
+        current.answered_at = min(answered) if answered else None
+    return latest
+
+
+def apply_status_events(db: Session, events: Dict[str, CallStatusEvent]) -> Dict[str, int]:
+    """Пакетное применение схлопнутых событий (без commit)"""
+    if not events:
+        return {"applied": 0, "stale": 0, "unmatched": 0}
+    calls = (
+        db.query(
+            Call.id,
+            Call.external_call_id,
+            Call.lead_id,
+            Call.agent_id,
+            Call.direction,
+            Call.status,
+            Call.status_event_at,
+            Call.start_time,
+            Call.duration_seconds,
+        )
+        .filter(Call.external_call_id.in_(list(events)))
+        .all()
+    )
+
+    rows: List[Dict[str, Any]] = []
+    outbox: List[Dict[str, Any]] = []
+    stale = 0
+    for call in calls:
+        event = events[call.external_call_id]
+        if not event.supersedes(call.status, call.status_event_at):
+            stale += 1
+            # answered, опоздавший после финального статуса, все еще задает начало разговора
+            if event.answered_at is not None and call.start_time is None:
+                rows.append({"id": call.id, "start_time": event.answered_at})
+            continue
+        row: Dict[str, Any] = {"id": call.id, "status": event.status, "status_event_at": event.event_at}
+        changes: Dict[str, List[Any]] = {}
+        if event.status != call.status:
+            changes["status"] = [call.status.value if call.status else None, event.status.value]
+        if event.answered_at is not None and call.start_time is None:
+            row["start_time"] = event.answered_at
+        if event.status in TERMINAL_STATUSES:
+            row["end_time"] = event.event_at
+        if event.duration_seconds is not None and event.duration_seconds != call.duration_seconds:
+            row["duration_seconds"] = event.duration_seconds
+            changes["duration_seconds"] = [call.duration_seconds, event.duration_seconds]
+        rows.append(row)
+        if changes:
+            outbox.append({
+                "aggregate_type": "call",
+                "aggregate_id": call.id,
+                "event_type": "updated",
+                "payload": {
+                    "id": call.id,
+                    "lead_id": call.lead_id,
+                    "agent_id": call.agent_id,
+                    "direction": call.direction.value if call.direction else None,
+                    "status": event.status.value,
+                    "duration_seconds": row.get("duration_seconds", call.duration_seconds),
+                    "changed_fields": sorted({"status_event_at", *row} - {"id"}),
+                    "changes": changes,
+                },
+            })
+
+    if rows:
+        db.execute(update(Call), rows)
+    # Массовый UPDATE не проходит через unit of work - события outbox пишутся явно
+    add_outbox_events(db, outbox)
+    return {"applied": len(calls) - stale, "stale": stale, "unmatched": len(events) - len(calls)}
+
+
+def run_status_batch(events: Dict[str, CallStatusEvent]) -> Dict[str, int]:
+    """Применение пачки в отдельной сессии"""
+    db = SessionLocal()
+    try:
+        result = apply_status_events(db, events)
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class CallStatusIngestor:
+    """Очередь событий статуса с пакетным сбросом.
+
+    submit() вызывается из обработчика запроса и не ходит в БД; фоновая
+    задача сбрасывает очередь раз в CALL_STATUS_FLUSH_SECONDS или сразу
+    при накоплении CALL_STATUS_BATCH_SIZE звонков. Очередь хранится в памяти
+    процесса: callback подтверждается после постановки в очередь.
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[str, CallStatusEvent] = {}
+        self._attempts: Dict[str, int] = {}  # неудачные сбросы по звонку
+        self._lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(self, events: List[CallStatusEvent]) -> None:
+        with self._lock:
+            if len(self._pending) + len(events) > settings.CALL_STATUS_MAX_PENDING:
+                raise CallStatusQueueFull("Call status queue is full")
+            coalesce(events, self._pending)
+            size = len(self._pending)
+        if self._wake is not None and size >= settings.CALL_STATUS_BATCH_SIZE:
+            self._wake.set()
+
+    def _take(self) -> Dict[str, CallStatusEvent]:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return batch
+
+    def _requeue(self, batch: Dict[str, CallStatusEvent]) -> None:
+        # События, пришедшие во время сброса, новее или схлопнутся с возвращенными
+        with self._lock:
+            self._pending = coalesce(self._pending.values(), dict(batch))
+
+    def flush(self) -> Dict[str, int]:
+        """Синхронный сброс очереди (фоновая задача, остановка, тесты).
+
+        Упавшая пачка применяется по одному звонку: событие, которое падает
+        CALL_STATUS_MAX_ATTEMPTS сбросов подряд, отбрасывается и не держит очередь.
+        """
+        totals = {"applied": 0, "stale": 0, "unmatched": 0}
+        batch = self._take()
+        if not batch:
+            return totals
+        try:
+            result = run_status_batch(batch)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning(f"Call status batch of {len(batch)} failed, applying one by one: {exc}")
+            isolated = isolate_failed_batch(
+                batch, run_status_batch, self._attempts, settings.CALL_STATUS_MAX_ATTEMPTS, totals
+            )
+            self._requeue(isolated.retry)
+            for external_call_id in isolated.dropped:
+                logger.error(f"Call status event dropped after repeated failures: {batch[external_call_id]}")
+            return isolated.totals
+        for external_call_id in batch:
+            self._attempts.pop(external_call_id, None)
+        return result
+
+    async def run_forever(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                result = await loop.run_in_executor(None, self.flush)
+                if result["applied"] or result["unmatched"]:
+                    logger.debug(f"Call status batch: {result}")
+            except Exception as exc:  # noqa: BLE001
+                logger.exception(f"Call status batch failed: {exc}")
+
+    def start(self, interval: float) -> None:
+        if not self.running:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self.run_forever(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wake = None
+        # Остаток очереди применяется до выхода
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.flush)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception(f"Call status queue flush on shutdown failed: {exc}")
+
+
+call_status_ingestor = CallStatusIngestor()
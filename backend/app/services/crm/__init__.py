@@ -0,0 +1,49 @@
+"""
+Синхронизация с внешними CRM
+"""
+from app.services.crm.adapters import (
+    CRMAdapter,
+    CRMAdapterError,
+    CRMPage,
+    CRMRateLimitError,
+    CRMRecord,
+    get_adapter,
+    register_adapter,
+)
+from app.services.crm.engine import CRMSyncEngine, CRMSyncResult, run_connection_sync
+from app.services.crm.fake import FakeCRMAdapter, FakeCRMServer
+from app.services.crm.mapping import (
+    CompiledMapping,
+    FieldMappingError,
+    compile_field_mapping,
+    get_compiled_mapping,
+    invalidate_compiled_mapping,
+)
+from app.services.crm.hubspot import HubSpotAdapter
+from app.services.crm.retry import RetryPolicy, call_with_retry
+from app.services.crm.scheduler import CRMSyncScheduler, crm_sync_scheduler
+
+__all__ = [
+    "CRMAdapter",
+    "CRMAdapterError",
+    "CRMPage",
+    "CRMRateLimitError",
+    "CRMRecord",
+    "get_adapter",
+    "register_adapter",
+    "CRMSyncEngine",
+    "CRMSyncResult",
+    "run_connection_sync",
+    "FakeCRMAdapter",
+    "FakeCRMServer",
+    "CompiledMapping",
+    "FieldMappingError",
+    "compile_field_mapping",
+    "get_compiled_mapping",
+    "invalidate_compiled_mapping",
+    "HubSpotAdapter",
+    "RetryPolicy",
+    "call_with_retry",
+    "CRMSyncScheduler",
+    "crm_sync_scheduler",
+]
@@ -0,0 +1,89 @@
+"""
+Адаптеры внешних CRM систем
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
+
+from app.models.crm_connection import CRMConnection
+
+
+class CRMAdapterError(Exception):
+    """Ошибка обращения к CRM"""
+
+
+class CRMRateLimitError(CRMAdapterError):
+    """CRM ответила ограничением частоты запросов"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class CRMRecord:
+    """Запись CRM в нормализованном виде"""
+    id: str
+    updated_at: datetime
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class CRMPage:
+    """Страница изменений; next_cursor=None означает последнюю страницу"""
+    records: List[CRMRecord]
+    next_cursor: Optional[str] = None
+
+
+class CRMAdapter(ABC):
+    """Базовый адаптер CRM.
+
+    fetch_changes возвращает записи, измененные не раньше since,
+    отсортированные по возрастанию updated_at.
+    """
+
+    object_types: Sequence[str] = ("leads", "contacts", "deals")
+
+    def __init__(self, connection: CRMConnection):
+        self.connection = connection
+
+    @abstractmethod
+    def fetch_changes(
+        self,
+        object_type: str,
+        since: Optional[datetime],
+        page_cursor: Optional[str],
+        limit: int,
+    ) -> CRMPage:
+        """Страница записей, измененных начиная с since"""
+
+    @abstractmethod
+    def push_records(self, object_type: str, records: List[Dict[str, Any]]) -> List[str]:
+        """Создание/обновление записей в CRM.
+
+        Запись с ключом "id" обновляется, без него - создается.
+        Возвращает внешние ID в порядке входных записей.
+        """
+
+    def close(self) -> None:
+        """Освобождение ресурсов (HTTP клиентов и т.п.)"""
+
+
+_ADAPTERS: Dict[str, Type[CRMAdapter]] = {}
+
+
+def register_adapter(crm_type: str) -> Callable[[Type[CRMAdapter]], Type[CRMAdapter]]:
+    """Регистрация адаптера для типа CRM"""
+    def decorator(adapter_cls: Type[CRMAdapter]) -> Type[CRMAdapter]:
+        _ADAPTERS[crm_type] = adapter_cls
+        return adapter_cls
+    return decorator
+
+
+def get_adapter(connection: CRMConnection) -> CRMAdapter:
+    """Создание адаптера для подключения"""
+    adapter_cls = _ADAPTERS.get(connection.crm_type)
+    if adapter_cls is None:
+        raise CRMAdapterError(f"CRM type '{connection.crm_type}' is not supported")
+    return adapter_cls(connection)
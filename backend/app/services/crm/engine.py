@@ -0,0 +1,566 @@
+"""
+Движок синхронизации лидов с CRM
+"""
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from loguru import logger
+from sqlalchemy import func, insert, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.crm_connection import CRMConnection
+from app.models.crm_record_hash import CRMRecordHash
+from app.models.crm_sync_cursor import CRMSyncCursor
+from app.models.lead import Lead
+from app.models.outbox import add_outbox_events
+from app.services.crm.adapters import CRMAdapter, CRMAdapterError, CRMRecord, get_adapter
+from app.services.crm.mapping import get_compiled_mapping
+from app.services.crm.retry import RetryPolicy, call_with_retry
+from app.services.phone_index import leads_by_phone, phone_index_values
+from app.utils.sql import bulk_upsert
+
+# Флаги подключения, включающие синхронизацию типа объекта
+OBJECT_TYPE_FLAGS = {
+    "leads": "sync_leads",
+    "contacts": "sync_contacts",
+    "deals": "sync_deals",
+}
+
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """Стабильный хеш смапленного payload"""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _LeadView:
+    """Лид с наложенными значениями из CRM - для расчета хеша без чтения из БД"""
+
+    def __init__(self, values: Dict[str, Any], lead: Optional[Lead] = None):
+        self._values = values
+        self._lead = lead
+
+    def __getattr__(self, name: str) -> Any:
+        if name in self._values:
+            return self._values[name]
+        return getattr(self._lead, name) if self._lead is not None else None
+
+
+@dataclass
+class ObjectSyncStats:
+    pulled: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0  # pull: запись CRM не изменилась с прошлой синхронизации
+    pushed: int = 0
+    push_skipped: int = 0  # push: payload лида не изменился
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["pull_skip_ratio"] = round(self.unchanged / self.pulled, 4) if self.pulled else 0.0
+        push_total = self.pushed + self.push_skipped
+        data["push_skip_ratio"] = round(self.push_skipped / push_total, 4) if push_total else 0.0
+        return data
+
+
+@dataclass
+class CRMSyncResult:
+    connection_id: int
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    objects: Dict[str, ObjectSyncStats] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "connection_id": self.connection_id,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "objects": {name: stats.as_dict() for name, stats in self.objects.items()},
+        }
+
+
+class CRMSyncEngine:
+    """Инкрементальная синхронизация одного подключения.
+
+    Pull: страницы изменений CRM начиная с high-water mark курсора,
+    upsert в leads пачками (по crm_type/crm_id).
+    Push: лиды, измененные после прошлого push, пачками отправляются в CRM.
+    Для каждой пары (лид, подключение) хранится хеш смапленного payload,
+    поэтому неизменившиеся записи не пишутся ни в БД, ни в CRM.
+    Курсор сдвигается после каждой страницы, поэтому прерванный запуск
+    продолжается с места остановки.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        connection: CRMConnection,
+        adapter: Optional[CRMAdapter] = None,
+        page_size: Optional[int] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+    ):
+        self.db = db
+        self.connection = connection
+        self.adapter = adapter or get_adapter(connection)
+        self.page_size = page_size or settings.CRM_SYNC_PAGE_SIZE
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.mapping = get_compiled_mapping(connection)
+
+    # --- Публичный API ---
+
+    def run(self) -> CRMSyncResult:
+        result = CRMSyncResult(connection_id=self.connection.id, started_at=datetime.utcnow())
+        direction = self.connection.sync_direction or "bidirectional"
+
+        try:
+            for object_type in self._object_types():
+                stats = result.objects.setdefault(object_type, ObjectSyncStats())
+                if direction in ("push", "bidirectional") and object_type != "deals":
+                    self._push(object_type, result.started_at, stats)
+                if direction in ("pull", "bidirectional"):
+                    self._pull(object_type, stats)
+        except Exception as exc:
+            self.db.rollback()
+            record_sync_error(self.db, self.connection.id, exc)
+            raise
+        finally:
+            self.adapter.close()
+
+        result.finished_at = datetime.utcnow()
+        self.db.execute(
+            update(CRMConnection)
+            .where(CRMConnection.id == self.connection.id)
+            .values(
+                last_sync_at=result.finished_at,
+                sync_count=func.coalesce(CRMConnection.sync_count, 0) + 1,
+                last_error=None,
+                connection_metadata={
+                    **(self.connection.connection_metadata or {}),
+                    "last_sync_stats": result.as_dict(),
+                },
+            )
+        )
+        self.db.commit()
+        return result
+
+    # --- Вспомогательные методы ---
+
+    def _object_types(self) -> List[str]:
+        return [
+            object_type
+            for object_type in self.adapter.object_types
+            if getattr(self.connection, OBJECT_TYPE_FLAGS[object_type], False)
+        ]
+
+    def _default_push_type(self) -> Optional[str]:
+        """Тип объекта CRM для лидов, еще не связанных с CRM"""
+        enabled = self._object_types()
+        for object_type in ("leads", "contacts"):
+            if object_type in enabled:
+                return object_type
+        return None
+
+    def _cursor(self, object_type: str, direction: str) -> CRMSyncCursor:
+        cursor = (
+            self.db.query(CRMSyncCursor)
+            .filter(
+                CRMSyncCursor.connection_id == self.connection.id,
+                CRMSyncCursor.object_type == object_type,
+                CRMSyncCursor.direction == direction,
+            )
+            .first()
+        )
+        if cursor is None:
+            cursor = CRMSyncCursor(
+                connection_id=self.connection.id,
+                object_type=object_type,
+                direction=direction,
+                records_synced=0,
+            )
+            self.db.add(cursor)
+        return cursor
+
+    @staticmethod
+    def _merge_custom_fields(current: Optional[Dict[str, Any]], incoming: Dict[str, Any]) -> Dict[str, Any]:
+        merged = dict(current or {})
+        for key, value in incoming.items():
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = CRMSyncEngine._merge_custom_fields(merged[key], value)
+            else:
+                merged[key] = value
+        return merged
+
+    def _stored_hashes(self, lead_ids: List[int]) -> Dict[int, str]:
+        """Хеши страницы лидов одним запросом"""
+        if not lead_ids:
+            return {}
+        return dict(
+            self.db.query(CRMRecordHash.lead_id, CRMRecordHash.payload_hash)
+            .filter(CRMRecordHash.connection_id == self.connection.id, CRMRecordHash.lead_id.in_(lead_ids))
+            .all()
+        )
+
+    def _save_hashes(self, hashes: Dict[int, str]) -> None:
+        now = datetime.utcnow()
+        bulk_upsert(
+            self.db,
+            CRMRecordHash,
+            [
+                {"connection_id": self.connection.id, "lead_id": lead_id, "payload_hash": value, "synced_at": now}
+                for lead_id, value in hashes.items()
+            ],
+            index_elements=("connection_id", "lead_id"),
+            update_columns=("payload_hash", "synced_at"),
+        )
+
+    # --- Pull ---
+
+    def _pull(self, object_type: str, stats: ObjectSyncStats) -> None:
+        cursor = self._cursor(object_type, "pull")
+        since = cursor.high_water_mark
+        page_cursor: Optional[str] = None
+
+        while True:
+            page = call_with_retry(
+                self.adapter.fetch_changes, self.retry_policy, object_type, since, page_cursor, self.page_size
+            )
+            if page.records:
+                # Дубликаты внутри страницы: последняя версия побеждает
+                records = list({record.id: record for record in page.records}.values())
+                if object_type == "deals":
+                    self._apply_deals(records, stats)
+                else:
+                    self._apply_leads(object_type, records, stats)
+
+                stats.pulled += len(records)
+                cursor.high_water_mark = max(record.updated_at for record in records)
+                cursor.records_synced = (cursor.records_synced or 0) + len(records)
+            self.db.commit()
+
+            if not page.next_cursor:
+                break
+            page_cursor = page.next_cursor
+
+    def _apply_leads(self, object_type: str, records: List[CRMRecord], stats: ObjectSyncStats) -> None:
+        crm_type = self.connection.crm_type
+        existing = {
+            lead.crm_id: lead
+            for lead in self.db.query(Lead)
+            .filter(Lead.crm_type == crm_type, Lead.crm_id.in_([record.id for record in records]))
+            .all()
+        }
+        stored_hashes = self._stored_hashes([lead.id for lead in existing.values()])
+
+        inbound, outbound = self.mapping.inbound, self.mapping.outbound
+        mapped = {record.id: phone_index_values(inbound(record.data)) for record in records}
+        # Новая запись CRM с номером лида, еще не связанного с CRM, привязывается к нему, а не дублирует
+        by_phone = leads_by_phone(
+            self.db,
+            (values.get("phone") for crm_id, values in mapped.items() if crm_id not in existing),
+            Lead.crm_id.is_(None),
+        )
+
+        inserts: List[Dict[str, Any]] = []
+        insert_hashes: Dict[str, str] = {}
+        updates: List[Dict[str, Any]] = []
+        new_hashes: Dict[int, str] = {}
+        for record in records:
+            values = mapped[record.id]
+            lead = existing.get(record.id)
+            if lead is None and values.get("phone_e164") in by_phone:
+                lead = by_phone.pop(values["phone_e164"])
+                values.update({"crm_id": record.id, "crm_type": crm_type, "crm_object_type": object_type})
+            if lead is not None:
+                if "custom_fields" in values:
+                    values["custom_fields"] = self._merge_custom_fields(lead.custom_fields, values["custom_fields"])
+                record_hash = payload_hash(outbound(_LeadView(values, lead)))
+                if stored_hashes.get(lead.id) == record_hash:
+                    stats.unchanged += 1
+                    continue
+                updates.append({"id": lead.id, **values})
+                new_hashes[lead.id] = record_hash
+            else:
+                values.setdefault("status", "new")
+                if not values.get("name"):
+                    values["name"] = values.get("email") or f"{crm_type} {record.id}"
+                insert_hashes[record.id] = payload_hash(outbound(_LeadView(values)))
+                inserts.append(
+                    {
+                        **values,
+                        "crm_id": record.id,
+                        "crm_type": crm_type,
+                        "crm_object_type": object_type,
+                        "source": "other",
+                        "source_data": {"platform": crm_type, "connection_id": self.connection.id},
+                    }
+                )
+
+        if inserts:
+            created = self.db.execute(insert(Lead).returning(Lead.id, Lead.crm_id), inserts).all()
+            for lead_id, crm_id in created:
+                new_hashes[lead_id] = insert_hashes[crm_id]
+            self._record_events("created", [lead_id for lead_id, _ in created], sorted(inserts[0]))
+        if updates:
+            self.db.execute(update(Lead), updates)
+            self._record_events(
+                "updated", [row["id"] for row in updates], sorted({key for row in updates for key in row} - {"id"})
+            )
+        # Хеш состояния после pull: следующий push не вернет эти же данные обратно в CRM
+        self._save_hashes(new_hashes)
+        stats.created += len(inserts)
+        stats.updated += len(updates)
+
+    def _apply_deals(self, records: List[CRMRecord], stats: ObjectSyncStats) -> None:
+        """Сделки не имеют отдельной модели - сохраняются в custom_fields связанного лида"""
+        by_contact = {
+            str(record.data["contact_id"]): record
+            for record in records
+            if record.data.get("contact_id")
+        }
+        if not by_contact:
+            return
+
+        leads = (
+            self.db.query(Lead.id, Lead.crm_id, Lead.custom_fields)
+            .filter(Lead.crm_type == self.connection.crm_type, Lead.crm_id.in_(list(by_contact)))
+            .all()
+        )
+        updates = []
+        for lead_id, crm_id, custom_fields in leads:
+            deal = by_contact[crm_id]
+            deal_data = {key: value for key, value in deal.data.items() if key != "contact_id"}
+            updates.append(
+                {
+                    "id": lead_id,
+                    "custom_fields": {**(custom_fields or {}), "crm_deal": {"id": deal.id, **deal_data}},
+                }
+            )
+
+        if updates:
+            self.db.execute(update(Lead), updates)
+            self._record_events("updated", [row["id"] for row in updates], ["custom_fields"])
+        stats.updated += len(updates)
+
+    # --- Push ---
+
+    def _push(self, object_type: str, until: datetime, stats: ObjectSyncStats) -> None:
+        cursor = self._cursor(object_type, "push")
+        crm_type = self.connection.crm_type
+        changed_at = func.coalesce(Lead.updated_at, Lead.created_at)
+
+        query = self.db.query(Lead).filter(
+            or_(Lead.crm_type.is_(None), Lead.crm_type == crm_type),
+            changed_at <= until,
+        )
+        if object_type == self._default_push_type():
+            query = query.filter(or_(Lead.crm_object_type.is_(None), Lead.crm_object_type == object_type))
+        else:
+            query = query.filter(Lead.crm_object_type == object_type)
+        if cursor.high_water_mark is not None:
+            query = query.filter(changed_at > cursor.high_water_mark)
+
+        last_id = 0
+        while True:
+            leads = query.filter(Lead.id > last_id).order_by(Lead.id).limit(self.page_size).all()
+            if not leads:
+                break
+            last_id = leads[-1].id
+
+            pushed = self._push_page(object_type, leads, stats)
+            cursor.records_synced = (cursor.records_synced or 0) + pushed
+            self.db.commit()
+
+        cursor.high_water_mark = until
+        self.db.commit()
+
+
+    def _push_page(self, object_type: str, leads: List[Lead], stats: ObjectSyncStats) -> int:
+        """Отправка страницы лидов; неизменившиеся по хешу пропускаются"""
+        crm_type = self.connection.crm_type
+        outbound = self.mapping.outbound
+        stored_hashes = self._stored_hashes([lead.id for lead in leads])
+        changed: List[Lead] = []
+        payloads = []
+        new_hashes: Dict[int, str] = {}
+        for lead in leads:
+            payload = outbound(lead)
+            lead_hash = payload_hash(payload)
+            if lead.crm_id and stored_hashes.get(lead.id) == lead_hash:
+                continue
+            if lead.crm_id:
+                payload["id"] = lead.crm_id
+            changed.append(lead)
+            payloads.append(payload)
+            new_hashes[lead.id] = lead_hash
+
+        stats.push_skipped += len(leads) - len(changed)
+        if not changed:
+            return 0
+
+        remote_ids = call_with_retry(self.adapter.push_records, self.retry_policy, object_type, payloads)
+
+        # Связываем новые записи; updated_at сохраняем, чтобы связь не считалась изменением
+        links = [
+            {
+                "id": lead.id,
+                "crm_id": remote_id,
+                "crm_type": crm_type,
+                "crm_object_type": object_type,
+                "updated_at": lead.updated_at,
+            }
+            for lead, remote_id in zip(changed, remote_ids)
+            if not lead.crm_id and remote_id
+        ]
+        if links:
+            self.db.execute(update(Lead), links)
+            self._record_events(
+                "updated", [link["id"] for link in links], ["crm_id", "crm_type", "crm_object_type"]
+            )
+        self._save_hashes(new_hashes)
+
+        stats.pushed += len(changed)
+        return len(changed)
+
+    def push_leads(self, lead_ids: List[int]) -> ObjectSyncStats:
+        """Отправка конкретных лидов без обхода таблицы (для ленты изменений outbox)"""
+        stats = ObjectSyncStats()
+        enabled = [object_type for object_type in self._object_types() if object_type != "deals"]
+        default_type = self._default_push_type()
+        crm_type = self.connection.crm_type
+        try:
+            for start in range(0, len(lead_ids), self.page_size):
+                leads = (
+                    self.db.query(Lead)
+                    .filter(
+                        Lead.id.in_(lead_ids[start:start + self.page_size]),
+                        or_(Lead.crm_type.is_(None), Lead.crm_type == crm_type),
+                    )
+                    .order_by(Lead.id)
+                    .all()
+                )
+                by_type: Dict[str, List[Lead]] = {}
+                for lead in leads:
+                    object_type = lead.crm_object_type or default_type
+                    if object_type in enabled:
+                        by_type.setdefault(object_type, []).append(lead)
+                for object_type, group in by_type.items():
+                    self._push_page(object_type, group, stats)
+                self.db.commit()
+        finally:
+            self.adapter.close()
+        return stats
+
+    def _record_events(self, event_type: str, lead_ids: List[int], changed_fields: List[str]) -> None:
+        """События outbox для массовых записей (source=crm, чтобы их не отправляли обратно в CRM)"""
+        add_outbox_events(
+            self.db,
+            [
+                {
+                    "aggregate_type": "lead",
+                    "aggregate_id": lead_id,
+                    "event_type": event_type,
+                    "payload": {
+                        "id": lead_id,
+                        "lead_id": lead_id,
+                        "source": "crm",
+                        "connection_id": self.connection.id,
+                        "changed_fields": changed_fields,
+                    },
+                }
+                for lead_id in lead_ids
+            ],
+        )
+
+
+def record_sync_error(db: Session, connection_id: int, exc: Exception) -> None:
+    """Фиксация ошибки; счетчик увеличивается в SQL, поэтому параллельные запуски не теряют инкременты"""
+    db.execute(
+        update(CRMConnection)
+        .where(CRMConnection.id == connection_id)
+        .values(
+            error_count=func.coalesce(CRMConnection.error_count, 0) + 1,
+            last_error=str(exc)[:2000],
+        )
+    )
+    db.commit()
+
+
+# Подключения, синхронизируемые в этом процессе (защита от параллельного запуска)
+_running: set = set()
+_running_lock = threading.Lock()
+
+
+@contextmanager
+def _sync_slot(connection_id: int) -> Iterator[bool]:
+    with _running_lock:
+        acquired = connection_id not in _running
+        _running.add(connection_id)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with _running_lock:
+                _running.discard(connection_id)
+
+
+def run_connection_sync(connection_id: int) -> Optional[CRMSyncResult]:
+    """Запуск синхронизации в отдельной сессии (для фоновых задач)"""
+    with _sync_slot(connection_id) as acquired:
+        if not acquired:
+            logger.info(f"CRM sync for connection {connection_id} is already running")
+            return None
+
+        db = SessionLocal()
+        try:
+            connection = db.query(CRMConnection).filter(CRMConnection.id == connection_id).first()
+            if not connection or not connection.is_active:
+                return None
+            try:
+                engine = CRMSyncEngine(db, connection)
+            except CRMAdapterError as exc:
+                record_sync_error(db, connection_id, exc)
+                raise
+            result = engine.run()
+            logger.info(f"CRM sync finished: {result.as_dict()}")
+            return result
+        except Exception as exc:  # noqa: BLE001
+            logger.exception(f"CRM sync failed for connection {connection_id}: {exc}")
+            return None
+        finally:
+            db.close()
+
+
+def push_connection_leads(connection_id: int, lead_ids: List[int]) -> bool:
+    """Отправка изменившихся лидов в CRM; False - подключение сейчас синхронизируется.
+
+    Ошибки фиксируются в подключении и не пробрасываются: пропущенные лиды
+    отправит очередная полная синхронизация по окну push курсора.
+    """
+    with _sync_slot(connection_id) as acquired:
+        if not acquired:
+            return False
+
+        db = SessionLocal()
+        try:
+            connection = db.query(CRMConnection).filter(CRMConnection.id == connection_id).first()
+            if not connection or not connection.is_active:
+                return True
+            try:
+                stats = CRMSyncEngine(db, connection).push_leads(lead_ids)
+            except Exception as exc:  # noqa: BLE001
+                db.rollback()
+                record_sync_error(db, connection_id, exc)
+                logger.warning(f"CRM push failed for connection {connection_id}: {exc}")
+                return True
+            if stats.pushed:
+                logger.info(f"CRM push for connection {connection_id}: {stats.as_dict()}")
+            return True
+        finally:
+            db.close()
@@ -0,0 +1,127 @@
+"""
+In-process CRM сервер для тестов и локальной разработки
+"""
+import threading
+import time
+from datetime import datetime
+from itertools import count
+from typing import Any, Dict, List, Optional
+
+from app.services.crm.adapters import (
+    CRMAdapter,
+    CRMPage,
+    CRMRateLimitError,
+    CRMRecord,
+    register_adapter,
+)
+
+
+class FakeCRMServer:
+    """Хранилище объектов CRM в памяти с выдачей изменений по страницам"""
+
+    _instances: Dict[str, "FakeCRMServer"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self):
+        self.objects: Dict[str, Dict[str, Dict[str, Any]]] = {
+            "leads": {},
+            "contacts": {},
+            "deals": {},
+        }
+        self.fetch_calls = 0
+        self.push_calls = 0
+        # Имитация поведения реального API: задержка ответа и отказы 429
+        self.latency = 0.0
+        self.throttle_next = 0
+        self.retry_after: Optional[float] = None
+        self._ids = count(1)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, name: str = "default") -> "FakeCRMServer":
+        with cls._instances_lock:
+            if name not in cls._instances:
+                cls._instances[name] = cls()
+            return cls._instances[name]
+
+    @classmethod
+    def reset(cls, name: Optional[str] = None) -> None:
+        with cls._instances_lock:
+            if name is None:
+                cls._instances.clear()
+            else:
+                cls._instances.pop(name, None)
+
+    def simulate_request(self) -> None:
+        """Задержка и, если запрошено, ответ 429 на очередной вызов API"""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.throttle_next > 0:
+                self.throttle_next -= 1
+                raise CRMRateLimitError("Fake CRM rate limit exceeded", retry_after=self.retry_after)
+
+    def upsert(
+        self,
+        object_type: str,
+        data: Dict[str, Any],
+        object_id: Optional[str] = None,
+        updated_at: Optional[datetime] = None,
+    ) -> str:
+        with self._lock:
+            object_id = object_id or str(next(self._ids))
+            stored = self.objects[object_type].setdefault(object_id, {"data": {}})
+            stored["data"].update(data)
+            stored["updated_at"] = updated_at or datetime.utcnow()
+            return object_id
+
+    def list_changed(
+        self,
+        object_type: str,
+        since: Optional[datetime],
+        after: Optional[str],
+        limit: int,
+    ) -> CRMPage:
+        with self._lock:
+            self.fetch_calls += 1
+            items = sorted(
+                (
+                    (stored["updated_at"], object_id, stored["data"])
+                    for object_id, stored in self.objects[object_type].items()
+                    if since is None or stored["updated_at"] >= since
+                ),
+                key=lambda item: (item[0], item[1]),
+            )
+
+        offset = int(after) if after else 0
+        page = items[offset:offset + limit]
+        next_cursor = str(offset + limit) if offset + limit < len(items) else None
+        return CRMPage(
+            records=[
+                CRMRecord(id=object_id, updated_at=updated_at, data=dict(data))
+                for updated_at, object_id, data in page
+            ],
+            next_cursor=next_cursor,
+        )
+
+
+@register_adapter("fake")
+class FakeCRMAdapter(CRMAdapter):
+    """Адаптер к FakeCRMServer; имя сервера берется из org_id подключения"""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.server = FakeCRMServer.get(connection.org_id or "default")
+
+    def fetch_changes(self, object_type, since, page_cursor, limit):
+        self.server.simulate_request()
+        return self.server.list_changed(object_type, since, page_cursor, limit)
+
+    def push_records(self, object_type, records):
+        self.server.simulate_request()
+        self.server.push_calls += 1
+        remote_ids: List[str] = []
+        for record in records:
+            data = {key: value for key, value in record.items() if key != "id"}
+            remote_ids.append(self.server.upsert(object_type, data, object_id=record.get("id")))
+        return remote_ids
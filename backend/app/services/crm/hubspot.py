@@ -0,0 +1,187 @@
+"""
+Адаптер HubSpot (CRM API v3)
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.services.crm.adapters import (
+    CRMAdapter,
+    CRMAdapterError,
+    CRMPage,
+    CRMRateLimitError,
+    CRMRecord,
+    register_adapter,
+)
+
+HUBSPOT_API_URL = "https://api.hubapi.com"
+
+# Свойство "дата изменения" отличается у разных объектов HubSpot
+MODIFIED_PROPERTY = {
+    "contacts": "lastmodifieddate",
+    "deals": "hs_lastmodifieddate",
+}
+
+# Каноническое поле -> свойство HubSpot
+CONTACT_PROPERTIES = {
+    "email": "email",
+    "phone": "phone",
+    "company": "company",
+    "position": "jobtitle",
+    "website": "website",
+    "city": "city",
+    "state": "state",
+    "country": "country",
+    "postal_code": "zip",
+    "industry": "industry",
+}
+
+DEAL_PROPERTIES = {
+    "name": "dealname",
+    "amount": "amount",
+    "stage": "dealstage",
+    "pipeline": "pipeline",
+    "close_date": "closedate",
+}
+
+
+def _parse_datetime(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@register_adapter("hubspot")
+class HubSpotAdapter(CRMAdapter):
+    """HubSpot не имеет отдельного объекта лидов - лиды хранятся как контакты"""
+
+    object_types = ("contacts", "deals")
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        token = connection.access_token or settings.HUBSPOT_API_KEY
+        if not token:
+            raise CRMAdapterError("HubSpot access token is not configured")
+        self.client = httpx.Client(
+            base_url=HUBSPOT_API_URL,
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=30.0,
+        )
+
+    def _request(self, method: str, url: str, **kwargs) -> Dict[str, Any]:
+        try:
+            response = self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as exc:
+            raise CRMAdapterError(f"HubSpot request failed: {exc}") from exc
+
+        if response.status_code == 429:
+            retry_after = response.headers.get("Retry-After")
+            raise CRMRateLimitError(
+                "HubSpot rate limit exceeded",
+                retry_after=float(retry_after) if retry_after else None,
+            )
+        if response.status_code >= 400:
+            raise CRMAdapterError(f"HubSpot API error {response.status_code}: {response.text[:500]}")
+        return response.json()
+
+    @staticmethod
+    def _from_contact(properties: Dict[str, Any]) -> Dict[str, Any]:
+        data = {field: properties.get(prop) for field, prop in CONTACT_PROPERTIES.items()}
+        full_name = " ".join(filter(None, [properties.get("firstname"), properties.get("lastname")]))
+        data["name"] = full_name or properties.get("email")
+        return data
+
+    @staticmethod
+    def _to_contact(data: Dict[str, Any]) -> Dict[str, Any]:
+        properties = {prop: data[field] for field, prop in CONTACT_PROPERTIES.items() if field in data}
+        if data.get("name"):
+            first_name, _, last_name = str(data["name"]).partition(" ")
+            properties["firstname"] = first_name
+            properties["lastname"] = last_name
+        return properties
+
+    def _deal_contacts(self, deal_ids: List[str]) -> Dict[str, str]:
+        """Первый связанный контакт для каждой сделки"""
+        if not deal_ids:
+            return {}
+        payload = self._request(
+            "POST",
+            "/crm/v4/associations/deals/contacts/batch/read",
+            json={"inputs": [{"id": deal_id} for deal_id in deal_ids]},
+        )
+        contacts: Dict[str, str] = {}
+        for item in payload.get("results", []):
+            targets = item.get("to") or []
+            if targets:
+                contacts[str(item["from"]["id"])] = str(targets[0]["toObjectId"])
+        return contacts
+
+    def fetch_changes(self, object_type, since, page_cursor, limit):
+        modified = MODIFIED_PROPERTY[object_type]
+        properties = CONTACT_PROPERTIES if object_type == "contacts" else DEAL_PROPERTIES
+        extra = ["firstname", "lastname"] if object_type == "contacts" else []
+        body: Dict[str, Any] = {
+            "sorts": [{"propertyName": modified, "direction": "ASCENDING"}],
+            "properties": list(properties.values()) + extra + [modified],
+            "limit": min(limit, 100),
+        }
+        if since is not None:
+            since_ms = int(since.replace(tzinfo=timezone.utc).timestamp() * 1000)
+            body["filterGroups"] = [
+                {"filters": [{"propertyName": modified, "operator": "GTE", "value": str(since_ms)}]}
+            ]
+        if page_cursor:
+            body["after"] = page_cursor
+
+        payload = self._request("POST", f"/crm/v3/objects/{object_type}/search", json=body)
+        results = payload.get("results", [])
+        if object_type == "contacts":
+            records = [
+                CRMRecord(
+                    id=str(item["id"]),
+                    updated_at=_parse_datetime(item["updatedAt"]),
+                    data=self._from_contact(item.get("properties") or {}),
+                )
+                for item in results
+            ]
+        else:
+            contacts = self._deal_contacts([str(item["id"]) for item in results])
+            records = []
+            for item in results:
+                deal_properties = item.get("properties") or {}
+                data = {field: deal_properties.get(prop) for field, prop in DEAL_PROPERTIES.items()}
+                data["contact_id"] = contacts.get(str(item["id"]))
+                records.append(
+                    CRMRecord(id=str(item["id"]), updated_at=_parse_datetime(item["updatedAt"]), data=data)
+                )
+        next_cursor: Optional[str] = (payload.get("paging") or {}).get("next", {}).get("after")
+        return CRMPage(records=records, next_cursor=next_cursor)
+
+    def push_records(self, object_type, records):
+        if object_type != "contacts":
+            raise CRMAdapterError(f"HubSpot push is not supported for '{object_type}'")
+
+        remote_ids: List[Optional[str]] = [record.get("id") for record in records]
+
+        updates = [
+            {"id": record["id"], "properties": self._to_contact(record)}
+            for record in records
+            if record.get("id")
+        ]
+        if updates:
+            self._request("POST", f"/crm/v3/objects/{object_type}/batch/update", json={"inputs": updates})
+
+        # Порядок результатов batch/create не гарантирован, поэтому новые записи создаются по одной
+        for index, record in enumerate(records):
+            if record.get("id"):
+                continue
+            created = self._request(
+                "POST", f"/crm/v3/objects/{object_type}", json={"properties": self._to_contact(record)}
+            )
+            remote_ids[index] = str(created["id"])
+
+        return remote_ids
+
+    def close(self) -> None:
+        self.client.close()
@@ -0,0 +1,232 @@
+"""
+Компиляция маппинга полей CRM
+
+Формат CRMConnection.field_mapping - словарь "локальное поле -> источник":
+
+    {
+        "email": "work_email",
+        "company": {"source": "org.name", "default": "Новый клиент"},
+        "score": {"source": "rating", "type": "float", "default": 0},
+        "custom_fields.budget.amount": {"source": "deal.amount", "type": "int"},
+        "notes": null
+    }
+
+Источник - путь через точку во вложенных данных записи CRM. Ключ
+custom_fields.<путь> пишет во вложенные custom_fields лида. Значение null
+исключает поле из обмена. Маппинг накладывается на каноническое
+соответствие полей (LEAD_FIELDS) и компилируется в две функции - для
+входящих записей и для исходящих лидов - без интерпретации на каждую запись.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Поля лида, которыми обмениваемся с CRM (канонические имена)
+LEAD_FIELDS = (
+    "name", "email", "phone", "company", "position", "website", "address",
+    "city", "state", "country", "postal_code", "industry", "company_size",
+    "annual_revenue", "status", "notes",
+)
+
+# Дополнительные поля лида, доступные как цели маппинга
+EXTRA_TARGETS = ("score", "score_category", "tags", "next_follow_up")
+
+CUSTOM_PREFIX = "custom_fields."
+
+
+class FieldMappingError(ValueError):
+    """Некорректный маппинг полей"""
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "on")
+    return bool(value)
+
+
+def _to_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def _to_str(value: Any) -> str:
+    return value if value.__class__ is str else str(value)
+
+
+COERCIONS: Dict[str, Callable[[Any], Any]] = {
+    "str": _to_str,
+    "int": lambda value: int(float(value)) if isinstance(value, str) else int(value),
+    "float": float,
+    "bool": _to_bool,
+    "datetime": _to_datetime,
+}
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    target: Tuple[str, ...]  # ("email",) или ("custom_fields", "budget", "amount")
+    source: Tuple[str, ...]
+    type: Optional[str] = None
+    default: Any = None
+    has_default: bool = False
+
+
+@dataclass
+class CompiledMapping:
+    fingerprint: str
+    inbound: Callable[[Dict[str, Any]], Dict[str, Any]]  # запись CRM -> значения лида
+    outbound: Callable[[Any], Dict[str, Any]]  # лид -> запись CRM
+    source: str  # сгенерированный код (для отладки)
+
+
+def mapping_fingerprint(mapping: Optional[Dict[str, Any]]) -> str:
+    raw = json.dumps(mapping or {}, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _split_path(path: Any, what: str) -> Tuple[str, ...]:
+    if not isinstance(path, str) or not path.strip():
+        raise FieldMappingError(f"Mapping {what} must be a non-empty string")
+    parts = tuple(part.strip() for part in path.split("."))
+    if any(not part for part in parts):
+        raise FieldMappingError(f"Invalid mapping path '{path}'")
+    return parts
+
+
+def parse_field_mapping(mapping: Optional[Dict[str, Any]]) -> List[FieldSpec]:
+    """Проверка маппинга и наложение на каноническое соответствие полей"""
+    if mapping is not None and not isinstance(mapping, dict):
+        raise FieldMappingError("field_mapping must be an object")
+
+    specs: Dict[str, Optional[FieldSpec]] = {
+        name: FieldSpec(target=(name,), source=(name,)) for name in LEAD_FIELDS
+    }
+
+    for target, rule in (mapping or {}).items():
+        target_path = _split_path(target, "target")
+        if target.startswith(CUSTOM_PREFIX):
+            if len(target_path) < 2:
+                raise FieldMappingError(f"Invalid custom field target '{target}'")
+        elif len(target_path) != 1 or target not in LEAD_FIELDS + EXTRA_TARGETS:
+            raise FieldMappingError(f"Unknown lead field '{target}'")
+
+        if rule is None:
+            specs[target] = None
+            continue
+        if isinstance(rule, str):
+            rule = {"source": rule}
+        if not isinstance(rule, dict):
+            raise FieldMappingError(f"Invalid mapping rule for '{target}'")
+
+        value_type = rule.get("type")
+        if value_type is not None and value_type not in COERCIONS and value_type != "json":
+            raise FieldMappingError(f"Unknown type '{value_type}' for '{target}'")
+
+        specs[target] = FieldSpec(
+            target=target_path,
+            source=_split_path(rule.get("source", target), "source"),
+            type=None if value_type == "json" else value_type,
+            default=rule.get("default"),
+            has_default="default" in rule,
+        )
+
+    return [spec for spec in specs.values() if spec is not None]
+
+
+def _generate(specs: List[FieldSpec]) -> Tuple[str, Dict[str, Any]]:
+    """Генерация исходного кода функций inbound/outbound"""
+    namespace: Dict[str, Any] = {"_MISSING": object()}
+    lines = ["def inbound(data):", "    out = {}", "    cf = {}"]
+
+    for index, spec in enumerate(specs):
+        # Чтение вложенного пути с проверкой каждого уровня
+        lines.append(f"    v = data.get({spec.source[0]!r}, _MISSING)")
+        for part in spec.source[1:]:
+            lines.append(f"    v = v.get({part!r}, _MISSING) if v.__class__ is dict else _MISSING")
+
+        value_lines = []
+        if spec.type:
+            namespace[f"_c{index}"] = COERCIONS[spec.type]
+            value_lines += [
+                "if v is not None:",
+                "    try:",
+                f"        v = _c{index}(v)",
+                "    except (TypeError, ValueError):",
+                f"        v = _d{index}",
+            ]
+        namespace[f"_d{index}"] = spec.default
+
+        if spec.target[0] == "custom_fields":
+            container = "cf"
+            for part in spec.target[1:-1]:
+                container = f"{container}.setdefault({part!r}, {{}})"
+            assign = f"{container}[{spec.target[-1]!r}] = v"
+        else:
+            assign = f"out[{spec.target[0]!r}] = v"
+
+        lines.append("    if v is not _MISSING:")
+        lines += [f"        {line}" for line in value_lines]
+        lines.append(f"        {assign}")
+        if spec.has_default:
+            lines.append("    else:")
+            lines.append(f"        v = _d{index}")
+            lines.append(f"        {assign}")
+
+    lines += ["    if cf:", "        out['custom_fields'] = cf", "    return out", ""]
+
+    lines += ["def outbound(lead):", "    out = {}"]
+    if any(spec.target[0] == "custom_fields" for spec in specs):
+        lines.append("    cf = lead.custom_fields or {}")
+    for spec in specs:
+        if spec.target[0] == "custom_fields":
+            value = "cf"
+            for part in spec.target[1:]:
+                value = f"({value}.get({part!r}) if {value}.__class__ is dict else None)"
+        else:
+            value = f"lead.{spec.target[0]}"
+
+        container = "out"
+        for part in spec.source[:-1]:
+            container = f"{container}.setdefault({part!r}, {{}})"
+        lines.append(f"    {container}[{spec.source[-1]!r}] = {value}")
+    lines += ["    return out", ""]
+
+    return "\n".join(lines), namespace
+
+
+def compile_field_mapping(mapping: Optional[Dict[str, Any]]) -> CompiledMapping:
+    """Компиляция маппинга в функции inbound/outbound"""
+    specs = parse_field_mapping(mapping)
+    source, namespace = _generate(specs)
+    exec(compile(source, "<crm-field-mapping>", "exec"), namespace)  # noqa: S102
+    return CompiledMapping(
+        fingerprint=mapping_fingerprint(mapping),
+        inbound=namespace["inbound"],
+        outbound=namespace["outbound"],
+        source=source,
+    )
+
+
+_cache: Dict[int, CompiledMapping] = {}
+_cache_lock = threading.Lock()
+
+
+def get_compiled_mapping(connection) -> CompiledMapping:
+    """Скомпилированный маппинг подключения (кешируется по ID подключения)"""
+    fingerprint = mapping_fingerprint(connection.field_mapping)
+    compiled = _cache.get(connection.id)
+    if compiled is None or compiled.fingerprint != fingerprint:
+        # Отпечаток защищает от устаревшего кеша в других воркерах
+        compiled = compile_field_mapping(connection.field_mapping)
+        with _cache_lock:
+            _cache[connection.id] = compiled
+    return compiled
+
+
+def invalidate_compiled_mapping(connection_id: int) -> None:
+    with _cache_lock:
+        _cache.pop(connection_id, None)
@@ -0,0 +1,46 @@
+"""
+Повторы запросов к CRM при ограничении частоты
+"""
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional, TypeVar
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.crm.adapters import CRMRateLimitError
+
+T = TypeVar("T")
+
+
+@dataclass
+class RetryPolicy:
+    """Экспоненциальный backoff с jitter; Retry-After от CRM имеет приоритет"""
+    max_attempts: int = field(default_factory=lambda: settings.CRM_SYNC_MAX_RETRIES)
+    base_delay: float = field(default_factory=lambda: settings.CRM_SYNC_RETRY_BASE_DELAY)
+    max_delay: float = field(default_factory=lambda: settings.CRM_SYNC_RETRY_MAX_DELAY)
+    jitter: float = 0.2  # доля случайной добавки к задержке
+    sleep: Callable[[float], None] = time.sleep
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            # Раньше Retry-After повторять бессмысленно - jitter только сверху
+            base = retry_after
+        else:
+            base = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return base + random.uniform(0, base * self.jitter)
+
+
+def call_with_retry(func: Callable[..., T], policy: RetryPolicy, *args, **kwargs) -> T:
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except CRMRateLimitError as exc:
+            attempt += 1
+            if attempt >= policy.max_attempts:
+                raise
+            delay = policy.delay(attempt, exc.retry_after)
+            logger.warning(f"CRM rate limited, retry {attempt}/{policy.max_attempts - 1} in {delay:.2f}s")
+            policy.sleep(delay)
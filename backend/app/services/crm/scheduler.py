@@ -0,0 +1,103 @@
+"""
+Планировщик параллельной синхронизации всех CRM подключений
+"""
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.crm_connection import CRMConnection
+from app.services.crm.engine import CRMSyncResult, run_connection_sync
+
+
+class CRMSyncScheduler:
+    """Запускает синхронизацию активных подключений параллельно.
+
+    Каждое подключение синхронизируется в своей задаче, ограниченной
+    семафором своего провайдера, поэтому медленный провайдер не задерживает
+    остальных: общее время стремится к времени самого медленного подключения.
+    """
+
+    def __init__(
+        self,
+        provider_limits: Optional[Dict[str, int]] = None,
+        default_limit: Optional[int] = None,
+        runner: Callable[[int], Optional[CRMSyncResult]] = run_connection_sync,
+    ):
+        self.provider_limits = provider_limits if provider_limits is not None else settings.CRM_SYNC_PROVIDER_CONCURRENCY
+        self.default_limit = default_limit or settings.CRM_SYNC_DEFAULT_CONCURRENCY
+        self.runner = runner
+        self._task: Optional[asyncio.Task] = None
+
+    def _limit(self, crm_type: str) -> int:
+        return max(1, self.provider_limits.get(crm_type, self.default_limit))
+
+    @staticmethod
+    def _active_connections() -> List[Tuple[int, str]]:
+        db = SessionLocal()
+        try:
+            return [
+                (connection_id, crm_type)
+                for connection_id, crm_type in db.query(CRMConnection.id, CRMConnection.crm_type)
+                .filter(CRMConnection.is_active.is_(True))
+                .all()
+            ]
+        finally:
+            db.close()
+
+    async def run_all(self) -> Dict[int, Optional[CRMSyncResult]]:
+        """Один проход синхронизации по всем активным подключениям"""
+        loop = asyncio.get_running_loop()
+        connections = await loop.run_in_executor(None, self._active_connections)
+        if not connections:
+            return {}
+
+        semaphores = {
+            crm_type: asyncio.Semaphore(self._limit(crm_type))
+            for crm_type in {crm_type for _, crm_type in connections}
+        }
+        # Потоков хватает на все провайдеры сразу - пул не становится общим узким местом
+        workers = sum(min(self._limit(crm_type), sum(1 for _, t in connections if t == crm_type)) for crm_type in semaphores)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crm-sync") as executor:
+            async def run_one(connection_id: int, crm_type: str) -> Optional[CRMSyncResult]:
+                async with semaphores[crm_type]:
+                    return await loop.run_in_executor(executor, self.runner, connection_id)
+
+            results = await asyncio.gather(
+                *(run_one(connection_id, crm_type) for connection_id, crm_type in connections)
+            )
+
+        summary = dict(zip((connection_id for connection_id, _ in connections), results))
+        failed = sum(1 for result in results if result is None)
+        logger.info(f"CRM sync pass finished: {len(connections)} connections, {failed} failed or skipped")
+        return summary
+
+    async def run_forever(self, interval: float) -> None:
+        """Периодический запуск с небольшим jitter, чтобы воркеры не стартовали синхронно"""
+        while True:
+            try:
+                await self.run_all()
+            except Exception as exc:  # noqa: BLE001
+                logger.exception(f"CRM sync pass failed: {exc}")
+            await asyncio.sleep(interval + random.uniform(0, interval * 0.1))
+
+    def start(self, interval: float) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+crm_sync_scheduler = CRMSyncScheduler()
@@ -0,0 +1,94 @@
+"""
+Сводка для главной страницы: лиды, воронка сообщений, звонки за день и просроченные задачи
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from app.models.call import Call, CallStatus, CallTask
+from app.models.lead import Lead
+from app.models.message import Message, MessageStatus
+from app.services.analytics import ANSWERED_CALL_STATUSES
+
+OPEN_TASK_STATUSES = ("pending", "in_progress")
+OVERDUE_TASKS_SHOWN = 5
+
+
+def dashboard_summary(db: Session, user_id: Optional[int], now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Сводка пользователя (user_id=None - по всей команде); пять запросов с группировкой в БД"""
+    now = now or datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1)
+
+    # Лиды: статус и категория скоринга одним GROUP BY
+    leads = db.query(Lead.status, Lead.score_category, func.count(Lead.id))
+    if user_id is not None:
+        leads = leads.filter(Lead.assigned_to == user_id)
+    by_status: Dict[str, int] = {}
+    by_category: Dict[str, int] = {}
+    for lead_status, category, count in leads.group_by(Lead.status, Lead.score_category).all():
+        by_status[lead_status or "unknown"] = by_status.get(lead_status or "unknown", 0) + count
+        by_category[category or "unknown"] = by_category.get(category or "unknown", 0) + count
+
+    messages = db.query(Message.status, func.count(Message.id))
+    if user_id is not None:
+        messages = messages.filter(Message.created_by == user_id)
+    message_counts = {message_status.value: 0 for message_status in MessageStatus}
+    for message_status, count in messages.group_by(Message.status).all():
+        if message_status is not None:
+            message_counts[message_status.value] = count
+
+    calls = db.query(
+        func.count(Call.id),
+        func.sum(case((Call.status.in_(ANSWERED_CALL_STATUSES), 1), else_=0)),
+        func.sum(case((Call.status == CallStatus.COMPLETED, 1), else_=0)),
+        func.sum(Call.duration_seconds),
+    ).filter(Call.created_at >= today, Call.created_at < tomorrow)
+    if user_id is not None:
+        calls = calls.filter(Call.agent_id == user_id)
+    total_calls, answered, completed, duration = calls.one()
+
+    # Открытые задачи со сроком до конца дня: просроченные и на сегодня
+    tasks = db.query(CallTask).filter(
+        CallTask.status.in_(OPEN_TASK_STATUSES),
+        CallTask.due_at < tomorrow,
+    )
+    if user_id is not None:
+        tasks = tasks.filter(CallTask.assigned_to == user_id)
+    overdue, due_today = tasks.with_entities(
+        func.sum(case((CallTask.due_at < now, 1), else_=0)),
+        func.sum(case((CallTask.due_at >= now, 1), else_=0)),
+    ).one()
+    oldest_overdue = (
+        tasks.filter(CallTask.due_at < now)
+        .order_by(CallTask.due_at, CallTask.id)
+        .limit(OVERDUE_TASKS_SHOWN)
+        .all()
+    )
+
+    return {
+        "user_id": user_id,
+        "generated_at": now,
+        "leads": {
+            "total": sum(by_status.values()),
+            "by_status": by_status,
+            "by_score_category": by_category,
+        },
+        "messages": {
+            "total": sum(message_counts.values()),
+            "by_status": message_counts,
+        },
+        "calls_today": {
+            "total": total_calls or 0,
+            "answered": answered or 0,
+            "completed": completed or 0,
+            "total_duration_seconds": duration or 0,
+        },
+        "tasks": {
+            "overdue": overdue or 0,
+            "due_today": due_today or 0,
+            "oldest_overdue": oldest_overdue,
+        },
+    }
@@ -0,0 +1,477 @@
+"""
+Поиск и слияние дубликатов лидов
+
+Лиды сравниваются не попарно со всеми, а только внутри блоков - групп с
+общим ключом блокировки (нормализованная компания, ее префикс, домен сайта
+или корпоративной почты, телефон E.164). Ключи хранятся в lead_dedup_keys с
+индексом по ключу, поэтому блок нового лида находится одним запросом. Блоки
+крупнее DEDUP_MAX_BLOCK_SIZE пропускаются (общий префикс, домен хостинга):
+стоимость прохода по базе ограничена n * DEDUP_MAX_BLOCK_SIZE сравнениями.
+Пары выше DEDUP_MIN_SCORE сохраняются кандидатами для ручного слияния.
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from loguru import logger
+from sqlalchemy import delete, func, insert, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.call import Call, CallTask
+from app.models.crm_record_hash import CRMRecordHash
+from app.models.lead import Lead
+from app.models.lead_duplicate import LeadDedupKey, LeadDuplicateCandidate
+from app.models.lead_interaction import LeadInteraction
+from app.models.message import Message
+from app.models.outbox import add_outbox_events
+from app.utils.sql import bulk_upsert
+
+# Организационно-правовые формы не отличают компании друг от друга
+LEGAL_FORMS = frozenset({
+    "gmbh", "mbh", "ag", "ug", "kg", "ohg", "gbr", "ev", "ek", "kgaa",
+    "ltd", "limited", "llc", "llp", "lp", "inc", "incorporated", "corp", "corporation", "co", "plc",
+    "sa", "sas", "sarl", "srl", "spa", "bv", "nv", "oy", "ab", "as", "aps",
+    "ооо", "оао", "зао", "пао", "ао", "ип", "тоо",
+})
+# Заглушки вместо названия компании (create_lead подставляет "Новый клиент")
+PLACEHOLDER_COMPANIES = frozenset({"новый клиент", "n a", "na", "none", "unknown", "test"})
+# Домены бесплатной почты не указывают на компанию
+FREE_EMAIL_DOMAINS = frozenset({
+    "gmail.com", "googlemail.com", "yahoo.com", "outlook.com", "hotmail.com", "live.com", "icloud.com",
+    "me.com", "aol.com", "proton.me", "protonmail.com", "gmx.de", "gmx.net", "web.de", "t-online.de",
+    "mail.ru", "yandex.ru", "ya.ru", "bk.ru", "inbox.ru", "list.ru", "rambler.ru", "example.com",
+})
+
+# Вес признака в итоговой оценке; учитываются признаки, заданные у обоих лидов
+WEIGHTS = {"company": 0.45, "name": 0.25, "phone": 0.15, "domain": 0.15}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_scan_lock = threading.Lock()
+
+
+class DedupScanInProgress(Exception):
+    """Полный проход уже выполняется"""
+
+
+@dataclass
+class LeadProfile:
+    """Нормализованные признаки лида для блокировки и сравнения"""
+    id: int
+    company: Optional[str] = None
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    domains: FrozenSet[str] = frozenset()
+    company_grams: FrozenSet[str] = frozenset()
+    name_grams: FrozenSet[str] = frozenset()
+    keys: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class DedupScanResult:
+    leads: int = 0
+    blocks: int = 0
+    skipped_blocks: int = 0  # крупнее DEDUP_MAX_BLOCK_SIZE
+    comparisons: int = 0
+    candidates: int = 0
+
+
+def normalize_company(value: Optional[str]) -> Optional[str]:
+    """Название в нижнем регистре без пунктуации и организационно-правовой формы"""
+    if not value:
+        return None
+    tokens = [token for token in _TOKEN_RE.findall(value.casefold().replace("_", " ")) if token not in LEGAL_FORMS]
+    normalized = " ".join(tokens)
+    return normalized if normalized and normalized not in PLACEHOLDER_COMPANIES else None
+
+
+def _domain(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    value = value.strip().lower()
+    if "@" in value:
+        host = value.rsplit("@", 1)[1]
+    else:
+        host = urlsplit(value if "//" in value else f"//{value}").hostname or ""
+    host = host.removeprefix("www.").rstrip(".")
+    return host if "." in host and host not in FREE_EMAIL_DOMAINS else None
+
+
+def trigrams(value: Optional[str]) -> FrozenSet[str]:
+    """Символьные триграммы строки с границами слов"""
+    if not value:
+        return frozenset()
+    padded = f"  {value} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def dice(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Коэффициент Дайса двух множеств триграмм (0-1)"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def build_profile(row: Any) -> LeadProfile:
+    """Профиль из строки с колонками id, name, company, email, phone_e164, website"""
+    # Компания сравнивается без пробелов: "Digital Flow" и "DigitalFlow" - одно название
+    company = (normalize_company(row.company) or "").replace(" ", "") or None
+    name = normalize_company(row.name)
+    domains = frozenset(domain for domain in (_domain(row.email), _domain(row.website)) if domain)
+    profile = LeadProfile(
+        id=row.id,
+        company=company,
+        name=name,
+        email=row.email.strip().lower() if row.email else None,
+        phone=row.phone_e164,
+        domains=domains,
+        company_grams=trigrams(company),
+        name_grams=trigrams(name),
+    )
+    if company:
+        profile.keys.add(f"co:{company}")
+        # Префикс ловит "DigitalFlow" и "DigitalFlow Studio"; крупные блоки отсекает лимит
+        if len(company) > settings.DEDUP_COMPANY_PREFIX_LENGTH:
+            profile.keys.add(f"cp:{company[:settings.DEDUP_COMPANY_PREFIX_LENGTH]}")
+    profile.keys.update(f"dom:{domain}" for domain in domains)
+    if profile.phone:
+        profile.keys.add(f"ph:{profile.phone}")
+    return profile
+
+
+def score_pair(a: LeadProfile, b: LeadProfile) -> Tuple[float, Dict[str, Any]]:
+    """Оценка сходства (0-1) и вклад признаков"""
+    if a.email and a.email == b.email:
+        return 1.0, {"email": 1.0}
+    components: Dict[str, float] = {}
+    if a.company and b.company:
+        components["company"] = 1.0 if a.company == b.company else dice(a.company_grams, b.company_grams)
+    if a.name and b.name:
+        components["name"] = 1.0 if a.name == b.name else dice(a.name_grams, b.name_grams)
+    if a.phone and b.phone:
+        components["phone"] = 1.0 if a.phone == b.phone else 0.0
+    if a.domains and b.domains:
+        components["domain"] = 1.0 if a.domains & b.domains else 0.0
+    if not components:
+        return 0.0, {}
+    total = sum(WEIGHTS[name] for name in components)
+    score = sum(WEIGHTS[name] * value for name, value in components.items()) / total
+    return round(score, 4), {name: round(value, 4) for name, value in components.items()}
+
+
+def _load_profiles(db: Session, lead_ids: Iterable[int]) -> Dict[int, LeadProfile]:
+    ids = list(set(lead_ids))
+    if not ids:
+        return {}
+    rows = (
+        db.query(Lead.id, Lead.name, Lead.company, Lead.email, Lead.phone_e164, Lead.website)
+        .filter(Lead.id.in_(ids))
+        .all()
+    )
+    return {row.id: build_profile(row) for row in rows}
+
+
+def _replace_keys(db: Session, profiles: Dict[int, LeadProfile]) -> None:
+    db.execute(delete(LeadDedupKey).where(LeadDedupKey.lead_id.in_(list(profiles))))
+    rows = [{"lead_id": lead_id, "key": key} for lead_id, profile in profiles.items() for key in profile.keys]
+    if rows:
+        db.execute(insert(LeadDedupKey), rows)
+
+
+def _save_candidates(db: Session, pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any]]]) -> int:
+    # Отклоненные пары остаются отклоненными: обновляются только оценка и признаки
+    bulk_upsert(
+        db,
+        LeadDuplicateCandidate,
+        [
+            {"lead_id": lead_id, "duplicate_id": duplicate_id, "score": score, "reasons": reasons, "status": "open"}
+            for (lead_id, duplicate_id), (score, reasons) in pairs.items()
+        ],
+        index_elements=("lead_id", "duplicate_id"),
+        update_columns=("score", "reasons"),
+    )
+    return len(pairs)
+
+
+def _score_block(
+    members: List[int],
+    profiles: Dict[int, LeadProfile],
+    pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any]]],
+    seen: Set[Tuple[int, int]],
+    only: Optional[Set[int]] = None,
+) -> int:
+    """Сравнение пар блока; пара с несколькими общими ключами оценивается один раз.
+
+    В seen попадают только такие пары: пара с одним общим ключом встречается
+    в одном блоке, и множество не растет с числом сравнений полного прохода.
+    """
+    comparisons = 0
+    for i, first in enumerate(members):
+        for second in members[i + 1:]:
+            if only is not None and first not in only and second not in only:
+                continue
+            pair = (first, second)  # участники блока упорядочены по id
+            if pair in seen or first not in profiles or second not in profiles:
+                continue
+            shared = profiles[first].keys & profiles[second].keys
+            if len(shared) > 1:
+                seen.add(pair)
+            comparisons += 1
+            score, reasons = score_pair(profiles[first], profiles[second])
+            if score >= settings.DEDUP_MIN_SCORE:
+                reasons["keys"] = sorted(shared)
+                pairs[pair] = (score, reasons)
+    return comparisons
+
+
+def _block_members(db: Session, keys: Iterable[str]) -> Tuple[Dict[str, List[int]], int]:
+    """Участники блоков с этими ключами; блоки крупнее лимита не загружаются"""
+    keys = list(set(keys))
+    if not keys:
+        return {}, 0
+    sizes = dict(
+        db.query(LeadDedupKey.key, func.count())
+        .filter(LeadDedupKey.key.in_(keys))
+        .group_by(LeadDedupKey.key)
+        .all()
+    )
+    usable = [key for key, size in sizes.items() if 1 < size <= settings.DEDUP_MAX_BLOCK_SIZE]
+    blocks: Dict[str, List[int]] = {}
+    if usable:
+        for key, lead_id in (
+            db.query(LeadDedupKey.key, LeadDedupKey.lead_id)
+            .filter(LeadDedupKey.key.in_(usable))
+            .order_by(LeadDedupKey.key, LeadDedupKey.lead_id)
+            .all()
+        ):
+            blocks.setdefault(key, []).append(lead_id)
+    skipped = sum(1 for size in sizes.values() if size > settings.DEDUP_MAX_BLOCK_SIZE)
+    return blocks, skipped
+
+
+def find_candidates_for(db: Session, lead_ids: Iterable[int]) -> int:
+    """Инкрементальный поиск для новых или измененных лидов (без commit)"""
+    lead_ids = set(lead_ids)
+    profiles = _load_profiles(db, lead_ids)
+    if not profiles:
+        return 0
+    _replace_keys(db, profiles)
+    # Признаки изменились - прежние открытые пары этих лидов пересчитываются заново
+    db.execute(
+        delete(LeadDuplicateCandidate).where(
+            LeadDuplicateCandidate.status == "open",
+            or_(
+                LeadDuplicateCandidate.lead_id.in_(list(profiles)),
+                LeadDuplicateCandidate.duplicate_id.in_(list(profiles)),
+            ),
+        )
+    )
+
+    blocks, _ = _block_members(db, (key for profile in profiles.values() for key in profile.keys))
+    others = {lead_id for members in blocks.values() for lead_id in members} - set(profiles)
+    profiles.update(_load_profiles(db, others))
+    pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any]]] = {}
+    seen: Set[Tuple[int, int]] = set()
+    for members in blocks.values():
+        _score_block(members, profiles, pairs, seen, only=lead_ids)
+    return _save_candidates(db, pairs)
+
+
+def forget_leads(db: Session, lead_ids: Iterable[int]) -> None:
+    """Удаление ключей и открытых пар удаленных лидов (без commit)"""
+    ids = list(set(lead_ids))
+    if not ids:
+        return
+    db.execute(delete(LeadDedupKey).where(LeadDedupKey.lead_id.in_(ids)))
+    db.execute(
+        delete(LeadDuplicateCandidate).where(
+            LeadDuplicateCandidate.status == "open",
+            or_(LeadDuplicateCandidate.lead_id.in_(ids), LeadDuplicateCandidate.duplicate_id.in_(ids)),
+        )
+    )
+
+
+def scan_all(db: Session, batch_size: Optional[int] = None) -> DedupScanResult:
+    """Полный проход: пересборка ключей и сравнение внутри блоков, коммит после каждой пачки"""
+    batch_size = batch_size or settings.DEDUP_BATCH_SIZE
+    result = DedupScanResult()
+
+    # 1. Ключи всех лидов пачками по id
+    db.execute(delete(LeadDedupKey))
+    last_id = 0
+    while True:
+        ids = [
+            lead_id
+            for (lead_id,) in db.query(Lead.id).filter(Lead.id > last_id).order_by(Lead.id).limit(batch_size).all()
+        ]
+        if not ids:
+            break
+        last_id = ids[-1]
+        _replace_keys(db, _load_profiles(db, ids))
+        result.leads += len(ids)
+        db.commit()
+
+    # 2. Открытые пары пересчитываются; отклоненные сохраняются
+    db.execute(delete(LeadDuplicateCandidate).where(LeadDuplicateCandidate.status != "dismissed"))
+    db.commit()
+
+    # 3. Блоки пачками по ключу: в пачке не больше batch_size ключей.
+    # seen общий для всех пачек: пара с общими ключами из разных пачек оценивается один раз
+    seen: Set[Tuple[int, int]] = set()
+    last_key = ""
+    while True:
+        block_rows = (
+            db.query(LeadDedupKey.key, func.count())
+            .filter(LeadDedupKey.key > last_key)
+            .group_by(LeadDedupKey.key)
+            .having(func.count() > 1)
+            .order_by(LeadDedupKey.key)
+            .limit(batch_size)
+            .all()
+        )
+        if not block_rows:
+            break
+        last_key = block_rows[-1][0]
+        keys = [key for key, size in block_rows if size <= settings.DEDUP_MAX_BLOCK_SIZE]
+        result.skipped_blocks += len(block_rows) - len(keys)
+        if not keys:
+            continue
+
+        blocks, _ = _block_members(db, keys)
+        profiles = _load_profiles(db, {lead_id for members in blocks.values() for lead_id in members})
+        pairs: Dict[Tuple[int, int], Tuple[float, Dict[str, Any]]] = {}
+        for members in blocks.values():
+            result.comparisons += _score_block(members, profiles, pairs, seen)
+        result.blocks += len(blocks)
+        result.candidates += _save_candidates(db, pairs)
+        db.commit()
+    return result
+
+
+def run_dedup_scan() -> Optional[DedupScanResult]:
+    """Полный проход в отдельной сессии (для фоновых задач); параллельный запуск пропускается"""
+    if not _scan_lock.acquire(blocking=False):
+        logger.info("Lead dedup scan is already running")
+        return None
+    db = SessionLocal()
+    try:
+        result = scan_all(db)
+        logger.info(f"Lead dedup scan finished: {result}")
+        return result
+    except Exception as exc:  # noqa: BLE001
+        logger.exception(f"Lead dedup scan failed: {exc}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+        _scan_lock.release()
+
+
+# Поля, которые переносятся со сливаемого лида, если у основного они пустые
+MERGE_FILL_FIELDS = (
+    "email", "phone", "company", "position", "website", "address", "city", "state", "country",
+    "postal_code", "industry", "company_size", "annual_revenue", "source", "assigned_to",
+    "instagram_user_id", "next_follow_up",
+)
+
+
+def _move_rows(db: Session, model, aggregate_type: str, source_id: int, target_id: int) -> int:
+    moved = db.scalars(
+        update(model)
+        .where(model.lead_id == source_id)
+        .values(lead_id=target_id)
+        .returning(model.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if moved:
+        # Массовый UPDATE не проходит через unit of work - события outbox пишутся явно
+        add_outbox_events(
+            db,
+            [
+                {
+                    "aggregate_type": aggregate_type,
+                    "aggregate_id": row_id,
+                    "event_type": "updated",
+                    "payload": {
+                        "id": row_id,
+                        "lead_id": target_id,
+                        "changed_fields": ["lead_id"],
+                        "changes": {"lead_id": [source_id, target_id]},
+                    },
+                }
+                for row_id in moved
+            ],
+        )
+    return len(moved)
+
+
+def merge_leads(db: Session, lead: Lead, duplicate: Lead) -> Dict[str, int]:
+    """Слияние duplicate в lead (без commit).
+
+    Сообщения, звонки, задачи и история взаимодействий переносятся к lead,
+    пустые поля lead заполняются из duplicate, теги объединяются. Сведения
+    о слитом лиде сохраняются в custom_fields["merged_leads"].
+    """
+    moved = {
+        "messages": _move_rows(db, Message, "message", duplicate.id, lead.id),
+        "calls": _move_rows(db, Call, "call", duplicate.id, lead.id),
+        "call_tasks": _move_rows(db, CallTask, "call_task", duplicate.id, lead.id),
+        "interactions": _move_rows(db, LeadInteraction, "interaction", duplicate.id, lead.id),
+    }
+
+    if duplicate.instagram_user_id and not lead.instagram_user_id:
+        # IGSID уникален: дубликат освобождает его до того, как он перейдет к основному лиду
+        db.execute(update(Lead.__table__).where(Lead.id == duplicate.id).values(instagram_user_id=None))
+    for name in MERGE_FILL_FIELDS:
+        if getattr(lead, name) in (None, "") and getattr(duplicate, name) not in (None, ""):
+            setattr(lead, name, getattr(duplicate, name))
+    if normalize_company(lead.company) is None and normalize_company(duplicate.company):
+        lead.company = duplicate.company
+    # Связь с CRM переносится целиком вместе с хешами синхронизации
+    if not lead.crm_id and duplicate.crm_id:
+        lead.crm_id, lead.crm_type, lead.crm_object_type = duplicate.crm_id, duplicate.crm_type, duplicate.crm_object_type
+        db.execute(
+            update(CRMRecordHash).where(CRMRecordHash.lead_id == duplicate.id).values(lead_id=lead.id)
+        )
+    else:
+        db.execute(delete(CRMRecordHash).where(CRMRecordHash.lead_id == duplicate.id))
+
+    if duplicate.tags:
+        lead.tags = list(dict.fromkeys([*(lead.tags or []), *duplicate.tags]))
+    # История решения хранится у основного лида: пары дубликата удаляются вместе с ним
+    merged = {"id": duplicate.id, "name": duplicate.name, "email": duplicate.email, "phone": duplicate.phone}
+    candidate = (
+        db.query(LeadDuplicateCandidate.score, LeadDuplicateCandidate.reasons)
+        .filter(
+            LeadDuplicateCandidate.lead_id == min(lead.id, duplicate.id),
+            LeadDuplicateCandidate.duplicate_id == max(lead.id, duplicate.id),
+        )
+        .first()
+    )
+    if candidate is not None:
+        merged["score"], merged["reasons"] = candidate.score, candidate.reasons
+    custom_fields = {**(duplicate.custom_fields or {}), **(lead.custom_fields or {})}
+    custom_fields["merged_leads"] = [*(lead.custom_fields or {}).get("merged_leads", []), merged]
+    lead.custom_fields = custom_fields
+    if duplicate.notes and duplicate.notes != lead.notes:
+        lead.notes = "\n\n".join(note for note in (lead.notes, duplicate.notes) if note)
+    if duplicate.last_contacted and (not lead.last_contacted or duplicate.last_contacted > lead.last_contacted):
+        lead.last_contacted = duplicate.last_contacted
+    if (duplicate.score or 0) > (lead.score or 0):
+        lead.score, lead.score_category = duplicate.score, duplicate.score_category
+
+    # Явно, а не только каскадом FK: SQLite без foreign_keys=ON каскад не выполняет
+    db.execute(
+        delete(LeadDuplicateCandidate).where(
+            or_(LeadDuplicateCandidate.lead_id == duplicate.id, LeadDuplicateCandidate.duplicate_id == duplicate.id)
+        )
+    )
+    db.execute(delete(LeadDedupKey).where(LeadDedupKey.lead_id == duplicate.id))
+    db.delete(duplicate)
+    db.flush()
+    find_candidates_for(db, [lead.id])
+    return moved
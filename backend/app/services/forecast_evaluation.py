@@ -0,0 +1,174 @@
+"""
+Оценка точности прогнозов: фактические значения закрытых периодов
+одним GROUP BY запросом на период и пакетное обновление прогнозов
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.forecast import Forecast
+from app.models.lead import Lead
+from app.services.forecasting import UNASSIGNED, accuracy_scores, average_deal_values
+
+# Статусы прогноза, для которых нет рассчитанных значений
+UNFINISHED_STATUSES = ("pending", "failed")
+
+
+def period_actuals(
+    db: Session, start: datetime, end: datetime, default_deal_value: float
+) -> Dict[Any, Dict[str, float]]:
+    """Фактические лиды, сделки и выручка по менеджерам за [start, end) - один GROUP BY.
+
+    Выручка - суммы сделок CRM (custom_fields.crm_deal.amount); сделки без суммы
+    оцениваются default_deal_value, как и в прогнозе.
+    """
+    status_time = func.coalesce(Lead.updated_at, Lead.created_at)
+    created_in_period = and_(Lead.created_at >= start, Lead.created_at < end)
+    closed_in_period = and_(Lead.status == "completed", status_time >= start, status_time < end)
+    amount = Lead.custom_fields[("crm_deal", "amount")].as_float()
+
+    rows = (
+        db.query(
+            Lead.assigned_to,
+            func.sum(case((created_in_period, 1), else_=0)),
+            func.sum(case((closed_in_period, 1), else_=0)),
+            func.sum(case((and_(closed_in_period, amount > 0), amount), else_=0)),
+            func.sum(case((and_(closed_in_period, amount > 0), 1), else_=0)),
+        )
+        .filter(or_(created_in_period, closed_in_period))
+        .group_by(Lead.assigned_to)
+        .all()
+    )
+
+    actuals = {}
+    for manager, leads, deals, amount_sum, priced_deals in rows:
+        deals = int(deals or 0)
+        unpriced = deals - int(priced_deals or 0)
+        actuals[manager] = {
+            "leads": int(leads or 0),
+            "deals": deals,
+            "revenue": float(amount_sum or 0) + unpriced * default_deal_value,
+        }
+    return actuals
+
+
+def _score(predicted: float, actual: float) -> float:
+    return float(accuracy_scores(np.array([predicted], dtype=float), np.array([actual], dtype=float))[0])
+
+
+def evaluate_closed_forecasts(db: Session, now: Optional[datetime] = None) -> int:
+    """Заполнение actual_* и accuracy_score у прогнозов закрытых периодов (без commit).
+
+    Прогнозы одного периода оцениваются по одному запросу фактических значений.
+    """
+    now = now or datetime.utcnow()
+    candidates = (
+        db.query(Forecast)
+        .filter(Forecast.period_end <= now, Forecast.actual_leads.is_(None))
+        .all()
+    )
+    forecasts = [
+        forecast for forecast in candidates
+        if (forecast.forecast_metadata or {}).get("status") not in UNFINISHED_STATUSES
+    ]
+    if not forecasts:
+        return 0
+
+    by_period: Dict[Tuple[datetime, datetime], List[Forecast]] = {}
+    for forecast in forecasts:
+        by_period.setdefault((forecast.period_start, forecast.period_end), []).append(forecast)
+
+    # Средняя сумма сделки для сделок без суммы в CRM - как при расчете прогноза
+    earliest = min(start for start, _ in by_period)
+    _, default_deal_value = average_deal_values(db, earliest - timedelta(days=settings.FORECAST_HISTORY_DAYS), [])
+
+    for (start, end), period_forecasts in by_period.items():
+        actuals = period_actuals(db, start, end, default_deal_value)
+        totals = {
+            metric: sum(values[metric] for values in actuals.values())
+            for metric in ("leads", "deals", "revenue")
+        }
+        by_manager = {str(UNASSIGNED if manager is None else manager): values for manager, values in actuals.items()}
+
+        for forecast in period_forecasts:
+            accuracy = {
+                "leads": _score(forecast.predicted_leads, totals["leads"]),
+                "deals": _score(forecast.predicted_deals, totals["deals"]),
+                "revenue": _score(forecast.predicted_revenue, totals["revenue"]),
+            }
+            forecast.actual_leads = totals["leads"]
+            forecast.actual_deals = totals["deals"]
+            forecast.actual_revenue = round(totals["revenue"], 2)
+            forecast.accuracy_score = round(sum(accuracy.values()) / len(accuracy), 4)
+
+            # JSON поля переприсваиваются целиком, иначе изменение не попадет в UPDATE
+            breakdown = {key: dict(values) for key, values in (forecast.manager_breakdown or {}).items()}
+            for key, values in by_manager.items():
+                entry = breakdown.setdefault(key, {})
+                entry.update({
+                    "actual_leads": values["leads"],
+                    "actual_deals": values["deals"],
+                    "actual_revenue": round(values["revenue"], 2),
+                })
+            forecast.manager_breakdown = breakdown
+            forecast.forecast_metadata = {
+                **(forecast.forecast_metadata or {}),
+                "accuracy": {metric: round(value, 4) for metric, value in accuracy.items()},
+                "evaluated_at": now.isoformat(),
+            }
+
+    logger.info(f"Evaluated {len(forecasts)} forecasts over {len(by_period)} closed periods")
+    return len(forecasts)
+
+
+def run_evaluation_job() -> int:
+    """Оценка закрытых прогнозов в отдельной сессии"""
+    db = SessionLocal()
+    try:
+        evaluated = evaluate_closed_forecasts(db)
+        db.commit()
+        return evaluated
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class ForecastEvaluationScheduler:
+    """Периодическая оценка прогнозов, у которых закрылся период"""
+
+    def __init__(self) -> None:
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_forever(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, run_evaluation_job)
+            except Exception as exc:  # noqa: BLE001
+                logger.exception(f"Forecast evaluation failed: {exc}")
+            await asyncio.sleep(interval)
+
+    def start(self, interval: float) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+forecast_evaluation_scheduler = ForecastEvaluationScheduler()
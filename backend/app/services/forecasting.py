@@ -0,0 +1,478 @@
+"""
+Прогнозирование продаж: исторические ряды из дневных агрегатов
+и векторизованные модели NumPy по всем менеджерам сразу
+"""
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.daily_rollup import DailyRollup
+from app.models.forecast import Forecast
+from app.models.lead import Lead
+from app.services.analytics import CALLS_COMPLETED, LEAD_STATUS_PREFIX, LEADS_CREATED, MESSAGE_STATUS_METRICS
+
+MODEL_NAME = "holt-conversion"
+MODEL_VERSION = "1.0"
+
+PERIOD_MONTHS = {"monthly": 1, "quarterly": 3, "yearly": 12}
+
+METRICS = ("leads", "deals", "messages", "calls")
+
+# Источник рядов истории в дневных агрегатах
+HISTORY_ROLLUPS = {
+    "leads": LEADS_CREATED,
+    "deals": LEAD_STATUS_PREFIX + "completed",
+    "messages": MESSAGE_STATUS_METRICS["sent"],
+    "calls": CALLS_COMPLETED,
+}
+
+# Сетка параметров Holt: подбирается для каждого ряда одновременно
+ALPHAS = np.array([0.1, 0.2, 0.3, 0.5, 0.7, 0.9])
+BETAS = np.array([0.01, 0.05, 0.1, 0.2, 0.3])
+
+# Вес априорной (общей) конверсии в лидах: сглаживает менеджеров с малой историей
+CONVERSION_PRIOR_WEIGHT = 10.0
+
+UNASSIGNED = "unassigned"
+
+
+class ForecastError(ValueError):
+    """Некорректные параметры прогноза"""
+
+
+def period_bounds(period_type: str, period_start: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """Границы периода [start, end); по умолчанию - следующий полный период"""
+    months = PERIOD_MONTHS.get(period_type)
+    if months is None:
+        raise ForecastError(f"Unknown period_type '{period_type}', expected one of {sorted(PERIOD_MONTHS)}")
+
+    if period_start is None:
+        today = datetime.utcnow()
+        index = (today.year * 12 + today.month - 1) // months + 1
+    else:
+        index = (period_start.year * 12 + period_start.month - 1) // months
+    start_month = index * months
+    end_month = start_month + months
+    start = datetime(start_month // 12, start_month % 12 + 1, 1)
+    end = datetime(end_month // 12, end_month % 12 + 1, 1)
+    return start, end
+
+
+@dataclass
+class History:
+    """Дневные ряды: metric -> матрица (менеджеры x дни)"""
+    start: date
+    days: int
+    managers: List[Any]
+    series: Dict[str, np.ndarray]
+
+
+def _to_date(value: Any) -> date:
+    # SQLite возвращает date() строкой, PostgreSQL - объектом date
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def load_history(db: Session, start: date, end: date) -> History:
+    """Дневные ряды по менеджерам за [start, end) - один запрос к дневным агрегатам"""
+    metric_index = {rollup_metric: metric for metric, rollup_metric in HISTORY_ROLLUPS.items()}
+    rows = (
+        db.query(DailyRollup.user_id, DailyRollup.metric, DailyRollup.day, DailyRollup.value)
+        .filter(DailyRollup.metric.in_(list(metric_index)), DailyRollup.day >= start, DailyRollup.day < end)
+        .all()
+    )
+
+    # user_id 0 в агрегатах - лиды/звонки без ответственного
+    managers = sorted({user_id or None for user_id, _, _, _ in rows}, key=lambda m: (m is None, m))
+    index = {manager: position for position, manager in enumerate(managers)}
+    days = (end - start).days
+    series = {metric: np.zeros((len(managers), days)) for metric in METRICS}
+    if rows:
+        user_ids, metrics, dates, values = zip(*rows)
+        row_index = np.fromiter((index[user_id or None] for user_id in user_ids), dtype=np.int64, count=len(rows))
+        day_index = np.fromiter(((_to_date(d) - start).days for d in dates), dtype=np.int64, count=len(rows))
+        values = np.asarray(values, dtype=float)
+        metric_names = np.array([metric_index[metric] for metric in metrics])
+        for metric, matrix in series.items():
+            mask = metric_names == metric
+            np.add.at(matrix, (row_index[mask], day_index[mask]), values[mask])
+    return History(start=start, days=days, managers=managers, series=series)
+
+
+def to_weekly(matrix: np.ndarray) -> np.ndarray:
+    """Недельные суммы (убирают недельную сезонность); неполная первая неделя отбрасывается"""
+    weeks = matrix.shape[1] // 7
+    if weeks == 0:
+        return np.zeros((matrix.shape[0], 0))
+    return matrix[:, matrix.shape[1] - weeks * 7:].reshape(matrix.shape[0], weeks, 7).sum(axis=2)
+
+
+@dataclass
+class HoltFit:
+    level: np.ndarray  # (ряды,)
+    trend: np.ndarray
+    alpha: np.ndarray
+    beta: np.ndarray
+    abs_error: np.ndarray  # сумма |ошибок| прогноза на шаг вперед
+    total: np.ndarray  # сумма фактических значений на участке оценки ошибки
+
+
+def holt_fit(weekly: np.ndarray) -> HoltFit:
+    """Двойное экспоненциальное сглаживание Holt для всех рядов и всей сетки параметров сразу.
+
+    Состояние имеет форму (параметры x ряды), цикл идет только по неделям;
+    для каждого ряда выбирается пара (alpha, beta) с минимальной SSE.
+    """
+    rows, weeks = weekly.shape
+    alpha = np.repeat(ALPHAS, len(BETAS))[:, None]
+    beta = np.tile(BETAS, len(ALPHAS))[:, None]
+    grid = alpha.shape[0]
+
+    if weeks == 0:
+        zeros = np.zeros(rows)
+        return HoltFit(zeros, zeros, np.full(rows, ALPHAS[0]), np.full(rows, BETAS[0]), zeros, zeros)
+
+    level = np.broadcast_to(weekly[:, 0], (grid, rows)).copy()
+    warmup = min(weeks - 1, 4)
+    initial_trend = (weekly[:, warmup] - weekly[:, 0]) / warmup if warmup else np.zeros(rows)
+    trend = np.broadcast_to(initial_trend, (grid, rows)).copy()
+    sse = np.zeros((grid, rows))
+    abs_error = np.zeros((grid, rows))
+
+    for week in range(1, weeks):
+        actual = weekly[:, week]
+        error = actual - (level + trend)
+        sse += error ** 2
+        abs_error += np.abs(error)
+        new_level = alpha * actual + (1 - alpha) * (level + trend)
+        trend = beta * (new_level - level) + (1 - beta) * trend
+        level = new_level
+
+    best = np.argmin(sse, axis=0)
+    columns = np.arange(rows)
+    return HoltFit(
+        level=level[best, columns],
+        trend=trend[best, columns],
+        alpha=alpha[best, 0],
+        beta=beta[best, 0],
+        abs_error=abs_error[best, columns],
+        total=weekly[:, 1:].sum(axis=1),
+    )
+
+
+def holt_forecast(fit: HoltFit, offsets: np.ndarray) -> np.ndarray:
+    """Сумма дневных прогнозов по смещениям дней (1 - первый день после истории)"""
+    if offsets.size == 0:
+        return np.zeros(fit.level.shape[0])
+    steps = (offsets - 1) // 7 + 1  # номер недели прогноза
+    weekly = fit.level[:, None] + fit.trend[:, None] * steps[None, :]
+    return np.clip(weekly, 0, None).sum(axis=1) / 7.0
+
+
+def _wape_confidence(fit: HoltFit) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        wape = np.where(fit.total > 0, fit.abs_error / fit.total, 1.0)
+    return np.clip(1.0 - wape, 0.0, 1.0)
+
+
+def average_deal_values(db: Session, start: datetime, managers: List[Any]) -> Tuple[np.ndarray, float]:
+    """Средняя сумма сделки по менеджерам из сделок CRM (custom_fields.crm_deal.amount)"""
+    default = settings.FORECAST_DEFAULT_DEAL_VALUE
+    amounts: Dict[Any, List[float]] = {}
+    rows = (
+        db.query(Lead.assigned_to, Lead.custom_fields)
+        .filter(Lead.status == "completed", Lead.crm_id.isnot(None), Lead.created_at >= start)
+        .all()
+    )
+    for manager, custom_fields in rows:
+        deal = (custom_fields or {}).get("crm_deal") if isinstance(custom_fields, dict) else None
+        try:
+            amount = float((deal or {}).get("amount"))
+        except (TypeError, ValueError):
+            continue
+        if amount > 0:
+            amounts.setdefault(manager, []).append(amount)
+
+    all_amounts = [amount for values in amounts.values() for amount in values]
+    overall = float(np.mean(all_amounts)) if all_amounts else default
+    values = np.array([np.mean(amounts[m]) if m in amounts else overall for m in managers], dtype=float)
+    return values, overall
+
+
+@dataclass
+class ModelRun:
+    """Результат модели для пакета окон истории: массивы формы (окна x ряды)"""
+    fits: Dict[str, HoltFit]  # параметры по всем окнам и рядам подряд
+    predicted: Dict[str, np.ndarray]
+    conversion: np.ndarray
+    overall_conversion: np.ndarray  # (окна,)
+    deals: np.ndarray
+    conversion_window: int
+
+
+def run_model(series: Dict[str, np.ndarray], offsets: List[np.ndarray]) -> ModelRun:
+    """Holt + конверсия лид -> сделка для пакета окон истории одинаковой длины.
+
+    series: metric -> (окна x ряды x дни), последний ряд каждого окна - суммарный;
+    offsets: дни прогнозного периода для каждого окна (1 - первый день после окна).
+    Подбор параметров выполняется одним проходом по неделям для всех окон сразу.
+    """
+    windows, rows, days = series["leads"].shape
+    fits = {metric: holt_fit(to_weekly(matrix.reshape(windows * rows, days))) for metric, matrix in series.items()}
+
+    predicted = {}
+    for metric, fit in fits.items():
+        predicted[metric] = np.vstack([
+            holt_forecast(_slice_fit(fit, slice(k * rows, (k + 1) * rows)), offsets[k]) for k in range(windows)
+        ])
+
+    # Конверсия лид -> сделка за последнее окно со сглаживанием к общей конверсии
+    window = min(settings.FORECAST_CONVERSION_WINDOW_DAYS, days)
+    recent_leads = series["leads"][:, :, -window:].sum(axis=2)
+    recent_deals = series["deals"][:, :, -window:].sum(axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        overall_conversion = np.where(recent_leads[:, -1] > 0, recent_deals[:, -1] / recent_leads[:, -1], 0.0)
+    conversion = (recent_deals + CONVERSION_PRIOR_WEIGHT * overall_conversion[:, None]) / (
+        recent_leads + CONVERSION_PRIOR_WEIGHT
+    )
+    deals = 0.5 * predicted["deals"] + 0.5 * conversion * predicted["leads"]
+    return ModelRun(fits, predicted, conversion, overall_conversion, deals, window)
+
+
+def _slice_fit(fit: HoltFit, rows: slice) -> HoltFit:
+    return HoltFit(*(getattr(fit, field)[rows] for field in HoltFit.__dataclass_fields__))
+
+
+def with_total_row(matrix: np.ndarray) -> np.ndarray:
+    """Добавление суммарного ряда по менеджерам последней строкой"""
+    return np.concatenate([matrix, matrix.sum(axis=-2, keepdims=True)], axis=-2)
+
+
+def build_forecast(db: Session, period_type: str, period_start: datetime, period_end: datetime) -> Dict[str, Any]:
+    """Расчет прогноза на период; возвращает значения полей Forecast"""
+    started = time.perf_counter()
+    history_end = datetime.utcnow().date()
+    history_start = history_end - timedelta(days=settings.FORECAST_HISTORY_DAYS)
+    history = load_history(db, history_start, history_end)
+    loaded = time.perf_counter()
+
+    managers = history.managers
+    rows = len(managers)
+
+    # Дни периода относительно конца истории (прошедшая часть текущего периода не прогнозируется)
+    first = max((period_start.date() - history_end).days + 1, 1)
+    last = (period_end.date() - history_end).days
+    offsets = np.arange(first, last + 1)
+    model = run_model({metric: with_total_row(matrix)[None] for metric, matrix in history.series.items()}, [offsets])
+    fits = model.fits
+    predicted = {metric: values[0, :rows] for metric, values in model.predicted.items()}
+    conversion = model.conversion[0, :rows]
+    overall_conversion = model.overall_conversion[0]
+    deals = model.deals[0, :rows]
+
+    deal_values, average_deal_value = average_deal_values(
+        db, datetime.combine(history_start, datetime.min.time()), managers
+    )
+    revenue = deals * deal_values
+
+    confidence_by_metric = {metric: _wape_confidence(fit) for metric, fit in fits.items()}
+    manager_confidence = (confidence_by_metric["leads"][:rows] + confidence_by_metric["deals"][:rows]) / 2
+    confidence = float((confidence_by_metric["leads"][-1] + confidence_by_metric["deals"][-1]) / 2)
+
+    breakdown = {
+        str(UNASSIGNED if manager is None else manager): {
+            "revenue": round(float(revenue[i]), 2),
+            "deals": int(round(deals[i])),
+            "leads": int(round(predicted["leads"][i])),
+            "messages": int(round(predicted["messages"][i])),
+            "calls": int(round(predicted["calls"][i])),
+            "conversion_rate": round(float(conversion[i]), 4),
+            "confidence": round(float(manager_confidence[i]), 4),
+        }
+        for i, manager in enumerate(managers)
+    }
+    finished = time.perf_counter()
+
+    return {
+        "predicted_revenue": round(float(revenue.sum()), 2),
+        "predicted_deals": int(round(deals.sum())),
+        "predicted_leads": int(round(predicted["leads"].sum())),
+        "confidence_level": round(confidence, 4),
+        "model_name": MODEL_NAME,
+        "model_version": MODEL_VERSION,
+        "model_parameters": {
+            "history_days": settings.FORECAST_HISTORY_DAYS,
+            "conversion_window_days": model.conversion_window,
+            "overall_conversion_rate": round(float(overall_conversion), 4),
+            "average_deal_value": round(average_deal_value, 2),
+            "holt": {
+                metric: {"alpha": float(fit.alpha[-1]), "beta": float(fit.beta[-1])}
+                for metric, fit in fits.items()
+            },
+        },
+        "manager_breakdown": breakdown,
+        "forecast_metadata": {
+            "history_start": history_start.isoformat(),
+            "history_end": history_end.isoformat(),
+            "managers": rows,
+            "predicted_messages": int(round(predicted["messages"].sum())),
+            "predicted_calls": int(round(predicted["calls"].sum())),
+            "timings_ms": {
+                "load": round((loaded - started) * 1000, 1),
+                "model": round((finished - loaded) * 1000, 1),
+            },
+        },
+    }
+
+
+def previous_periods(period_type: str, count: int, before: Optional[datetime] = None) -> List[Tuple[datetime, datetime]]:
+    """Последние count закрытых периодов до before (по умолчанию - до текущего), от старых к новым"""
+    current_start, _ = period_bounds(period_type, before or datetime.utcnow())
+    periods = []
+    end = current_start
+    for _ in range(count):
+        start, _ = period_bounds(period_type, end - timedelta(days=1))
+        periods.append((start, end))
+        end = start
+    return periods[::-1]
+
+
+def accuracy_scores(predicted: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    """1 - |ошибка| / факт, в [0, 1]; при нулевом факте - 1 только для нулевого прогноза"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = np.where(actual > 0, 1.0 - np.abs(predicted - actual) / actual, (predicted < 0.5).astype(float))
+    return np.clip(score, 0.0, 1.0)
+
+
+def run_backtest(db: Session, period_type: str, periods: int) -> Dict[str, Any]:
+    """Бэктест модели на скользящих окнах: прогноз каждого из прошлых периодов по истории до его начала.
+
+    История загружается одним запросом на весь диапазон, окна складываются в один пакет
+    и оцениваются одним вызовом run_model.
+    """
+    if periods < 1:
+        raise ForecastError("periods must be positive")
+    started = time.perf_counter()
+    windows = previous_periods(period_type, periods)
+    history_days = settings.FORECAST_HISTORY_DAYS
+    load_start = windows[0][0].date() - timedelta(days=history_days)
+    load_end = windows[-1][1].date()
+    history = load_history(db, load_start, load_end)
+    loaded = time.perf_counter()
+
+    cutoffs = [(start.date() - load_start).days for start, _ in windows]
+    lengths = [(end - start).days for start, end in windows]
+    series = {
+        metric: with_total_row(np.stack([matrix[:, cutoff - history_days:cutoff] for cutoff in cutoffs]))
+        for metric, matrix in history.series.items()
+    }
+    model = run_model(series, [np.arange(1, length + 1) for length in lengths])
+
+    actual_leads = np.array([
+        history.series["leads"][:, cutoff:cutoff + length].sum() for cutoff, length in zip(cutoffs, lengths)
+    ])
+    actual_deals = np.array([
+        history.series["deals"][:, cutoff:cutoff + length].sum() for cutoff, length in zip(cutoffs, lengths)
+    ])
+    predicted_leads = model.predicted["leads"][:, :-1].sum(axis=1)
+    predicted_deals = model.deals[:, :-1].sum(axis=1)
+    leads_accuracy = accuracy_scores(predicted_leads, actual_leads)
+    deals_accuracy = accuracy_scores(predicted_deals, actual_deals)
+    accuracy = (leads_accuracy + deals_accuracy) / 2
+
+    def _ratio(numerator: float, denominator: float) -> Optional[float]:
+        return round(float(numerator / denominator), 4) if denominator else None
+
+    results = [
+        {
+            "period_start": start.isoformat(),
+            "period_end": end.isoformat(),
+            "predicted_leads": int(round(predicted_leads[k])),
+            "actual_leads": int(actual_leads[k]),
+            "predicted_deals": int(round(predicted_deals[k])),
+            "actual_deals": int(actual_deals[k]),
+            "accuracy": round(float(accuracy[k]), 4),
+        }
+        for k, (start, end) in enumerate(windows)
+    ]
+    finished = time.perf_counter()
+    summary = {
+        "period_type": period_type,
+        "periods": len(windows),
+        "mean_accuracy": round(float(accuracy.mean()), 4),
+        "leads_wape": _ratio(np.abs(predicted_leads - actual_leads).sum(), actual_leads.sum()),
+        "deals_wape": _ratio(np.abs(predicted_deals - actual_deals).sum(), actual_deals.sum()),
+        "leads_bias": _ratio((predicted_leads - actual_leads).sum(), actual_leads.sum()),
+        "deals_bias": _ratio((predicted_deals - actual_deals).sum(), actual_deals.sum()),
+        "timings_ms": {
+            "load": round((loaded - started) * 1000, 1),
+            "model": round((finished - loaded) * 1000, 1),
+        },
+    }
+    return {"summary": summary, "results": results}
+
+
+def create_pending_forecast(
+    db: Session, period_type: str, period_start: Optional[datetime], requested_by: int
+) -> Forecast:
+    """Запись прогноза в статусе pending; расчет выполняет run_forecast_job"""
+    start, end = period_bounds(period_type, period_start)
+    forecast = Forecast(
+        period_type=period_type,
+        period_start=start,
+        period_end=end,
+        predicted_revenue=0.0,
+        predicted_deals=0,
+        predicted_leads=0,
+        model_name=MODEL_NAME,
+        model_version=MODEL_VERSION,
+        forecast_metadata={"status": "pending", "requested_by": requested_by},
+    )
+    db.add(forecast)
+    db.commit()
+    db.refresh(forecast)
+    return forecast
+
+
+def run_forecast_job(forecast_id: int) -> None:
+    """Фоновый расчет прогноза в отдельной сессии"""
+    db = SessionLocal()
+    try:
+        forecast = db.query(Forecast).filter(Forecast.id == forecast_id).first()
+        if forecast is None:
+            return
+        metadata = dict(forecast.forecast_metadata or {})
+        try:
+            values = build_forecast(db, forecast.period_type, forecast.period_start, forecast.period_end)
+        except Exception as exc:  # noqa: BLE001
+            db.rollback()
+            logger.exception(f"Forecast {forecast_id} failed: {exc}")
+            forecast.forecast_metadata = {**metadata, "status": "failed", "error": str(exc)[:1000]}
+            db.commit()
+            return
+
+        if settings.FORECAST_BACKTEST_PERIODS > 0:
+            # Оценка точности модели на прошлых периодах того же типа; без нее прогноз все равно готов
+            try:
+                backtest = run_backtest(db, forecast.period_type, settings.FORECAST_BACKTEST_PERIODS)
+            except Exception as exc:  # noqa: BLE001
+                db.rollback()
+                logger.exception(f"Forecast {forecast_id} backtest failed: {exc}")
+                values["forecast_metadata"]["backtest_error"] = str(exc)[:1000]
+            else:
+                values["model_parameters"]["backtest"] = backtest["summary"]
+                values["forecast_metadata"]["backtest"] = backtest["results"]
+
+        values["forecast_metadata"] = {**metadata, **values["forecast_metadata"], "status": "completed"}
+        for field, value in values.items():
+            setattr(forecast, field, value)
+        db.commit()
+        logger.info(f"Forecast {forecast_id} completed: {values['forecast_metadata']['timings_ms']}")
+    finally:
+        db.close()
@@ -0,0 +1,67 @@
+"""
+Интеграция с Instagram Direct: источники контактов, импорт лидов и webhook сообщений
+"""
+from app.services.instagram.ingestion import (
+    InstagramSyncInProgress,
+    InstagramSyncResult,
+    PageIngestResult,
+    ingest_contacts,
+    run_account_sync,
+    sync_account,
+)
+from app.services.instagram.scheduler import InstagramSyncScheduler, instagram_sync_scheduler
+from app.services.instagram.sources import (
+    ContactPage,
+    ContactSource,
+    GraphContactSource,
+    InstagramContact,
+    InstagramSourceError,
+    SampleContactSource,
+    account_request_budget,
+    close_graph_http_client,
+    contact_source_for,
+    extract_contact_details,
+    graph_http_client,
+)
+from app.services.instagram.webhook import (
+    DirectMessage,
+    InstagramWebhookDebouncer,
+    InstagramWebhookError,
+    InstagramWebhookQueueFull,
+    apply_direct_messages,
+    group_by_sender,
+    instagram_webhook_debouncer,
+    parse_webhook,
+    run_direct_batch,
+)
+
+__all__ = [
+    "InstagramSyncInProgress",
+    "InstagramSyncResult",
+    "PageIngestResult",
+    "ingest_contacts",
+    "run_account_sync",
+    "sync_account",
+    "InstagramSyncScheduler",
+    "instagram_sync_scheduler",
+    "ContactPage",
+    "ContactSource",
+    "GraphContactSource",
+    "InstagramContact",
+    "InstagramSourceError",
+    "SampleContactSource",
+    "account_request_budget",
+    "close_graph_http_client",
+    "contact_source_for",
+    "extract_contact_details",
+    "graph_http_client",
+    "DirectMessage",
+    "InstagramWebhookDebouncer",
+    "InstagramWebhookError",
+    "InstagramWebhookQueueFull",
+    "apply_direct_messages",
+    "group_by_sender",
+    "instagram_webhook_debouncer",
+    "parse_webhook",
+    "run_direct_batch",
+]
@@ -0,0 +1,353 @@
+"""
+Импорт лидов из Instagram Direct постранично
+
+На страницу контактов: нормализация и дедупликация внутри страницы, один
+запрос IN по email, телефону E.164 и IGSID к существующим лидам, один
+массовый INSERT ... ON CONFLICT DO NOTHING RETURNING id для новых лидов.
+IGSID уникален в БД: если того же собеседника одновременно создал другой
+поток или воркер (синхронизация, webhook), строка не вставляется, а лид
+читается обратно и считается дубликатом. Курсор страницы хранится в
+integration_metadata аккаунта и коммитится вместе с лидами страницы, поэтому
+прерванная синхронизация продолжается с того же места. Один аккаунт
+синхронизируется в процессе не более чем одним потоком.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from loguru import logger
+from sqlalchemy import and_, bindparam, exists, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.instagram_account import InstagramAccount
+from app.models.lead import Lead
+from app.models.outbox import add_outbox_events, created_events
+from app.schemas.lead import LeadSource, LeadStatus
+from app.services.instagram.sources import ContactSource, InstagramContact, contact_source_for
+from app.utils.phone import normalize_phone
+from app.utils.sql import dialect_insert
+
+_running: set = set()
+_running_lock = threading.Lock()
+
+
+class InstagramSyncInProgress(Exception):
+    """Аккаунт уже синхронизируется"""
+
+
+@dataclass
+class PageIngestResult:
+    created_ids: List[int] = field(default_factory=list)
+    duplicates: int = 0
+    linked: int = 0
+    lead_ids: Dict[str, int] = field(default_factory=dict)  # IGSID собеседника -> лид
+
+
+@dataclass
+class InstagramSyncResult:
+    created_ids: List[int] = field(default_factory=list)
+    duplicates: int = 0
+    linked: int = 0
+    pages: int = 0
+    next_cursor: Optional[str] = None
+
+
+def _normalize_email(value: Optional[str]) -> Optional[str]:
+    return value.strip().lower() if value and value.strip() else None
+
+
+def _contact_keys(contact: InstagramContact) -> Tuple[Optional[str], Optional[str], str]:
+    return _normalize_email(contact.email), normalize_phone(contact.phone), contact.instagram_user_id
+
+
+def _find_existing(db: Session, contacts: List[InstagramContact]) -> List[Any]:
+    """Лиды, совпадающие с контактами страницы по любому ключу, одним запросом"""
+    emails, phones, instagram_ids = set(), set(), set()
+    for contact in contacts:
+        email, phone, instagram_id = _contact_keys(contact)
+        emails.update({email, contact.email} - {None})
+        if phone:
+            phones.add(phone)
+        instagram_ids.add(instagram_id)
+    conditions = [Lead.instagram_user_id.in_(instagram_ids)]
+    if emails:
+        conditions.append(Lead.email.in_(emails))
+    if phones:
+        conditions.append(Lead.phone_e164.in_(phones))
+    return (
+        db.query(Lead.id, Lead.email, Lead.phone_e164, Lead.instagram_user_id)
+        .filter(or_(*conditions))
+        .all()
+    )
+
+
+def ingest_contacts(
+    db: Session,
+    account: InstagramAccount,
+    contacts: List[InstagramContact],
+    now: Optional[datetime] = None,
+) -> PageIngestResult:
+    """Запись страницы контактов (без commit): новые лиды и лид каждого собеседника"""
+    result = PageIngestResult()
+    if not contacts:
+        return result
+    now = now or datetime.utcnow()
+
+    # Значение - id существующего лида или IGSID новой строки этой страницы
+    by_email: Dict[str, Union[int, str]] = {}
+    by_phone: Dict[str, Union[int, str]] = {}
+    by_instagram: Dict[str, Union[int, str]] = {}
+    unlinked = set()
+    for lead in _find_existing(db, contacts):
+        if lead.email:
+            by_email[lead.email.strip().lower()] = lead.id
+        if lead.phone_e164:
+            by_phone[lead.phone_e164] = lead.id
+        if lead.instagram_user_id:
+            by_instagram[lead.instagram_user_id] = lead.id
+        else:
+            unlinked.add(lead.id)
+
+    rows: List[Dict[str, Any]] = []
+    links: Dict[int, str] = {}
+    matches: Dict[str, Union[int, str]] = {}
+    for contact in contacts:
+        email, phone, instagram_id = _contact_keys(contact)
+        match = (
+            by_instagram.get(instagram_id)
+            or (by_email.get(email) if email else None)
+            or (by_phone.get(phone) if phone else None)
+        )
+        if match is not None:
+            result.duplicates += 1
+            matches.setdefault(instagram_id, match)
+            # Лид, найденный по email/телефону, запоминает собеседника для следующих синхронизаций
+            if match in unlinked:
+                links.setdefault(match, instagram_id)
+                by_instagram[instagram_id] = match
+            continue
+
+        # У всех строк одинаковый набор ключей - вставка одним executemany
+        rows.append({
+            "name": contact.name or contact.username or f"Instagram {instagram_id}",
+            "email": email,
+            "phone": contact.phone,
+            "phone_e164": phone,
+            "company": contact.company,
+            "status": LeadStatus.NEW.value,
+            "source": LeadSource.SOCIAL.value,
+            "source_data": {
+                "platform": "instagram",
+                "account_id": account.id,
+                "username": account.username,
+                "contact_username": contact.username,
+                "synced_at": now.isoformat(),
+            },
+            "instagram_user_id": instagram_id,
+            "tags": contact.tags,
+            "custom_fields": contact.custom_fields,
+            "notes": contact.notes,
+            "last_contacted": contact.last_message_at,
+        })
+        # Повтор того же собеседника дальше на странице - дубликат новой строки
+        by_instagram[instagram_id] = instagram_id
+        if email:
+            by_email[email] = instagram_id
+        if phone:
+            by_phone[phone] = instagram_id
+
+    result.linked = _link_instagram_ids(db, links)
+
+    returned: Dict[str, int] = {}
+    if rows:
+        insert = dialect_insert(db)
+        # Порядок RETURNING при пакетной вставке не гарантирован - строки сопоставляются по IGSID
+        # (он уникален среди новых строк страницы)
+        inserted = dict(
+            db.execute(
+                insert(Lead.__table__)
+                .on_conflict_do_nothing(index_elements=["instagram_user_id"])
+                .returning(Lead.instagram_user_id, Lead.id),
+                rows,
+            ).tuples().all()
+        )
+        created = [row for row in rows if row["instagram_user_id"] in inserted]
+        conflicts = [row["instagram_user_id"] for row in rows if row["instagram_user_id"] not in inserted]
+        returned = dict(inserted)
+        if conflicts:
+            # Собеседника уже создал параллельный импорт - его лид становится совпадением
+            returned.update(
+                db.query(Lead.instagram_user_id, Lead.id).filter(Lead.instagram_user_id.in_(conflicts)).all()
+            )
+            result.duplicates += len(conflicts)
+        for row in created:
+            row["id"] = inserted[row["instagram_user_id"]]
+            result.created_ids.append(row["id"])
+        # Массовый INSERT не проходит через unit of work - события outbox пишутся явно
+        add_outbox_events(db, created_events(Lead, created))
+
+    result.lead_ids = dict(returned)
+    for instagram_id, match in matches.items():
+        result.lead_ids[instagram_id] = returned[match] if isinstance(match, str) else match
+    return result
+
+
+def _link_instagram_ids(db: Session, links: Dict[int, str]) -> int:
+    """Запись IGSID в найденные по email/телефону лиды; занятый другим лидом IGSID пропускается"""
+    if not links:
+        return 0
+    other = aliased(Lead)
+    statement = (
+        update(Lead.__table__)
+        .where(
+            and_(
+                Lead.id == bindparam("lead_id"),
+                Lead.instagram_user_id.is_(None),
+                ~exists().where(other.instagram_user_id == bindparam("value")),
+            )
+        )
+        .values(instagram_user_id=bindparam("value"))
+    )
+    params = [{"lead_id": lead_id, "value": value} for lead_id, value in links.items()]
+    try:
+        with db.begin_nested():
+            return db.execute(statement, params).rowcount
+    except IntegrityError:
+        # Тот же IGSID параллельно получил другой лид; связь восстановится при следующей синхронизации
+        logger.warning(f"Instagram ids were linked concurrently, skipped linking {len(links)} leads")
+        return 0
+
+
+def _sync_state(account: InstagramAccount) -> Dict[str, Any]:
+    return dict((account.integration_metadata or {}).get("sync") or {})
+
+
+def _save_sync_state(account: InstagramAccount, state: Dict[str, Any]) -> None:
+    metadata = dict(account.integration_metadata or {})
+    metadata["sync"] = state
+    account.integration_metadata = metadata
+
+
+@contextmanager
+def _sync_slot(account_id: int) -> Iterator[bool]:
+    with _running_lock:
+        acquired = account_id not in _running
+        _running.add(account_id)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with _running_lock:
+                _running.discard(account_id)
+
+
+def sync_account(
+    db: Session,
+    account: InstagramAccount,
+    source: Optional[ContactSource] = None,
+    max_pages: Optional[int] = None,
+) -> InstagramSyncResult:
+    """Синхронизация аккаунта с сохраненного курсора; коммит после каждой страницы"""
+    with _sync_slot(account.id) as acquired:
+        if not acquired:
+            raise InstagramSyncInProgress(f"Instagram account {account.id} is already syncing")
+        try:
+            return _sync_pages(db, account, source or contact_source_for(account), max_pages)
+        except Exception as exc:
+            # Ошибка сохраняется в состоянии; курсор остается на последней записанной странице
+            db.rollback()
+            state = _sync_state(account)
+            state["last_error"] = str(exc)[:500]
+            state["last_error_at"] = datetime.utcnow().isoformat()
+            _save_sync_state(account, state)
+            db.commit()
+            raise
+
+
+def _sync_pages(
+    db: Session,
+    account: InstagramAccount,
+    source: ContactSource,
+    max_pages: Optional[int],
+) -> InstagramSyncResult:
+    max_pages = max_pages or settings.INSTAGRAM_SYNC_MAX_PAGES
+    result = InstagramSyncResult()
+    state = _sync_state(account)
+    cursor = state.get("cursor")
+    started = time.perf_counter()
+    state["last_started_at"] = datetime.utcnow().isoformat()
+    fetch_seconds = write_seconds = 0.0
+
+    while result.pages < max_pages:
+        fetch_started = time.perf_counter()
+        page = source.fetch_page(account, cursor, settings.INSTAGRAM_SYNC_PAGE_SIZE)
+        write_started = time.perf_counter()
+        fetch_seconds += write_started - fetch_started
+        now = datetime.utcnow()
+        page_result = ingest_contacts(db, account, page.contacts, now)
+        result.created_ids.extend(page_result.created_ids)
+        result.duplicates += page_result.duplicates
+        result.linked += page_result.linked
+        result.pages += 1
+
+        cursor = page.next_cursor
+        state.update({
+            # Пройденный до конца список в следующий раз читается с начала (новые диалоги)
+            "cursor": cursor,
+            "pages_total": state.get("pages_total", 0) + 1,
+            "leads_created_total": state.get("leads_created_total", 0) + len(page_result.created_ids),
+            "last_page_at": now.isoformat(),
+        })
+        if cursor is None:
+            state["completed_at"] = now.isoformat()
+        _save_sync_state(account, state)
+        account.last_sync_at = now
+        account.updated_at = now
+        db.commit()
+        write_seconds += time.perf_counter() - write_started
+        if cursor is None:
+            break
+
+    state.update({
+        "sync_count": state.get("sync_count", 0) + 1,
+        "last_finished_at": datetime.utcnow().isoformat(),
+        "last_duration_seconds": round(time.perf_counter() - started, 3),
+        # Время ответа Graph API (включая ожидание бюджета запросов) и записи в БД
+        "last_fetch_seconds": round(fetch_seconds, 3),
+        "last_write_seconds": round(write_seconds, 3),
+        "last_pages": result.pages,
+        "last_error": None,
+    })
+    _save_sync_state(account, state)
+    db.commit()
+    result.next_cursor = cursor
+    return result
+
+
+def run_account_sync(account_id: int) -> Optional[InstagramSyncResult]:
+    """Синхронизация аккаунта в отдельной сессии (для фоновых задач)"""
+    db = SessionLocal()
+    try:
+        account = db.query(InstagramAccount).filter(InstagramAccount.id == account_id).first()
+        if not account or account.status != "connected":
+            return None
+        result = sync_account(db, account)
+        logger.info(
+            f"Instagram sync finished for account {account_id}: "
+            f"{len(result.created_ids)} created, {result.duplicates} duplicates, {result.pages} pages"
+        )
+        return result
+    except InstagramSyncInProgress:
+        logger.info(f"Instagram sync for account {account_id} is already running")
+        return None
+    except Exception as exc:  # noqa: BLE001
+        logger.exception(f"Instagram sync failed for account {account_id}: {exc}")
+        return None
+    finally:
+        db.close()
@@ -0,0 +1,88 @@
+"""
+Планировщик параллельной синхронизации подключенных Instagram аккаунтов
+"""
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.instagram_account import InstagramAccount
+from app.services.instagram.ingestion import InstagramSyncResult, run_account_sync
+
+
+class InstagramSyncScheduler:
+    """Синхронизирует подключенные аккаунты параллельно, не больше concurrency одновременно.
+
+    Каждый аккаунт расходует свой бюджет запросов, поэтому аккаунт, упершийся
+    в лимит Meta, ждет сам и не задерживает остальные.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        runner: Callable[[int], Optional[InstagramSyncResult]] = run_account_sync,
+    ):
+        self.concurrency = concurrency or settings.INSTAGRAM_SYNC_CONCURRENCY
+        self.runner = runner
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _connected_accounts() -> List[int]:
+        db = SessionLocal()
+        try:
+            return [
+                account_id
+                for (account_id,) in db.query(InstagramAccount.id)
+                .filter(InstagramAccount.status == "connected")
+                .order_by(InstagramAccount.id)
+                .all()
+            ]
+        finally:
+            db.close()
+
+    async def run_all(self) -> Dict[int, Optional[InstagramSyncResult]]:
+        """Один проход синхронизации по всем подключенным аккаунтам"""
+        loop = asyncio.get_running_loop()
+        account_ids = await loop.run_in_executor(None, self._connected_accounts)
+        if not account_ids:
+            return {}
+
+        workers = max(1, min(self.concurrency, len(account_ids)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="instagram-sync") as executor:
+            results = await asyncio.gather(
+                *(loop.run_in_executor(executor, self.runner, account_id) for account_id in account_ids)
+            )
+
+        summary = dict(zip(account_ids, results))
+        failed = sum(1 for result in results if result is None)
+        logger.info(f"Instagram sync pass finished: {len(account_ids)} accounts, {failed} failed or skipped")
+        return summary
+
+    async def run_forever(self, interval: float) -> None:
+        """Периодический запуск с небольшим jitter, чтобы воркеры не стартовали синхронно"""
+        while True:
+            try:
+                await self.run_all()
+            except Exception as exc:  # noqa: BLE001
+                logger.exception(f"Instagram sync pass failed: {exc}")
+            await asyncio.sleep(interval + random.uniform(0, interval * 0.1))
+
+    def start(self, interval: float) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever(interval))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+instagram_sync_scheduler = InstagramSyncScheduler()
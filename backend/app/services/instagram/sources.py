@@ -0,0 +1,229 @@
+"""
+Источники контактов из Instagram Direct: Graph API и демо-данные
+
+Синхронизации всех аккаунтов ходят в Graph API через один httpx.Client с
+общим пулом соединений; частота запросов ограничивается бюджетом каждого
+аккаунта (лимиты Meta считаются на аккаунт), а не общим.
+"""
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.rate_limit import TokenBucket
+from app.models.instagram_account import InstagramAccount
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"(?:\+|00)?\d[\d\s().-]{6,}\d")
+
+
+class InstagramSourceError(Exception):
+    """Ошибка получения контактов из Instagram"""
+
+
+@dataclass
+class InstagramContact:
+    """Собеседник в Direct в нормализованном виде"""
+    instagram_user_id: str
+    username: Optional[str] = None
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    company: Optional[str] = None
+    notes: Optional[str] = None
+    custom_fields: Optional[Dict[str, Any]] = None
+    tags: List[str] = field(default_factory=lambda: ["instagram"])
+    last_message_at: Optional[datetime] = None
+
+
+@dataclass
+class ContactPage:
+    """Страница контактов; next_cursor=None означает последнюю страницу"""
+    contacts: List[InstagramContact]
+    next_cursor: Optional[str] = None
+
+
+class ContactSource(ABC):
+    @abstractmethod
+    def fetch_page(self, account: InstagramAccount, cursor: Optional[str], limit: int) -> ContactPage:
+        """Страница собеседников начиная с cursor"""
+
+
+def extract_contact_details(texts: List[str]) -> Dict[str, Optional[str]]:
+    """Email и телефон, которые собеседник написал в сообщениях"""
+    joined = "\n".join(texts)
+    email = _EMAIL_RE.search(joined)
+    phone = _PHONE_RE.search(joined)
+    return {
+        "email": email.group(0) if email else None,
+        "phone": phone.group(0).strip() if phone else None,
+    }
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z")
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+_graph_client: Optional[httpx.Client] = None
+_graph_client_lock = threading.Lock()
+
+# Бюджет запросов к Graph API по ключу аккаунта
+account_request_budget = TokenBucket(
+    capacity=settings.INSTAGRAM_ACCOUNT_REQUESTS_PER_MINUTE,
+    refill_per_second=settings.INSTAGRAM_ACCOUNT_REQUESTS_PER_MINUTE / 60,
+)
+
+
+def graph_http_client() -> httpx.Client:
+    """Общий клиент Graph API (httpx.Client потокобезопасен)"""
+    global _graph_client
+    with _graph_client_lock:
+        if _graph_client is None or _graph_client.is_closed:
+            _graph_client = httpx.Client(
+                base_url=settings.INSTAGRAM_GRAPH_API_URL,
+                timeout=30.0,
+                limits=httpx.Limits(
+                    max_connections=settings.INSTAGRAM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.INSTAGRAM_HTTP_MAX_CONNECTIONS,
+                ),
+            )
+        return _graph_client
+
+
+def close_graph_http_client() -> None:
+    global _graph_client
+    with _graph_client_lock:
+        if _graph_client is not None:
+            _graph_client.close()
+            _graph_client = None
+
+
+def wait_for_budget(account_id: int, budget: TokenBucket = account_request_budget) -> float:
+    """Ожидание токена из бюджета аккаунта; возвращает время ожидания в секундах"""
+    waited = 0.0
+    while True:
+        allowed, tokens = budget.consume(f"instagram:{account_id}")
+        if allowed:
+            return waited
+        delay = budget.wait_time(tokens)
+        time.sleep(delay)
+        waited += delay
+
+
+class GraphContactSource(ContactSource):
+    """Диалоги Instagram Messaging API: GET /{ig-user-id}/conversations"""
+
+    def __init__(self, client: Optional[httpx.Client] = None):
+        self.client = client or graph_http_client()
+
+    def fetch_page(self, account: InstagramAccount, cursor: Optional[str], limit: int) -> ContactPage:
+        params = {
+            "platform": "instagram",
+            "fields": "participants,updated_time,messages.limit(10){message,from,created_time}",
+            "limit": limit,
+            "access_token": account.access_token,
+        }
+        if cursor:
+            params["after"] = cursor
+        wait_for_budget(account.id)
+        try:
+            response = self.client.get(f"/{account.business_account_id}/conversations", params=params)
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            raise InstagramSourceError(f"Instagram conversations request failed: {exc}") from exc
+        body = response.json()
+
+        contacts: List[InstagramContact] = []
+        for conversation in body.get("data") or []:
+            participants = (conversation.get("participants") or {}).get("data") or []
+            other = next((p for p in participants if p.get("id") != account.business_account_id), None)
+            if other is None or not other.get("id"):
+                continue
+            # Только сообщения собеседника: наши ответы не содержат его контактов
+            texts = [
+                message.get("message") or ""
+                for message in (conversation.get("messages") or {}).get("data") or []
+                if (message.get("from") or {}).get("id") == other["id"]
+            ]
+            details = extract_contact_details(texts)
+            contacts.append(InstagramContact(
+                instagram_user_id=str(other["id"]),
+                username=other.get("username"),
+                name=other.get("name") or other.get("username") or f"Instagram {other['id']}",
+                email=details["email"],
+                phone=details["phone"],
+                notes="\n".join(reversed([text for text in texts if text])) or None,
+                last_message_at=_parse_time(conversation.get("updated_time")),
+            ))
+
+        paging = body.get("paging") or {}
+        next_cursor = (paging.get("cursors") or {}).get("after") if paging.get("next") else None
+        return ContactPage(contacts=contacts, next_cursor=next_cursor)
+
+
+SAMPLE_CONTACTS = [
+    InstagramContact(
+        instagram_user_id="sample-irina",
+        username="irina.sergeeva",
+        name="Ирина Сергеева",
+        email="irina.sergeeva@example.com",
+        phone="+7 (916) 123-45-67",
+        notes="Запрос в Instagram: нужен корпоративный сайт для IT-компании.",
+        custom_fields={"requested_service": "Корпоративный сайт", "budget": "≈ 6 000 €"},
+        tags=["instagram", "web", "it-services"],
+    ),
+    InstagramContact(
+        instagram_user_id="sample-digitalflow",
+        username="digitalflow.studio",
+        name="DigitalFlow Studio",
+        email="ceo@digitalflow.studio",
+        phone="+49 151 23456789",
+        company="DigitalFlow Studio",
+        notes="Хочет обсудить SEO и техническую поддержку корпоративного портала.",
+        custom_fields={"requested_service": "SEO + поддержка", "preferred_language": "de"},
+        tags=["instagram", "seo"],
+    ),
+    InstagramContact(
+        instagram_user_id="sample-artem",
+        username="artem.kovalev",
+        name="Артем Ковалев",
+        email="artem.kovalev@example.com",
+        phone="+7 (903) 555-12-90",
+        notes="Написал в Direct: требуются услуги интеграции CRM и разработка чат-бота.",
+        custom_fields={"requested_service": "CRM + чат-бот", "priority": "high"},
+        tags=["instagram", "automation"],
+    ),
+]
+
+
+class SampleContactSource(ContactSource):
+    """Демо-контакты (INSTAGRAM_SAMPLE_DATA); курсор - смещение в списке"""
+
+    def __init__(self, contacts: Optional[List[InstagramContact]] = None):
+        self.contacts = SAMPLE_CONTACTS if contacts is None else contacts
+
+    def fetch_page(self, account: InstagramAccount, cursor: Optional[str], limit: int) -> ContactPage:
+        offset = int(cursor) if cursor and cursor.isdigit() else 0
+        end = offset + limit
+        return ContactPage(
+            contacts=self.contacts[offset:end],
+            next_cursor=str(end) if end < len(self.contacts) else None,
+        )
+
+
+def contact_source_for(account: InstagramAccount) -> ContactSource:
+    if settings.INSTAGRAM_SAMPLE_DATA or not account.access_token or not account.business_account_id:
+        return SampleContactSource()
+    return GraphContactSource()
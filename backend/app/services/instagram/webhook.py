@@ -0,0 +1,330 @@
+"""
+Webhook входящих сообщений Instagram Direct с объединением по отправителю
+
+Запрос только проверяет подпись и кладет сообщения в корзину отправителя.
+Корзина закрывается, когда отправитель молчит INSTAGRAM_WEBHOOK_DEBOUNCE_SECONDS
+(или копится дольше INSTAGRAM_WEBHOOK_MAX_WAIT_SECONDS). Все закрытые корзины
+применяются одной транзакцией: лиды собеседников находятся или создаются
+одним проходом импорта, сообщения пишутся одним INSERT в lead_interactions,
+и каждый лид обновляется один раз за окно.
+
+Повторные доставки Meta (в том числе попавшие в другой воркер или пришедшие
+после перезапуска) отсекаются в БД: mid хранится в уникальном
+lead_interactions.external_message_id, вставка идет с ON CONFLICT DO NOTHING.
+Корзины живут в памяти процесса, поэтому "один раз за окно" верно только
+в пределах воркера: при нескольких воркерах сообщения одного отправителя
+могут попасть в разные процессы, и лид обновится каждым из них.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.instagram_account import InstagramAccount
+from app.models.lead import Lead
+from app.models.lead_interaction import InteractionAuthor, LeadInteraction
+from app.models.outbox import add_outbox_events, created_events
+from app.services.batch_retry import isolate_failed_batch
+from app.services.instagram.ingestion import ingest_contacts
+from app.services.instagram.sources import InstagramContact, extract_contact_details
+from app.utils.sql import dialect_insert
+
+# Повторные доставки Meta отсекаются в памяти по mid последних сообщений (до записи в БД)
+SEEN_MESSAGE_IDS = 10000
+
+
+class InstagramWebhookError(ValueError):
+    """Тело webhook не является событием Instagram"""
+
+
+class InstagramWebhookQueueFull(RuntimeError):
+    """Очередь переполнена: Meta повторит доставку позже"""
+
+
+@dataclass
+class DirectMessage:
+    account_id: str  # ID бизнес-аккаунта (entry.id)
+    sender_id: str  # IGSID собеседника
+    message_id: str
+    text: str
+    sent_at: datetime
+
+
+@dataclass
+class SenderBucket:
+    messages: List[DirectMessage] = field(default_factory=list)
+    first_at: float = 0.0
+    last_at: float = 0.0
+
+
+def parse_webhook(payload: Any) -> List[DirectMessage]:
+    """Входящие сообщения из тела webhook; эхо собственных ответов пропускается"""
+    if not isinstance(payload, dict) or payload.get("object") != "instagram":
+        raise InstagramWebhookError("Not an Instagram webhook")
+    messages: List[DirectMessage] = []
+    for entry in payload.get("entry") or []:
+        account_id = str(entry.get("id") or "")
+        for item in entry.get("messaging") or []:
+            message = item.get("message") or {}
+            sender_id = str((item.get("sender") or {}).get("id") or "")
+            if not message.get("mid") or not sender_id or message.get("is_echo") or sender_id == account_id:
+                continue
+            timestamp = item.get("timestamp")
+            messages.append(DirectMessage(
+                account_id=account_id,
+                sender_id=sender_id,
+                message_id=str(message["mid"]),
+                text=message.get("text") or "",
+                sent_at=datetime.utcfromtimestamp(timestamp / 1000) if timestamp else datetime.utcnow(),
+            ))
+    return messages
+
+
+def group_by_sender(messages: List[DirectMessage]) -> Dict[Tuple[str, str], List[DirectMessage]]:
+    """Сообщения по (аккаунт, отправитель) в порядке отправки"""
+    buckets: Dict[Tuple[str, str], List[DirectMessage]] = {}
+    for message in sorted(messages, key=lambda item: item.sent_at):
+        buckets.setdefault((message.account_id, message.sender_id), []).append(message)
+    return buckets
+
+
+def apply_direct_messages(db: Session, buckets: Dict[Tuple[str, str], List[DirectMessage]]) -> Dict[str, int]:
+    """Запись закрытых корзин (без commit)"""
+    accounts = {
+        account.business_account_id: account
+        for account in db.query(InstagramAccount)
+        .filter(InstagramAccount.business_account_id.in_({account_id for account_id, _ in buckets}))
+        .all()
+    }
+
+    interactions: List[Dict[str, Any]] = []
+    created = unknown = 0
+    for account_id in {account_id for account_id, _ in buckets}:
+        account = accounts.get(account_id)
+        senders = {sender_id: messages for (acc, sender_id), messages in buckets.items() if acc == account_id}
+        if account is None:
+            unknown += sum(len(messages) for messages in senders.values())
+            logger.warning(f"Instagram webhook for unknown account {account_id}")
+            continue
+
+        contacts = []
+        for sender_id, messages in senders.items():
+            texts = [message.text for message in messages if message.text]
+            details = extract_contact_details(texts)
+            contacts.append(InstagramContact(
+                instagram_user_id=sender_id,
+                name=f"Instagram {sender_id}",
+                email=details["email"],
+                phone=details["phone"],
+                notes="\n".join(texts) or None,
+                last_message_at=messages[-1].sent_at,
+            ))
+        page = ingest_contacts(db, account, contacts)
+        created += len(page.created_ids)
+
+        for sender_id, messages in senders.items():
+            interactions.extend(
+                {
+                    "lead_id": page.lead_ids[sender_id],
+                    "author_type": InteractionAuthor.CLIENT,
+                    "author_name": f"instagram:{sender_id}",
+                    "message": message.text or "[вложение]",
+                    "context": {
+                        "platform": "instagram",
+                        "account_id": account.id,
+                        "message_id": message.message_id,
+                        "sent_at": message.sent_at.isoformat(),
+                    },
+                    "external_message_id": message.message_id,
+                }
+                for message in messages
+            )
+
+    inserted = _insert_interactions(db, interactions)
+    last_contacted: Dict[int, datetime] = {}
+    for row in inserted:
+        sent_at = datetime.fromisoformat(row["context"]["sent_at"])
+        last_contacted[row["lead_id"]] = max(last_contacted.get(row["lead_id"], sent_at), sent_at)
+    if last_contacted:
+        db.execute(update(Lead), [{"id": lead_id, "last_contacted": at} for lead_id, at in last_contacted.items()])
+    return {
+        "interactions": len(inserted),
+        "leads": len(last_contacted),
+        "created": created,
+        "unknown": unknown,
+        "duplicates": len(interactions) - len(inserted),
+    }
+
+
+def _insert_interactions(db: Session, interactions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """INSERT ... ON CONFLICT DO NOTHING по mid; возвращает действительно вставленные строки"""
+    if not interactions:
+        return []
+    insert = dialect_insert(db)
+    # Порядок RETURNING при пакетной вставке не гарантирован - строки сопоставляются по mid
+    returned = dict(
+        db.execute(
+            insert(LeadInteraction.__table__)
+            .on_conflict_do_nothing(index_elements=["external_message_id"])
+            .returning(LeadInteraction.external_message_id, LeadInteraction.id),
+            interactions,
+        ).tuples().all()
+    )
+    inserted = []
+    for row in interactions:
+        # Тот же mid дважды в одной пачке вставляется один раз
+        if row["external_message_id"] in returned:
+            row["id"] = returned.pop(row["external_message_id"])
+            inserted.append(row)
+    # Массовый INSERT не проходит через unit of work - события outbox пишутся явно
+    add_outbox_events(db, created_events(LeadInteraction, inserted))
+    return inserted
+
+
+def run_direct_batch(buckets: Dict[Tuple[str, str], List[DirectMessage]]) -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        result = apply_direct_messages(db, buckets)
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class InstagramWebhookDebouncer:
+    """Корзины сообщений по (аккаунт, отправитель) с закрытием по тишине.
+
+    submit() вызывается из обработчика запроса и не ходит в БД; фоновая
+    задача раз в INSTAGRAM_WEBHOOK_TICK_SECONDS забирает закрытые корзины.
+    Очередь хранится в памяти процесса: при остановке остаток применяется.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: Dict[Tuple[str, str], SenderBucket] = {}
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._pending = 0
+        self._attempts: Dict[Tuple[str, str], int] = {}  # неудачные сбросы по корзине
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, messages: List[DirectMessage], now: Optional[float] = None) -> int:
+        """Постановка сообщений в корзины; возвращает число новых (не повторных) сообщений"""
+        now = time.monotonic() if now is None else now
+        accepted = 0
+        with self._lock:
+            if self._pending + len(messages) > settings.INSTAGRAM_WEBHOOK_MAX_PENDING:
+                raise InstagramWebhookQueueFull("Instagram webhook queue is full")
+            for message in messages:
+                if message.message_id in self._seen:
+                    continue
+                self._seen[message.message_id] = None
+                if len(self._seen) > SEEN_MESSAGE_IDS:
+                    self._seen.popitem(last=False)
+                bucket = self._buckets.get((message.account_id, message.sender_id))
+                if bucket is None:
+                    bucket = self._buckets[(message.account_id, message.sender_id)] = SenderBucket(first_at=now)
+                bucket.messages.append(message)
+                bucket.last_at = now
+                self._pending += 1
+                accepted += 1
+        return accepted
+
+    def _take(self, now: Optional[float], everything: bool = False) -> Dict[Tuple[str, str], List[DirectMessage]]:
+        debounce = settings.INSTAGRAM_WEBHOOK_DEBOUNCE_SECONDS
+        max_wait = settings.INSTAGRAM_WEBHOOK_MAX_WAIT_SECONDS
+        with self._lock:
+            ready = [
+                key
+                for key, bucket in self._buckets.items()
+                if everything or now - bucket.last_at >= debounce or now - bucket.first_at >= max_wait
+            ]
+            batch = {}
+            for key in ready:
+                bucket = self._buckets.pop(key)
+                self._pending -= len(bucket.messages)
+                batch[key] = sorted(bucket.messages, key=lambda message: message.sent_at)
+        return batch
+
+    def _requeue(self, batch: Dict[Tuple[str, str], List[DirectMessage]]) -> None:
+        now = time.monotonic()
+        with self._lock:
+            for key, messages in batch.items():
+                bucket = self._buckets.setdefault(key, SenderBucket(first_at=now, last_at=now))
+                bucket.messages[:0] = messages
+                self._pending += len(messages)
+
+    def flush(self, now: Optional[float] = None, everything: bool = False) -> Dict[str, int]:
+        """Применение закрытых корзин (everything - всех, при остановке и в тестах).
+
+        Упавшая пачка применяется по одной корзине: корзина, которая падает
+        INSTAGRAM_WEBHOOK_MAX_ATTEMPTS сбросов подряд, отбрасывается.
+        """
+        totals = {"interactions": 0, "leads": 0, "created": 0, "unknown": 0, "duplicates": 0}
+        batch = self._take(time.monotonic() if now is None else now, everything)
+        if not batch:
+            return totals
+        try:
+            result = run_direct_batch(batch)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning(f"Instagram DM batch of {len(batch)} senders failed, applying one by one: {exc}")
+            isolated = isolate_failed_batch(
+                batch, run_direct_batch, self._attempts, settings.INSTAGRAM_WEBHOOK_MAX_ATTEMPTS, totals
+            )
+            self._requeue(isolated.retry)
+            for key in isolated.dropped:
+                logger.error(f"Instagram DM bucket {key} dropped after repeated failures: {len(batch[key])} messages")
+            return isolated.totals
+        for key in batch:
+            self._attempts.pop(key, None)
+        return result
+
+    async def run_forever(self, tick_seconds: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(tick_seconds)
+            try:
+                result = await loop.run_in_executor(None, self.flush)
+                if result["interactions"]:
+                    logger.debug(f"Instagram DM batch: {result}")
+            except Exception as exc:  # noqa: BLE001
+                logger.exception(f"Instagram DM batch failed: {exc}")
+
+    def start(self, tick_seconds: float) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self.run_forever(tick_seconds))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, lambda: self.flush(everything=True))
+        except Exception as exc:  # noqa: BLE001
+            logger.exception(f"Instagram DM flush on shutdown failed: {exc}")
+
+
+instagram_webhook_debouncer = InstagramWebhookDebouncer()
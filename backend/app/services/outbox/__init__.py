@@ -0,0 +1,23 @@
+"""
+Transactional outbox: лента изменений лидов, сообщений, взаимодействий и звонков
+"""
+from app.services.outbox.relay import OutboxConsumer, OutboxRelay, outbox_relay, serialize_event
+from app.services.outbox.consumers import (
+    CRMPushConsumer,
+    RealtimeConsumer,
+    RollupConsumer,
+    WebhookConsumer,
+    register_default_consumers,
+)
+
+__all__ = [
+    "OutboxConsumer",
+    "OutboxRelay",
+    "outbox_relay",
+    "serialize_event",
+    "CRMPushConsumer",
+    "RealtimeConsumer",
+    "RollupConsumer",
+    "WebhookConsumer",
+    "register_default_consumers",
+]
@@ -0,0 +1,158 @@
+"""
+Встроенные потребители outbox: исходящие webhooks, push в CRM, агрегаты, лента реального времени
+и поиск дубликатов
+"""
+import hashlib
+import hmac
+import json
+from typing import List, Optional
+
+import httpx
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.crm_connection import CRMConnection
+from app.models.lead import Lead
+from app.models.outbox import OutboxEvent
+from app.services.analytics import apply_increments, backfill_rollups, full_history_range, increments_from_events
+from app.services.crm.engine import push_connection_leads
+from app.services.dedup import find_candidates_for, forget_leads
+from app.services.outbox.relay import OutboxConsumer, serialize_event
+from app.services.realtime import event_recipients, realtime_broker
+
+
+class WebhookConsumer(OutboxConsumer):
+    """Пачка событий одним POST; у каждого URL свое смещение"""
+
+    start_at_latest = True
+
+    def __init__(self, url: str, secret: Optional[str] = None, timeout: float = 10.0):
+        self.url = url
+        self.secret = secret
+        self.timeout = timeout
+        self.name = f"webhook:{hashlib.sha1(url.encode('utf-8')).hexdigest()[:12]}"
+
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        body = json.dumps({"events": [serialize_event(event) for event in events]}, default=str).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            signature = hmac.new(self.secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            headers["X-Outbox-Signature"] = f"sha256={signature}"
+        # Ошибка доставки откатывает смещение - пачка уйдет повторно (получатель дедуплицирует по id)
+        response = httpx.post(self.url, content=body, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class CRMPushConsumer(OutboxConsumer):
+    """Отправка измененных лидов в CRM сразу после коммита, без обхода таблицы"""
+
+    name = "crm_push"
+    aggregate_types = ("lead",)
+    start_at_latest = True
+
+    def accepts(self, event: OutboxEvent) -> bool:
+        # Изменения, пришедшие из CRM, обратно не отправляем
+        return (
+            super().accepts(event)
+            and event.event_type in ("created", "updated")
+            and (event.payload or {}).get("source") != "crm"
+        )
+
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        lead_ids = sorted({event.aggregate_id for event in events})
+        connection_ids = [
+            connection_id
+            for (connection_id,) in db.query(CRMConnection.id)
+            .filter(
+                CRMConnection.is_active.is_(True),
+                or_(CRMConnection.sync_leads.is_(True), CRMConnection.sync_contacts.is_(True)),
+            )
+            .all()
+        ]
+        busy = [
+            connection_id
+            for connection_id in connection_ids
+            if not push_connection_leads(connection_id, lead_ids)
+        ]
+        if busy:
+            # Пачка повторится позже; уже отправленные лиды отсечет сравнение хешей
+            raise RuntimeError(f"CRM connections {busy} are syncing")
+
+
+class RollupConsumer(OutboxConsumer):
+    """Инкрементальное обновление дневных агрегатов; пишет в сессию релея вместе со смещением"""
+
+    name = "daily_rollups"
+    aggregate_types = ("lead", "message", "call")
+    start_at_latest = True
+
+    def initialize(self, db: Session) -> None:
+        # История до подключения потребителя считается из исходных таблиц
+        start, end = full_history_range(db)
+        backfill_rollups(db, start, end)
+
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        apply_increments(db, increments_from_events(events))
+
+
+class RealtimeConsumer(OutboxConsumer):
+    """Публикация событий лидов брокеру WebSocket ленты"""
+
+    name = "realtime"
+    aggregate_types = ("lead", "message", "call", "interaction", "call_task")
+    start_at_latest = True
+
+    def __init__(self, broker=None):
+        self.broker = broker or realtime_broker
+
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        lead_ids = {(event.payload or {}).get("lead_id") for event in events} - {None}
+        # Ответственный за лид для подписок "мои лиды" - один запрос на пачку
+        owners = dict(db.query(Lead.id, Lead.assigned_to).filter(Lead.id.in_(lead_ids)).all()) if lead_ids else {}
+        messages = []
+        for event in events:
+            payload = event.payload or {}
+            lead_id = payload.get("lead_id")
+            messages.append({
+                "lead_id": lead_id,
+                "user_ids": event_recipients(payload, owners.get(lead_id)),
+                "event": serialize_event(event),
+            })
+        self.broker.publish(messages)
+
+
+class DedupConsumer(OutboxConsumer):
+    """Инкрементальный поиск дубликатов для новых лидов и лидов с измененными ключевыми полями"""
+
+    name = "lead_dedup"
+    aggregate_types = ("lead",)
+    start_at_latest = True
+    # Поля, от которых зависят ключи блокировки и оценка сходства
+    fields = frozenset({"name", "company", "email", "phone", "phone_e164", "website"})
+
+    def accepts(self, event: OutboxEvent) -> bool:
+        if not super().accepts(event):
+            return False
+        if event.event_type == "updated":
+            return bool(self.fields.intersection((event.payload or {}).get("changed_fields") or ()))
+        return event.event_type in ("created", "deleted")
+
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        deleted = {event.aggregate_id for event in events if event.event_type == "deleted"}
+        changed = {event.aggregate_id for event in events} - deleted
+        forget_leads(db, deleted)
+        find_candidates_for(db, changed)
+
+
+def register_default_consumers(relay) -> None:
+    """Регистрация потребителей, включенных настройками"""
+    relay.register_consumer(RollupConsumer())
+    for url in settings.OUTBOX_WEBHOOK_URLS:
+        relay.register_consumer(WebhookConsumer(url, settings.OUTBOX_WEBHOOK_SECRET))
+    if settings.OUTBOX_CRM_PUSH_ENABLED:
+        relay.register_consumer(CRMPushConsumer())
+    if settings.REALTIME_ENABLED:
+        relay.register_consumer(RealtimeConsumer())
+    if settings.DEDUP_ENABLED:
+        relay.register_consumer(DedupConsumer())
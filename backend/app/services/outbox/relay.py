@@ -0,0 +1,226 @@
+"""
+Релей outbox: доставка событий потребителям пачками по порядку ID
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.outbox import OutboxConsumerOffset, OutboxEvent, on_outbox_commit
+from app.utils.sql import dialect_insert
+
+
+class OutboxConsumer:
+    """Потребитель ленты изменений.
+
+    handle() получает сессию релея: записи потребителя в БД коммитятся
+    вместе со смещением, поэтому для локальных потребителей доставка
+    фактически exactly-once. Внешние побочные эффекты (HTTP, CRM)
+    получают at-least-once и должны быть идемпотентными.
+    """
+
+    name: str = ""
+    aggregate_types: Optional[Tuple[str, ...]] = None  # None - все агрегаты
+    start_at_latest: bool = False  # новый потребитель не получает историю
+
+    def accepts(self, event: OutboxEvent) -> bool:
+        return self.aggregate_types is None or event.aggregate_type in self.aggregate_types
+
+    def initialize(self, db: Session) -> None:
+        """Вызывается один раз при создании смещения, в той же транзакции (например, backfill)"""
+
+    def handle(self, db: Session, events: List[OutboxEvent]) -> None:
+        raise NotImplementedError
+
+
+def serialize_event(event: OutboxEvent) -> Dict:
+    return {
+        "id": event.id,
+        "aggregate_type": event.aggregate_type,
+        "aggregate_id": event.aggregate_id,
+        "event_type": event.event_type,
+        "payload": event.payload,
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+    }
+
+
+class OutboxRelay:
+    """Читает outbox_events после смещения каждого потребителя.
+
+    Просыпается сразу после коммита транзакции с событиями в этом процессе;
+    изменения из других процессов подхватываются опросом раз в
+    OUTBOX_POLL_INTERVAL_SECONDS. Пропуск в последовательности ID (транзакция
+    с меньшим ID еще не закоммичена) выдерживается OUTBOX_GAP_TIMEOUT_SECONDS,
+    после чего считается откатом - так порядок не нарушается.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.consumers: Dict[str, OutboxConsumer] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._gaps: Dict[str, Tuple[int, float]] = {}  # потребитель -> (ожидаемый ID, первое наблюдение)
+        self._retry_at: Dict[str, float] = {}
+        self._failures: Dict[str, int] = {}
+        on_outbox_commit(self._wake.set)
+
+    def register_consumer(self, consumer: OutboxConsumer) -> None:
+        if not consumer.name:
+            raise ValueError("Outbox consumer must have a name")
+        self.consumers[consumer.name] = consumer
+
+    # --- Обработка ---
+
+    def _offset(self, db: Session, consumer: OutboxConsumer) -> Optional[OutboxConsumerOffset]:
+        """Смещение потребителя; на PostgreSQL строка блокируется, чтобы воркеры не дублировали доставку"""
+        query = db.query(OutboxConsumerOffset).filter(OutboxConsumerOffset.consumer == consumer.name)
+        offset = query.with_for_update(skip_locked=True).first()
+        if offset is not None:
+            return offset
+
+        if consumer.start_at_latest:
+            start = db.query(func.max(OutboxEvent.id)).scalar() or 0
+        else:
+            start = (db.query(func.min(OutboxEvent.id)).scalar() or 1) - 1
+        consumer.initialize(db)
+        insert = dialect_insert(db)
+        db.execute(
+            insert(OutboxConsumerOffset.__table__)
+            .values(consumer=consumer.name, last_event_id=start)
+            .on_conflict_do_nothing(index_elements=["consumer"])
+        )
+        db.commit()
+        return query.with_for_update(skip_locked=True).first()
+
+    def _ready_events(self, consumer_name: str, last_id: int, events: List[OutboxEvent]) -> List[OutboxEvent]:
+        """Непрерывный префикс пачки; пропуск ждет OUTBOX_GAP_TIMEOUT_SECONDS"""
+        ready: List[OutboxEvent] = []
+        expected = last_id + 1
+        for event in events:
+            if event.id != expected:
+                gap = self._gaps.get(consumer_name)
+                now = time.monotonic()
+                if gap is None or gap[0] != expected:
+                    self._gaps[consumer_name] = (expected, now)
+                    break
+                if now - gap[1] < settings.OUTBOX_GAP_TIMEOUT_SECONDS:
+                    break
+            ready.append(event)
+            expected = event.id + 1
+        if ready:
+            self._gaps.pop(consumer_name, None)
+        return ready
+
+    def _process(self, db: Session, consumer: OutboxConsumer) -> int:
+        """Одна пачка потребителя; возвращает число продвинутых событий"""
+        offset = self._offset(db, consumer)
+        if offset is None:  # смещение удерживает другой воркер
+            db.rollback()
+            return 0
+
+        events = (
+            db.query(OutboxEvent)
+            .filter(OutboxEvent.id > offset.last_event_id)
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+            .all()
+        )
+        ready = self._ready_events(consumer.name, offset.last_event_id, events)
+        if not ready:
+            db.rollback()
+            return 0
+
+        accepted = [event for event in ready if consumer.accepts(event)]
+        if accepted:
+            consumer.handle(db, accepted)
+        offset.last_event_id = ready[-1].id
+        db.commit()
+        return len(ready)
+
+    def run_once(self) -> int:
+        """Одна пачка для каждого потребителя; возвращает число доставленных событий"""
+        delivered = 0
+        for consumer in list(self.consumers.values()):
+            if self._retry_at.get(consumer.name, 0) > time.monotonic():
+                continue
+            db = SessionLocal()
+            try:
+                delivered += self._process(db, consumer)
+                self._failures.pop(consumer.name, None)
+                self._retry_at.pop(consumer.name, None)
+            except Exception as exc:  # noqa: BLE001
+                db.rollback()
+                failures = self._failures.get(consumer.name, 0) + 1
+                self._failures[consumer.name] = failures
+                delay = min(settings.OUTBOX_POLL_INTERVAL_SECONDS * 12, 2 ** failures)
+                self._retry_at[consumer.name] = time.monotonic() + delay
+                logger.warning(f"Outbox consumer '{consumer.name}' failed (retry in {delay}s): {exc}")
+            finally:
+                db.close()
+        return delivered
+
+    def drain(self) -> int:
+        """Обработка до опустошения очереди (для скриптов и тестов)"""
+        total = 0
+        while True:
+            delivered = self.run_once()
+            if not delivered:
+                return total
+            total += delivered
+
+    def prune(self) -> int:
+        """Удаление событий, доставленных всем известным потребителям (включая другие процессы)"""
+        db = SessionLocal()
+        try:
+            min_offset = db.query(func.min(OutboxConsumerOffset.last_event_id)).scalar()
+            if min_offset is None:
+                return 0
+            deleted = (
+                db.query(OutboxEvent)
+                .filter(OutboxEvent.id <= min_offset)
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    # --- Фоновый поток ---
+
+    def _loop(self) -> None:
+        last_prune = time.monotonic()
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                delivered = self.run_once()
+                if time.monotonic() - last_prune > settings.OUTBOX_PRUNE_INTERVAL_SECONDS:
+                    self.prune()
+                    last_prune = time.monotonic()
+            except Exception as exc:  # noqa: BLE001
+                logger.exception(f"Outbox relay iteration failed: {exc}")
+                delivered = 0
+            if not delivered:
+                self._wake.wait(settings.OUTBOX_POLL_INTERVAL_SECONDS)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="outbox-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+
+outbox_relay = OutboxRelay()
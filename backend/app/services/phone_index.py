@@ -0,0 +1,98 @@
+"""
+Поиск лидов по телефону через индекс leads.phone_e164
+
+Номер приводится к E.164 один раз на стороне приложения, после чего поиск -
+точное совпадение по индексу вместо разбора строк Lead.phone каждой строки.
+ORM заполняет phone_e164 сам (событие модели Lead); массовые INSERT/UPDATE
+передают его через phone_index_values.
+"""
+from typing import Any, Dict, Iterable, Optional
+
+from loguru import logger
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.lead import Lead
+from app.utils.phone import normalize_phone
+
+
+def phone_index_values(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Добавляет phone_e164 к значениям массовой записи, если в них есть phone"""
+    if "phone" in values:
+        values["phone_e164"] = normalize_phone(values["phone"])
+    return values
+
+
+def lead_for_phone(db: Session, number: Optional[str], *criteria: Any) -> Optional[Lead]:
+    """Самый ранний лид с этим номером - одна выборка по индексу"""
+    e164 = normalize_phone(number)
+    if e164 is None:
+        return None
+    return (
+        db.query(Lead)
+        .filter(Lead.phone_e164 == e164, *criteria)
+        .order_by(Lead.id)
+        .limit(1)
+        .first()
+    )
+
+
+def leads_by_phone(db: Session, numbers: Iterable[Optional[str]], *criteria: Any) -> Dict[str, Lead]:
+    """Лиды по номерам одним запросом IN: E.164 -> самый ранний лид с этим номером"""
+    phones = {e164 for e164 in (normalize_phone(number) for number in numbers) if e164}
+    if not phones:
+        return {}
+    found: Dict[str, Lead] = {}
+    for lead in db.query(Lead).filter(Lead.phone_e164.in_(phones), *criteria).order_by(Lead.id.desc()).all():
+        found[lead.phone_e164] = lead
+    return found
+
+
+def backfill_phone_e164(db: Session, batch_size: Optional[int] = None) -> int:
+    """Заполнение phone_e164 у лидов, записанных до появления колонки.
+
+    Обход по id пачками с коммитом после каждой; возвращает число
+    заполненных строк. Нераспознанные номера остаются NULL.
+    """
+    batch_size = batch_size or settings.PHONE_BACKFILL_BATCH_SIZE
+    filled = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(Lead.id, Lead.phone, Lead.updated_at)
+            .filter(Lead.id > last_id, Lead.phone.isnot(None), Lead.phone_e164.is_(None))
+            .order_by(Lead.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+        # Производная колонка: событий outbox не требуется, updated_at сохраняется
+        updates = [
+            {"id": row.id, "phone_e164": e164, "updated_at": row.updated_at}
+            for row, e164 in ((row, normalize_phone(row.phone)) for row in rows)
+            if e164
+        ]
+        if updates:
+            db.execute(update(Lead), updates)
+            filled += len(updates)
+        db.commit()
+    return filled
+
+
+def run_phone_backfill() -> int:
+    """Заполнение phone_e164 в отдельной сессии (для фонового запуска при старте)"""
+    db = SessionLocal()
+    try:
+        filled = backfill_phone_e164(db)
+        if filled:
+            logger.info(f"Phone index backfill: {filled} leads")
+        return filled
+    except Exception as exc:  # noqa: BLE001
+        logger.exception(f"Phone index backfill failed: {exc}")
+        return 0
+    finally:
+        db.close()
@@ -0,0 +1,183 @@
+"""
+Лента изменений лидов в реальном времени (WebSocket)
+
+События берутся из outbox потребителем RealtimeConsumer и публикуются брокеру:
+через Redis pub/sub, если Redis настроен (доходит до подписчиков всех воркеров),
+иначе - напрямую в хаб текущего процесса. Хаб раздает сообщение только
+подписчикам его лида и пользователям, которым лид назначен, без перебора
+всех соединений.
+"""
+import asyncio
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import redis
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import redis_client
+
+
+class RealtimeSubscription:
+    """Подписки одного WebSocket соединения и его очередь отправки"""
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, queue_size: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.lead_ids: Set[int] = set()
+        self.my_leads = False
+
+    def _put(self, message: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Медленный клиент: очередь сбрасывается, клиент перечитывает данные
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+    def deliver(self, message: Dict[str, Any]) -> None:
+        """Потокобезопасная постановка в очередь (вызывается из потока релея или слушателя Redis)"""
+        self.loop.call_soon_threadsafe(self._put, message)
+
+
+class RealtimeHub:
+    """Подписчики текущего процесса с индексами по лиду и по пользователю"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._by_lead: Dict[int, Set[RealtimeSubscription]] = {}
+        self._by_user: Dict[int, Set[RealtimeSubscription]] = {}
+
+    def subscribe_lead(self, subscription: RealtimeSubscription, lead_id: int) -> None:
+        with self._lock:
+            subscription.lead_ids.add(lead_id)
+            self._by_lead.setdefault(lead_id, set()).add(subscription)
+
+    def unsubscribe_lead(self, subscription: RealtimeSubscription, lead_id: int) -> None:
+        with self._lock:
+            subscription.lead_ids.discard(lead_id)
+            self._discard(self._by_lead, lead_id, subscription)
+
+    def set_my_leads(self, subscription: RealtimeSubscription, enabled: bool) -> None:
+        with self._lock:
+            subscription.my_leads = enabled
+            if enabled:
+                self._by_user.setdefault(subscription.user_id, set()).add(subscription)
+            else:
+                self._discard(self._by_user, subscription.user_id, subscription)
+
+    def remove(self, subscription: RealtimeSubscription) -> None:
+        with self._lock:
+            for lead_id in subscription.lead_ids:
+                self._discard(self._by_lead, lead_id, subscription)
+            subscription.lead_ids.clear()
+            self._discard(self._by_user, subscription.user_id, subscription)
+            subscription.my_leads = False
+
+    @staticmethod
+    def _discard(index: Dict[int, Set[RealtimeSubscription]], key: int, subscription: RealtimeSubscription) -> None:
+        subscribers = index.get(key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del index[key]
+
+    def dispatch(self, message: Dict[str, Any]) -> int:
+        """Рассылка сообщения брокера; возвращает число получателей"""
+        with self._lock:
+            targets = set(self._by_lead.get(message.get("lead_id"), ()))
+            for user_id in message.get("user_ids") or ():
+                targets.update(self._by_user.get(user_id, ()))
+        outgoing = {"type": "event", "event": message["event"]}
+        for subscription in targets:
+            subscription.deliver(outgoing)
+        return len(targets)
+
+
+class LocalBroker:
+    """Брокер без Redis: события доходят только до подписчиков этого процесса"""
+
+    name = "local"
+
+    def __init__(self, hub: RealtimeHub):
+        self.hub = hub
+
+    def publish(self, messages: Iterable[Dict[str, Any]]) -> None:
+        for message in messages:
+            self.hub.dispatch(message)
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class RedisBroker:
+    """Redis pub/sub: публикация пачкой через pipeline, слушатель в отдельном потоке"""
+
+    name = "redis"
+
+    def __init__(self, hub: RealtimeHub, redis_conn: "redis.Redis", channel: str):
+        self.hub = hub
+        self.redis = redis_conn
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self, messages: Iterable[Dict[str, Any]]) -> None:
+        # Ошибка Redis уходит в релей - пачка будет опубликована повторно
+        pipeline = self.redis.pipeline(transaction=False)
+        for message in messages:
+            pipeline.publish(self.channel, json.dumps(message, default=str))
+        pipeline.execute()
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                while not self._stop.is_set():
+                    item = pubsub.get_message(timeout=1.0)
+                    if item is None or item.get("type") != "message":
+                        continue
+                    try:
+                        self.hub.dispatch(json.loads(item["data"]))
+                    except (ValueError, KeyError) as exc:
+                        logger.warning(f"Invalid realtime message: {exc}")
+            except redis.RedisError as exc:
+                logger.warning(f"Realtime Redis subscription lost: {exc}")
+                self._stop.wait(1.0)
+            finally:
+                pubsub.close()
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._listen, name="realtime-redis", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+def event_recipients(payload: Dict[str, Any], lead_owner: Optional[int]) -> List[int]:
+    """Пользователи, чья подписка "мои лиды" получает событие"""
+    recipients = {lead_owner, payload.get("assigned_to"), payload.get("agent_id")}
+    # При переназначении лида событие получает и прежний ответственный
+    recipients.update((payload.get("changes") or {}).get("assigned_to") or ())
+    return sorted(user_id for user_id in recipients if isinstance(user_id, int))
+
+
+realtime_hub = RealtimeHub()
+realtime_broker = (
+    RedisBroker(realtime_hub, redis_client, settings.REALTIME_REDIS_CHANNEL)
+    if redis_client is not None
+    else LocalBroker(realtime_hub)
+)
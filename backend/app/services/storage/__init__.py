@@ -0,0 +1,50 @@
+"""
+Хранилище записей звонков: локальная файловая система или S3-совместимое
+"""
+from functools import lru_cache
+from typing import Dict, Optional, Type
+
+from app.core.config import settings
+from app.services.storage.base import (
+    RecordingStorage,
+    StorageError,
+    StorageObjectTooLarge,
+    StoredObject,
+    validate_key,
+)
+from app.services.storage.local import LocalRecordingStorage
+from app.services.storage.s3 import S3RecordingStorage
+
+BACKENDS: Dict[str, Type[RecordingStorage]] = {
+    LocalRecordingStorage.name: LocalRecordingStorage,
+    S3RecordingStorage.name: S3RecordingStorage,
+}
+
+
+@lru_cache(maxsize=None)
+def get_recording_storage(name: Optional[str] = None) -> RecordingStorage:
+    name = name or settings.RECORDING_STORAGE_BACKEND
+    if name == LocalRecordingStorage.name:
+        return LocalRecordingStorage(settings.RECORDING_STORAGE_PATH)
+    if name == S3RecordingStorage.name:
+        return S3RecordingStorage(
+            settings.AWS_BUCKET_NAME,
+            region=settings.AWS_REGION,
+            endpoint_url=settings.AWS_ENDPOINT_URL,
+            access_key=settings.AWS_ACCESS_KEY_ID,
+            secret_key=settings.AWS_SECRET_ACCESS_KEY,
+        )
+    raise StorageError(f"Unknown recording storage '{name}', expected one of {sorted(BACKENDS)}")
+
+
+__all__ = [
+    "BACKENDS",
+    "LocalRecordingStorage",
+    "RecordingStorage",
+    "S3RecordingStorage",
+    "StorageError",
+    "StorageObjectTooLarge",
+    "StoredObject",
+    "get_recording_storage",
+    "validate_key",
+]
@@ -0,0 +1,50 @@
+"""
+Интерфейс хранилища записей звонков
+"""
+import re
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+
+class StorageError(Exception):
+    """Ошибка хранилища записей"""
+
+
+class StorageObjectTooLarge(StorageError):
+    """Загрузка превышает допустимый размер"""
+
+
+@dataclass
+class StoredObject:
+    key: str
+    size: int
+    content_type: str
+
+
+_KEY_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._/-]*$")
+
+
+def validate_key(key: str) -> str:
+    """Ключ объекта: относительный путь без переходов вверх"""
+    if not _KEY_RE.match(key) or ".." in key.split("/"):
+        raise StorageError(f"Invalid storage key '{key}'")
+    return key
+
+
+class RecordingStorage:
+    """Бэкенд хранилища: потоковая запись и выдача объектов"""
+
+    name = "base"
+
+    async def save_stream(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: str,
+        max_bytes: Optional[int] = None,
+    ) -> StoredObject:
+        """Запись потока частями; в памяти только текущий буфер"""
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
@@ -0,0 +1,71 @@
+"""
+Хранилище записей на локальной файловой системе
+"""
+import os
+import uuid
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from anyio import to_thread
+
+from app.services.storage.base import (
+    RecordingStorage,
+    StorageError,
+    StorageObjectTooLarge,
+    StoredObject,
+    validate_key,
+)
+
+# Поток загрузки пишется на диск блоками не меньше этого размера
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+
+class LocalRecordingStorage(RecordingStorage):
+    """Файлы в каталоге root; запись во временный файл и атомарное переименование"""
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = Path(root).expanduser().resolve()
+
+    def path(self, key: str) -> Path:
+        path = (self.root / validate_key(key)).resolve()
+        if self.root not in path.parents:
+            raise StorageError(f"Invalid storage key '{key}'")
+        return path
+
+    async def save_stream(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: str,
+        max_bytes: Optional[int] = None,
+    ) -> StoredObject:
+        path = self.path(key)
+        await to_thread.run_sync(lambda: path.parent.mkdir(parents=True, exist_ok=True))
+        partial = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+        handle = await to_thread.run_sync(open, partial, "wb")
+        size = 0
+        buffer = bytearray()
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise StorageObjectTooLarge(f"Upload exceeds {max_bytes} bytes")
+                buffer.extend(chunk)
+                if len(buffer) >= WRITE_BUFFER_BYTES:
+                    await to_thread.run_sync(handle.write, bytes(buffer))
+                    buffer.clear()
+            if buffer:
+                await to_thread.run_sync(handle.write, bytes(buffer))
+            await to_thread.run_sync(handle.close)
+            await to_thread.run_sync(os.replace, partial, path)
+        except BaseException:
+            handle.close()
+            partial.unlink(missing_ok=True)
+            raise
+        return StoredObject(key=key, size=size, content_type=content_type)
+
+    async def delete(self, key: str) -> None:
+        path = self.path(key)
+        await to_thread.run_sync(lambda: path.unlink(missing_ok=True))
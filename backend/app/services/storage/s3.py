@@ -0,0 +1,119 @@
+"""
+Хранилище записей в S3-совместимом объектном хранилище (AWS S3, MinIO)
+
+boto3 импортируется при первом обращении: для локального хранилища он не нужен.
+"""
+from typing import AsyncIterator, List, Optional
+
+from anyio import to_thread
+
+from app.services.storage.base import (
+    RecordingStorage,
+    StorageError,
+    StorageObjectTooLarge,
+    StoredObject,
+    validate_key,
+)
+
+# Минимальный размер части multipart upload в S3 (кроме последней)
+PART_BYTES = 8 * 1024 * 1024
+
+
+class S3RecordingStorage(RecordingStorage):
+    """Потоковая загрузка частями (multipart upload), выдача через presigned URL"""
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: Optional[str],
+        region: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+    ):
+        if not bucket:
+            raise StorageError("AWS_BUCKET_NAME is not configured")
+        self.bucket = bucket
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError as exc:
+                raise StorageError("boto3 is required for S3 recording storage") from exc
+            self._client = boto3.client(
+                "s3",
+                region_name=self.region,
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+            )
+        return self._client
+
+    async def save_stream(
+        self,
+        key: str,
+        chunks: AsyncIterator[bytes],
+        content_type: str,
+        max_bytes: Optional[int] = None,
+    ) -> StoredObject:
+        validate_key(key)
+        client = self._get_client()
+        upload = await to_thread.run_sync(
+            lambda: client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=content_type)
+        )
+        upload_id = upload["UploadId"]
+        parts: List[dict] = []
+        buffer = bytearray()
+        size = 0
+
+        async def _upload_part(data: bytes) -> None:
+            number = len(parts) + 1
+            response = await to_thread.run_sync(
+                lambda: client.upload_part(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data
+                )
+            )
+            parts.append({"PartNumber": number, "ETag": response["ETag"]})
+
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise StorageObjectTooLarge(f"Upload exceeds {max_bytes} bytes")
+                buffer.extend(chunk)
+                if len(buffer) >= PART_BYTES:
+                    await _upload_part(bytes(buffer))
+                    buffer.clear()
+            # Пустой объект - тоже одна (пустая) часть
+            if buffer or not parts:
+                await _upload_part(bytes(buffer))
+            await to_thread.run_sync(
+                lambda: client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+                )
+            )
+        except BaseException:
+            await to_thread.run_sync(
+                lambda: client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            )
+            raise
+        return StoredObject(key=key, size=size, content_type=content_type)
+
+    def presigned_url(self, key: str, expires_seconds: int) -> str:
+        """Временная ссылка на объект; Range запросы обслуживает само хранилище"""
+        return self._get_client().generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": validate_key(key)},
+            ExpiresIn=expires_seconds,
+        )
+
+    async def delete(self, key: str) -> None:
+        client = self._get_client()
+        await to_thread.run_sync(lambda: client.delete_object(Bucket=self.bucket, Key=validate_key(key)))
@@ -0,0 +1,240 @@
+"""
+Планировщик задач по звонкам: очередь агента и напоминания о сроках
+
+Очередь "следующие N задач" читается по индексу (assigned_to, status, due_at).
+Напоминания срабатывают из колеса таймеров: раз в CALL_TASK_REMINDER_REFRESH_SECONDS
+в колесо загружается только окно ближайших сроков по индексу (status, due_at),
+а каждый тик проверяет один слот колеса, а не всю таблицу.
+"""
+import asyncio
+import math
+import time
+from datetime import datetime, timezone
+from typing import Dict, Hashable, List, Optional
+
+from loguru import logger
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.call import CallTask
+from app.models.outbox import add_outbox_events
+
+PRIORITY_RANK = {"urgent": 0, "high": 1, "medium": 2, "low": 3}
+TASK_STATUSES = ("pending", "in_progress", "completed", "cancelled")
+
+# Неизвестный приоритет - в конец очереди
+priority_order = case(PRIORITY_RANK, value=CallTask.priority, else_=len(PRIORITY_RANK))
+
+
+def next_tasks(db: Session, user_id: int, limit: int) -> List[CallTask]:
+    """Очередь агента: открытые задачи по приоритету, затем по сроку"""
+    return (
+        db.query(CallTask)
+        .filter(CallTask.assigned_to == user_id, CallTask.status == "pending")
+        .order_by(priority_order, CallTask.due_at, CallTask.id)
+        .limit(limit)
+        .all()
+    )
+
+
+def _timestamp(value: datetime) -> float:
+    # Naive значения из SQLite считаются UTC
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class TimerWheel:
+    """Хешированное колесо таймеров: добавление, удаление и тик за O(1) на слот.
+
+    Срок дальше одного оборота колеса остается в слоте до своего оборота
+    (слот проверяет точное время срабатывания).
+    """
+
+    def __init__(self, tick_seconds: float, slots: int, now: float):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self._buckets: List[Dict[Hashable, float]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[Hashable, int] = {}
+        self._tick = int(now // tick_seconds)
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._slot_of
+
+    def add(self, key: Hashable, fire_at: float) -> None:
+        self.remove(key)
+        slot = max(int(fire_at // self.tick_seconds), self._tick) % self.slots
+        self._buckets[slot][key] = fire_at
+        self._slot_of[key] = slot
+
+    def remove(self, key: Hashable) -> None:
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._buckets[slot].pop(key, None)
+
+    def advance(self, now: float) -> List[Hashable]:
+        """Ключи, время которых наступило, с момента прошлого вызова"""
+        target = int(now // self.tick_seconds)
+        fired: List[Hashable] = []
+        # После долгой паузы достаточно одного полного оборота
+        for tick in range(max(self._tick, target - self.slots + 1), target + 1):
+            bucket = self._buckets[tick % self.slots]
+            due = [key for key, fire_at in bucket.items() if fire_at <= now]
+            for key in due:
+                del bucket[key]
+                del self._slot_of[key]
+            fired.extend(due)
+        self._tick = target
+        return fired
+
+
+def fire_reminders(db: Session, task_ids: List[int], now: Optional[datetime] = None) -> int:
+    """Отметка напоминаний и события call_task/reminder в outbox (без commit).
+
+    UPDATE ... WHERE reminder_sent_at IS NULL атомарно забирает задачи, поэтому
+    при нескольких процессах напоминание уходит один раз.
+    """
+    if not task_ids:
+        return 0
+    now = now or datetime.utcnow()
+    claimed = db.execute(
+        update(CallTask)
+        .where(
+            CallTask.id.in_(task_ids),
+            CallTask.status == "pending",
+            CallTask.reminder_sent_at.is_(None),
+        )
+        .values(reminder_sent_at=now)
+        .returning(
+            CallTask.id,
+            CallTask.lead_id,
+            CallTask.assigned_to,
+            CallTask.task_type,
+            CallTask.priority,
+            CallTask.due_at,
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+    add_outbox_events(
+        db,
+        [
+            {
+                "aggregate_type": "call_task",
+                "aggregate_id": row.id,
+                "event_type": "reminder",
+                "payload": {
+                    "id": row.id,
+                    "lead_id": row.lead_id,
+                    "assigned_to": row.assigned_to,
+                    "task_type": row.task_type,
+                    "priority": row.priority,
+                    "due_at": row.due_at.isoformat() if row.due_at else None,
+                },
+            }
+            for row in claimed
+        ],
+    )
+    return len(claimed)
+
+
+class TaskReminderScheduler:
+    """Напоминания о сроках задач из колеса таймеров"""
+
+    def __init__(self) -> None:
+        self._task: Optional[asyncio.Task] = None
+        self._wheel: Optional[TimerWheel] = None
+        self._loaded_until = 0.0
+
+    @property
+    def lead_seconds(self) -> float:
+        return settings.CALL_TASK_REMINDER_LEAD_SECONDS
+
+    @property
+    def window_seconds(self) -> float:
+        # Окно с запасом в один интервал: задачи не теряются между загрузками
+        return 2 * settings.CALL_TASK_REMINDER_REFRESH_SECONDS
+
+    def schedule(self, task: CallTask) -> None:
+        """Постановка или снятие задачи после изменения через API этого процесса"""
+        if self._wheel is None:
+            return
+        if task.status != "pending" or task.reminder_sent_at is not None or task.due_at is None:
+            self._wheel.remove(task.id)
+            return
+        fire_at = _timestamp(task.due_at) - self.lead_seconds
+        if fire_at <= self._loaded_until:
+            self._wheel.add(task.id, fire_at)
+        else:
+            # Подхватится следующей загрузкой окна
+            self._wheel.remove(task.id)
+
+    def _load_window(self, now: float) -> int:
+        """Задачи со сроком в окне; давно просроченные без напоминания не поднимаются"""
+        until = now + self.window_seconds
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(CallTask.id, CallTask.due_at)
+                .filter(
+                    CallTask.status == "pending",
+                    CallTask.due_at >= datetime.utcfromtimestamp(now - self.window_seconds),
+                    CallTask.due_at < datetime.utcfromtimestamp(until + self.lead_seconds),
+                    CallTask.reminder_sent_at.is_(None),
+                )
+                .all()
+            )
+        finally:
+            db.close()
+        for task_id, due_at in rows:
+            self._wheel.add(task_id, _timestamp(due_at) - self.lead_seconds)
+        self._loaded_until = until
+        return len(rows)
+
+    def _fire(self, task_ids: List[int]) -> int:
+        db = SessionLocal()
+        try:
+            sent = fire_reminders(db, task_ids)
+            db.commit()
+            return sent
+        finally:
+            db.close()
+
+    async def run_forever(self, tick_seconds: float) -> None:
+        loop = asyncio.get_running_loop()
+        slots = math.ceil(self.window_seconds / tick_seconds) + 1
+        self._wheel = TimerWheel(tick_seconds, slots, time.time())
+        next_refresh = 0.0
+        while True:
+            try:
+                now = time.time()
+                if now >= next_refresh:
+                    await loop.run_in_executor(None, self._load_window, now)
+                    next_refresh = now + settings.CALL_TASK_REMINDER_REFRESH_SECONDS
+                fired = self._wheel.advance(now)
+                if fired:
+                    sent = await loop.run_in_executor(None, self._fire, fired)
+                    logger.info(f"Call task reminders sent: {sent}")
+            except Exception as exc:  # noqa: BLE001
+                logger.exception(f"Call task reminders failed: {exc}")
+            await asyncio.sleep(tick_seconds)
+
+    def start(self, tick_seconds: float) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run_forever(tick_seconds))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._wheel = None
+        self._loaded_until = 0.0
+
+
+task_reminder_scheduler = TaskReminderScheduler()
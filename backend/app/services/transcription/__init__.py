@@ -0,0 +1,39 @@
+"""
+Транскрибация записей звонков: потоковая нарезка, распознавание речи и анализ
+"""
+from app.services.transcription.chunker import AudioChunk, AudioFormatError, ByteChunker, SingleFileChunker, WavChunker, chunker_for
+from app.services.transcription.pipeline import (
+    RecordingTooLargeError,
+    TranscriptionJob,
+    merge_transcripts,
+    set_transcription_status,
+)
+from app.services.transcription.stt import (
+    ChunkTranscript,
+    FakeSpeechToText,
+    OpenAISpeechToText,
+    SpeechToTextBackend,
+    SpeechToTextError,
+    get_stt_backend,
+    register_backend,
+)
+
+__all__ = [
+    "AudioChunk",
+    "AudioFormatError",
+    "ByteChunker",
+    "SingleFileChunker",
+    "WavChunker",
+    "chunker_for",
+    "RecordingTooLargeError",
+    "TranscriptionJob",
+    "merge_transcripts",
+    "set_transcription_status",
+    "ChunkTranscript",
+    "FakeSpeechToText",
+    "OpenAISpeechToText",
+    "SpeechToTextBackend",
+    "SpeechToTextError",
+    "get_stt_backend",
+    "register_backend",
+]
@@ -0,0 +1,214 @@
+"""
+Нарезка потока аудио на фрагменты для распознавания
+
+WAV (PCM) режется по границам сэмплов с перекрытием, каждый фрагмент
+получает собственный заголовок. MP3 - поток самостоятельных кадров без
+общего заголовка, поэтому режется по байтам: декодер находит синхронизацию
+на границе. Контейнеры (ogg, webm, mp4, flac) держат заголовки только в
+начале файла - фрагмент без них не декодируется, поэтому такая запись
+уходит в STT одним файлом. В памяти держится только текущий фрагмент.
+"""
+import struct
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+class AudioFormatError(ValueError):
+    """Поток не удалось разобрать как аудио заявленного формата"""
+
+
+@dataclass
+class AudioChunk:
+    index: int
+    data: bytes
+    filename: str
+    start_seconds: Optional[float] = None  # известно только для PCM
+    end_seconds: Optional[float] = None
+
+
+class ByteChunker:
+    """Фрагменты фиксированного размера в байтах"""
+
+    extension = "bin"
+
+    def __init__(self, chunk_bytes: int, extension: str = "bin"):
+        self.chunk_bytes = chunk_bytes
+        self.extension = extension
+        self._buffer = bytearray()
+        self._index = 0
+        self.total_bytes = 0
+
+    def _emit(self, data: bytes) -> AudioChunk:
+        chunk = AudioChunk(self._index, data, f"chunk_{self._index:05d}.{self.extension}")
+        self._index += 1
+        return chunk
+
+    def feed(self, data: bytes) -> List[AudioChunk]:
+        self.total_bytes += len(data)
+        self._buffer.extend(data)
+        chunks = []
+        while len(self._buffer) >= self.chunk_bytes:
+            chunks.append(self._emit(bytes(self._buffer[:self.chunk_bytes])))
+            del self._buffer[:self.chunk_bytes]
+        return chunks
+
+    def finish(self) -> List[AudioChunk]:
+        if not self._buffer:
+            return []
+        chunk = self._emit(bytes(self._buffer))
+        self._buffer.clear()
+        return [chunk]
+
+
+class SingleFileChunker(ByteChunker):
+    """Вся запись одним фрагментом: контейнерные форматы нельзя резать по байтам"""
+
+    def __init__(self, max_bytes: int, extension: str):
+        super().__init__(max_bytes, extension)
+
+    def feed(self, data: bytes) -> List[AudioChunk]:
+        self.total_bytes += len(data)
+        if self.total_bytes > self.chunk_bytes:
+            raise AudioFormatError(
+                f"{self.extension} recording is larger than {self.chunk_bytes} bytes and cannot be split; "
+                "upload it as WAV or MP3"
+            )
+        self._buffer.extend(data)
+        return []
+
+
+class WavChunker:
+    """Фрагменты PCM WAV по chunk_seconds с перекрытием overlap_seconds"""
+
+    def __init__(self, chunk_seconds: float, overlap_seconds: float = 0.0):
+        self.chunk_seconds = chunk_seconds
+        self.overlap_seconds = overlap_seconds
+        self._header = bytearray()
+        self._format: Optional[tuple] = None  # (audio_format, channels, sample_rate, bits_per_sample)
+        self._buffer = bytearray()
+        self._index = 0
+        self._buffer_start_frame = 0
+        self.total_bytes = 0
+
+    @property
+    def frame_size(self) -> int:
+        _, channels, _, bits = self._format
+        return channels * bits // 8
+
+    @property
+    def sample_rate(self) -> int:
+        return self._format[2]
+
+    def _parse_header(self) -> None:
+        """Разбор RIFF заголовка до начала блока data; данные после него уходят в буфер"""
+        header = bytes(self._header)
+        if len(header) < 12:
+            return
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise AudioFormatError("Not a RIFF/WAVE stream")
+        offset = 12
+        while len(header) >= offset + 8:
+            chunk_id, size = header[offset:offset + 4], struct.unpack("<I", header[offset + 4:offset + 8])[0]
+            body = offset + 8
+            if chunk_id == b"data":
+                if self._format is None:
+                    raise AudioFormatError("WAV data chunk before fmt chunk")
+                self._buffer.extend(header[body:])
+                self._header = bytearray()
+                return
+            if len(header) < body + size:
+                return
+            if chunk_id == b"fmt ":
+                audio_format, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", header[body:body + 16])
+                if audio_format not in (1, 0xFFFE) or bits % 8 or not channels or not sample_rate:
+                    raise AudioFormatError("Only PCM WAV can be split by samples")
+                self._format = (audio_format, channels, sample_rate, bits)
+            offset = body + size + (size & 1)
+        if len(header) > 1024 * 1024:
+            raise AudioFormatError("WAV header is too large")
+
+    def _wav_bytes(self, pcm: bytes) -> bytes:
+        audio_format, channels, sample_rate, bits = self._format
+        header = struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF", 36 + len(pcm), b"WAVE",
+            b"fmt ", 16, 1 if audio_format == 0xFFFE else audio_format, channels, sample_rate,
+            sample_rate * self.frame_size, self.frame_size, bits,
+            b"data", len(pcm),
+        )
+        return header + pcm
+
+    def _emit(self, pcm: bytes) -> AudioChunk:
+        start = self._buffer_start_frame / self.sample_rate
+        end = start + len(pcm) / self.frame_size / self.sample_rate
+        chunk = AudioChunk(self._index, self._wav_bytes(pcm), f"chunk_{self._index:05d}.wav", start, end)
+        self._index += 1
+        return chunk
+
+    def feed(self, data: bytes) -> List[AudioChunk]:
+        self.total_bytes += len(data)
+        if self._format is None or self._header:
+            self._header.extend(data)
+            self._parse_header()
+            if self._header:
+                return []
+        else:
+            self._buffer.extend(data)
+
+        frame_size = self.frame_size
+        chunk_bytes = int(self.chunk_seconds * self.sample_rate) * frame_size
+        overlap_bytes = int(self.overlap_seconds * self.sample_rate) * frame_size
+        step = max(chunk_bytes - overlap_bytes, frame_size)
+        chunks = []
+        while len(self._buffer) >= chunk_bytes:
+            chunks.append(self._emit(bytes(self._buffer[:chunk_bytes])))
+            # Хвост фрагмента остается в буфере и становится началом следующего
+            del self._buffer[:step]
+            self._buffer_start_frame += step // frame_size
+        return chunks
+
+    def finish(self) -> List[AudioChunk]:
+        if self._format is None:
+            raise AudioFormatError("WAV stream ended before audio data")
+        overlap_bytes = int(self.overlap_seconds * self.sample_rate) * self.frame_size
+        usable = len(self._buffer) - len(self._buffer) % self.frame_size
+        # Остаток короче перекрытия уже целиком вошел в предыдущий фрагмент
+        if usable == 0 or (self._index > 0 and usable <= overlap_bytes):
+            return []
+        chunk = self._emit(bytes(self._buffer[:usable]))
+        self._buffer.clear()
+        return [chunk]
+
+
+# content-type -> расширение файла фрагмента для нарезки по байтам
+BYTE_FORMATS = {
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+}
+# content-type -> расширение контейнера, который отправляется целиком
+CONTAINER_FORMATS = {
+    "audio/ogg": "ogg",
+    "audio/webm": "webm",
+    "audio/mp4": "m4a",
+    "audio/x-m4a": "m4a",
+    "audio/flac": "flac",
+}
+WAV_FORMATS = ("audio/wav", "audio/x-wav", "audio/wave", "audio/vnd.wave")
+
+
+def chunker_for(
+    content_type: str,
+    chunk_seconds: float,
+    overlap_seconds: float,
+    chunk_bytes: int,
+    single_file_bytes: int,
+):
+    """Нарезчик для MIME типа записи"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in WAV_FORMATS:
+        return WavChunker(chunk_seconds, overlap_seconds)
+    if media_type in BYTE_FORMATS:
+        return ByteChunker(chunk_bytes, BYTE_FORMATS[media_type])
+    if media_type in CONTAINER_FORMATS:
+        return SingleFileChunker(single_file_bytes, CONTAINER_FORMATS[media_type])
+    raise AudioFormatError(f"Unsupported recording content type '{content_type}'")
@@ -0,0 +1,228 @@
+"""
+Конвейер транскрибации записи звонка:
+поток загрузки -> фрагменты -> параллельный STT -> склейка -> AI анализ -> CallTranscript
+"""
+import asyncio
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from loguru import logger
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.call import Call, CallTranscript
+from app.services.call_analysis import analyze_transcript
+from app.services.call_index import index_transcript
+from app.services.transcription.chunker import AudioChunk, chunker_for
+from app.services.transcription.stt import (
+    ChunkTranscript,
+    SpeechToTextBackend,
+    get_stt_backend,
+    transcribe_with_retry,
+)
+
+_executor = ThreadPoolExecutor(max_workers=settings.TRANSCRIPTION_WORKERS, thread_name_prefix="stt")
+
+
+class RecordingTooLargeError(ValueError):
+    """Запись превышает TRANSCRIPTION_MAX_UPLOAD_MB"""
+
+
+def _normalize(word: str) -> str:
+    return re.sub(r"[^\w]", "", word.lower())
+
+
+def merge_transcripts(parts: List[ChunkTranscript], max_overlap_words: int = 0) -> str:
+    """Склейка частичных транскриптов по порядку фрагментов.
+
+    При перекрытии фрагментов слова на стыке распознаются дважды: удаляется
+    самое длинное совпадение конца предыдущей части с началом следующей.
+    """
+    merged: List[str] = []
+    for part in sorted(parts, key=lambda p: p.index):
+        words = part.text.split()
+        if merged and words and max_overlap_words:
+            limit = min(max_overlap_words, len(merged), len(words))
+            tail = [_normalize(word) for word in merged[-limit:]]
+            head = [_normalize(word) for word in words[:limit]]
+            overlap = next((k for k in range(limit, 0, -1) if tail[-k:] == head[:k]), 0)
+            words = words[overlap:]
+        merged.extend(words)
+    return " ".join(merged)
+
+
+def set_transcription_status(db, call: Call, status: str, **details: Any) -> None:
+    """Статус транскрибации в метаданных звонка (без commit)"""
+    metadata = dict(call.call_metadata or {})
+    metadata["transcription"] = {**(metadata.get("transcription") or {}), "status": status, **details}
+    call.call_metadata = metadata
+
+
+class TranscriptionJob:
+    """Транскрибация одной записи.
+
+    Фрагменты отправляются в STT по мере чтения загрузки; в работе одновременно
+    не больше TRANSCRIPTION_CONCURRENCY фрагментов, и пока они не освободятся,
+    следующая часть записи не читается из запроса. В памяти - только эти
+    фрагменты и буфер нарезчика, а не весь файл.
+    """
+
+    def __init__(
+        self,
+        call_id: int,
+        language: str,
+        content_type: Optional[str] = None,
+        backend: Optional[SpeechToTextBackend] = None,
+    ):
+        self.call_id = call_id
+        self.language = language
+        self.backend = backend or (get_stt_backend() if content_type is not None else None)
+        self.chunker = (
+            chunker_for(
+                content_type,
+                settings.TRANSCRIPTION_CHUNK_SECONDS,
+                settings.TRANSCRIPTION_CHUNK_OVERLAP_SECONDS,
+                settings.TRANSCRIPTION_CHUNK_BYTES,
+                settings.TRANSCRIPTION_SINGLE_FILE_MAX_MB * 1024 * 1024,
+            )
+            if content_type is not None
+            else None
+        )
+        self.max_bytes = settings.TRANSCRIPTION_MAX_UPLOAD_MB * 1024 * 1024
+        self.chunks_submitted = 0
+        self._pending: Set[asyncio.Future] = set()
+        self._results: List[ChunkTranscript] = []
+        self._started = time.perf_counter()
+        self._upload_finished: Optional[float] = None
+        self._text: Optional[str] = None
+
+    @classmethod
+    def from_text(cls, call_id: int, text: str, language: str) -> "TranscriptionJob":
+        """Готовый текст (ручной транскрипт): без STT, только анализ"""
+        job = cls(call_id, language)
+        job._text = text
+        job._upload_finished = job._started
+        return job
+
+    @property
+    def uploaded_bytes(self) -> int:
+        return self.chunker.total_bytes if self.chunker else 0
+
+    async def feed(self, data: bytes) -> None:
+        """Очередная часть потока загрузки"""
+        if self.uploaded_bytes + len(data) > self.max_bytes:
+            raise RecordingTooLargeError(f"Recording exceeds {settings.TRANSCRIPTION_MAX_UPLOAD_MB} MB")
+        for chunk in self.chunker.feed(data):
+            await self._submit(chunk)
+
+    async def finish_upload(self) -> None:
+        for chunk in self.chunker.finish():
+            await self._submit(chunk)
+        self._upload_finished = time.perf_counter()
+
+    async def _submit(self, chunk: AudioChunk) -> None:
+        while len(self._pending) >= settings.TRANSCRIPTION_CONCURRENCY:
+            await self._collect(asyncio.FIRST_COMPLETED)
+        loop = asyncio.get_running_loop()
+        self._pending.add(loop.run_in_executor(_executor, transcribe_with_retry, self.backend, chunk, self.language))
+        self.chunks_submitted += 1
+
+    async def _collect(self, return_when) -> None:
+        done, self._pending = await asyncio.wait(self._pending, return_when=return_when)
+        for future in done:
+            self._results.append(future.result())
+
+    def abort(self) -> None:
+        """Отмена фрагментов, еще не взятых пулом"""
+        for future in self._pending:
+            future.cancel()
+        self._pending = set()
+
+    async def complete(self) -> None:
+        """Ожидание распознавания, склейка, анализ и запись CallTranscript (фоновая задача)"""
+        loop = asyncio.get_running_loop()
+        try:
+            if self._pending:
+                await self._collect(asyncio.ALL_COMPLETED)
+            transcribed = time.perf_counter()
+
+            if self._text is None:
+                overlap = settings.TRANSCRIPTION_CHUNK_OVERLAP_SECONDS
+                # Для нарезки по байтам перекрытия нет - повторы слов на стыке настоящие
+                timed = bool(self._results) and self._results[0].start_seconds is not None
+                dedupe_words = int(overlap * 4) + 5 if overlap and timed else 0
+                text = merge_transcripts(self._results, dedupe_words)
+            else:
+                text = self._text
+            merged = time.perf_counter()
+
+            analysis = await loop.run_in_executor(None, analyze_transcript, text, self.language)
+            analyzed = time.perf_counter()
+
+            confidences = [part.confidence for part in self._results if part.confidence is not None]
+            stages: Dict[str, Any] = {
+                "upload": round(self._upload_finished - self._started, 3),
+                "transcription_wait": round(transcribed - self._upload_finished, 3),
+                "merge": round(merged - transcribed, 3),
+                "analysis": round(analyzed - merged, 3),
+                "chunks": len(self._results),
+                "stt_backend": self.backend.name if self.backend else None,
+                "stt_seconds_total": round(sum(part.seconds for part in self._results), 3),
+                "stt_seconds_max": round(max((part.seconds for part in self._results), default=0.0), 3),
+                "uploaded_bytes": self.uploaded_bytes,
+            }
+            values = {
+                "language": self.language,
+                "text": text,
+                "sentiment_score": analysis.get("sentiment_score"),
+                "sentiment_label": analysis.get("sentiment_label"),
+                "summary": analysis.get("summary"),
+                "intents": analysis.get("intents"),
+                "keywords": analysis.get("keywords"),
+                "entities": analysis.get("entities"),
+                "quality_score": analysis.get("quality_score"),
+                "confidence_score": round(sum(confidences) / len(confidences), 4) if confidences else None,
+                "model_used": analysis.get("model_used"),
+                "processing_time": round(analyzed - self._started, 3),
+                "processing_stages": stages,
+            }
+            await loop.run_in_executor(None, self._save, values)
+            logger.info(f"Call {self.call_id} transcribed: {stages}")
+        except Exception as exc:  # noqa: BLE001
+            self.abort()
+            logger.exception(f"Call {self.call_id} transcription failed: {exc}")
+            await loop.run_in_executor(None, self._mark_failed, str(exc)[:1000])
+
+    def _save(self, values: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            transcript = db.query(CallTranscript).filter(CallTranscript.call_id == self.call_id).first()
+            if transcript is None:
+                transcript = CallTranscript(call_id=self.call_id)
+                db.add(transcript)
+            for field, value in values.items():
+                setattr(transcript, field, value)
+            index_transcript(db, transcript)
+            call = db.query(Call).filter(Call.id == self.call_id).first()
+            if call is not None:
+                set_transcription_status(
+                    db, call, "completed",
+                    completed_at=datetime.utcnow().isoformat(),
+                    processing_time=values["processing_time"],
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    def _mark_failed(self, error: str) -> None:
+        db = SessionLocal()
+        try:
+            call = db.query(Call).filter(Call.id == self.call_id).first()
+            if call is not None:
+                set_transcription_status(db, call, "failed", error=error)
+                db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,129 @@
+"""
+Бэкенды распознавания речи (speech-to-text)
+"""
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Type
+
+from loguru import logger
+
+from app.core.config import settings
+from app.services.transcription.chunker import AudioChunk
+
+
+class SpeechToTextError(Exception):
+    """Ошибка распознавания фрагмента"""
+
+
+@dataclass
+class ChunkTranscript:
+    index: int
+    text: str
+    confidence: Optional[float] = None
+    start_seconds: Optional[float] = None
+    seconds: float = 0.0  # время распознавания
+
+
+class SpeechToTextBackend:
+    """Интерфейс бэкенда: распознавание одного фрагмента, вызывается из потоков пула"""
+
+    name = "base"
+
+    def transcribe(self, chunk: AudioChunk, language: str) -> ChunkTranscript:
+        raise NotImplementedError
+
+
+class OpenAISpeechToText(SpeechToTextBackend):
+    """Распознавание через OpenAI Whisper API"""
+
+    name = "openai"
+
+    def __init__(self, model: Optional[str] = None):
+        self.model = model or settings.STT_MODEL
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            if not settings.OPENAI_API_KEY:
+                raise SpeechToTextError("OpenAI API key is not configured")
+            from openai import OpenAI
+
+            self._client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        return self._client
+
+    def transcribe(self, chunk: AudioChunk, language: str) -> ChunkTranscript:
+        try:
+            response = self._get_client().audio.transcriptions.create(
+                model=self.model,
+                file=(chunk.filename, chunk.data),
+                language=language,
+            )
+        except SpeechToTextError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            raise SpeechToTextError(f"Chunk {chunk.index} transcription failed: {exc}") from exc
+        return ChunkTranscript(chunk.index, (response.text or "").strip(), start_seconds=chunk.start_seconds)
+
+
+class FakeSpeechToText(SpeechToTextBackend):
+    """Детерминированный бэкенд для тестов и локальной разработки.
+
+    Для PCM фрагментов возвращает слово на каждую секунду записи ("wort12"),
+    поэтому перекрытия фрагментов видны в тексте и проверяются при склейке.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, fail_chunks: Optional[set] = None):
+        self.latency = latency
+        self.fail_chunks = fail_chunks or set()
+
+    def transcribe(self, chunk: AudioChunk, language: str) -> ChunkTranscript:
+        if self.latency:
+            time.sleep(self.latency)
+        if chunk.index in self.fail_chunks:
+            self.fail_chunks.discard(chunk.index)  # следующая попытка успешна
+            raise SpeechToTextError(f"Fake failure for chunk {chunk.index}")
+        if chunk.start_seconds is not None and chunk.end_seconds is not None:
+            words = [f"wort{second}" for second in range(int(chunk.start_seconds), int(chunk.end_seconds))]
+        else:
+            words = [f"teil{chunk.index}"]
+        return ChunkTranscript(chunk.index, " ".join(words), confidence=0.9, start_seconds=chunk.start_seconds)
+
+
+BACKENDS: Dict[str, Type[SpeechToTextBackend]] = {
+    OpenAISpeechToText.name: OpenAISpeechToText,
+    FakeSpeechToText.name: FakeSpeechToText,
+}
+
+
+def register_backend(backend: Type[SpeechToTextBackend]) -> None:
+    """Подключение стороннего бэкенда (Deepgram, локальный Whisper и т.д.)"""
+    BACKENDS[backend.name] = backend
+
+
+@lru_cache(maxsize=None)
+def get_stt_backend(name: Optional[str] = None) -> SpeechToTextBackend:
+    name = name or settings.STT_BACKEND
+    if name not in BACKENDS:
+        raise SpeechToTextError(f"Unknown STT backend '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def transcribe_with_retry(backend: SpeechToTextBackend, chunk: AudioChunk, language: str) -> ChunkTranscript:
+    """Распознавание фрагмента с повторами и экспоненциальной задержкой"""
+    started = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            result = backend.transcribe(chunk, language)
+            result.seconds = time.perf_counter() - started
+            return result
+        except SpeechToTextError as exc:
+            attempt += 1
+            if attempt >= settings.STT_MAX_ATTEMPTS:
+                raise
+            delay = min(30.0, 0.5 * 2 ** (attempt - 1))
+            logger.warning(f"{exc}; retry {attempt}/{settings.STT_MAX_ATTEMPTS - 1} in {delay:.1f}s")
+            time.sleep(delay)
@@ -3,5 +3,20 @@
 """
 
 from .bootstrap import seed_demo_users
+from .pagination import decode_cursor, encode_cursor
+from .phone import normalize_phone
+from .range_response import RangeFileResponse, RangeNotSatisfiable, parse_range
+from .sql import bulk_increment, bulk_upsert, dialect_insert
 
-__all__ = ["seed_demo_users"]
+__all__ = [
+    "seed_demo_users",
+    "decode_cursor",
+    "encode_cursor",
+    "normalize_phone",
+    "RangeFileResponse",
+    "RangeNotSatisfiable",
+    "parse_range",
+    "bulk_increment",
+    "bulk_upsert",
+    "dialect_insert",
+]
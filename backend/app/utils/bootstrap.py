@@ -1,14 +1,82 @@
 """
 Вспомогательные функции для инициализации данных
 """
+from typing import List
+
+from loguru import logger
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from app.core.auth import DEMO_USERS
-from app.core.database import SessionLocal
+from app.core.database import SessionLocal, engine
 from app.core.security import get_password_hash
+from app.models import Base
 from app.models.user import User
 
 
+def upgrade_schema(bind: Engine = engine) -> List[str]:
+    """Доводит существующие таблицы до моделей: недостающие колонки и индексы.
+
+    create_all создает только новые таблицы, поэтому колонки и индексы,
+    добавленные в модели позже, в старой БД (например, data/ai_sales.db)
+    появляются здесь. Шаг идемпотентен; возвращает примененные изменения.
+    """
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    preparer = bind.dialect.identifier_preparer
+    applied: List[str] = []
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            if not column.nullable and column.server_default is None:
+                logger.warning(f"Schema upgrade: cannot add NOT NULL column {table.name}.{column.name}")
+                continue
+            ddl = (
+                f"ALTER TABLE {preparer.format_table(table)} "
+                f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=bind.dialect)}"
+            )
+            with bind.begin() as connection:
+                connection.execute(text(ddl))
+            applied.append(f"{table.name}.{column.name}")
+
+        indexes = {index["name"]: index for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            current = indexes.get(index.name)
+            if current is not None and bool(current["unique"]) == bool(index.unique):
+                continue
+            try:
+                with bind.begin() as connection:
+                    if current is not None:
+                        # Индекс стал уникальным - пересоздается
+                        index.drop(connection)
+                    index.create(connection)
+            except SQLAlchemyError as exc:
+                # Например, дубликаты мешают уникальному индексу - их нужно разобрать вручную
+                logger.warning(f"Schema upgrade: index {index.name} not created: {exc}")
+                remaining = {item["name"] for item in inspect(bind).get_indexes(table.name)}
+                if current is not None and index.name not in remaining:
+                    # DDL SQLite не откатывается: удаленный прежний индекс восстанавливается неуникальным
+                    columns = ", ".join(preparer.format_column(column) for column in index.columns)
+                    with bind.begin() as connection:
+                        connection.execute(text(
+                            f"CREATE INDEX {preparer.quote(index.name)} ON {preparer.format_table(table)} ({columns})"
+                        ))
+                continue
+            applied.append(index.name)
+
+    if applied:
+        logger.info(f"Schema upgrade applied: {', '.join(applied)}")
+    return applied
+
+
 def seed_demo_users() -> None:
     """Создает демо-пользователей в БД, если они отсутствуют"""
     db: Session = SessionLocal()
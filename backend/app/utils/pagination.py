@@ -0,0 +1,25 @@
+"""
+Keyset пагинация: непрозрачные курсоры из значений ключа сортировки
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Sequence
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Курсор из значений ключа сортировки последней строки страницы"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Разбор курсора; ValueError для поврежденного курсора"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
@@ -0,0 +1,41 @@
+"""
+Нормализация телефонных номеров в E.164 для поиска и дедупликации
+"""
+import re
+from typing import Optional
+
+from app.core.config import settings
+
+# Добавочный номер отбрасывается: "+49 30 1234567 ext. 12", "... доб. 12"
+_EXTENSION_RE = re.compile(r"(?:ext\.?|extension|доб\.?|x)\s*\d+\s*$", re.IGNORECASE)
+
+
+def normalize_phone(value: Optional[str], default_country_code: Optional[str] = None) -> Optional[str]:
+    """Номер в формате E.164 (+491511234567) или None, если номер не распознан.
+
+    Номера без международного префикса (+ или 00) считаются национальными
+    для default_country_code (по умолчанию PHONE_DEFAULT_COUNTRY_CODE):
+    ведущий 0 (префикс междугородней связи) отбрасывается.
+    """
+    if not value:
+        return None
+    # "+49 (0)30 ..." - национальный префикс в скобках после кода страны не набирается
+    raw = _EXTENSION_RE.sub("", value.strip()).replace("(0)", "")
+    digits = re.sub(r"\D", "", raw)
+    if not digits:
+        return None
+
+    if raw.startswith("+"):
+        number = digits
+    elif digits.startswith("00"):
+        number = digits[2:]
+    else:
+        country_code = default_country_code or settings.PHONE_DEFAULT_COUNTRY_CODE
+        if not country_code:
+            return None
+        number = country_code + digits.lstrip("0")
+
+    # E.164: код страны без ведущего нуля, не больше 15 цифр
+    if number.startswith("0") or not 8 <= len(number) <= 15:
+        return None
+    return f"+{number}"
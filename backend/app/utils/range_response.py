@@ -0,0 +1,114 @@
+"""
+Отдача файла с поддержкой HTTP Range (206 Partial Content)
+
+Тело отправляется блоками через os.pread без чтения файла целиком. Отдачу без
+копирования (sendfile) дает только nginx по X-Accel-Redirect
+(RECORDING_ACCEL_REDIRECT_PREFIX): uvicorn не поддерживает расширение
+http.response.zerocopysend, а BaseHTTPMiddleware приложения пропускает
+только http.response.body.
+"""
+import os
+from email.utils import formatdate
+from typing import Mapping, Optional, Tuple
+
+from anyio import to_thread
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_BYTES = 256 * 1024
+
+
+class RangeNotSatisfiable(ValueError):
+    """Запрошенный диапазон вне файла"""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end) включительно для одного диапазона bytes=...; None - отдать файл целиком.
+
+    Несколько диапазонов в одном запросе не поддерживаются и игнорируются.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable(header)
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+class RangeFileResponse(Response):
+    """Файл целиком (200) или один диапазон (206); 416 для недостижимого диапазона"""
+
+    def __init__(
+        self,
+        path: str,
+        request_headers: Mapping[str, str],
+        media_type: str = "application/octet-stream",
+        headers: Optional[Mapping[str, str]] = None,
+    ):
+        self.path = path
+        self.media_type = media_type
+        self.background = None
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+
+        range_header = request_headers.get("range")
+        # If-Range: диапазон только для той же версии файла
+        if_range = request_headers.get("if-range")
+        if if_range and if_range != etag:
+            range_header = None
+
+        self.status_code = 200
+        self.offset, self.count = 0, size
+        extra = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": formatdate(stat.st_mtime, usegmt=True),
+            **(headers or {}),
+        }
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            self.status_code = 416
+            self.count = 0
+            extra["content-range"] = f"bytes */{size}"
+            byte_range = None
+        if byte_range is not None:
+            start, end = byte_range
+            self.status_code = 206
+            self.offset, self.count = start, end - start + 1
+            extra["content-range"] = f"bytes {start}-{end}/{size}"
+
+        self.init_headers({**extra, "content-length": str(self.count)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        fd = await to_thread.run_sync(os.open, self.path, os.O_RDONLY)
+        try:
+            position, remaining = self.offset, self.count
+            while remaining > 0:
+                data = await to_thread.run_sync(os.pread, fd, min(CHUNK_BYTES, remaining), position)
+                if not data:
+                    break
+                position += len(data)
+                remaining -= len(data)
+                await send({"type": "http.response.body", "body": data, "more_body": remaining > 0})
+            if remaining > 0:
+                # Файл укоротился во время отдачи
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            os.close(fd)
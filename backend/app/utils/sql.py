@@ -0,0 +1,56 @@
+"""
+SQL утилиты, зависящие от диалекта БД
+"""
+from typing import Any, Dict, Iterable, List, Sequence
+
+from sqlalchemy.orm import Session
+
+
+def dialect_insert(db: Session):
+    """insert() с поддержкой ON CONFLICT для текущего диалекта"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upsert is not supported for dialect '{dialect}'")
+    return insert
+
+
+def bulk_upsert(
+    db: Session,
+    model,
+    rows: List[Dict[str, Any]],
+    index_elements: Sequence[str],
+    update_columns: Iterable[str],
+) -> None:
+    """Пакетный INSERT ... ON CONFLICT DO UPDATE одним executemany"""
+    if not rows:
+        return
+    insert = dialect_insert(db)
+    statement = insert(model.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(index_elements),
+        set_={column: statement.excluded[column] for column in update_columns},
+    )
+    db.execute(statement, rows)
+
+
+def bulk_increment(
+    db: Session,
+    model,
+    rows: List[Dict[str, Any]],
+    index_elements: Sequence[str],
+    column: str,
+) -> None:
+    """Пакетный INSERT ... ON CONFLICT DO UPDATE SET column = column + excluded.column"""
+    if not rows:
+        return
+    insert = dialect_insert(db)
+    statement = insert(model.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(index_elements),
+        set_={column: model.__table__.c[column] + statement.excluded[column]},
+    )
+    db.execute(statement, rows)
@@ -0,0 +1,60 @@
+"""
+Общие фикстуры: in-memory SQLite и отключенные фоновые задачи
+"""
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("OUTBOX_RELAY_ENABLED", "false")
+os.environ.setdefault("REDIS_URL", "")
+
+import pytest  # noqa: E402
+from fastapi import Depends  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.core.database import SessionLocal, engine, get_db  # noqa: E402
+from app.core.security import get_current_user  # noqa: E402
+from app.models import Base, User  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """Сессия на чистой схеме; таблицы пересоздаются для каждого теста"""
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def users(db):
+    """Админ и два менеджера"""
+    users = {
+        name: User(email=f"{name}@example.org", username=name, hashed_password="-", role=role)
+        for name, role in (("admin", "admin"), ("rep", "sales_rep"), ("other", "sales_rep"))
+    }
+    db.add_all(users.values())
+    db.commit()
+    return users
+
+
+@pytest.fixture
+def client(db, users):
+    """TestClient без startup-задач; запросы идут от имени client.act_as(name), по умолчанию admin"""
+    from app.main import app
+
+    current = {"id": users["admin"].id}
+
+    def current_user(db=Depends(get_db)):
+        return db.get(User, current["id"])
+
+    app.dependency_overrides[get_current_user] = current_user
+    test_client = TestClient(app)
+    test_client.act_as = lambda name: current.update(id=users[name].id)
+    try:
+        yield test_client
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,104 @@
+"""
+Пакетный анализ транскриптов: упаковка в запросы, разбор ответа модели и запуск из API
+"""
+import json
+
+import pytest
+
+from app.models.call import Call, CallDirection, CallTranscript
+from app.services import call_analysis
+from app.services.call_analysis import BatchItem, analyze_batch, estimate_tokens, pack_batches
+
+
+def _item(transcript_id: int, tokens: int) -> BatchItem:
+    return BatchItem(transcript_id, transcript_id, "x" * (tokens - 1) * 4, "de")
+
+
+def test_pack_batches_first_fit_decreasing_within_budget():
+    items = [_item(1, 60), _item(2, 50), _item(3, 40), _item(4, 30), _item(5, 20)]
+    batches = pack_batches(items, token_budget=100, max_items=10)
+
+    assert [[item.transcript_id for item in batch] for batch in batches] == [[1, 3], [2, 4, 5]]
+    assert all(sum(estimate_tokens(item.text) for item in batch) <= 100 for batch in batches)
+
+
+def test_pack_batches_respects_max_items_and_isolates_oversized():
+    items = [_item(1, 500)] + [_item(i, 10) for i in range(2, 8)]
+    batches = pack_batches(items, token_budget=100, max_items=4)
+
+    assert [item.transcript_id for item in batches[0]] == [1]
+    assert [len(batch) for batch in batches[1:]] == [4, 2]
+    assert sorted(item.transcript_id for batch in batches for item in batch) == list(range(1, 8))
+
+
+def test_pack_batches_empty():
+    assert pack_batches([], token_budget=100, max_items=4) == []
+
+
+def test_analyze_batch_ignores_ids_outside_the_batch(monkeypatch):
+    batch = [BatchItem(10, 1, "Kunde will ein Angebot", "de"), BatchItem(11, 2, "Kein Interesse", "de")]
+    response = {
+        "results": [
+            {"id": 10, "summary": "Angebot", "sentiment_label": "positive", "sentiment_score": 0.7},
+            {"id": 999, "summary": "erfunden", "sentiment_label": "negative", "sentiment_score": -0.9},
+        ]
+    }
+    monkeypatch.setattr(
+        call_analysis,
+        "generate_sales_assistant_reply",
+        lambda *args, **kwargs: {"content": json.dumps(response), "usage": {"total_tokens": 120}, "model": "test"},
+    )
+    single = []
+    monkeypatch.setattr(
+        call_analysis,
+        "analyze_transcript",
+        lambda text, language: single.append(text) or {"summary": "einzeln", "tokens_used": 30},
+    )
+
+    analyses, tokens = analyze_batch(batch)
+
+    assert set(analyses) == {10, 11}
+    assert analyses[10]["summary"] == "Angebot"
+    # Пропущенный моделью транскрипт анализируется отдельно
+    assert single == ["Kein Interesse"]
+    assert analyses[11]["summary"] == "einzeln"
+    assert tokens == 150
+
+
+def _transcripts(db, users, count):
+    for i in range(count):
+        owner = users["rep"] if i % 2 else users["other"]
+        call = Call(agent_id=owner.id, from_number="+4930111", to_number="+4930222", direction=CallDirection.OUTBOUND)
+        db.add(call)
+        db.flush()
+        db.add(CallTranscript(call_id=call.id, text=f"Gespräch {i}", language="de"))
+    db.commit()
+
+
+def test_analyze_call_counts_pending_without_loading_texts(client, db, users, monkeypatch):
+    _transcripts(db, users, 5)
+    started = []
+    monkeypatch.setattr(
+        "app.api.api_v1.endpoints.ai.run_batch_analysis_job", lambda limit, agent_id: started.append((limit, agent_id))
+    )
+
+    response = client.post("/api/v1/ai/analyze-call", params={"limit": 3})
+    assert response.json()["pending"] == 3
+
+    client.act_as("rep")
+    response = client.post("/api/v1/ai/analyze-call")
+    assert response.json()["pending"] == 2
+    assert started == [(3, None), (500, users["rep"].id)]
+
+
+def test_analyze_call_rejects_second_batch_while_one_runs(client, db, users, monkeypatch):
+    _transcripts(db, users, 2)
+    monkeypatch.setattr(call_analysis, "run_batch_analysis", lambda *args: pytest.fail("ran twice"))
+
+    assert call_analysis._batch_lock.acquire(blocking=False)
+    try:
+        assert client.post("/api/v1/ai/analyze-call").status_code == 409
+        # Задача, поставленная до проверки, тоже не запускает второй проход
+        call_analysis.run_batch_analysis_job(10)
+    finally:
+        call_analysis._batch_lock.release()
@@ -0,0 +1,78 @@
+"""
+Записи звонков: Range через middleware приложения и ошибки настройки хранилища
+"""
+import pytest
+
+from app.core.config import settings
+from app.models.call import Call, CallDirection
+from app.services.storage import get_recording_storage
+
+
+@pytest.fixture
+def call(db, users):
+    call = Call(
+        agent_id=users["admin"].id,
+        from_number="+4930111",
+        to_number="+4930222",
+        direction=CallDirection.OUTBOUND,
+    )
+    db.add(call)
+    db.commit()
+    return call
+
+
+@pytest.fixture(autouse=True)
+def local_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "RECORDING_STORAGE_BACKEND", "local")
+    monkeypatch.setattr(settings, "RECORDING_STORAGE_PATH", str(tmp_path))
+    monkeypatch.setattr(settings, "RECORDING_ACCEL_REDIRECT_PREFIX", None)
+    # Хранилище кешируется по имени бэкенда - настройки теста должны его пересоздать
+    get_recording_storage.cache_clear()
+    yield
+    get_recording_storage.cache_clear()
+
+
+def test_range_request_passes_through_http_middleware(client, call):
+    audio = bytes(range(256)) * 8
+    response = client.put(f"/api/v1/calls/{call.id}/recording", content=audio, headers={"Content-Type": "audio/mpeg"})
+    assert response.status_code == 200
+
+    response = client.get(f"/api/v1/calls/{call.id}/recording", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 10-19/{len(audio)}"
+    assert response.content == audio[10:20]
+
+    response = client.get(f"/api/v1/calls/{call.id}/recording")
+    assert response.status_code == 200
+    assert response.content == audio
+
+
+def test_accel_redirect_leaves_body_to_nginx(client, call, monkeypatch):
+    client.put(f"/api/v1/calls/{call.id}/recording", content=b"ID3data", headers={"Content-Type": "audio/mpeg"})
+    monkeypatch.setattr(settings, "RECORDING_ACCEL_REDIRECT_PREFIX", "/protected-recordings/")
+
+    response = client.get(f"/api/v1/calls/{call.id}/recording")
+
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"].startswith(f"/protected-recordings/calls/{call.id}/")
+    assert response.content == b""
+
+
+def test_misconfigured_storage_returns_bad_gateway(client, call, monkeypatch):
+    monkeypatch.setattr(settings, "RECORDING_STORAGE_BACKEND", "ftp")
+    response = client.put(f"/api/v1/calls/{call.id}/recording", content=b"ID3", headers={"Content-Type": "audio/mpeg"})
+    assert response.status_code == 502
+
+    monkeypatch.setattr(settings, "RECORDING_STORAGE_BACKEND", "s3")
+    monkeypatch.setattr(settings, "AWS_BUCKET_NAME", None)
+    response = client.put(f"/api/v1/calls/{call.id}/recording", content=b"ID3", headers={"Content-Type": "audio/mpeg"})
+    assert response.status_code == 502
+    assert "AWS_BUCKET_NAME" in response.json()["detail"]
+
+
+def test_recording_on_unconfigured_s3_returns_bad_gateway(client, call, db, monkeypatch):
+    monkeypatch.setattr(settings, "AWS_BUCKET_NAME", None)
+    call.call_metadata = {"recording": {"storage": "s3", "key": f"calls/{call.id}/a.mp3"}}
+    db.commit()
+
+    assert client.get(f"/api/v1/calls/{call.id}/recording").status_code == 502
@@ -0,0 +1,110 @@
+"""
+Статусы звонков: схлопывание событий, пакетное применение и предел повторов
+"""
+from datetime import datetime, timedelta
+
+from app.core.config import settings
+from app.models.call import Call, CallDirection, CallStatus
+from app.services import call_status
+from app.services.call_status import CallStatusEvent, CallStatusIngestor, apply_status_events, coalesce
+
+T0 = datetime(2026, 3, 2, 10, 0, 0)
+
+
+def _event(call_id: str, status: CallStatus, seconds: int, duration=None) -> CallStatusEvent:
+    return CallStatusEvent(call_id, status, T0 + timedelta(seconds=seconds), duration)
+
+
+def test_coalesce_keeps_highest_rank_then_latest_event():
+    latest = coalesce([
+        _event("a", CallStatus.RINGING, 1),
+        _event("a", CallStatus.COMPLETED, 5, duration=4),
+        _event("a", CallStatus.ANSWERED, 9),  # пришел позже, но ранг ниже финального
+        _event("b", CallStatus.RINGING, 1),
+        _event("b", CallStatus.RINGING, 3),
+        _event("b", CallStatus.RINGING, 2),
+    ])
+
+    assert latest["a"].status == CallStatus.COMPLETED
+    assert latest["a"].duration_seconds == 4
+    assert latest["b"].status == CallStatus.RINGING
+    assert latest["b"].event_at == T0 + timedelta(seconds=3)
+
+
+def test_coalesce_carries_duration_and_earliest_answered_time():
+    latest = coalesce([
+        _event("a", CallStatus.ANSWERED, 2),
+        _event("a", CallStatus.RINGING, 1),
+        _event("a", CallStatus.COMPLETED, 8),
+    ])
+    assert latest["a"].status == CallStatus.COMPLETED
+    assert latest["a"].answered_at == T0 + timedelta(seconds=2)
+
+    # Финальный статус без длительности не затирает длительность из более раннего события
+    latest = coalesce([_event("b", CallStatus.ANSWERED, 2, duration=3), _event("b", CallStatus.COMPLETED, 8)])
+    assert latest["b"].duration_seconds == 3
+
+
+def test_apply_status_events_sets_start_time_and_skips_stale(db):
+    call = Call(
+        agent_id=1,
+        from_number="+4930111",
+        to_number="+4930222",
+        direction=CallDirection.OUTBOUND,
+        status=CallStatus.INITIATED,
+        external_call_id="ext-1",
+    )
+    db.add(call)
+    db.commit()
+
+    events = coalesce([_event("ext-1", CallStatus.ANSWERED, 2), _event("ext-1", CallStatus.COMPLETED, 30, 28)])
+    events["missing"] = _event("missing", CallStatus.RINGING, 1)
+    assert apply_status_events(db, events) == {"applied": 1, "stale": 0, "unmatched": 1}
+    db.commit()
+    db.refresh(call)
+    assert call.status == CallStatus.COMPLETED
+    assert call.duration_seconds == 28
+    assert call.start_time.replace(tzinfo=None) == T0 + timedelta(seconds=2)
+
+    result = apply_status_events(db, {"ext-1": _event("ext-1", CallStatus.RINGING, 40)})
+    assert result == {"applied": 0, "stale": 1, "unmatched": 0}
+
+
+def test_ingestor_drops_failing_event_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(settings, "CALL_STATUS_MAX_ATTEMPTS", 3)
+    applied = []
+
+    def run_status_batch(batch):
+        if "bad" in batch:
+            raise RuntimeError("constraint violation")
+        applied.extend(batch)
+        return {"applied": len(batch), "stale": 0, "unmatched": 0}
+
+    monkeypatch.setattr(call_status, "run_status_batch", run_status_batch)
+    ingestor = CallStatusIngestor()
+
+    ingestor.submit([_event("good", CallStatus.RINGING, 1), _event("bad", CallStatus.RINGING, 1)])
+    assert ingestor.flush()["applied"] == 1
+    assert applied == ["good"]
+    assert ingestor.pending == 1
+
+    ingestor.flush()
+    assert ingestor.pending == 1
+    ingestor.flush()
+    assert ingestor.pending == 0
+    assert ingestor.flush() == {"applied": 0, "stale": 0, "unmatched": 0}
+
+
+def test_ingestor_outage_requeues_without_spending_attempts(monkeypatch):
+    monkeypatch.setattr(settings, "CALL_STATUS_MAX_ATTEMPTS", 2)
+
+    def run_status_batch(batch):
+        raise RuntimeError("database is unavailable")
+
+    monkeypatch.setattr(call_status, "run_status_batch", run_status_batch)
+    ingestor = CallStatusIngestor()
+    ingestor.submit([_event(f"c{i}", CallStatus.RINGING, 1) for i in range(6)])
+
+    for _ in range(5):
+        ingestor.flush()
+    assert ingestor.pending == 6
@@ -0,0 +1,76 @@
+"""
+Инкрементальная синхронизация CRM на FakeCRMServer: пропуск неизменившихся записей по хешу
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import CRMConnection, CRMRecordHash, Lead
+from app.services.crm import CRMSyncEngine, FakeCRMServer
+
+
+@pytest.fixture
+def server():
+    FakeCRMServer.reset("tests")
+    yield FakeCRMServer.get("tests")
+    FakeCRMServer.reset("tests")
+
+
+def _connection(db, direction: str) -> CRMConnection:
+    connection = CRMConnection(
+        name="fake",
+        crm_type="fake",
+        org_id="tests",
+        sync_direction=direction,
+        sync_leads=False,
+        sync_deals=False,
+        sync_companies=False,
+    )
+    db.add(connection)
+    db.commit()
+    return connection
+
+
+def _run(db, connection):
+    return CRMSyncEngine(db, connection).run().objects["contacts"]
+
+
+def test_pull_skips_records_with_unchanged_payload(db, server):
+    for i in range(5):
+        server.upsert("contacts", {"name": f"Contact {i}", "email": f"c{i}@example.org"})
+    connection = _connection(db, "pull")
+
+    first = _run(db, connection)
+    assert (first.pulled, first.created, first.unchanged) == (5, 5, 0)
+    assert db.query(CRMRecordHash).count() == 5
+
+    # CRM отдает записи снова (новый updated_at), но данные те же
+    later = datetime.utcnow() + timedelta(minutes=1)
+    for object_id in list(server.objects["contacts"]):
+        server.upsert("contacts", {}, object_id=object_id, updated_at=later)
+    server.upsert("contacts", {"name": "Contact 0 renamed"}, object_id="1", updated_at=later)
+
+    second = _run(db, connection)
+    assert (second.pulled, second.updated, second.unchanged) == (5, 1, 4)
+    assert db.query(Lead).filter(Lead.crm_id == "1").one().name == "Contact 0 renamed"
+
+
+def test_push_skips_leads_with_unchanged_payload(db, server):
+    leads = [Lead(name=f"Local {i}", email=f"l{i}@example.org") for i in range(3)]
+    db.add_all(leads)
+    connection = _connection(db, "push")
+    lead_ids = [lead.id for lead in leads]
+
+    first = CRMSyncEngine(db, connection).push_leads(lead_ids)
+    assert (first.pushed, first.push_skipped) == (3, 0)
+    assert len(server.objects["contacts"]) == 3
+    assert server.push_calls == 1
+
+    second = CRMSyncEngine(db, connection).push_leads(lead_ids)
+    assert (second.pushed, second.push_skipped) == (0, 3)
+    assert server.push_calls == 1
+
+    db.query(Lead).filter(Lead.id == lead_ids[0]).update({"name": "Local 0 renamed"})
+    db.commit()
+    third = CRMSyncEngine(db, connection).push_leads(lead_ids)
+    assert (third.pushed, third.push_skipped) == (1, 2)
@@ -0,0 +1,157 @@
+"""
+Поиск дубликатов лидов: нормализация, оценка пар, блокировка и слияние
+"""
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.call import Call, CallDirection, CallTask
+from app.models.lead import Lead
+from app.models.lead_duplicate import LeadDedupKey, LeadDuplicateCandidate
+from app.models.lead_interaction import InteractionAuthor, LeadInteraction
+from app.models.message import Message, MessageType
+from app.services.dedup import build_profile, find_candidates_for, merge_leads, normalize_company, scan_all, score_pair
+
+
+def _profile(lead_id=1, name=None, company=None, email=None, phone=None, website=None):
+    return build_profile(SimpleNamespace(
+        id=lead_id, name=name, company=company, email=email, phone_e164=phone, website=website
+    ))
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("DigitalFlow GmbH", "digitalflow"),
+        ("Digital-Flow GmbH & Co. KG", "digital flow"),
+        ("ACME Inc.", "acme"),
+        ("ООО «Ромашка»", "ромашка"),
+        ("Новый клиент", None),
+        ("GmbH", None),
+        ("", None),
+        (None, None),
+    ],
+)
+def test_normalize_company(value, expected):
+    assert normalize_company(value) == expected
+
+
+def test_build_profile_blocking_keys(monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_COMPANY_PREFIX_LENGTH", 8)
+    profile = _profile(company="Digital Flow Studio GmbH", email="anna@digitalflow.de", phone="+49301234567")
+    assert profile.keys == {"co:digitalflowstudio", "cp:digitalf", "dom:digitalflow.de", "ph:+49301234567"}
+
+    # Бесплатная почта не указывает на компанию
+    assert _profile(email="anna@gmail.com", website="https://www.digitalflow.de/kontakt").keys == {
+        "dom:digitalflow.de"
+    }
+
+
+def test_score_pair():
+    same_email = score_pair(_profile(email="A@x.de"), _profile(2, email="a@x.de"))
+    assert same_email == (1.0, {"email": 1.0})
+
+    score, reasons = score_pair(
+        _profile(company="DigitalFlow GmbH", phone="+49301234567"),
+        _profile(2, company="Digital Flow", phone="+49301234567"),
+    )
+    assert score == 1.0
+    assert reasons == {"company": 1.0, "phone": 1.0}
+
+    score, reasons = score_pair(
+        _profile(company="DigitalFlow", phone="+49301234567"),
+        _profile(2, company="BlueOcean", phone="+49309999999"),
+    )
+    assert score < 0.3
+    assert score_pair(_profile(name="Anna"), _profile(2, company="Acme")) == (0.0, {})
+
+
+def test_scan_all_scores_pair_once_across_key_batches(db, monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_COMPANY_PREFIX_LENGTH", 8)
+    db.add_all([
+        Lead(name="Anna Schmidt", company="DigitalFlow GmbH", phone="+49 30 1234567"),
+        Lead(name="A. Schmidt", company="Digital Flow", phone="030 1234567"),
+        Lead(name="Ben", company="BlueOcean AG"),
+    ])
+    db.commit()
+
+    # Одна пачка - один ключ: общие ключи пары (co:, cp:, ph:) попадают в разные пачки
+    result = scan_all(db, batch_size=1)
+
+    candidate = db.query(LeadDuplicateCandidate).one()
+    assert (candidate.lead_id, candidate.duplicate_id) == (1, 2)
+    assert candidate.reasons["keys"] == ["co:digitalflow", "cp:digitalf", "ph:+49301234567"]
+    assert result.comparisons == 1
+    assert result.candidates == 1
+
+
+def test_scan_all_skips_oversized_blocks_and_keeps_dismissed(db, monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_MAX_BLOCK_SIZE", 2)
+    db.add_all([Lead(name=f"Lead {i}", phone="+49 30 1234567") for i in range(3)])
+    db.add_all([Lead(name="Anna", email="anna@acme.de"), Lead(name="Anna", email="anna@acme.de")])
+    db.commit()
+    db.add(LeadDuplicateCandidate(lead_id=4, duplicate_id=5, score=1.0, status="dismissed"))
+    db.commit()
+
+    result = scan_all(db)
+
+    assert result.skipped_blocks == 1
+    assert db.query(LeadDuplicateCandidate.status).all() == [("dismissed",)]
+
+
+def test_find_candidates_for_new_lead(db, monkeypatch):
+    monkeypatch.setattr(settings, "DEDUP_COMPANY_PREFIX_LENGTH", 8)
+    db.add(Lead(name="Anna", company="DigitalFlow GmbH", email="anna@digitalflow.de"))
+    db.commit()
+    scan_all(db)
+    lead = Lead(name="Anna", company="Digital Flow", email="info@digitalflow.de")
+    db.add(lead)
+    db.commit()
+
+    assert find_candidates_for(db, [lead.id]) == 1
+    candidate = db.query(LeadDuplicateCandidate).one()
+    assert candidate.duplicate_id == lead.id
+    assert candidate.reasons["keys"] == ["co:digitalflow", "cp:digitalf", "dom:digitalflow.de"]
+
+
+def test_merge_leads_moves_rows_and_keeps_history_on_the_lead(db, users):
+    lead = Lead(name="Anna Schmidt", company="DigitalFlow", tags=["vip"])
+    duplicate = Lead(
+        name="A. Schmidt", company="DigitalFlow GmbH", phone="+49 30 1234567", email="anna@digitalflow.de",
+        tags=["berlin", "vip"], notes="Rückruf", instagram_user_id="ig-1",
+    )
+    other = Lead(name="Anna Schmidt", company="DigitalFlow", email="a.schmidt@digitalflow.de")
+    db.add_all([lead, duplicate, other])
+    db.commit()
+    agent = users["rep"].id
+    db.add_all([
+        Message(lead_id=duplicate.id, created_by=agent, message_type=MessageType.EMAIL, body="Hallo"),
+        Call(lead_id=duplicate.id, agent_id=agent, from_number="+4930111", to_number="+4930222",
+             direction=CallDirection.OUTBOUND),
+        CallTask(lead_id=duplicate.id, created_by=agent, task_type="callback", due_at=datetime(2026, 3, 2)),
+        LeadInteraction(lead_id=duplicate.id, author_type=InteractionAuthor.CLIENT, message="Preis?"),
+    ])
+    db.commit()
+    scan_all(db)
+    assert db.query(LeadDuplicateCandidate).filter(LeadDuplicateCandidate.duplicate_id == duplicate.id).count() == 1
+
+    moved = merge_leads(db, lead, duplicate)
+    db.commit()
+
+    assert moved == {"messages": 1, "calls": 1, "call_tasks": 1, "interactions": 1}
+    assert db.get(Lead, duplicate.id) is None
+    assert (lead.phone, lead.email, lead.instagram_user_id) == ("+49 30 1234567", "anna@digitalflow.de", "ig-1")
+    assert lead.tags == ["vip", "berlin"]
+    history = lead.custom_fields["merged_leads"]
+    assert [entry["id"] for entry in history] == [duplicate.id]
+    assert history[0]["score"] >= settings.DEDUP_MIN_SCORE
+    # Пары дубликата удалены явно (без FK-каскада SQLite), ключи тоже
+    duplicate_pairs = db.query(LeadDuplicateCandidate).filter(
+        (LeadDuplicateCandidate.lead_id == duplicate.id) | (LeadDuplicateCandidate.duplicate_id == duplicate.id)
+    )
+    assert duplicate_pairs.count() == 0
+    assert db.query(LeadDedupKey).filter(LeadDedupKey.lead_id == duplicate.id).count() == 0
+    # Основной лид снова проверен: пара с третьим лидом осталась
+    assert db.query(LeadDuplicateCandidate).filter(LeadDuplicateCandidate.duplicate_id == other.id).count() == 1
@@ -0,0 +1,25 @@
+"""
+Фоновый расчет прогноза: ошибка бэктеста не оставляет прогноз в pending
+"""
+from app.core.config import settings
+from app.models.forecast import Forecast
+from app.services import forecasting
+from app.services.forecasting import create_pending_forecast, run_forecast_job
+
+
+def test_forecast_completes_when_backtest_fails(db, monkeypatch):
+    monkeypatch.setattr(settings, "FORECAST_BACKTEST_PERIODS", 3)
+
+    def failing_backtest(*args, **kwargs):
+        raise ValueError("not enough history")
+
+    monkeypatch.setattr(forecasting, "run_backtest", failing_backtest)
+    forecast = create_pending_forecast(db, "monthly", None, requested_by=1)
+
+    run_forecast_job(forecast.id)
+
+    db.expire_all()
+    metadata = db.get(Forecast, forecast.id).forecast_metadata
+    assert metadata["status"] == "completed"
+    assert metadata["backtest_error"] == "not enough history"
+    assert "backtest" not in metadata
@@ -0,0 +1,51 @@
+"""
+Импорт собеседников Instagram: дедупликация по IGSID, email и телефону
+"""
+from app.models.instagram_account import InstagramAccount
+from app.models.lead import Lead
+from app.services.instagram import ingestion
+from app.services.instagram.ingestion import ingest_contacts
+from app.services.instagram.sources import InstagramContact
+
+
+def _account(db) -> InstagramAccount:
+    account = InstagramAccount(username="shop")
+    db.add(account)
+    db.commit()
+    return account
+
+
+def test_ingest_contacts_dedupes_page_and_links_existing_leads(db):
+    account = _account(db)
+    db.add(Lead(name="Known", email="anna@example.org"))
+    db.commit()
+
+    result = ingest_contacts(db, account, [
+        InstagramContact(instagram_user_id="ig-1", name="Anna", email="Anna@Example.org"),
+        InstagramContact(instagram_user_id="ig-2", name="Ben", phone="+49 30 1234567"),
+        InstagramContact(instagram_user_id="ig-2", name="Ben again"),
+    ])
+    db.commit()
+
+    known = db.query(Lead).filter(Lead.email == "anna@example.org").one()
+    assert known.instagram_user_id == "ig-1"
+    assert result.linked == 1
+    assert result.duplicates == 2
+    assert len(result.created_ids) == 1
+    assert result.lead_ids == {"ig-1": known.id, "ig-2": result.created_ids[0]}
+
+
+def test_ingest_contacts_reuses_lead_created_concurrently(db, monkeypatch):
+    account = _account(db)
+    existing = ingest_contacts(db, account, [InstagramContact(instagram_user_id="ig-1", name="Anna")])
+    db.commit()
+
+    # Другой воркер создал лид собеседника между SELECT и INSERT этой страницы
+    monkeypatch.setattr(ingestion, "_find_existing", lambda db, contacts: [])
+    result = ingest_contacts(db, account, [InstagramContact(instagram_user_id="ig-1", name="Anna")])
+    db.commit()
+
+    assert result.created_ids == []
+    assert result.duplicates == 1
+    assert result.lead_ids == {"ig-1": existing.created_ids[0]}
+    assert db.query(Lead).filter(Lead.instagram_user_id == "ig-1").count() == 1
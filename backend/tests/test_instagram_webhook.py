@@ -0,0 +1,40 @@
+"""
+Webhook Instagram Direct: повторные доставки Meta не дублируют историю лида
+"""
+from datetime import datetime
+
+from app.models.instagram_account import InstagramAccount
+from app.models.lead import Lead
+from app.models.lead_interaction import LeadInteraction
+from app.services.instagram.webhook import (
+    DirectMessage,
+    InstagramWebhookDebouncer,
+    apply_direct_messages,
+    group_by_sender,
+)
+
+
+def _messages():
+    return [
+        DirectMessage("biz-1", "ig-7", "mid-1", "Hallo, anna@example.org", datetime(2026, 3, 2, 10, 0)),
+        DirectMessage("biz-1", "ig-7", "mid-2", "Preisliste bitte", datetime(2026, 3, 2, 10, 1)),
+    ]
+
+
+def test_redelivery_to_another_worker_is_not_written_twice(db):
+    db.add(InstagramAccount(username="shop", business_account_id="biz-1"))
+    db.commit()
+    result = apply_direct_messages(db, group_by_sender(_messages()))
+    db.commit()
+    assert result["interactions"] == 2
+    assert result["created"] == 1
+
+    # Свежий debouncer - другой воркер или процесс после перезапуска: его _seen пуст
+    debouncer = InstagramWebhookDebouncer()
+    assert debouncer.submit(_messages()) == 2
+    result = debouncer.flush(everything=True)
+
+    assert result["interactions"] == 0
+    assert result["duplicates"] == 2
+    assert db.query(LeadInteraction).count() == 2
+    assert db.query(Lead).count() == 1
@@ -0,0 +1,52 @@
+"""
+Keyset-курсоры истории взаимодействий лида
+"""
+from app.models import Lead, LeadInteraction
+from app.models.lead_interaction import InteractionAuthor
+from app.utils.pagination import encode_cursor
+
+
+def _lead_with_history(db, name: str, count: int) -> Lead:
+    lead = Lead(name=name)
+    db.add(lead)
+    db.flush()
+    db.add_all(LeadInteraction(lead_id=lead.id, author_type=InteractionAuthor.ADMIN, message=f"{name} {i}") for i in range(count))
+    db.commit()
+    return lead
+
+
+def test_cursor_pages_through_history(client, db):
+    lead = _lead_with_history(db, "Lead", 5)
+
+    page = client.get(f"/api/v1/leads/{lead.id}/interactions", params={"limit": 2})
+    assert page.status_code == 200
+    assert [item["message"] for item in page.json()] == ["Lead 3", "Lead 4"]
+
+    older = client.get(
+        f"/api/v1/leads/{lead.id}/interactions",
+        params={"limit": 2, "before": page.headers["X-Older-Cursor"]},
+    )
+    assert [item["message"] for item in older.json()] == ["Lead 1", "Lead 2"]
+
+    newer = client.get(f"/api/v1/leads/{lead.id}/interactions", params={"after": page.headers["X-Newer-Cursor"]})
+    assert newer.status_code == 200
+    assert newer.json() == []
+
+
+def test_cursor_of_missing_or_foreign_row_is_rejected(client, db):
+    lead = _lead_with_history(db, "Lead", 2)
+    foreign = _lead_with_history(db, "Other", 1)
+    foreign_id = db.query(LeadInteraction.id).filter(LeadInteraction.lead_id == foreign.id).scalar()
+    deleted = db.query(LeadInteraction).filter(LeadInteraction.lead_id == lead.id).first()
+    deleted_id = deleted.id
+    db.delete(deleted)
+    db.commit()
+
+    for interaction_id in (deleted_id, foreign_id):
+        for param in ("after", "before"):
+            response = client.get(
+                f"/api/v1/leads/{lead.id}/interactions",
+                params={param: encode_cursor([interaction_id])},
+            )
+            assert response.status_code == 400
+            assert response.json()["detail"] == "Invalid cursor"
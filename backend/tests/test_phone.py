@@ -0,0 +1,67 @@
+"""
+Нормализация номеров в E.164 и привязка звонка к лиду по номеру
+"""
+import pytest
+
+from app.models.call import Call
+from app.models.lead import Lead
+from app.utils.phone import normalize_phone
+
+
+@pytest.mark.parametrize(
+    "value, country_code, expected",
+    [
+        ("+49 30 1234567", None, "+49301234567"),
+        ("+49 (0)30 123-45-67", None, "+49301234567"),
+        ("+1 (415) 555-2671", None, "+14155552671"),
+        ("0049 30 1234567", None, "+49301234567"),
+        ("0044 20 7946 0958", None, "+442079460958"),
+        ("030 1234567", None, "+49301234567"),
+        ("0171/1234567", None, "+491711234567"),
+        ("0171 1234567", "43", "+431711234567"),
+        ("+49 30 1234567 ext. 12", None, "+49301234567"),
+        ("+49 30 1234567 x12", None, "+49301234567"),
+        ("030 1234567 доб. 5", None, "+49301234567"),
+        ("+0 30 1234567", None, None),
+        ("12345", None, None),
+        ("+49 1234 5678 9012 3456", None, None),
+        ("n/a", None, None),
+        ("", None, None),
+        (None, None, None),
+    ],
+)
+def test_normalize_phone(value, country_code, expected):
+    assert normalize_phone(value, country_code) == expected
+
+
+def test_normalize_phone_without_default_country(monkeypatch):
+    monkeypatch.setattr("app.utils.phone.settings.PHONE_DEFAULT_COUNTRY_CODE", "")
+    assert normalize_phone("030 1234567") is None
+    assert normalize_phone("+49 30 1234567") == "+49301234567"
+
+
+def _create_call(client, number):
+    response = client.post(
+        "/api/v1/calls/",
+        json={"direction": "inbound", "from_number": number, "to_number": "+49 30 9999999"},
+    )
+    assert response.status_code == 200
+    return response.json()["lead_id"]
+
+
+def test_create_call_links_only_leads_visible_to_the_agent(client, db, users):
+    foreign = Lead(name="Fremd", phone="030 1234567", assigned_to=users["other"].id)
+    db.add(foreign)
+    db.commit()
+
+    client.act_as("rep")
+    assert _create_call(client, "+49 30 1234567") is None
+
+    unassigned = Lead(name="Offen", phone="+49 (0)30 1234567")
+    db.add(unassigned)
+    db.commit()
+    assert _create_call(client, "0049 30 1234567") == unassigned.id
+
+    client.act_as("admin")
+    assert _create_call(client, "030 1234567") == foreign.id
+    assert db.query(Call).count() == 3
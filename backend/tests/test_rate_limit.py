@@ -0,0 +1,48 @@
+"""
+Rate limiter: асинхронный Redis и быстрый переход на локальный bucket
+"""
+import asyncio
+
+import redis
+
+from app.core.rate_limit import RateLimiter
+
+
+class FakeRedis:
+    """Клиент redis.asyncio: register_script возвращает корутину вызова скрипта"""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def register_script(self, source):
+        async def script(keys, args):
+            self.calls += 1
+            if self.error is not None:
+                raise self.error
+            return [1, str(float(args[1]))]
+
+        return script
+
+
+def test_hit_uses_redis_script():
+    fake = FakeRedis()
+    decision = asyncio.run(RateLimiter(10, fake).hit("user:1:read", 2))
+
+    assert fake.calls == 1
+    assert decision.allowed
+    assert decision.remaining == 8
+
+
+def test_redis_timeout_falls_back_to_local_bucket_and_pauses_redis():
+    fake = FakeRedis(redis.TimeoutError("Timeout reading from socket"))
+    limiter = RateLimiter(3, fake)
+
+    async def burst():
+        return [await limiter.hit("user:1:read") for _ in range(4)]
+
+    decisions = asyncio.run(burst())
+
+    # Ошибка Redis стоит одного таймаута, дальше запросы считаются локально
+    assert fake.calls == 1
+    assert [decision.allowed for decision in decisions] == [True, True, True, False]
@@ -0,0 +1,119 @@
+"""
+Нарезка записей и склейка частичных транскриптов
+"""
+import io
+import struct
+import wave
+
+import pytest
+
+from app.services.transcription import (
+    AudioFormatError,
+    ByteChunker,
+    FakeSpeechToText,
+    SingleFileChunker,
+    WavChunker,
+    chunker_for,
+)
+from app.services.transcription.pipeline import merge_transcripts
+from app.services.transcription.stt import ChunkTranscript
+
+SAMPLE_RATE = 8000
+
+
+def _wav(seconds: float, channels: int = 1) -> bytes:
+    frames = int(seconds * SAMPLE_RATE)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(struct.pack(f"<{frames * channels}h", *(i % 1000 for i in range(frames * channels))))
+    return buffer.getvalue()
+
+
+def _feed(chunker, data: bytes, piece: int = 777):
+    chunks = []
+    for start in range(0, len(data), piece):
+        chunks.extend(chunker.feed(data[start:start + piece]))
+    return chunks + chunker.finish()
+
+
+def _parts(*texts: str):
+    return [ChunkTranscript(index, text) for index, text in enumerate(texts)]
+
+
+def test_merge_transcripts_removes_repeated_words_at_the_seam():
+    parts = _parts("Guten Tag, wir sprechen über", "Wir sprechen über den Vertrag")
+    assert merge_transcripts(parts, max_overlap_words=5) == "Guten Tag, wir sprechen über den Vertrag"
+
+
+def test_merge_transcripts_orders_parts_and_keeps_words_without_dedupe():
+    parts = [ChunkTranscript(1, "eins zwei"), ChunkTranscript(0, "null eins")]
+    assert merge_transcripts(parts) == "null eins eins zwei"
+    assert merge_transcripts(parts, max_overlap_words=3) == "null eins zwei"
+
+
+def test_merge_transcripts_overlap_is_limited_by_window():
+    parts = _parts("a b c d", "b c d e")
+    assert merge_transcripts(parts, max_overlap_words=2) == "a b c d b c d e"
+
+
+def test_wav_chunker_splits_on_sample_boundaries_with_overlap():
+    chunker = WavChunker(chunk_seconds=4, overlap_seconds=1)
+    chunks = _feed(chunker, _wav(10.5))
+
+    assert [(chunk.start_seconds, chunk.end_seconds) for chunk in chunks] == [
+        (0.0, 4.0), (3.0, 7.0), (6.0, 10.0), (9.0, 10.5),
+    ]
+    assert [chunk.index for chunk in chunks] == [0, 1, 2, 3]
+    for chunk in chunks:
+        # Каждый фрагмент - самостоятельный WAV с корректным заголовком
+        with wave.open(io.BytesIO(chunk.data)) as wav:
+            assert wav.getframerate() == SAMPLE_RATE
+            assert wav.getnframes() == round((chunk.end_seconds - chunk.start_seconds) * SAMPLE_RATE)
+
+
+def test_wav_chunker_drops_tail_already_covered_by_overlap():
+    chunks = _feed(WavChunker(chunk_seconds=4, overlap_seconds=1), _wav(7.0))
+    assert [(chunk.start_seconds, chunk.end_seconds) for chunk in chunks] == [(0.0, 4.0), (3.0, 7.0)]
+
+
+def test_wav_chunker_keeps_whole_frames_for_stereo():
+    chunks = _feed(WavChunker(chunk_seconds=1.5), _wav(2.0, channels=2), piece=333)
+    assert all(len(chunk.data[44:]) % 4 == 0 for chunk in chunks)
+    assert chunks[-1].end_seconds == 2.0
+
+
+def test_wav_chunker_rejects_non_wav_stream():
+    chunker = WavChunker(chunk_seconds=4)
+    with pytest.raises(AudioFormatError):
+        chunker.feed(b"OggS" + b"\0" * 64)
+
+
+def test_fake_stt_over_overlapping_chunks_merges_into_continuous_text():
+    backend = FakeSpeechToText()
+    chunks = _feed(WavChunker(chunk_seconds=4, overlap_seconds=1), _wav(10.5))
+    parts = [backend.transcribe(chunk, "de") for chunk in chunks]
+    assert merge_transcripts(parts, max_overlap_words=9) == " ".join(f"wort{second}" for second in range(10))
+
+
+def test_chunker_for_splits_only_mp3_by_bytes():
+    mp3 = chunker_for("audio/mpeg", 60, 1, chunk_bytes=1000, single_file_bytes=5000)
+    assert type(mp3) is ByteChunker
+    assert [len(chunk.data) for chunk in _feed(mp3, b"\xff" * 2500)] == [1000, 1000, 500]
+
+    ogg = chunker_for("audio/ogg; codecs=opus", 60, 1, chunk_bytes=1000, single_file_bytes=5000)
+    assert isinstance(ogg, SingleFileChunker)
+    chunks = _feed(ogg, b"OggS" + b"\0" * 2996)
+    assert [(chunk.filename, len(chunk.data)) for chunk in chunks] == [("chunk_00000.ogg", 3000)]
+
+    assert isinstance(chunker_for("audio/wav", 60, 1, 1000, 5000), WavChunker)
+    with pytest.raises(AudioFormatError):
+        chunker_for("video/mp4", 60, 1, 1000, 5000)
+
+
+def test_container_larger_than_single_file_limit_is_rejected():
+    chunker = chunker_for("audio/webm", 60, 1, chunk_bytes=1000, single_file_bytes=5000)
+    with pytest.raises(AudioFormatError):
+        _feed(chunker, b"\x1aE\xdf\xa3" + b"\0" * 6000)